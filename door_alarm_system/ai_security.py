@@ -5,10 +5,94 @@ Provides intelligent threat detection, pattern recognition, and predictive analy
 
 import numpy as np
 from datetime import datetime, timedelta
-from collections import defaultdict, deque
+from collections import defaultdict, deque, Counter
 import json
 import pickle
 import os
+import time
+import threading
+
+# Saved model: versioned JSON, replaced atomically by the snapshot thread
+MODEL_FILE = 'ai_model.json'
+MODEL_FORMAT = 'edomos-ai-model'
+MODEL_VERSION = 2
+
+# Snapshot debounce: save after SNAPSHOT_INTERVAL seconds with changes, or
+# after SNAPSHOT_MAX_CHANGES learned events, at most once per SNAPSHOT_MIN_GAP
+SNAPSHOT_INTERVAL = 60.0
+SNAPSHOT_MAX_CHANGES = 500
+SNAPSHOT_MIN_GAP = 5.0
+
+# Optional exponential decay of learned patterns (half-life in seconds, e.g.
+# 30 * 86400 to let a month-old routine count half as much); None disables it
+DECAY_HALF_LIFE = None
+
+# Decayed weights below this are dropped from the model
+MIN_WEIGHT = 0.01
+
+# Sliding windows: threat features cover the last THREAT_WINDOW events; more
+# than RAPID_EVENT_LIMIT events within RAPID_PERIOD seconds is an anomaly
+THREAT_WINDOW = 10
+RAPID_PERIOD = 60
+RAPID_EVENT_LIMIT = 10
+
+
+class EventWindow:
+    """
+    Features of the most recent events, kept up to date as events enter and
+    leave the window, so scoring an event never rescans the history
+    """
+    
+    def __init__(self, size=THREAT_WINDOW, rapid_period=RAPID_PERIOD, rapid_limit=RAPID_EVENT_LIMIT):
+        self.events = deque(maxlen=size)           # (event_type, timestamp)
+        self.type_counts = Counter()
+        self.gaps = deque(maxlen=size - 1)         # Seconds between neighbouring events (None if unknown)
+        self.gap_sum = 0
+        self.gap_count = 0
+        self.rapid_period = rapid_period
+        self.recent = deque(maxlen=rapid_limit + 1)  # Newest timestamps; more than rapid_limit is all we test
+        self.total = 0
+    
+    def push(self, event_type, timestamp):
+        events = self.events
+        if len(events) == events.maxlen:
+            self.type_counts[events[0][0]] -= 1
+        if events:
+            previous = events[-1][1]
+            gap = None
+            if isinstance(timestamp, datetime) and isinstance(previous, datetime):
+                gap = (timestamp - previous).seconds
+            if len(self.gaps) == self.gaps.maxlen and self.gaps[0] is not None:
+                self.gap_sum -= self.gaps[0]
+                self.gap_count -= 1
+            self.gaps.append(gap)
+            if gap is not None:
+                self.gap_sum += gap
+                self.gap_count += 1
+        events.append((event_type, timestamp))
+        self.type_counts[event_type] += 1
+        self.total += 1
+        if isinstance(timestamp, datetime):
+            self.recent.append(timestamp)
+    
+    def count(self, event_type):
+        return self.type_counts[event_type]
+    
+    @property
+    def gap_mean(self):
+        """Mean inter-arrival time in seconds, None before two timed events"""
+        return self.gap_sum / self.gap_count if self.gap_count else None
+    
+    def rapid_count(self, now):
+        """Events within rapid_period before now (capped at rapid_limit + 1)"""
+        recent = self.recent
+        while recent and (now - recent[0]).total_seconds() >= self.rapid_period:
+            recent.popleft()
+        return len(recent)
+    
+    def event_rate(self, now):
+        """Events per minute over the rapid period (a lower bound once capped)"""
+        return self.rapid_count(now) * 60.0 / self.rapid_period
 
 class AISecurityEngine:
     """
@@ -20,56 +104,234 @@ class AISecurityEngine:
     4. Smart Alerting - Reduces false alarms using ML
     """
     
-    def __init__(self):
+    def __init__(self, model_file=MODEL_FILE, decay_half_life=DECAY_HALF_LIFE, learning=True):
         self.event_history = deque(maxlen=1000)  # Last 1000 events
-        self.hourly_patterns = defaultdict(list)  # Pattern by hour
-        self.daily_patterns = defaultdict(list)   # Pattern by day
+        self.window = EventWindow()  # Incremental features of the newest events
+        # Running tallies over event_history for the dashboard insights
+        self.history_type_counts = Counter()
+        self.history_hour_counts = Counter()
+        self._history_version = 0   # Bumped by every analyzed event
+        self._insights = None       # (history version, hour, snapshot)
+        self._insights_lock = threading.Lock()
+        self.insights_version = 0
+        # Pattern model: event type counts per hour of day and per weekday.
+        # Bounded by 24 + 7 buckets x number of event types, so learning and
+        # scoring are O(1) and the model file stays the same size
+        self.hourly_patterns = defaultdict(Counter)  # hour -> {event_type: weight}
+        self.daily_patterns = defaultdict(Counter)   # weekday -> {event_type: weight}
+        self.hourly_totals = defaultdict(float)
+        self.daily_totals = defaultdict(float)
+        self.decay_half_life = decay_half_life  # Seconds; None keeps all history at full weight
+        self._decayed_at = {}  # (bucket kind, key) -> time its weights were last decayed
         self.anomaly_threshold = 2.5  # Standard deviations
-        self.model_file = 'ai_model.pkl'
+        self.model_file = model_file
         self.incidents_prevented = 0  # Count of anomalies detected
+        self.events_learned = 0
+        
+        # Snapshots: the event path only counts changes, a background thread writes.
+        # Only one process may learn and write the model file; the others
+        # (learning=False, web workers) score with it and reload it when replaced
+        self.learning = learning
+        self._model_lock = threading.Lock()
+        self.unsaved_changes = 0
+        self.snapshot_max_changes = SNAPSHOT_MAX_CHANGES
+        self._last_saved = 0.0
+        self._snapshot_thread = None
+        self._snapshot_wake = threading.Event()
+        self._snapshot_stop = threading.Event()
         self.load_model()
         
     def load_model(self):
-        """Load trained AI model if exists"""
-        if os.path.exists(self.model_file):
-            try:
-                with open(self.model_file, 'rb') as f:
+        """
+        Load the trained AI model if one was saved
+        
+        Snapshots are replaced by rename, so a crash mid-write leaves the
+        previous snapshot; a file that still fails validation is ignored and
+        the engine starts learning from scratch.
+        """
+        legacy_file = os.path.splitext(self.model_file)[0] + '.pkl'
+        try:
+            if os.path.exists(self.model_file):
+                with open(self.model_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('format') != MODEL_FORMAT or data.get('version') != MODEL_VERSION:
+                    raise ValueError(f"unsupported model format {data.get('format')} v{data.get('version')}")
+                data['hourly_patterns'] = {int(hour): counts for hour, counts in data['hourly_patterns'].items()}
+                data['decayed_at'] = {(kind, int(key) if kind == 'hour' else key): datetime.fromisoformat(stamp)
+                                      for kind, key, stamp in data.get('decayed_at', [])}
+            elif os.path.exists(legacy_file):
+                # Models from older versions were pickled (version 1: per-bucket event lists)
+                with open(legacy_file, 'rb') as f:
                     data = pickle.load(f)
-                    self.hourly_patterns = data.get('hourly_patterns', defaultdict(list))
-                    self.daily_patterns = data.get('daily_patterns', defaultdict(list))
-                    self.incidents_prevented = data.get('incidents_prevented', 0)
-                print("✅ AI Model loaded successfully")
-            except Exception as e:
-                print(f"⚠️ Could not load AI model: {e}")
+            else:
+                return
+            with self._model_lock:
+                self._set_patterns(self.hourly_patterns, self.hourly_totals, data.get('hourly_patterns', {}))
+                self._set_patterns(self.daily_patterns, self.daily_totals, data.get('daily_patterns', {}))
+                self.incidents_prevented = data.get('incidents_prevented', 0)
+                self.events_learned = data.get('events_learned', int(sum(self.hourly_totals.values())))
+                self._decayed_at = data.get('decayed_at', {})
+            print("✅ AI Model loaded successfully")
+        except Exception as e:
+            print(f"⚠️ Could not load AI model: {e}")
+    
+    @staticmethod
+    def _set_patterns(patterns, totals, stored):
+        patterns.clear()
+        totals.clear()
+        for key, counts in stored.items():
+            patterns[key] = Counter(counts)  # Counter(list) converts a version 1 model
+            totals[key] = float(sum(patterns[key].values()))
+    
+    def snapshot(self):
+        """JSON-serializable copy of the learned model"""
+        with self._model_lock:
+            return {
+                'format': MODEL_FORMAT,
+                'version': MODEL_VERSION,
+                'saved_at': datetime.now().isoformat(),
+                'hourly_patterns': {str(hour): dict(counts) for hour, counts in self.hourly_patterns.items()},
+                'daily_patterns': {day: dict(counts) for day, counts in self.daily_patterns.items()},
+                'incidents_prevented': self.incidents_prevented,
+                'events_learned': self.events_learned,
+                'decayed_at': [[kind, key, stamp.isoformat()] for (kind, key), stamp in self._decayed_at.items()]
+            }
+    
+    def replace_patterns(self, hourly_patterns, daily_patterns, events_learned, decayed_at=None):
+        """Install a pattern model trained offline (ai_training.train_patterns)"""
+        with self._model_lock:
+            self._set_patterns(self.hourly_patterns, self.hourly_totals, hourly_patterns)
+            self._set_patterns(self.daily_patterns, self.daily_totals, daily_patterns)
+            self.events_learned = events_learned
+            self._decayed_at = dict(decayed_at or {})
+            self.unsaved_changes += 1
     
     def save_model(self):
-        """Save trained AI model"""
+        """Write a model snapshot atomically (temp file, fsync, rename)"""
+        with self._model_lock:
+            changes = self.unsaved_changes
+        tmp_file = f"{self.model_file}.{os.getpid()}.tmp"
         try:
-            with open(self.model_file, 'wb') as f:
-                pickle.dump({
-                    'hourly_patterns': dict(self.hourly_patterns),
-                    'daily_patterns': dict(self.daily_patterns),
-                    'incidents_prevented': self.incidents_prevented
-                }, f)
-            print("✅ AI Model saved successfully")
+            data = self.snapshot()
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, separators=(',', ':'))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.model_file)
+            with self._model_lock:
+                self.unsaved_changes = max(self.unsaved_changes - changes, 0)
+            self._last_saved = time.monotonic()
+            return True
         except Exception as e:
             print(f"⚠️ Could not save AI model: {e}")
+            try:
+                os.remove(tmp_file)
+            except OSError:
+                pass
+            return False
+    
+    def start_snapshots(self, interval=SNAPSHOT_INTERVAL, max_changes=SNAPSHOT_MAX_CHANGES):
+        """
+        Save the model from a background thread
+        
+        A snapshot is written once `interval` seconds have passed with
+        unsaved changes, or earlier when `max_changes` events have been
+        learned, but never more than once per SNAPSHOT_MIN_GAP seconds.
+        
+        An engine that does not learn never writes; its thread reloads the
+        model file instead whenever the learning process has replaced it.
+        """
+        if self._snapshot_thread and self._snapshot_thread.is_alive():
+            return
+        self.snapshot_max_changes = max_changes
+        self._snapshot_stop.clear()
+        if self.learning:
+            self._snapshot_thread = threading.Thread(target=self._snapshot_loop, args=(interval,), name="AIModelSnapshot")
+        else:
+            self._snapshot_thread = threading.Thread(target=self._follow_loop, args=(interval,), name="AIModelReload")
+        self._snapshot_thread.daemon = True
+        self._snapshot_thread.start()
+    
+    def stop_snapshots(self, flush=True):
+        """Stop the snapshot thread, writing pending changes if it was running"""
+        if not self._snapshot_thread:
+            return
+        self._snapshot_stop.set()
+        self._snapshot_wake.set()
+        self._snapshot_thread.join(timeout=2.0)
+        self._snapshot_thread = None
+        if flush and self.learning and self.unsaved_changes:
+            self.save_model()
+    
+    def _snapshot_loop(self, interval):
+        while not self._snapshot_stop.is_set():
+            self._snapshot_wake.wait(interval)
+            self._snapshot_wake.clear()
+            if self._snapshot_stop.is_set():
+                break
+            # Debounce bursts: at most one write per SNAPSHOT_MIN_GAP
+            gap = SNAPSHOT_MIN_GAP - (time.monotonic() - self._last_saved)
+            if gap > 0 and self._snapshot_stop.wait(gap):
+                break
+            if self.unsaved_changes:
+                self.save_model()
+    
+    def _model_mtime(self):
+        try:
+            return os.stat(self.model_file).st_mtime_ns
+        except OSError:
+            return None
+    
+    def _follow_loop(self, interval):
+        loaded = self._model_mtime()
+        while not self._snapshot_stop.wait(interval):
+            mtime = self._model_mtime()
+            if mtime is not None and mtime != loaded:
+                loaded = mtime
+                self.load_model()
+    
+    def _decay(self, kind, patterns, totals, key, timestamp):
+        """Fade a bucket's weights by the time since it was last touched"""
+        mark = (kind, key)
+        last = self._decayed_at.get(mark)
+        self._decayed_at[mark] = timestamp if last is None else max(last, timestamp)
+        if last is None or timestamp <= last:
+            return
+        factor = 0.5 ** ((timestamp - last).total_seconds() / self.decay_half_life)
+        counts = patterns[key]
+        for event_type in list(counts):
+            counts[event_type] *= factor
+            if counts[event_type] < MIN_WEIGHT:
+                del counts[event_type]
+        totals[key] = float(sum(counts.values()))
     
     def learn_pattern(self, event_type, timestamp):
         """
         Machine Learning: Learn normal behavior patterns
-        Analyzes when events typically occur
+        Analyzes when events typically occur (only in the learning process)
         """
+        if not self.learning:
+            return
         hour = timestamp.hour
         day = timestamp.strftime('%A')  # Monday, Tuesday, etc.
         
-        # Record pattern
-        self.hourly_patterns[hour].append(event_type)
-        self.daily_patterns[day].append(event_type)
-        
-        # Save model periodically (every 50 events)
-        if len(self.event_history) % 50 == 0:
-            self.save_model()
+        with self._model_lock:
+            if self.decay_half_life:
+                self._decay('hour', self.hourly_patterns, self.hourly_totals, hour, timestamp)
+                self._decay('day', self.daily_patterns, self.daily_totals, day, timestamp)
+            
+            # Record pattern
+            self.hourly_patterns[hour][event_type] += 1
+            self.hourly_totals[hour] += 1
+            self.daily_patterns[day][event_type] += 1
+            self.daily_totals[day] += 1
+            self.events_learned += 1
+            
+            # Saving is left to the snapshot thread (start_snapshots)
+            self.unsaved_changes += 1
+            due = self.unsaved_changes >= self.snapshot_max_changes
+        if due:
+            self._snapshot_wake.set()
     
     def detect_anomaly(self, event_type, timestamp):
         """
@@ -80,20 +342,22 @@ class AISecurityEngine:
         day = timestamp.strftime('%A')
         
         # Get historical data for this time
-        hour_events = self.hourly_patterns.get(hour, [])
-        day_events = self.daily_patterns.get(day, [])
+        hour_counts = self.hourly_patterns.get(hour, {})
+        day_counts = self.daily_patterns.get(day, {})
+        hour_total = self.hourly_totals.get(hour, 0)
+        day_total = self.daily_totals.get(day, 0)
         
         # Not enough data yet - still learning (lowered threshold for quicker anomaly detection)
-        if len(hour_events) < 2 and len(day_events) < 3:
+        if hour_total < 2 and day_total < 3:
             return False, 0.0, "Learning phase - collecting data"
         
         anomaly_score = 0
         reasons = []
         
         # 1. Check frequency anomaly
-        if hour_events:
-            avg_events = len(hour_events) / max(len(set(hour_events)), 1)
-            current_count = hour_events.count(event_type)
+        if hour_total:
+            avg_events = hour_total / max(len(hour_counts), 1)
+            current_count = hour_counts.get(event_type, 0)
             if current_count > avg_events * 3:
                 anomaly_score += 30
                 reasons.append(f"Unusual frequency at {hour}:00")
@@ -105,16 +369,13 @@ class AISecurityEngine:
                 reasons.append("Unusual activity during night hours")
         
         # 3. Check rapid events (DDoS-like pattern)
-        recent_events = [e for e in self.event_history if 
-                        (timestamp - e['timestamp']).seconds < 60]
-        if len(recent_events) > 10:
+        if self.window.rapid_count(timestamp) > RAPID_EVENT_LIMIT:
             anomaly_score += 50
             reasons.append("Abnormally rapid events detected")
         
         # 4. Check day pattern
-        if day_events:
-            typical_events = set(day_events)
-            if event_type not in typical_events and len(day_events) > 20:
+        if day_total:
+            if event_type not in day_counts and day_total > 20:
                 anomaly_score += 25
                 reasons.append(f"Atypical event for {day}")
         
@@ -125,54 +386,54 @@ class AISecurityEngine:
         
         return is_anomaly, confidence, reason
     
-    def predict_threat_level(self, recent_events):
+    def predict_threat_level(self, recent_events=None, now=None):
         """
         AI Threat Prediction using Pattern Recognition
+        Scores the engine's own sliding window, or the given list of events,
+        with the hour of `now` (default: current time) as the risk period
         Returns: (threat_level, confidence, prediction)
         Threat levels: LOW, MEDIUM, HIGH, CRITICAL
         """
-        if len(recent_events) < 3:
+        window = self.window
+        if recent_events is not None:
+            window = EventWindow()
+            window.total = max(len(recent_events) - THREAT_WINDOW, 0)
+            for event in recent_events[-THREAT_WINDOW:]:
+                window.push(event.get('event_type'), event.get('timestamp'))
+        
+        if window.total < 3:
             return "LOW", 0.5, "Insufficient data for prediction"
         
         threat_score = 0
         factors = []
         
-        # Analyze last 10 events
-        last_10 = recent_events[-10:]
+        # Features of the last THREAT_WINDOW events
         
         # 1. Check for alarm patterns
-        alarm_events = [e for e in last_10 if e.get('event_type') == 'alarm_triggered']
-        if len(alarm_events) >= 2:
+        if window.count('alarm_triggered') >= 2:
             threat_score += 40
             factors.append("Multiple alarms detected")
         
         # 2. Check for door access patterns
-        door_events = [e for e in last_10 if e.get('event_type') == 'door_opened']
-        if len(door_events) >= 5:
+        if window.count('door_opened') >= 5:
             threat_score += 30
             factors.append("Excessive door access attempts")
         
         # 3. Time-based risk
-        current_hour = datetime.now().hour
+        current_hour = (now or datetime.now()).hour
         if current_hour >= 22 or current_hour <= 6:
             threat_score += 20
             factors.append("High-risk time period")
         
         # 4. Sequence analysis
-        event_types = [e.get('event_type') for e in last_10]
-        if event_types.count('door_opened') > event_types.count('door_closed'):
+        if window.count('door_opened') > window.count('door_closed'):
             threat_score += 25
             factors.append("Unclosed door detected")
         
         # 5. Temporal clustering (events too close together)
-        if len(last_10) >= 5:
-            time_diffs = []
-            for i in range(1, len(last_10)):
-                if isinstance(last_10[i].get('timestamp'), datetime):
-                    diff = (last_10[i]['timestamp'] - last_10[i-1]['timestamp']).seconds
-                    time_diffs.append(diff)
-            
-            if time_diffs and np.mean(time_diffs) < 30:  # Average < 30 seconds
+        if len(window.events) >= 5:
+            gap_mean = window.gap_mean
+            if gap_mean is not None and gap_mean < 30:  # Average < 30 seconds
                 threat_score += 35
                 factors.append("Rapid event clustering")
         
@@ -204,11 +465,17 @@ class AISecurityEngine:
         event_type = event_data.get('event_type', 'unknown')
         
         # Add to history
-        self.event_history.append({
-            'timestamp': timestamp,
-            'event_type': event_type,
-            'data': event_data
-        })
+        with self._model_lock:
+            if len(self.event_history) == self.event_history.maxlen:
+                self._tally(self.event_history[0], -1)
+            entry = {
+                'timestamp': timestamp,
+                'event_type': event_type,
+                'data': event_data
+            }
+            self.event_history.append(entry)
+            self._tally(entry, 1)
+            self.window.push(event_type, timestamp)
         
         # Learn from this event
         self.learn_pattern(event_type, timestamp)
@@ -219,11 +486,10 @@ class AISecurityEngine:
         # Count incidents prevented
         if is_anomaly:
             self.incidents_prevented += 1
+        self._history_version += 1
         
         # Predict threat
-        threat_level, threat_confidence, prediction = self.predict_threat_level(
-            list(self.event_history)
-        )
+        threat_level, threat_confidence, prediction = self.predict_threat_level()
         
         # Generate recommendations
         recommendations = []
@@ -253,10 +519,43 @@ class AISecurityEngine:
         
         return analysis
     
+    def _tally(self, entry, delta):
+        """Add (delta=1) or remove (delta=-1) a history entry from the running tallies"""
+        for counts, key in ((self.history_type_counts, entry['event_type']),
+                            (self.history_hour_counts, entry['timestamp'].hour
+                             if isinstance(entry['timestamp'], datetime) else None)):
+            if key is None:
+                continue
+            counts[key] += delta
+            if counts[key] <= 0:
+                del counts[key]
+    
     def get_ai_insights(self):
         """
         Get AI-powered insights about security patterns
+        
+        The snapshot is rebuilt from running tallies only after new events
+        (or when the hour, which feeds the threat level, changes); every
+        other call returns the same cached dict, which callers must not
+        modify. Its 'version' changes whenever the content may have.
         """
+        hour = datetime.now().hour
+        cached = self._insights
+        if cached and cached[0] == self._history_version and cached[1] == hour:
+            return cached[2]
+        
+        with self._insights_lock:
+            cached = self._insights
+            if cached and cached[0] == self._history_version and cached[1] == hour:
+                return cached[2]
+            history_version = self._history_version
+            insights = self._build_insights()
+            self.insights_version += 1
+            insights['version'] = self.insights_version
+            self._insights = (history_version, hour, insights)
+            return insights
+    
+    def _build_insights(self):
         total_events = len(self.event_history)
         
         if total_events == 0:
@@ -267,16 +566,16 @@ class AISecurityEngine:
             }
         
         # Calculate insights
-        event_types = [e['event_type'] for e in self.event_history]
-        most_common = max(set(event_types), key=event_types.count) if event_types else 'none'
+        with self._model_lock:
+            most_common = self.history_type_counts.most_common(1)
+            busiest = self.history_hour_counts.most_common(1)
+        most_common = most_common[0][0] if most_common else 'none'
         
         # Busiest hour
-        hours = [e['timestamp'].hour for e in self.event_history if isinstance(e['timestamp'], datetime)]
-        busiest_hour = max(set(hours), key=hours.count) if hours else 12
+        busiest_hour = busiest[0][0] if busiest else 12
         
         # Threat assessment
-        recent_20 = list(self.event_history)[-20:]
-        threat_level, confidence, _ = self.predict_threat_level(recent_20)
+        threat_level, confidence, _ = self.predict_threat_level()
         
         # Calculate Security Score (0-100)
         # Based on: AI accuracy, threat level, anomaly rate
@@ -307,7 +606,7 @@ class AISecurityEngine:
             'busiest_hour': f"{busiest_hour}:00",
             'current_threat_level': threat_level,
             'threat_confidence': round(confidence * 100, 2),
-            'patterns_learned': len(self.hourly_patterns),
+            'patterns_learned': sum(1 for counts in self.hourly_patterns.values() if counts),
             'ai_accuracy': min(95, 60 + (total_events / 10))  # Improves with data
         }
 
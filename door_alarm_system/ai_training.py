@@ -0,0 +1,394 @@
+"""
+Batch AI Training for eDOMOS
+Rebuilds the AISecurityEngine pattern model from the whole EventLog table and
+re-scores historical events with NumPy array operations instead of one Python
+call per event. Used by train_ai.py.
+"""
+
+import json
+import logging
+import multiprocessing
+from collections import namedtuple, deque
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import create_engine, select, update, bindparam, cast, func, Integer
+
+from models import EventLog
+from ai_security import THREAT_WINDOW, RAPID_PERIOD, RAPID_EVENT_LIMIT, MIN_WEIGHT
+
+logger = logging.getLogger(__name__)
+
+DAY_NAMES = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+EPOCH = datetime(1970, 1, 1)
+EPOCH_WEEKDAY = 3  # 1970-01-01 was a Thursday
+
+# Rows fetched per round trip, and events per re-scoring task / bulk UPDATE
+FETCH_CHUNK = 50000
+RESCORE_CHUNK = 50000
+
+# Earlier events a re-scored chunk needs for its first event's window features
+CONTEXT = max(THREAT_WINDOW - 1, RAPID_EVENT_LIMIT)
+
+# Events in time order: ids, naive timestamps as whole seconds since the
+# epoch, event type codes and the type names the codes index
+EventArrays = namedtuple('EventArrays', 'ids seconds codes types')
+
+
+def _to_datetime(seconds):
+    return EPOCH + timedelta(seconds=int(seconds))
+
+
+def load_event_arrays(source, since=None, until=None, chunk_size=FETCH_CHUNK):
+    """
+    Stream EventLog rows into NumPy arrays, oldest first
+
+    Timestamps are converted to epoch seconds by SQLite, so no datetime
+    objects are built per row. Second resolution is all the pattern model
+    and window features need.
+
+    Args:
+        source: SQLAlchemy Engine or database URI
+        since, until: Optional datetime bounds (since inclusive)
+    """
+    table = EventLog.__table__
+    seconds = cast(func.strftime('%s', table.c.timestamp), Integer)
+    query = select(table.c.id, seconds, table.c.event_type).where(table.c.timestamp.isnot(None))
+    if since is not None:
+        query = query.where(table.c.timestamp >= since)
+    if until is not None:
+        query = query.where(table.c.timestamp < until)
+    query = query.order_by(table.c.timestamp, table.c.id)
+
+    engine = create_engine(source) if isinstance(source, str) else source
+    vocabulary = {}
+    ids, secs, codes = [], [], []
+    try:
+        with engine.connect() as conn:
+            result = conn.execution_options(stream_results=True).execute(query)
+            for rows in result.partitions(chunk_size):
+                chunk_ids, chunk_secs, chunk_types = zip(*rows)
+                ids.append(np.array(chunk_ids, dtype=np.int64))
+                secs.append(np.array(chunk_secs, dtype=np.int64))
+                codes.append(np.fromiter((vocabulary.setdefault(t, len(vocabulary)) for t in chunk_types),
+                                         dtype=np.int32, count=len(chunk_types)))
+    finally:
+        if isinstance(source, str):
+            engine.dispose()
+
+    def joined(parts, dtype):
+        return np.concatenate(parts) if parts else np.empty(0, dtype=dtype)
+    return EventArrays(joined(ids, np.int64), joined(secs, np.int64), joined(codes, np.int32),
+                       list(vocabulary))
+
+
+def event_hours(seconds):
+    return (seconds // 3600) % 24
+
+
+def event_weekdays(seconds):
+    return (seconds // 86400 + EPOCH_WEEKDAY) % 7
+
+
+def _bucket_counts(buckets, n_buckets, events, decay_half_life):
+    """
+    Per-bucket event type weights (n_buckets x types) and each bucket's last event time
+
+    With a half-life every event is weighted by its age at the bucket's last
+    event, as the engine's lazy per-bucket decay does (except that the engine
+    also drops weights below MIN_WEIGHT along the way).
+    """
+    n_types = len(events.types)
+    last = np.full(n_buckets, -1, dtype=np.int64)
+    np.maximum.at(last, buckets, events.seconds)
+    weights = None
+    if decay_half_life:
+        weights = 0.5 ** ((last[buckets] - events.seconds) / decay_half_life)
+    counts = np.bincount(buckets * n_types + events.codes, weights=weights,
+                         minlength=n_buckets * n_types).reshape(n_buckets, n_types)
+    if decay_half_life:
+        counts[counts < MIN_WEIGHT] = 0
+    return counts, last
+
+
+def _pattern_dict(counts, keys, types):
+    patterns = {}
+    for row, key in zip(counts, keys):
+        nonzero = np.flatnonzero(row)
+        if len(nonzero):
+            patterns[key] = {types[j]: row[j].item() for j in nonzero}
+    return patterns
+
+
+def _pattern_matrix(patterns, keys, types):
+    matrix = np.zeros((len(keys), len(types)))
+    index = {name: j for j, name in enumerate(types)}
+    for i, key in enumerate(keys):
+        for name, weight in patterns.get(key, {}).items():
+            if name in index:
+                matrix[i, index[name]] = weight
+    return matrix
+
+
+def rapid_counts(seconds, period=RAPID_PERIOD):
+    """Events within `period` seconds up to and including each event"""
+    positions = np.arange(len(seconds))
+    return positions - np.searchsorted(seconds, seconds - period, side='right') + 1
+
+
+def train_patterns(events, decay_half_life=None):
+    """
+    Build the engine's pattern model and rate statistics from EventArrays
+
+    Returns:
+        Dict with the engine model (hourly_patterns, daily_patterns,
+        decayed_at, events_learned, ready for
+        AISecurityEngine.replace_patterns), the hour-of-week baseline
+        (168 x types array, Monday 00:00 first) and rate statistics
+    """
+    types = events.types
+    hours = event_hours(events.seconds)
+    days = event_weekdays(events.seconds)
+
+    hourly, hour_last = _bucket_counts(hours, 24, events, decay_half_life)
+    daily, day_last = _bucket_counts(days, 7, events, decay_half_life)
+    hour_of_week = np.bincount((days * 24 + hours) * len(types) + events.codes,
+                               minlength=168 * len(types)).reshape(168, len(types))
+
+    decayed_at = {}
+    if decay_half_life:
+        decayed_at.update((('hour', h), _to_datetime(last)) for h, last in enumerate(hour_last) if last >= 0)
+        decayed_at.update((('day', DAY_NAMES[d]), _to_datetime(last)) for d, last in enumerate(day_last) if last >= 0)
+
+    n = len(events.seconds)
+    gaps = np.diff(events.seconds)
+    weeks = max((events.seconds[-1] - events.seconds[0]) / (7 * 86400), 1.0) if n else 1.0
+    rates = {
+        'events': n,
+        'first_event': _to_datetime(events.seconds[0]).isoformat() if n else None,
+        'last_event': _to_datetime(events.seconds[-1]).isoformat() if n else None,
+        'events_per_week': round(n / weeks, 2),
+        'busiest_hour_of_week': int(hour_of_week.sum(axis=1).argmax()) if n else None,
+        'mean_gap_seconds': round(float(gaps.mean()), 2) if len(gaps) else None,
+        'median_gap_seconds': float(np.median(gaps)) if len(gaps) else None,
+        'p95_gap_seconds': float(np.percentile(gaps, 95)) if len(gaps) else None,
+        'rapid_events': int((rapid_counts(events.seconds) > RAPID_EVENT_LIMIT).sum()),
+        'by_type': {types[j]: int(count) for j, count in enumerate(np.bincount(events.codes, minlength=len(types)))},
+    }
+
+    return {
+        'hourly_patterns': _pattern_dict(hourly, range(24), types),
+        'daily_patterns': _pattern_dict(daily, DAY_NAMES, types),
+        'decayed_at': decayed_at,
+        'events_learned': n,
+        'hour_of_week': hour_of_week,
+        'rates': rates,
+    }
+
+
+def _window_sums(values, size):
+    """Sum of the last `size` values up to and including each position"""
+    sums = np.concatenate(([0], np.cumsum(values)))
+    positions = np.arange(1, len(values) + 1)
+    return sums[positions] - sums[np.maximum(positions - size, 0)]
+
+
+def score_events(seconds, codes, types, model, first_index=0):
+    """
+    Vectorized AISecurityEngine.detect_anomaly / predict_threat_level
+
+    Every event is scored against the given (final) pattern model and the
+    window of events before it, with the event's own hour as the threat
+    period. Positions before the scored range may be passed as context.
+
+    Args:
+        seconds, codes: EventArrays slices in time order
+        model: Engine model dict (hourly_patterns, daily_patterns)
+        first_index: Position of seconds[0] in the full history
+
+    Returns:
+        Dict of per-event arrays (scores, rule flags, hours and weekdays)
+    """
+    hours = event_hours(seconds)
+    days = event_weekdays(seconds)
+    hourly = _pattern_matrix(model['hourly_patterns'], range(24), types)
+    daily = _pattern_matrix(model['daily_patterns'], DAY_NAMES, types)
+    code_of = {name: j for j, name in enumerate(types)}
+
+    def is_type(name):
+        return codes == code_of[name] if name in code_of else np.zeros(len(codes), dtype=bool)
+
+    # Anomaly rules (see detect_anomaly)
+    hour_total = hourly.sum(axis=1)[hours]
+    day_total = daily.sum(axis=1)[days]
+    learning = (hour_total < 2) & (day_total < 3)
+    hour_types = np.maximum((hourly > 0).sum(axis=1), 1)[hours]
+    unusual_frequency = (hour_total > 0) & (hourly[hours, codes] > hour_total / hour_types * 3)
+    night = ((hours >= 23) | (hours <= 5)) & (is_type('door_opened') | is_type('alarm_triggered'))
+    rapid = rapid_counts(seconds) > RAPID_EVENT_LIMIT
+    atypical_day = (day_total > 20) & (daily[days, codes] == 0)
+    anomaly_score = 30 * unusual_frequency + 40 * night + 50 * rapid + 25 * atypical_day
+    anomaly_score[learning] = 0
+
+    # Threat rules over the last THREAT_WINDOW events (see predict_threat_level)
+    history = first_index + np.arange(1, len(seconds) + 1)
+    window = np.minimum(history, THREAT_WINDOW)
+    opened = _window_sums(is_type('door_opened'), THREAT_WINDOW)
+    closed = _window_sums(is_type('door_closed'), THREAT_WINDOW)
+    alarms = _window_sums(is_type('alarm_triggered'), THREAT_WINDOW) >= 2
+    excessive = opened >= 5
+    risk_hour = (hours >= 22) | (hours <= 6)
+    unclosed = opened > closed
+    gaps = np.diff(seconds, prepend=seconds[:1]) % 86400  # timedelta.seconds, as in the engine
+    gap_count = np.maximum(window - 1, 1)
+    clustering = (window >= 5) & (_window_sums(gaps, THREAT_WINDOW - 1) / gap_count < 30)
+    threat_score = 40 * alarms + 30 * excessive + 20 * risk_hour + 25 * unclosed + 35 * clustering
+    insufficient = history < 3
+
+    return {
+        'hours': hours, 'days': days,
+        'learning': learning, 'unusual_frequency': unusual_frequency, 'night': night,
+        'rapid': rapid, 'atypical_day': atypical_day, 'anomaly_score': anomaly_score,
+        'insufficient': insufficient, 'alarms': alarms, 'excessive': excessive, 'risk_hour': risk_hour,
+        'unclosed': unclosed, 'clustering': clustering, 'threat_score': threat_score,
+    }
+
+
+def _threat_level(score):
+    if score >= 80:
+        return "CRITICAL", 0.95
+    if score >= 60:
+        return "HIGH", 0.85
+    if score >= 40:
+        return "MEDIUM", 0.75
+    return "LOW", 0.65
+
+
+def _analysis(event_type, seconds, scores, i):
+    """The analyze_behavior result for scored event i"""
+    hour = int(scores['hours'][i])
+    day = DAY_NAMES[scores['days'][i]]
+    if scores['learning'][i]:
+        confidence, reason = 0.0, "Learning phase - collecting data"
+    else:
+        reasons = []
+        if scores['unusual_frequency'][i]:
+            reasons.append(f"Unusual frequency at {hour}:00")
+        if scores['night'][i]:
+            reasons.append("Unusual activity during night hours")
+        if scores['rapid'][i]:
+            reasons.append("Abnormally rapid events detected")
+        if scores['atypical_day'][i]:
+            reasons.append(f"Atypical event for {day}")
+        confidence = min(scores['anomaly_score'][i] / 100.0, 1.0)
+        reason = " | ".join(reasons) if reasons else "Normal behavior"
+    is_anomaly = bool(scores['anomaly_score'][i] >= 50)
+
+    if scores['insufficient'][i]:
+        threat_level, threat_confidence, prediction = "LOW", 0.5, "Insufficient data for prediction"
+    else:
+        factors = [text for flag, text in (('alarms', "Multiple alarms detected"),
+                                           ('excessive', "Excessive door access attempts"),
+                                           ('risk_hour', "High-risk time period"),
+                                           ('unclosed', "Unclosed door detected"),
+                                           ('clustering', "Rapid event clustering")) if scores[flag][i]]
+        threat_level, threat_confidence = _threat_level(scores['threat_score'][i])
+        prediction = " | ".join(factors) if factors else "Normal activity pattern"
+
+    recommendations = []
+    if is_anomaly:
+        recommendations.append("⚠️ Review security footage")
+        recommendations.append("🔔 Increase monitoring")
+    if threat_level in ['HIGH', 'CRITICAL']:
+        recommendations.append("🚨 Alert security personnel")
+        recommendations.append("📹 Enable continuous recording")
+    if event_type == 'door_opened' and hour >= 23:
+        recommendations.append("🌙 Verify authorized late-night access")
+
+    return {
+        'timestamp': _to_datetime(seconds).isoformat(),
+        'event_type': event_type,
+        'anomaly_detected': is_anomaly,
+        'anomaly_confidence': round(float(confidence) * 100, 2),
+        'anomaly_reason': reason,
+        'threat_level': threat_level,
+        'threat_confidence': round(threat_confidence * 100, 2),
+        'threat_prediction': prediction,
+        'recommendations': recommendations,
+        'ai_score': round((float(confidence) + threat_confidence) / 2 * 100, 2)
+    }
+
+
+def _rescore_chunk(ids, seconds, codes, types, model, first_index, context):
+    """Score a chunk (after `context` leading events) and render its ai_metadata values"""
+    scores = score_events(seconds, codes, types, model, first_index)
+    updates = []
+    for i in range(context, len(ids)):
+        metadata = {
+            'ai_analysis': _analysis(types[codes[i]], seconds[i], scores, i),
+            'ai_processed': True,
+            'ai_backfill': True,
+        }
+        updates.append({'_id': int(ids[i]), 'metadata': json.dumps(metadata)})
+    return updates
+
+
+def _chunk_results(tasks, workers):
+    """Results of _rescore_chunk in task order, with at most two chunks per worker in flight"""
+    if workers <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            yield _rescore_chunk(*task)
+        return
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as pool:
+        pending = deque()
+        queued = iter(tasks)
+        try:
+            for task in islice(queued, workers * 2):
+                pending.append(pool.submit(_rescore_chunk, *task))
+            while pending:
+                rows = pending.popleft().result()
+                for task in islice(queued, 1):
+                    pending.append(pool.submit(_rescore_chunk, *task))
+                yield rows
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def rescore_events(source, events, model, workers=1, chunk_size=RESCORE_CHUNK, progress=None):
+    """
+    Re-score historical events and write their ai_metadata
+
+    Chunks are scored in a process pool and written back with one
+    executemany UPDATE per chunk, in order, as results arrive.
+
+    Returns:
+        Number of events updated
+    """
+    table = EventLog.__table__
+    statement = update(table).where(table.c.id == bindparam('_id')).values(ai_metadata=bindparam('metadata'))
+    engine = create_engine(source) if isinstance(source, str) else source
+    n = len(events.ids)
+    tasks = []
+    for start in range(0, n, chunk_size):
+        begin = max(start - CONTEXT, 0)
+        stop = min(start + chunk_size, n)
+        tasks.append((events.ids[begin:stop], events.seconds[begin:stop], events.codes[begin:stop],
+                      events.types, model, begin, start - begin))
+
+    updated = 0
+    try:
+        for rows in _chunk_results(tasks, workers):
+            if rows:
+                with engine.begin() as conn:
+                    conn.execute(statement, rows)
+            updated += len(rows)
+            if progress:
+                progress(updated, n)
+    finally:
+        if isinstance(source, str):
+            engine.dispose()
+    logger.info(f"Re-scored {updated} events")
+    return updated
@@ -0,0 +1,290 @@
+"""
+Streaming Anomaly Rules for eDOMOS
+Evaluates the door access anomaly rules (odd hours, repeated opens, prolonged
+open and any configured window rules) against in-memory sliding windows and
+cached business hours, so logging an event costs no database queries.
+Detected anomalies are written to the anomaly_detection table in batches by a
+writer thread.
+"""
+
+import time
+import threading
+import logging
+from collections import deque, defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, select, insert, func
+
+from models import AnomalyDetection, EventLog, Setting
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUSINESS_HOURS = (9, 17)
+
+# The built-in repeated opens rule: 3+ door opens within 10 minutes
+DEFAULT_WINDOW_RULES = [
+    {
+        'name': 'repeated_opens',
+        'event_type': 'door_open',
+        'count': 3,
+        'window': 600,
+        'severity': 'high',
+        'description': 'Repeated door access detected: {count} opens in last {minutes} minutes',
+        'message': '{count} door opens in {minutes} minutes',
+    },
+]
+
+
+class WindowRule:
+    """
+    `count` or more events of one type within `window` seconds
+
+    description and message are format strings with {count} (events in the
+    window, this one included), {minutes} and {seconds} (the window length).
+    """
+
+    def __init__(self, name, event_type, count, window, severity='medium', description=None, message=None):
+        self.name = name
+        self.event_type = event_type
+        self.count = count
+        self.window = timedelta(seconds=window)
+        self.severity = severity
+        self.description = description or f'{event_type} x{{count}} within {{seconds}} seconds'
+        self.message = message or self.description
+
+    def format(self, template, count):
+        seconds = int(self.window.total_seconds())
+        return template.format(count=count, seconds=seconds, minutes=seconds // 60)
+
+
+class AnomalyRuleEngine:
+    """
+    Per-door sliding windows plus a batched anomaly writer
+
+    Each window rule keeps a deque of the timestamps of its event type inside
+    the window per door; an event appends once and expired timestamps are
+    popped from the front, so a rule costs O(1) amortized per event.
+    Windows are seeded from EventLog when the engine is created, so a
+    restart does not forget opens from just before it; an event already
+    seeded (created lazily after its row was committed) is not counted twice.
+    """
+
+    def __init__(self, source, rules=None, settings_ttl=60, flush_interval=2.0, batch_size=50,
+                 on_anomaly=None, clock=datetime.now):
+        """
+        Args:
+            source: SQLAlchemy Engine or database URI
+            rules: Window rule dicts (WindowRule arguments); DEFAULT_WINDOW_RULES if None
+            settings_ttl: Seconds cached business hours are trusted; other
+                processes' changes are seen after at most this long
+            flush_interval: Longest time a detected anomaly waits to be written
+            batch_size: Pending anomalies that trigger an immediate write
+            on_anomaly: Callable(anomaly dict) run for each detection (alerts)
+            clock: Current local time
+        """
+        self.engine = create_engine(source) if isinstance(source, str) else source
+        self.rules = [WindowRule(**rule) for rule in (DEFAULT_WINDOW_RULES if rules is None else rules)]
+        self.settings_ttl = settings_ttl
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.on_anomaly = on_anomaly
+        self.clock = clock
+
+        self.table = AnomalyDetection.__table__
+        self._windows = defaultdict(deque)  # (door, rule name) -> timestamps in the window
+        self._opened_at = {}                 # door -> time of the open still in progress
+        self._seeded_through = None          # Highest EventLog id loaded into the windows
+        self._business_hours = None
+        self._settings_loaded = 0.0
+        self._lock = threading.Lock()
+        self._pending = []
+        self._write_lock = threading.Lock()
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.detected = 0
+        self.written = 0
+
+        self._seed_windows()
+
+    # ------------------------------------------------------------------
+    # Settings
+    # ------------------------------------------------------------------
+
+    def business_hours(self):
+        """(start, end) hours, re-read from Settings at most every settings_ttl seconds"""
+        if self._business_hours is None or time.monotonic() - self._settings_loaded > self.settings_ttl:
+            start, end = DEFAULT_BUSINESS_HOURS
+            table = Setting.__table__
+            try:
+                with self.engine.connect() as conn:
+                    values = dict(conn.execute(select(table.c.key, table.c.value).where(
+                        table.c.key.in_(('business_hours_start', 'business_hours_end')))).all())
+                start = int(values.get('business_hours_start', start))
+                end = int(values.get('business_hours_end', end))
+            except Exception as e:
+                logger.warning(f"Could not load business hours, using {start}-{end}: {e}")
+            self._business_hours = (start, end)
+            self._settings_loaded = time.monotonic()
+        return self._business_hours
+
+    def invalidate_settings(self):
+        """Re-read business hours on the next event (they were just changed)"""
+        self._business_hours = None
+
+    def _seed_windows(self, door='main'):
+        table = EventLog.__table__
+        now = self.clock()
+        try:
+            with self.engine.connect() as conn:
+                last_id = conn.execute(select(func.max(table.c.id))).scalar()
+                if last_id is None:
+                    return
+                for rule in self.rules:
+                    timestamps = conn.execute(
+                        select(table.c.timestamp).where(table.c.event_type == rule.event_type,
+                                                        table.c.timestamp >= now - rule.window,
+                                                        table.c.id <= last_id)
+                        .order_by(table.c.timestamp)).scalars().all()
+                    self._windows[(door, rule.name)].extend(timestamps)
+                self._seeded_through = last_id
+        except Exception as e:
+            logger.warning(f"Could not seed anomaly windows: {e}")
+
+    # ------------------------------------------------------------------
+    # Rules
+    # ------------------------------------------------------------------
+
+    def evaluate(self, event_type, event_id=None, door='main', timestamp=None, threshold=None):
+        """
+        Run the rules for one logged event
+
+        Args:
+            threshold: Alarm timer duration in seconds, reported by the
+                prolonged open rule
+
+        Returns:
+            List of detected anomaly dicts (already queued for writing)
+        """
+        now = timestamp or self.clock()
+        anomalies = []
+
+        def detected(anomaly_type, severity, description, message):
+            anomalies.append({'event_id': event_id, 'anomaly_type': anomaly_type, 'severity': severity,
+                              'description': description, 'message': message, 'detected_at': now})
+
+        with self._lock:
+            # 1. Odd hours
+            if event_type == 'door_open':
+                start, end = self.business_hours()
+                if now.hour < start or now.hour >= end:
+                    detected('odd_hours', 'medium',
+                             f'Door accessed outside business hours ({now.hour}:00 - Business hours: {start}:00-{end}:00)',
+                             'Door accessed outside business hours')
+
+            # 2. Window rules (repeated opens and configured rules)
+            seeded = event_id is not None and self._seeded_through is not None and event_id <= self._seeded_through
+            for rule in self.rules:
+                if rule.event_type != event_type:
+                    continue
+                window = self._windows[(door, rule.name)]
+                if not seeded:
+                    window.append(now)
+                cutoff = now - rule.window
+                while window and window[0] < cutoff:
+                    window.popleft()
+                if len(window) >= rule.count:
+                    detected(rule.name, rule.severity, rule.format(rule.description, len(window)),
+                             rule.format(rule.message, len(window)))
+
+            # 3. Prolonged open (the alarm only fires while the door is held open)
+            if event_type == 'door_open':
+                self._opened_at[door] = now
+            elif event_type == 'door_close':
+                self._opened_at.pop(door, None)
+            elif event_type == 'alarm_triggered':
+                opened_at = self._opened_at.get(door)
+                duration = int((now - opened_at).total_seconds()) if opened_at else threshold
+                detected('prolonged_open', 'high',
+                         f'Door left open for {duration} seconds (exceeded threshold)',
+                         f'Door open for {duration} seconds')
+
+        if anomalies:
+            self.detected += len(anomalies)
+            self._queue(anomalies)
+            for anomaly in anomalies:
+                if self.on_anomaly:
+                    try:
+                        self.on_anomaly(anomaly)
+                    except Exception as e:
+                        logger.error(f"Anomaly callback failed: {e}")
+        return anomalies
+
+    # ------------------------------------------------------------------
+    # Batched writer
+    # ------------------------------------------------------------------
+
+    def _queue(self, anomalies):
+        with self._lock:
+            self._pending.extend(anomalies)
+            full = len(self._pending) >= self.batch_size
+        if not self.is_alive():
+            self.flush()  # No writer thread - write now
+        elif full:
+            self._wake_event.set()
+
+    def flush(self):
+        """Write pending anomalies in one transaction; returns the number written"""
+        with self._write_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            rows = [{key: anomaly[key] for key in ('event_id', 'anomaly_type', 'severity', 'description', 'detected_at')}
+                    for anomaly in batch]
+            try:
+                with self.engine.begin() as conn:
+                    conn.execute(insert(self.table), rows)
+            except Exception as e:
+                logger.error(f"Writing {len(rows)} anomalies failed, will retry: {e}")
+                with self._lock:
+                    self._pending[:0] = batch
+                return 0
+            self.written += len(rows)
+            return len(rows)
+
+    def start(self):
+        if self.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="AnomalyWriter")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=2.0):
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self.flush()
+
+    def is_alive(self):
+        return bool(self._thread and self._thread.is_alive())
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._wake_event.wait(self.flush_interval)
+            self._wake_event.clear()
+            self.flush()
+
+    def get_stats(self):
+        with self._lock:
+            pending = len(self._pending)
+            windows = {f"{door}/{name}": len(window) for (door, name), window in self._windows.items()}
+        return {
+            'detected': self.detected,
+            'written': self.written,
+            'pending': pending,
+            'windows': windows,
+            'business_hours': self._business_hours,
+        }
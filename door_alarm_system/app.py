@@ -3,17 +3,18 @@ import time
 import threading
 import sqlite3
 import json
-import smtplib
 import traceback
 import csv
 import base64
 import signal
 import atexit
+import bisect
 import hashlib
 import ipaddress
 import pygame  # For audio alarm functionality
 import cv2  # For video streaming
 import RPi.GPIO as GPIO
+from collections import Counter
 from pathlib import Path
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
@@ -21,7 +22,7 @@ from email.mime.application import MIMEApplication
 from datetime import datetime, timedelta, date
 from flask import Flask, render_template, request, jsonify, redirect, url_for, session, send_file, flash, render_template_string, abort, Response
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, emit, join_room, leave_room, rooms
 from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, BooleanField, IntegerField, SelectMultipleField
 from wtforms.validators import DataRequired, Email, Length, ValidationError
@@ -42,10 +43,24 @@ def resilient_email(form, field):
         pattern = r"^[^@\s]+@[^@\s]+\.[^@\s]+$"
         if not re.match(pattern, email):
             raise ValidationError('Invalid email address')
-from sqlalchemy import func
-from models import db, User, Setting, EventLog, EmailConfig, CompanyProfile, DoorSystemInfo, AnomalyDetection, ScheduledReport
+from sqlalchemy import func, case, select
+from models import db, User, Setting, EventLog, EmailConfig, CompanyProfile, DoorSystemInfo, AnomalyDetection, ScheduledReport, ScheduledReportRun
+from sqlalchemy.exc import IntegrityError
 from config import Config
 from ai_security import analyze_event_with_ai, get_ai_dashboard_stats, ai_engine
+from ws_broadcaster import (CoalescingBroadcaster, LEGACY_ROOM, EVENTS_ROOM,
+                            ANOMALY_ROOM, rooms_for_user, user_room)
+from hardware_ipc import ControllerClient, ControllerUnavailable
+from report_jobs import ReportJobManager, JOB_DONE, JOB_FAILED
+from report_cache import ReportCache
+from report_scheduler import ReportScheduler, report_window, following_run
+from email_outbox import EmailOutbox
+from anomaly_rules import AnomalyRuleEngine, DEFAULT_WINDOW_RULES
+from door_flap import FlapDetector
+from perf_metrics import registry as metrics, request_metrics, TimedLock
+from event_trace import EventTracer
+from slow_queries import SlowQueryLog, SORT_KEYS as SLOW_QUERY_SORT_KEYS
+from report_engine import report_datetime_formats, stream_report, iter_csv, gzip_chunks
 
 # ============================================================================
 # IP ADDRESS RESTRICTION SYSTEM
@@ -236,12 +251,16 @@ def after_request(response):
 
 # Initialize extensions
 db.init_app(app)
+request_metrics.init_app(app)  # Latency, SQL and response size metrics (see /metrics)
+slow_query_log = SlowQueryLog(**Config.SLOW_QUERY_CONFIG)  # Statements over the threshold, with query plans
+slow_query_log.instrument()
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
 socketio = SocketIO(
     app, 
-    async_mode='threading', 
+    async_mode=Config.SOCKETIO_ASYNC_MODE,  # 'eventlet'/'gevent' in production (wsgi.py)
+    message_queue=Config.SOCKETIO_MESSAGE_QUEUE,  # Shared by multiple worker processes
     cors_allowed_origins="*",
     logger=False,
     engineio_logger=False,
@@ -252,6 +271,28 @@ socketio = SocketIO(
     always_connect=True
 )
 
+def announce_latency_budget(stage, seconds, budget, trace_id):
+    """Alert administrators that a door event pipeline stage exceeded its latency budget"""
+    print(f"[LATENCY] ⚠️ Door event stage '{stage}' took {seconds * 1000:.0f}ms (budget {budget * 1000:.0f}ms, trace {trace_id})")
+    emit_to_stream('latency_budget_exceeded', {
+        'stage': stage,
+        'ms': round(seconds * 1000, 1),
+        'budget_ms': round(budget * 1000, 1),
+        'trace_id': trace_id
+    }, ANOMALY_ROOM)
+
+# Sensor-to-browser latency of door events (see event_trace.py)
+event_tracer = EventTracer(on_budget_exceeded=announce_latency_budget, **Config.EVENT_TRACE_CONFIG)
+
+def trace_events_emitted(events):
+    for entry in events:
+        event_tracer.mark((entry.get('event') or {}).get('trace_id'), 'emitted')
+
+# Coalesces real-time updates and sends per-client deltas (see ws_broadcaster.py)
+broadcaster = CoalescingBroadcaster(socketio, namespace='/events', window=0.1,
+                                    distributed=bool(Config.SOCKETIO_MESSAGE_QUEUE),
+                                    on_events_sent=trace_events_emitted)
+
 # Helper function for blockchain logging
 def add_to_blockchain(event_type, user_id, details):
     """
@@ -289,6 +330,11 @@ def handle_connect():
     print(f"  ├─ Origin: {client_info['origin']}")
     print(f"  └─ Namespace: /events")
     
+    # Only logged-in users may subscribe; streams are scoped by permission
+    if not current_user.is_authenticated:
+        print(f"[WEBSOCKET] ⛔ Rejected unauthenticated connection: {client_id}")
+        return False
+    
     try:
         # Get total connected clients
         rooms = socketio.server.manager.rooms.get('/events', {})
@@ -300,6 +346,19 @@ def handle_connect():
         print(f"  ├─ Total Connected Clients: {total_clients}")
         print(f"  └─ Connection Time: {datetime.now().isoformat()}")
         
+        # Join the stream rooms this user's permissions allow
+        stream_rooms = rooms_for_user(current_user)
+        for room in stream_rooms:
+            join_room(room)
+        print(f"[WEBSOCKET] 🔐 {current_user.username} joined streams: {', '.join(stream_rooms) or 'none'}")
+        
+        # Full-payload 'new_event' stream until the client opts into deltas
+        if EVENTS_ROOM in stream_rooms:
+            join_room(LEGACY_ROOM)
+        
+        # Private room for this user's report job notifications
+        join_room(user_room(current_user.id))
+        
         # Send connection confirmation with detailed info
         emit('connection_status', {
             'status': 'connected',
@@ -307,6 +366,7 @@ def handle_connect():
             'server_time': datetime.now().isoformat(),
             'session_id': client_id,
             'total_clients': total_clients,
+            'streams': stream_rooms,
             'connection_established': True
         })
         
@@ -330,6 +390,7 @@ def handle_disconnect(*args):
     by different versions of Flask-SocketIO, but we don't use them.
     """
     client_id = request.sid
+    broadcaster.remove_client(client_id)
     try:
         rooms = socketio.server.manager.rooms.get('/events', {})
         remaining_clients = len(rooms) - 1  # Subtract the disconnecting client
@@ -389,28 +450,64 @@ def handle_client_ready(data):
         'message': 'Server received client ready signal'
     })
 
-# Enhanced broadcast function for events
+@socketio.on('subscribe_deltas', namespace='/events')
+def handle_subscribe_deltas(data=None):
+    """Switch client from full 'new_event' payloads to 'state_update' delta frames"""
+    if EVENTS_ROOM not in rooms():
+        return  # Not permitted to see the event stream
+    if broadcaster.distributed:
+        return  # Delta frames need per-client state in this process
+    leave_room(LEGACY_ROOM)
+    broadcaster.enable_delta(request.sid)
+
+@socketio.on('event_ack', namespace='/events')
+def handle_event_ack(data):
+    """Browser rendered a traced door event - closes its latency trace"""
+    if not isinstance(data, dict) or not isinstance(data.get('trace_id'), str):
+        return
+    if hardware_client is None:
+        event_tracer.mark(data['trace_id'], 'acked')
+        return
+    # Traces live in the controller. time.monotonic() is the system-wide
+    # CLOCK_MONOTONIC, so the ack stamped here lines up with its stamps
+    try:
+        hardware_client.command('trace_ack', trace_id=data['trace_id'], at=time.monotonic(), timeout=1.0)
+    except ControllerUnavailable:
+        pass
+
+@socketio.on('state_resync', namespace='/events')
+def handle_state_resync(data=None):
+    """Client detected a version gap - resend the full state"""
+    broadcaster.resync(request.sid)
+
+# Broadcast function for events
 def broadcast_event(event_data, namespace='/events'):
-    """Enhanced broadcast function with better error handling"""
+    """
+    Queue an event payload for broadcast
+    
+    Delivery is coalesced by the broadcaster: bursts within its window go out
+    together, and delta clients only receive the status fields that changed.
+    """
     try:
-        event_type = event_data.get('event', {}).get('event_type', 'unknown')
-        print(f"[WEBSOCKET] 📡 BROADCASTING EVENT:")
-        print(f"  ├─ Event Type: {event_type}")
-        print(f"  ├─ Event Name: 'new_event'")
-        print(f"  ├─ Namespace: {namespace}")
-        print(f"  ├─ Connected Clients: {len(socketio.server.manager.rooms.get(namespace, {}))}")
-        print(f"  └─ Payload Keys: {list(event_data.keys())}")
-        
-        # Emit the event
-        socketio.emit('new_event', event_data, namespace=namespace)
-        
-        print(f"[WEBSOCKET] ✅ EVENT BROADCAST SUCCESSFUL - Event '{event_type}' sent to all clients")
+        broadcaster.publish(event_data)
+        if controller_server:
+            controller_server.publish_state()
+            controller_server.publish_event(event_data)
     except Exception as e:
         print(f"[WEBSOCKET ERROR] ❌ BROADCAST FAILED: {e}")
-        print(f"[WEBSOCKET ERROR] Event data: {event_data}")
-        import traceback
         traceback.print_exc()
 
+def emit_to_stream(name, payload, room):
+    """Emit a one-off event to a stream room, relaying it to web workers"""
+    broadcaster.emit_to_room(name, payload, room)
+    if controller_server:
+        controller_server.publish_emit(name, payload, room)
+
+# Web worker processes leave GPIO to the single hardware-owning process
+if not Config.HARDWARE_OWNER and not os.environ.get('TESTING'):
+    print("[DEBUG] 🔧 EDOMOS_HARDWARE_OWNER=false - web worker, hardware features disabled")
+    os.environ['TESTING'] = '1'
+
 # GPIO setup - only if not in testing mode
 print("[DEBUG] 🔧 Starting GPIO setup...")
 if not os.environ.get('TESTING'):
@@ -576,6 +673,29 @@ alarm_volume = 1.0  # Default alarm volume (0.0 to 1.0) - MAXIMUM VOLUME
 # Camera system
 camera_manager = None
 
+# Hardware controller channel (see hardware_controller.py / hardware_ipc.py)
+controller_server = None  # Set in the controller daemon
+hardware_client = None    # Set in web workers that read the controller's state
+
+def hardware_state():
+    """
+    Current door/alarm state
+    
+    Web workers read the mirror published by the hardware controller; the
+    process that owns the hardware reads its own globals.
+    """
+    if hardware_client is not None:
+        return hardware_client.state
+    return {
+        'door_open': door_open,
+        'alarm_active': alarm_active,
+        'timer_active': timer_active,
+        'timer_duration': timer_duration,
+        'camera_available': bool(camera_manager and camera_manager.camera_available),
+        'camera_type': camera_manager.camera_type if camera_manager else None,
+        'camera_resolution': camera_manager.resolution if camera_manager else None
+    }
+
 # Hardware pin assignments
 # Door sensor is connected to GPIO pin 11 (BOARD numbering used in setup)
 DOOR_SENSOR_PIN = 11
@@ -593,9 +713,12 @@ audio_system_ready = False
 last_logged_door_state = None
 last_logged_alarm_state = False
 last_event_timestamps = {}
-event_lock = threading.Lock()
+event_lock = TimedLock(metrics, 'event_lock')  # Records lock wait/hold times
 event_counter = 0  # Global counter to track all log_event calls
-last_door_event_time = 0  # Track last door event time for minimum interval
+# Door transitions are logged through the flap detector, which collapses
+# open/close storms into door_flapping summaries (per-type de-dup would drop real transitions)
+door_flap = FlapDetector(lambda event_type, description, **context: log_event(event_type, description, dedup=False, **context),
+                         **Config.DOOR_FLAP_CONFIG)
 
 # Signal handling and cleanup functions
 def cleanup_and_exit():
@@ -621,6 +744,17 @@ def cleanup_and_exit():
         if timer_thread.is_alive():
             print("[DEBUG] ⚠️ Timer thread did not stop within timeout")
     
+    # Stop scheduled reports, the email sender and report job workers
+    if report_scheduler is not None:
+        report_scheduler.stop()
+    if email_outbox is not None:
+        email_outbox.stop()
+    if anomaly_rules is not None:
+        anomaly_rules.stop()  # Writes anomalies still pending
+    if report_job_manager is not None:
+        report_job_manager.shutdown()
+    ai_engine.stop_snapshots()  # Write what was learned since the last snapshot
+    
     # Clean up GPIO
     if not os.environ.get('TESTING'):
         try:
@@ -984,6 +1118,13 @@ def format_datetime_filter(dt, date_format='YYYY-MM-DD', time_format='24h'):
 # Initialize system
 def init_system():
     os.makedirs('instance', exist_ok=True)
+    with app.app_context():
+        # Report workers are forked now, before this process starts any thread
+        get_report_job_manager().start()
+    # Only the hardware owner learns and writes the AI model; web workers
+    # score with it and reload it when the owner saves a new snapshot
+    ai_engine.learning = Config.HARDWARE_OWNER
+    ai_engine.start_snapshots(**Config.AI_SNAPSHOT_CONFIG)
     with app.app_context():
         db.create_all()
         
@@ -1020,6 +1161,12 @@ def init_system():
         else:
             print("[DEBUG] 🔧 GPIO not available - Skipping LED initialization")
             
+        if not Config.HARDWARE_OWNER:
+            print("[DEBUG] 🔧 Web worker - audio and camera are owned by the hardware process")
+            if Config.CONTROLLER_SOCKET:
+                start_hardware_client()
+            return
+        
         # Initialize audio system
         print("[DEBUG] 🔧 Initializing audio system...")
         initialize_audio()
@@ -1032,6 +1179,9 @@ def init_system():
             camera_manager = initialize_camera_manager(camera_config)
             camera_status = camera_manager.get_status()
             
+            # Enforce retention_days / max_storage_gb in the background
+            camera_manager.start_retention(on_delete=clear_deleted_image_references)
+            
             if camera_status['available']:
                 print(f"[DEBUG] ✅ Camera initialized successfully!")
                 print(f"[DEBUG]    Type: {camera_status['type']}")
@@ -1046,10 +1196,114 @@ def init_system():
             print("[DEBUG] 🔧 Continuing without camera (non-critical)...")
             camera_manager = None
 
+def start_hardware_client():
+    """Web worker: mirror the hardware controller's state and relay its events"""
+    global hardware_client
+    
+    def relay_event(payload):
+        # With a message queue the controller already emitted to every worker
+        if not broadcaster.distributed:
+            broadcaster.publish(payload)
+    
+    def relay_emit(name, payload, room):
+        if not broadcaster.distributed:
+            broadcaster.emit_to_room(name, payload, room)
+    
+    hardware_client = ControllerClient(Config.CONTROLLER_SOCKET, on_event=relay_event, on_emit=relay_emit)
+    hardware_client.start()
+    if hardware_client.wait_for_state(timeout=2.0):
+        print(f"[DEBUG] ✅ Connected to hardware controller at {Config.CONTROLLER_SOCKET}")
+    else:
+        print(f"[WARNING] ⚠️ Hardware controller not reachable at {Config.CONTROLLER_SOCKET} - retrying in background")
+
+def reload_hardware_settings():
+    """Re-read the settings the hardware loops keep in memory (timer duration, business hours)"""
+    global timer_duration
+    with app.app_context():
+        timer_setting = Setting.query.filter_by(key='timer_duration').first()
+        if timer_setting:
+            timer_duration = int(timer_setting.value)
+    if anomaly_rules is not None:
+        anomaly_rules.invalidate_settings()
+    return True
+
+def door_event_latency_stats():
+    """Door event trace statistics from the process that runs the door monitor"""
+    if hardware_client is not None:
+        try:
+            return hardware_client.command('trace_stats', timeout=1.0)
+        except ControllerUnavailable as e:
+            return {'error': f"Hardware controller unavailable: {e}"}
+    return event_tracer.get_stats()
+
+def notify_settings_changed():
+    """Settings were saved: refresh cached copies in the process owning the hardware"""
+    if hardware_client is not None:
+        try:
+            hardware_client.command('settings_changed', timeout=1.0)
+        except ControllerUnavailable as e:
+            print(f"[SETTINGS] ⚠️ Could not notify the hardware controller ({e}) - applied on its next door event")
+    elif anomaly_rules is not None:
+        anomaly_rules.invalidate_settings()
+
+def clear_deleted_image_references(deleted_entries):
+    """
+    Retention callback: clear EventLog.image_path for images removed from disk.
+    image_hash and image_timestamp are kept so the audit record still shows a
+    capture existed and what its hash was.
+    """
+    event_ids = [entry.event_id for entry in deleted_entries if entry.event_id]
+    # Captures indexed from a directory scan have no event id - match by path
+    paths = [entry.path for entry in deleted_entries if not entry.event_id]
+    
+    try:
+        with app.app_context():
+            updated = 0
+            # Chunk IN() lists to stay under SQLite's bound-parameter limit
+            for i in range(0, len(event_ids), 500):
+                updated += EventLog.query.filter(EventLog.id.in_(event_ids[i:i + 500])).update(
+                    {EventLog.image_path: None}, synchronize_session=False)
+            for i in range(0, len(paths), 500):
+                updated += EventLog.query.filter(EventLog.image_path.in_(paths[i:i + 500])).update(
+                    {EventLog.image_path: None}, synchronize_session=False)
+            db.session.commit()
+            print(f"[RETENTION] 🗑️ Cleared image references on {updated} events")
+    except Exception as e:
+        print(f"[RETENTION ERROR] Failed to clear image references: {e}")
+        try:
+            db.session.rollback()
+        except Exception:
+            pass
+
 # ============================================================================
 # ANOMALY DETECTION SYSTEM
 # ============================================================================
 
+anomaly_rules = None
+
+def announce_anomaly(anomaly):
+    """Real-time alert for a detected anomaly (the row is written in the next batch)"""
+    print(f"[ANOMALY] 🚨 {anomaly['anomaly_type']}: {anomaly['description']}")
+    emit_to_stream('anomaly_detected', {
+        'type': anomaly['anomaly_type'],
+        'severity': anomaly['severity'],
+        'message': anomaly['message'],
+        'time': anomaly['detected_at'].strftime('%Y-%m-%d %H:%M:%S')
+    }, ANOMALY_ROOM)
+
+def get_anomaly_rules():
+    """Create the streaming anomaly rule engine and its writer on first use"""
+    global anomaly_rules
+    if anomaly_rules is None:
+        config = Config.ANOMALY_RULES_CONFIG
+        with app.app_context():
+            anomaly_rules = AnomalyRuleEngine(db.engine, rules=DEFAULT_WINDOW_RULES + list(config['extra_rules']),
+                                              settings_ttl=config['settings_ttl'],
+                                              flush_interval=config['flush_interval'],
+                                              batch_size=config['batch_size'], on_anomaly=announce_anomaly)
+        anomaly_rules.start()
+    return anomaly_rules
+
 def detect_anomalies(event_type, event_id=None):
     """
     Detect anomalous door access patterns and log them
@@ -1057,80 +1311,13 @@ def detect_anomalies(event_type, event_id=None):
     Anomaly types:
     1. odd_hours - Door accessed outside business hours
     2. repeated_opens - Multiple opens in short timeframe (3+ in 10 minutes)
-    3. prolonged_open - Door left open beyond threshold (2x timer duration)
+    3. prolonged_open - Door held open until the alarm triggered
+    plus any window rules in ANOMALY_RULES_CONFIG['extra_rules'].
+    Rules run on in-memory windows (see anomaly_rules.py); anomalies are
+    written in batches.
     """
     try:
-        with app.app_context():
-            # Get business hours setting (default 9-17 for 9am-5pm)
-            business_hours_start = 9
-            business_hours_end = 17
-            
-            # Check if there's a setting for business hours
-            bh_start_setting = Setting.query.filter_by(key='business_hours_start').first()
-            bh_end_setting = Setting.query.filter_by(key='business_hours_end').first()
-            
-            if bh_start_setting:
-                business_hours_start = int(bh_start_setting.value)
-            if bh_end_setting:
-                business_hours_end = int(bh_end_setting.value)
-            
-            current_hour = datetime.now().hour
-            current_time = datetime.now()
-            
-            # 1. Odd hours detection
-            if event_type == 'door_open':
-                if current_hour < business_hours_start or current_hour >= business_hours_end:
-                    anomaly = AnomalyDetection(
-                        event_id=event_id,
-                        anomaly_type='odd_hours',
-                        severity='medium',
-                        description=f'Door accessed outside business hours ({current_hour}:00 - Business hours: {business_hours_start}:00-{business_hours_end}:00)',
-                        detected_at=current_time
-                    )
-                    db.session.add(anomaly)
-                    db.session.commit()
-                    
-                    print(f"[ANOMALY] 🚨 Odd hours access detected at {current_hour}:00")
-                    
-                    # Emit WebSocket event for real-time alert
-                    socketio.emit('anomaly_detected', {
-                        'type': 'odd_hours',
-                        'severity': 'medium',
-                        'message': f'Door accessed outside business hours',
-                        'time': current_time.strftime('%Y-%m-%d %H:%M:%S')
-                    }, namespace='/events')
-            
-            # 2. Repeated opens detection (3+ opens in last 10 minutes)
-            if event_type == 'door_open':
-                ten_minutes_ago = current_time - timedelta(minutes=10)
-                recent_opens = EventLog.query.filter(
-                    EventLog.event_type == 'door_open',
-                    EventLog.timestamp >= ten_minutes_ago
-                ).count()
-                
-                if recent_opens >= 3:  # Including current event
-                    anomaly = AnomalyDetection(
-                        event_id=event_id,
-                        anomaly_type='repeated_opens',
-                        severity='high',
-                        description=f'Repeated door access detected: {recent_opens} opens in last 10 minutes',
-                        detected_at=current_time
-                    )
-                    db.session.add(anomaly)
-                    db.session.commit()
-                    
-                    print(f"[ANOMALY] 🚨 Repeated opens: {recent_opens} times in 10 minutes")
-                    
-                    socketio.emit('anomaly_detected', {
-                        'type': 'repeated_opens',
-                        'severity': 'high',
-                        'message': f'{recent_opens} door opens in 10 minutes',
-                        'time': current_time.strftime('%Y-%m-%d %H:%M:%S')
-                    }, namespace='/events')
-            
-            # 3. Prolonged open detection (handled in alarm_timer when alarm triggers)
-            # This will be called from alarm_timer when alarm is triggered
-            
+        get_anomaly_rules().evaluate(event_type, event_id, threshold=timer_duration)
     except Exception as e:
         print(f"[ERROR] Anomaly detection failed: {e}")
         import traceback
@@ -1141,6 +1328,7 @@ def monitor_door():
     global door_open, alarm_active, timer_active, timer_duration, timer_thread, shutdown_flag
     last_gpio_state = None
     state_change_time = 0
+    edge_time = time.monotonic()  # Latency trace start of the pending state change
     
     print("[DEBUG] 🚪 Door monitoring loop started")
     
@@ -1152,6 +1340,7 @@ def monitor_door():
         return
     
     while not shutdown_flag.is_set():
+        door_flap.poll()  # Summarize a flapping episode once the door settles
         try:
             if os.environ.get('TESTING'):
                 time.sleep(1)  # Don't monitor in testing mode
@@ -1173,6 +1362,7 @@ def monitor_door():
             if current_gpio_state != last_gpio_state:
                 print(f"[DEBUG] 🚪 Door state change detected: {last_gpio_state} -> {current_gpio_state}")
                 state_change_time = time.time()
+                edge_time = time.monotonic()
                 last_gpio_state = current_gpio_state
                 continue
                 
@@ -1192,17 +1382,13 @@ def monitor_door():
         door_is_open = current_gpio_state
 
         if door_is_open and not door_open:
-            # Door just opened - check minimum time between events
-            global last_door_event_time
+            # Door just opened
             current_time = time.time()
-            if current_time - last_door_event_time < 1.0:  # Minimum 1 second between door events
-                print(f"[DEBUG] Door event too soon after last event, ignoring (time since last: {current_time - last_door_event_time:.3f}s)")
-                continue
-                
+            trace_id = event_tracer.start(edge_at=edge_time)
+            event_tracer.mark(trace_id, 'debounced')
             door_open = True
             alarm_active = False
             timer_active = True
-            last_door_event_time = current_time
             
             # Ensure proper LED states when door opens
             safe_gpio_output(16, GPIO.LOW, "(White LED - ensure alarm off)")
@@ -1225,7 +1411,8 @@ def monitor_door():
             print(f"  ├─ Global timer_duration: {timer_duration} seconds")
             print(f"  ├─ Current Time: {current_time}")
             print(f"  └─ Will trigger alarm at: {current_time + current_timer_duration}")
-            log_event('door_open', 'Door opened')
+            if not door_flap.transition(True, trace_id=trace_id):
+                print("[DEBUG] 🚪 Door flapping - open counted into summary")
             
             # Improved timer thread management with proper cleanup
             if timer_thread and timer_thread.is_alive():
@@ -1244,18 +1431,13 @@ def monitor_door():
             print(f"[DEBUG] 🔍 Verification - Thread args: {timer_thread._args}")
             
         elif not door_is_open and door_open:
-            # Door just closed - check minimum time between events
-            current_time = time.time()
-            if current_time - last_door_event_time < 1.0:  # Minimum 1 second between door events
-                print(f"[DEBUG] Door event too soon after last event, ignoring (time since last: {current_time - last_door_event_time:.3f}s)")
-                continue
-                
             # Door closed - immediately stop all timers and alarms
             print(f"[DEBUG] 🚪 Door closed - stopping all timers and alarms")
+            trace_id = event_tracer.start(edge_at=edge_time)
+            event_tracer.mark(trace_id, 'debounced')
             door_open = False
             alarm_active = False
             timer_active = False  # This signals the timer thread to stop immediately
-            last_door_event_time = current_time
             
             # Turn off red LED and deactivate alarm (white LED + audio linked)
             safe_gpio_output(13, GPIO.LOW, "(Red LED - door closed)")
@@ -1264,7 +1446,8 @@ def monitor_door():
             deactivate_alarm_led_and_audio()
             
             print("[DEBUG] ✅ Door closed. Timer and alarm deactivated.")
-            log_event('door_close', 'Door closed')
+            if not door_flap.transition(False, trace_id=trace_id):
+                print("[DEBUG] 🚪 Door flapping - close counted into summary")
         time.sleep(0.1)
         
     print("[DEBUG] 🚪 Door monitoring thread exiting...")
@@ -1361,34 +1544,7 @@ def alarm_timer(duration):
         # Activate alarm: white LED ON + audio playing (linked together)
         activate_alarm_led_and_audio()
         
-        log_event('alarm_triggered', f'Alarm triggered after {duration} seconds')
-        
-        # Detect prolonged open anomaly
-        with app.app_context():
-            try:
-                # Get the alarm event that was just logged
-                alarm_event = EventLog.query.filter_by(event_type='alarm_triggered').order_by(EventLog.timestamp.desc()).first()
-                if alarm_event:
-                    anomaly = AnomalyDetection(
-                        event_id=alarm_event.id,
-                        anomaly_type='prolonged_open',
-                        severity='high',
-                        description=f'Door left open for {duration} seconds (exceeded threshold)',
-                        detected_at=datetime.now()
-                    )
-                    db.session.add(anomaly)
-                    db.session.commit()
-                    
-                    print(f"[ANOMALY] 🚨 Prolonged open detected: {duration}s")
-                    
-                    socketio.emit('anomaly_detected', {
-                        'type': 'prolonged_open',
-                        'severity': 'high',
-                        'message': f'Door open for {duration} seconds',
-                        'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    }, namespace='/events')
-            except Exception as e:
-                print(f"[ERROR] Failed to log prolonged_open anomaly: {e}")
+        log_event('alarm_triggered', f'Alarm triggered after {duration} seconds')  # Also raises prolonged_open
         
         send_alarm_email(duration)
         
@@ -1416,7 +1572,7 @@ def alarm_timer(duration):
     
     print(f"[DEBUG] Timer thread ending - Final state: timer_active={timer_active}, alarm_active={alarm_active}")
 
-def log_event(event_type, description):
+def log_event(event_type, description, dedup=True, trace_id=None):
     from pytz import timezone
     import uuid
     global door_open, alarm_active, last_logged_door_state, last_logged_alarm_state, last_event_timestamps, event_counter
@@ -1435,7 +1591,7 @@ def log_event(event_type, description):
         print(f"[DEBUG] log_event #{call_id} [{event_id}]: {event_type} - {description}")
         
         # Single time-based duplicate prevention (simpler and more reliable)
-        if event_key in last_event_timestamps:
+        if dedup and event_key in last_event_timestamps:
             time_diff = current_time - last_event_timestamps[event_key]
             if time_diff < 2.0:  # Prevent duplicates within 2 seconds
                 print(f"[DEBUG] *** DUPLICATE PREVENTED [{event_id}] ***: {event_type} (time_diff: {time_diff:.3f}s)")
@@ -1462,8 +1618,10 @@ def log_event(event_type, description):
                 ist = timezone('Asia/Kolkata')
                 now_ist = datetime.now(ist)
                 event = EventLog(event_type=event_type, description=description, timestamp=now_ist)
-                db.session.add(event)
-                db.session.commit()
+                with metrics.timer('ingest_stage_seconds', stage='db_commit'):
+                    db.session.add(event)
+                    db.session.commit()
+                event_tracer.mark(trace_id, 'db_commit')
                 
                 print(f"[DEBUG] ✅ DB COMMIT SUCCESS [{event_id}]: {event_type} -> DB")
                 
@@ -1478,7 +1636,8 @@ def log_event(event_type, description):
                     
                     if should_capture:
                         print(f"[DEBUG] 📸 Attempting to capture image for {event_type}...")
-                        capture_result = capture_event_image(event_type=event_type, event_id=event.id)
+                        with metrics.timer('ingest_stage_seconds', stage='camera'):
+                            capture_result = capture_event_image(event_type=event_type, event_id=event.id)
                         
                         if capture_result and capture_result.get('success'):
                             # Update event record with image info
@@ -1501,12 +1660,13 @@ def log_event(event_type, description):
                 try:
                     from blockchain_helper import add_blockchain_event
                     user_id = current_user.id if hasattr(current_user, 'id') and current_user.is_authenticated else None
-                    blockchain_block = add_blockchain_event(
-                        event_type=event_type,
-                        description=description,
-                        user_id=user_id,
-                        ip_address=request.remote_addr if request else None
-                    )
+                    with metrics.timer('ingest_stage_seconds', stage='blockchain'):
+                        blockchain_block = add_blockchain_event(
+                            event_type=event_type,
+                            description=description,
+                            user_id=user_id,
+                            ip_address=request.remote_addr if request else None
+                        )
                     print(f"[DEBUG] ✅ BLOCKCHAIN COMMIT SUCCESS [{event_id}]: Block #{blockchain_block.block_index}")
                 except Exception as blockchain_error:
                     # Don't fail the entire event if blockchain fails
@@ -1514,16 +1674,18 @@ def log_event(event_type, description):
                 
                 # Run anomaly detection for door events
                 if event_type in ['door_open', 'door_close', 'alarm_triggered']:
-                    detect_anomalies(event_type, event.id)
+                    with metrics.timer('ingest_stage_seconds', stage='anomaly'):
+                        detect_anomalies(event_type, event.id)
                 
                 # AI ANALYSIS - Analyze event with AI Security Engine
                 try:
-                    ai_analysis = analyze_event_with_ai({
-                        'timestamp': now_ist,
-                        'event_type': event_type,
-                        'description': description,
-                        'event_id': event.id
-                    })
+                    with metrics.timer('ingest_stage_seconds', stage='ai'):
+                        ai_analysis = analyze_event_with_ai({
+                            'timestamp': now_ist,
+                            'event_type': event_type,
+                            'description': description,
+                            'event_id': event.id
+                        })
                     print(f"[AI] ✅ Event analyzed:")
                     print(f"[AI]    Anomaly: {ai_analysis['anomaly_detected']} ({ai_analysis['anomaly_confidence']}%)")
                     print(f"[AI]    Threat Level: {ai_analysis['threat_level']} ({ai_analysis['threat_confidence']}%)")
@@ -1541,6 +1703,7 @@ def log_event(event_type, description):
                 
                 # Refresh event from database to get updated image fields
                 db.session.refresh(event)
+                event_tracer.mark(trace_id, 'enriched')
                 
                 # Get updated statistics (in same transaction)
                 total_events = EventLog.query.count()
@@ -1554,10 +1717,11 @@ def log_event(event_type, description):
                 
                 # Prepare real-time status payload
                 last_event = EventLog.query.order_by(EventLog.timestamp.desc()).first()
+                state = hardware_state()
                 payload = {
                     'event': event.to_dict(),
-                    'door_status': 'Open' if door_open else 'Closed',
-                    'alarm_status': 'Active' if alarm_active else 'Inactive',
+                    'door_status': 'Open' if state.get('door_open') else 'Closed',
+                    'alarm_status': 'Active' if state.get('alarm_active') else 'Inactive',
                     'timer_set': timer_set,
                     'last_event': last_event.to_dict() if last_event else None,
                     'statistics': {
@@ -1568,14 +1732,8 @@ def log_event(event_type, description):
                     },
                     'event_id': event_id  # Add tracking ID
                 }
-                
-                print(f"[DEBUG] Broadcasting WebSocket [{event_id}]: {event_type}")
-                print(f"[DEBUG] Event data being broadcast:")
-                print(f"[DEBUG]   - ID: {event.id}")
-                print(f"[DEBUG]   - Type: {event.event_type}")
-                print(f"[DEBUG]   - Image Path: {event.image_path}")
-                print(f"[DEBUG]   - Image Hash: {event.image_hash[:16] if event.image_hash else 'None'}...")
-                print(f"[DEBUG]   - Full event dict: {payload['event']}")
+                if trace_id:
+                    payload['event']['trace_id'] = trace_id  # Acknowledged by the browser
                 
                 # Broadcast event to all connected clients
                 broadcast_event(payload)
@@ -1590,7 +1748,34 @@ def log_event(event_type, description):
             except:
                 pass
 
+# ==================== OUTBOUND EMAIL QUEUE ====================
+email_outbox = None
+
+def email_smtp_settings():
+    """SMTP settings for the outbox sender, or None while email is not configured"""
+    with app.app_context():
+        email_config = EmailConfig.query.first()
+        if not email_config or not email_config.is_configured:
+            return None
+        return {
+            'host': Config.MAIL_SERVER,
+            'port': Config.MAIL_PORT,
+            'starttls': Config.MAIL_USE_TLS,
+            'username': email_config.sender_email if Config.MAIL_USE_AUTH else None,
+            'password': email_config.app_password
+        }
+
+def get_email_outbox():
+    """Create and start the outbound email sender on first use"""
+    global email_outbox
+    if email_outbox is None:
+        email_outbox = EmailOutbox(db.engine, email_smtp_settings, **Config.EMAIL_OUTBOX_CONFIG)
+        email_outbox.start()
+        print(f"[EMAIL] ✅ Outbox sender started ({Config.MAIL_SERVER}:{Config.MAIL_PORT})")
+    return email_outbox
+
 def send_alarm_email(duration):
+    """Queue the alarm alert email for all configured recipients"""
     try:
         print(f"[DEBUG] Attempting to send alarm email for duration: {duration}s")
         
@@ -1640,28 +1825,13 @@ Advanced Door Security & Monitoring Systems
             
             msg.attach(MIMEText(body, 'plain'))
             
-            print("[DEBUG] Connecting to Gmail SMTP...")
-            server = smtplib.SMTP('smtp.gmail.com', 587)
-            server.starttls()
-            
-            print("[DEBUG] Attempting login...")
-            server.login(email_config.sender_email, email_config.app_password)
-            
-            print(f"[DEBUG] Sending email to {len(recipients)} recipients...")
-            text = msg.as_string()
-            server.sendmail(email_config.sender_email, recipients, text)
-            server.quit()
+            # Delivered by the outbox sender; the alarm timer never waits on SMTP
+            email_id = get_email_outbox().enqueue(msg.as_string(), email_config.sender_email, recipients,
+                                                  subject=msg['Subject'], category='alarm', priority=10)
+            print(f"[SUCCESS] Alarm email #{email_id} queued for: {', '.join(recipients)}")
             
-            print(f"[SUCCESS] Alarm email sent successfully to: {', '.join(recipients)}")
-            
-    except smtplib.SMTPAuthenticationError as e:
-        error_msg = f"SMTP Authentication failed - check email credentials: {e}"
-        print(f"[ERROR] {error_msg}")
-    except smtplib.SMTPException as e:
-        error_msg = f"SMTP error occurred: {e}"
-        print(f"[ERROR] {error_msg}")
     except Exception as e:
-        error_msg = f"Email sending failed with unexpected error: {e}"
+        error_msg = f"Queueing alarm email failed: {e}"
         print(f"[ERROR] {error_msg}")
 
 # Flask-Login user loader
@@ -2087,6 +2257,16 @@ def training_reports():
     users = User.query.filter_by(is_active=True).all()
     modules = TrainingModule.query.filter_by(is_active=True).all()
     
+    # Latest record per (user, module), loaded in one query
+    latest_records = {}
+    if users and modules:
+        records = TrainingRecord.query.filter(
+            TrainingRecord.user_id.in_([user.id for user in users]),
+            TrainingRecord.module_id.in_([module.id for module in modules])
+        ).order_by(TrainingRecord.completed_date.desc()).all()
+        for record in records:
+            latest_records.setdefault((record.user_id, record.module_id), record)
+    
     # Build user training matrix
     user_training = []
     for user in users:
@@ -2099,10 +2279,7 @@ def training_reports():
         }
         
         for module in modules:
-            record = TrainingRecord.query.filter_by(
-                user_id=user.id,
-                module_id=module.id
-            ).order_by(TrainingRecord.completed_date.desc()).first()
+            record = latest_records.get((user.id, module.id))
             
             if record:
                 user_data['records'].append({
@@ -3790,8 +3967,9 @@ def dashboard():
     permissions = current_user.permissions.split(',') if current_user.permissions else ['dashboard']
     
     # Get system status
-    door_status = "Open" if door_open else "Closed"
-    alarm_status = "Active" if alarm_active else "Inactive"
+    state = hardware_state()
+    door_status = "Open" if state.get('door_open') else "Closed"
+    alarm_status = "Active" if state.get('alarm_active') else "Inactive"
     timer_set = Setting.query.filter_by(key='timer_duration').first().value
     
     # Get event counts
@@ -3821,16 +3999,117 @@ def dashboard():
         uptime=uptime_data
     )
 
+def metrics_process_label():
+    """'process' label of this process's metrics series"""
+    if controller_server is not None:
+        return 'controller'
+    if hardware_client is not None or not Config.HARDWARE_OWNER:
+        return f"web-{os.getpid()}"
+    return 'main'
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """
+    Performance metrics in Prometheus text format
+
+    Unauthenticated for scrapers, so only served to the addresses in
+    METRICS_CONFIG['allowed_ips'] (the direct peer; forwarded headers are
+    not trusted here). Every series carries a 'process' label; web workers
+    merge in the hardware controller's series (event ingestion stages), as
+    the controller serves no HTTP.
+    """
+    if not is_ip_in_list(request.remote_addr, Config.METRICS_CONFIG['allowed_ips']):
+        abort(404)
+    others = []
+    if hardware_client is not None:
+        try:
+            others.append(('controller', hardware_client.command('metrics', timeout=2.0)))
+        except ControllerUnavailable:
+            metrics.inc('controller_scrape_errors_total')
+    return Response(metrics.render_prometheus(process=metrics_process_label(), others=others),
+                    mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/api/admin/metrics')
+@login_required
+def admin_metrics():
+    """Performance metrics summary (latency percentiles, SQL, ingestion stages) for the admin page"""
+    if not current_user.is_admin:
+        return jsonify({'success': False, 'message': 'Admin access required'}), 403
+    result = {'success': True, 'pid': os.getpid(), 'process': metrics_process_label(),
+              'metrics': metrics.summary(), 'door_event_latency': door_event_latency_stats()}
+    if hardware_client is not None:
+        try:
+            result['controller_metrics'] = hardware_client.command('metrics', summary=True, timeout=2.0)
+        except ControllerUnavailable as e:
+            result['controller_metrics'] = {'error': f"Hardware controller unavailable: {e}"}
+    return jsonify(result)
+
+@app.route('/admin/slow-queries')
+@login_required
+def admin_slow_queries():
+    """Slow query log ranked by total time, mean time or count"""
+    if not current_user.is_admin:
+        return redirect(url_for('dashboard'))
+    sort = request.args.get('sort', 'total')
+    if sort not in SLOW_QUERY_SORT_KEYS:
+        sort = 'total'
+    return render_template('admin_slow_queries.html', queries=slow_query_log.report(sort=sort),
+                           stats=slow_query_log.get_stats(), sort=sort, sort_keys=SLOW_QUERY_SORT_KEYS)
+
+@app.route('/api/admin/slow-queries', methods=['GET', 'POST'])
+@login_required
+def api_slow_queries():
+    """Slow query log as JSON (?sort=total|mean|count|max&limit=N); POST clears it"""
+    if not current_user.is_admin:
+        return jsonify({'success': False, 'message': 'Admin access required'}), 403
+    if request.method == 'POST':
+        slow_query_log.reset()
+        return jsonify({'success': True})
+    sort = request.args.get('sort', 'total')
+    if sort not in SLOW_QUERY_SORT_KEYS:
+        return jsonify({'success': False, 'message': f"sort must be one of {', '.join(SLOW_QUERY_SORT_KEYS)}"}), 400
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify({'success': True, 'stats': slow_query_log.get_stats(),
+                    'queries': slow_query_log.report(sort=sort, limit=limit)})
+
+@app.route('/api/admin/report-cache', methods=['GET', 'POST'])
+@login_required
+def api_report_cache():
+    """Rendered report cache statistics; POST empties it (after editing report data by hand)"""
+    if not current_user.is_admin:
+        return jsonify({'success': False, 'message': 'Admin access required'}), 403
+    cache = get_report_job_manager().cache
+    if cache is None:
+        return jsonify({'success': True, 'enabled': False})
+    if request.method == 'POST':
+        removed = cache.purge()
+        log_event('report_cache_purged', f'Report cache purged by {current_user.username} ({removed} reports)')
+        return jsonify({'success': True, 'removed': removed})
+    return jsonify({'success': True, 'enabled': True, 'stats': cache.get_stats()})
+
 @app.route('/api/ai/stats')
 @login_required
 def get_ai_stats():
-    """Get AI security statistics"""
+    """
+    Get AI security statistics
+    
+    The engine serves a cached snapshot; its version (per process, as every
+    worker has its own engine) is the ETag, so polls from dashboards that
+    already have it get a bodyless 304.
+    """
     try:
         ai_stats = get_ai_dashboard_stats()
-        return jsonify({
-            'success': True,
-            'ai_stats': ai_stats
-        })
+        etag = f"ai-{os.getpid()}-{ai_stats.get('version', 0)}"
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = jsonify({
+                'success': True,
+                'ai_stats': ai_stats
+            })
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
     except Exception as e:
         return jsonify({
             'success': False,
@@ -4137,6 +4416,7 @@ def admin_settings():
         # Commit changes if any settings were updated
         if settings_updated:
             db.session.commit()
+            notify_settings_changed()
             
             # Log specific non-timer settings changes
             settings_changed = []
@@ -4286,6 +4566,34 @@ def manage_user(user_id):
         log_event('user_deleted', f'User {username} deleted by admin')
         return jsonify({'success': True})
 
+def following_door_closes(alarm_events):
+    """
+    Time of the first door_close after each alarm (None if the door has not
+    closed since), from one query instead of one per alarm
+
+    Args:
+        alarm_events: alarm_triggered EventLogs in ascending timestamp order
+    """
+    if not alarm_events:
+        return []
+    close_times = [row.timestamp for row in db.session.query(EventLog.timestamp).filter(
+        EventLog.timestamp > alarm_events[0].timestamp,
+        EventLog.event_type == 'door_close'
+    ).order_by(EventLog.timestamp.asc())]
+    following = []
+    for alarm_event in alarm_events:
+        index = bisect.bisect_right(close_times, alarm_event.timestamp)
+        following.append(close_times[index] if index < len(close_times) else None)
+    return following
+
+def daily_counts(events):
+    """
+    (YYYY-MM-DD, count) per day for EventLogs already loaded in ascending
+    timestamp order - the rows a date() GROUP BY would return
+    """
+    counts = Counter(event.timestamp.date().isoformat() for event in events)
+    return list(counts.items())
+
 @app.route('/analytics')
 @login_required
 def analytics():
@@ -4385,16 +4693,8 @@ def analytics():
     open_percentage = (open_time_total / total_monitoring_time * 100) if total_monitoring_time > 0 else 0
     closed_percentage = 100 - open_percentage
     
-    # Get daily open counts for the period
-    daily_opens = db.session.query(
-        func.date(EventLog.timestamp).label('date'),
-        func.count(EventLog.id).label('count')
-    ).filter(
-        and_(
-            EventLog.timestamp >= start_date,
-            EventLog.event_type == 'door_open'
-        )
-    ).group_by(func.date(EventLog.timestamp)).all()
+    # Get daily open counts for the period from the events loaded above
+    daily_opens = daily_counts(event for event in door_events if event.event_type == 'door_open')
     
     # ============================================
     # ALARM EVENT ANALYSIS
@@ -4428,19 +4728,12 @@ def analytics():
     compliant_events = 0
     non_compliant_events = 0
     
-    for alarm_event in alarm_events:
+    # Find the next door_close event after each alarm
+    for alarm_event, next_close_time in zip(alarm_events, following_door_closes(alarm_events)):
         alarm_time = alarm_event.timestamp
         
-        # Find the next door_close event after this alarm
-        next_close = EventLog.query.filter(
-            and_(
-                EventLog.timestamp > alarm_time,
-                EventLog.event_type == 'door_close'
-            )
-        ).order_by(EventLog.timestamp.asc()).first()
-        
-        if next_close:
-            alarm_duration = (next_close.timestamp - alarm_time).total_seconds()
+        if next_close_time:
+            alarm_duration = (next_close_time - alarm_time).total_seconds()
             alarm_durations.append(alarm_duration)
             mttr_durations.append(alarm_duration)
             
@@ -4469,15 +4762,7 @@ def analytics():
     avg_alarm_duration = sum(alarm_durations) / len(alarm_durations) if alarm_durations else 0
     
     # Calculate daily alarm counts for trend analysis
-    daily_alarms = db.session.query(
-        func.date(EventLog.timestamp).label('date'),
-        func.count(EventLog.id).label('count')
-    ).filter(
-        and_(
-            EventLog.timestamp >= start_date,
-            EventLog.event_type == 'alarm_triggered'
-        )
-    ).group_by(func.date(EventLog.timestamp)).all()
+    daily_alarms = daily_counts(alarm_events)
     
     # Weekly alarm comparison for reduction trend
     week_1_alarms = 0
@@ -4715,17 +5000,11 @@ def get_analytics_data():
     alarm_durations = []
     unacknowledged_alarms = 0
     
-    for alarm_event in alarm_events:
+    for alarm_event, next_close_time in zip(alarm_events, following_door_closes(alarm_events)):
         alarm_time = alarm_event.timestamp
-        next_close = EventLog.query.filter(
-            and_(
-                EventLog.timestamp > alarm_time,
-                EventLog.event_type == 'door_close'
-            )
-        ).order_by(EventLog.timestamp.asc()).first()
         
-        if next_close:
-            alarm_duration = (next_close.timestamp - alarm_time).total_seconds()
+        if next_close_time:
+            alarm_duration = (next_close_time - alarm_time).total_seconds()
             alarm_durations.append(alarm_duration)
             
             if alarm_duration > (alarm_threshold * 2):
@@ -4877,6 +5156,7 @@ def update_settings():
         # Update global variable for immediate effect
         global timer_duration
         timer_duration = int(new_value)
+        notify_settings_changed()
         
         return jsonify({'success': True})
     return jsonify({'error': 'Invalid setting'}), 400
@@ -4931,6 +5211,18 @@ def test_hooter_api():
     try:
         print("[API] 🔊 Hooter test requested by admin")
         
+        if hardware_client is not None:
+            # The siren belongs to the hardware controller process
+            try:
+                hardware_client.command('test_hooter')
+            except ControllerUnavailable as e:
+                return jsonify({'error': f'Hardware controller unavailable: {e}'}), 503
+            return jsonify({
+                'success': True,
+                'message': 'Hooter test started (2-second activation)',
+                'duration': '2 seconds'
+            })
+        
         # Run hooter test in background thread to avoid blocking
         def run_hooter_test():
             test_hooter()
@@ -4948,6 +5240,111 @@ def test_hooter_api():
         print(f"[ERROR] Hooter test failed: {e}")
         return jsonify({'error': str(e)}), 500
 
+# ==================== BACKGROUND REPORT JOBS ====================
+report_job_manager = None
+
+def report_job_payload(job):
+    """Job status with its polling and download links"""
+    payload = job.to_dict()
+    payload['status_url'] = f"/api/report/jobs/{job.id}"
+    payload['download_url'] = f"/api/report/jobs/{job.id}/download" if job.status == JOB_DONE else None
+    return payload
+
+def notify_report_job(job):
+    """Push job progress to the owner's sockets"""
+    socketio.emit('report_job', report_job_payload(job), to=user_room(job.owner_id), namespace='/events')
+
+def get_report_job_manager():
+    """Create the report job queue on first use"""
+    global report_job_manager
+    if report_job_manager is None:
+        # Worker processes open the database themselves; an in-memory
+        # database only exists here, so its jobs share this engine
+        in_memory = db.engine.url.database in (None, '', ':memory:')
+        source = db.engine if in_memory else db.engine.url.render_as_string(hide_password=False)
+        artifact_dir = os.path.join(app.instance_path, 'reports')
+        cache_max_mb = Config.REPORT_JOB_CONFIG['cache_max_mb']
+        cache = ReportCache(os.path.join(artifact_dir, 'cache'), cache_max_mb * 1024 * 1024) if cache_max_mb else None
+        report_job_manager = ReportJobManager(
+            artifact_dir,
+            source,
+            max_workers=Config.REPORT_JOB_CONFIG['workers'],
+            ttl=Config.REPORT_JOB_CONFIG['artifact_ttl'],
+            on_update=notify_report_job,
+            cache=cache
+        )
+        print(f"[REPORT] ✅ Report job queue ready ({report_job_manager.get_stats()['mode']} workers)")
+    return report_job_manager
+
+def build_report_params(user, report_format, start_date, end_date, event_types, report_type=None,
+                        render_mode=None):
+    """Report job params for a user (None = system), with their date/time format preferences"""
+    from models import UserPreference
+    
+    user_pref = UserPreference.query.filter_by(user_id=user.id).first() if user else None
+    date_format = user_pref.date_format if user_pref and user_pref.date_format else 'YYYY-MM-DD'
+    time_format = user_pref.time_format if user_pref and user_pref.time_format else '24h'
+    date_fmt, time_fmt = report_datetime_formats(date_format, time_format)
+    return {
+        'format': report_format,
+        'start_date': start_date,
+        'end_date': end_date,
+        'event_types': sorted(event_types or []),
+        # Only the compliance audit adds content; any other type is the standard
+        # audit report, so 'summary' schedules share cache entries with /reports
+        'report_type': report_type if report_type == 'compliance_audit' else None,
+        'render_mode': render_mode or 'auto',
+        'render_workers': Config.REPORT_JOB_CONFIG['render_processes'],
+        'date_fmt': date_fmt,
+        'time_fmt': time_fmt,
+        'static_root': os.path.join(app.root_path, 'static'),
+        'generated_by': {
+            'username': user.username,
+            'full_name': user.full_name,
+            'employee_id': user.employee_id,
+            'department': user.department
+        } if user else {}
+    }
+
+def get_own_report_job(job_id):
+    """Look up a job the current user may see (owner or administrator)"""
+    job = get_report_job_manager().get(job_id)
+    if job is None or (job.owner_id != current_user.id and not current_user.is_admin):
+        return None
+    return job
+
+@app.route('/api/report/jobs/<job_id>')
+@login_required
+def report_job_status(job_id):
+    job = get_own_report_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Report job not found or expired'}), 404
+    return jsonify(report_job_payload(job))
+
+@app.route('/api/report/jobs/<job_id>/download')
+@login_required
+def report_job_download(job_id):
+    job = get_own_report_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Report job not found or expired'}), 404
+    if job.status != JOB_DONE:
+        return jsonify({'error': f'Report is not ready (status: {job.status})', 'status': job.status}), 409
+    return send_file(job.path, mimetype=job.mimetype, as_attachment=True, download_name=job.filename)
+
+def stream_csv_report(params):
+    """Stream a CSV export as text/csv, gzip-compressed when the client accepts it"""
+    context, events = stream_report(db.engine, params)
+    chunks = iter_csv(context, events, params)
+    headers = {
+        'Content-Disposition': f'attachment; filename="eDOMOS_Report_{params["start_date"]}_to_{params["end_date"]}.csv"',
+        'X-Accel-Buffering': 'no'  # Let nginx pass chunks through as they are produced
+    }
+    if 'gzip' in request.accept_encodings:
+        chunks = gzip_chunks(chunks)
+        headers['Content-Encoding'] = 'gzip'
+        headers['Vary'] = 'Accept-Encoding'
+    return Response(chunks, mimetype='text/csv', headers=headers)
+
 @app.route('/api/report', methods=['POST'])
 @login_required
 def generate_report():
@@ -4966,773 +5363,55 @@ def generate_report():
         end_date = datetime.strptime(data['end_date'], '%Y-%m-%d') + timedelta(days=1)
         event_types = data.get('event_types', [])
         
-        query = EventLog.query.filter(EventLog.timestamp.between(start_date, end_date))
-        if event_types:
-            query = query.filter(EventLog.event_type.in_(event_types))
-            
-        events = query.all()
-        
-        # Get company and system info (used by all export formats)
-        company_profile = CompanyProfile.query.first()
-        door_system_info = DoorSystemInfo.query.first()
-        
         # Load user preferences for date/time formatting
         user_pref = UserPreference.query.filter_by(user_id=current_user.id).first()
         date_format = user_pref.date_format if user_pref and user_pref.date_format else 'YYYY-MM-DD'
         time_format = user_pref.time_format if user_pref and user_pref.time_format else '24h'
-        
-        # Create format mapping for Python strftime
-        date_format_map = {
-            'YYYY-MM-DD': '%Y-%m-%d',
-            'DD/MM/YYYY': '%d/%m/%Y',
-            'MM/DD/YYYY': '%m/%d/%Y',
-            'DD-MM-YYYY': '%d-%m-%Y'
-        }
-        time_format_map = {
-            '24h': '%H:%M:%S',
-            '12h': '%I:%M:%S %p'
-        }
-        
-        date_fmt = date_format_map.get(date_format, '%Y-%m-%d')
-        time_fmt = time_format_map.get(time_format, '%H:%M:%S')
+        date_fmt, time_fmt = report_datetime_formats(date_format, time_format)
         datetime_fmt = f"{date_fmt} {time_fmt}"
         
-        # For CSV
-        if data.get('format') == 'csv':
-            import csv
-            from io import StringIO
-            
-            output = StringIO()
-            writer = csv.writer(output)
-            
-            # Add metadata header
-            writer.writerow(['# eDOMOS Security Report - CSV Export'])
-            writer.writerow([f'# Generated: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}'])
-            writer.writerow([f'# Generated By: {current_user.full_name if current_user.full_name else current_user.username}'])
-            
-            if company_profile and company_profile.company_name:
-                writer.writerow([f'# Company: {company_profile.company_name}'])
-            
-            if door_system_info:
-                if door_system_info.door_location:
-                    writer.writerow([f'# Door Location: {door_system_info.door_location}'])
-                if door_system_info.device_serial_number:
-                    writer.writerow([f'# Device S/N: {door_system_info.device_serial_number}'])
-            
-            writer.writerow([f'# Report Period: {data.get("start_date")} to {data.get("end_date")}'])
-            writer.writerow(['#'])
-            
-            # Data header with additional fields
-            headers = ['ID', 'Event Type', 'Description', 'Timestamp']
-            if current_user.employee_id:
-                headers.append('Logged By ID')
-            if door_system_info and door_system_info.door_location:
-                headers.append('Location')
-            
-            writer.writerow(headers)
-            
-            # Event data
-            for event in events:
-                # Format timestamp using user preference
-                formatted_timestamp = event.timestamp.strftime(datetime_fmt)
-                row = [event.id, event.event_type, event.description, formatted_timestamp]
-                if current_user.employee_id:
-                    row.append(current_user.employee_id)
-                if door_system_info and door_system_info.door_location:
-                    row.append(door_system_info.door_location)
-                writer.writerow(row)
-                
-            output.seek(0)
-            return jsonify({'csv_data': output.getvalue()})
+        # PDF (and CSV on request) is generated by a background report job
+        if data.get('format') in ('csv', 'pdf'):
+            params = build_report_params(current_user, data['format'], data['start_date'], data['end_date'],
+                                         event_types, data.get('report_type'), data.get('render_mode'))
+            # CSV streams straight to the client in constant memory
+            if data['format'] == 'csv' and not data.get('async'):
+                return stream_csv_report(params)
+            
+            manager = get_report_job_manager()
+            job, created = manager.submit(params, current_user.id)
+            
+            # Async clients poll the status URL (or listen for 'report_job') and download when done
+            if data.get('async'):
+                response = report_job_payload(job)
+                response['deduplicated'] = not created
+                return jsonify(response), 202
+            
+            # Legacy clients get the finished report inline if it is ready within
+            # sync_timeout (well below proxy timeouts); otherwise they get the job to poll
+            manager.wait(job.id, timeout=Config.REPORT_JOB_CONFIG['sync_timeout'])
+            if job.status == JOB_FAILED:
+                print(f"[REPORT] ❌ Report job {job.id} failed: {job.error}")
+                return jsonify({'error': f"{data['format'].upper()} generation failed: {job.error}"}), 500
+            if job.status != JOB_DONE:
+                response = report_job_payload(job)
+                response['deduplicated'] = not created
+                return jsonify(response), 202
+            import base64
+            with open(job.path, 'rb') as f:
+                return jsonify({'pdf_data': base64.b64encode(f.read()).decode()})
         
-        # For PDF - INDUSTRIAL-GRADE AUDIT-READY DESIGN
-        elif data.get('format') == 'pdf':
-            try:
-                from reportlab.lib.pagesizes import A4
-                from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak, KeepTogether
-                from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-                from reportlab.lib.units import inch, mm
-                from reportlab.lib import colors
-                from reportlab.platypus.flowables import HRFlowable
-                from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT, TA_JUSTIFY
-                from reportlab.pdfgen import canvas
-                from io import BytesIO
-                import base64
-            except ImportError as e:
-                return jsonify({'error': f'PDF generation libraries not available: {str(e)}'}), 500
-            
-            # ==================== PROFESSIONAL HEADER/FOOTER TEMPLATE ====================
-            class AuditReportTemplate(SimpleDocTemplate):
-                def __init__(self, *args, **kwargs):
-                    self.report_data = kwargs.pop('report_data', {})
-                    self.company_profile = kwargs.pop('company_profile', None)
-                    self.door_system_info = kwargs.pop('door_system_info', None)
-                    SimpleDocTemplate.__init__(self, *args, **kwargs)
-                
-                def afterPage(self):
-                    """Add header and footer to each page"""
-                    self.handle_pageBegin()
-                    canvas_obj = self.canv
-                    
-                    # Define colors
-                    primary_blue = colors.HexColor('#0066CC')
-                    dark_gray = colors.HexColor('#1A1A1A')
-                    medium_gray = colors.HexColor('#555555')
-                    light_gray = colors.HexColor('#CCCCCC')
-                    
-                    # PAGE HEADER (top of every page)
-                    canvas_obj.saveState()
-                    
-                    # Top border - Bold blue line
-                    canvas_obj.setStrokeColor(primary_blue)
-                    canvas_obj.setLineWidth(3)
-                    canvas_obj.line(self.leftMargin, A4[1] - 0.6*inch, A4[0] - self.rightMargin, A4[1] - 0.6*inch)
-                    
-                    # Company/System name (top left)
-                    canvas_obj.setFont('Helvetica-Bold', 9)
-                    canvas_obj.setFillColor(dark_gray)
-                    canvas_obj.drawString(self.leftMargin, A4[1] - 0.5*inch, "eDOMOS SECURITY SYSTEM")
-                    
-                    # Document ID and Classification (top right)
-                    canvas_obj.setFont('Helvetica', 7)
-                    canvas_obj.setFillColor(medium_gray)
-                    doc_id = f"DOC-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
-                    canvas_obj.drawRightString(A4[0] - self.rightMargin, A4[1] - 0.45*inch, f"Document ID: {doc_id}")
-                    canvas_obj.drawRightString(A4[0] - self.rightMargin, A4[1] - 0.55*inch, "Classification: CONFIDENTIAL")
-                    
-                    # PAGE FOOTER (bottom of every page)
-                    
-                    # Bottom border - Thin gray line
-                    canvas_obj.setStrokeColor(light_gray)
-                    canvas_obj.setLineWidth(0.5)
-                    canvas_obj.line(self.leftMargin, 0.75*inch, A4[0] - self.rightMargin, 0.75*inch)
-                    
-                    # Footer left: System info and company name
-                    canvas_obj.setFont('Helvetica', 7)
-                    canvas_obj.setFillColor(medium_gray)
-                    
-                    # Show company name if available
-                    footer_line1 = "eDOMOS Door Monitoring System"
-                    if self.company_profile and self.company_profile.company_name:
-                        footer_line1 = self.company_profile.company_name
-                    
-                    footer_line2 = f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-                    if self.door_system_info and self.door_system_info.door_location:
-                        footer_line2 = f"{self.door_system_info.door_location} | {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-                    
-                    canvas_obj.drawString(self.leftMargin, 0.6*inch, footer_line1)
-                    canvas_obj.drawString(self.leftMargin, 0.5*inch, footer_line2)
-                    
-                    # Footer center: Security notice
-                    canvas_obj.setFont('Helvetica-Oblique', 7)
-                    canvas_obj.drawCentredString(A4[0]/2, 0.6*inch, "SECURITY AUDIT REPORT")
-                    canvas_obj.drawCentredString(A4[0]/2, 0.5*inch, "This document contains confidential information")
-                    
-                    # Footer right: Page number
-                    canvas_obj.setFont('Helvetica-Bold', 8)
-                    canvas_obj.setFillColor(dark_gray)
-                    page_text = f"Page {canvas_obj.getPageNumber()}"
-                    canvas_obj.drawRightString(A4[0] - self.rightMargin, 0.55*inch, page_text)
-                    
-                    canvas_obj.restoreState()
-            
-            buffer = BytesIO()
-            
-            # Page Setup: A4, Portrait, optimized margins for printing
-            doc = AuditReportTemplate(
-                buffer, 
-                pagesize=A4,
-                rightMargin=0.75*inch,
-                leftMargin=0.75*inch,
-                topMargin=1*inch,
-                bottomMargin=1*inch,
-                title=f"eDOMOS Security Audit Report - {data.get('start_date')} to {data.get('end_date')}",
-                author="eDOMOS Security System",
-                subject="Door Monitoring Security Audit Report",
-                report_data={'start_date': data.get('start_date'), 'end_date': data.get('end_date')},
-                company_profile=company_profile,
-                door_system_info=door_system_info
-            )
-            
-            # ==================== PROFESSIONAL COLOR PALETTE ====================
-            # Primary colors
-            primary_blue = colors.HexColor('#0066CC')
-            accent_teal = colors.HexColor('#00897B')
-            
-            # Text colors
-            dark_text = colors.HexColor('#1A1A1A')
-            medium_text = colors.HexColor('#424242')
-            light_text = colors.HexColor('#757575')
-            
-            # Background colors
-            header_bg = colors.HexColor('#E3F2FD')       # Light blue
-            header_accent = colors.HexColor('#BBDEFB')   # Darker blue
-            alt_row_bg = colors.HexColor('#F5F5F5')      # Light gray
-            highlight_bg = colors.HexColor('#FFF9C4')    # Light yellow for alerts
-            
-            # Status colors
-            status_success = colors.HexColor('#4CAF50')  # Green
-            status_warning = colors.HexColor('#FF9800')  # Orange
-            status_error = colors.HexColor('#F44336')    # Red
-            status_info = colors.HexColor('#2196F3')     # Blue
-            
-            # ==================== TYPOGRAPHY STYLES ====================
-            styles = getSampleStyleSheet()
-            
-            # Main Title - Bold, Large, Professional
-            main_title_style = ParagraphStyle(
-                'MainTitle',
-                parent=styles['Title'],
-                fontSize=24,
-                fontName='Helvetica-Bold',
-                textColor=primary_blue,
-                spaceAfter=6,
-                spaceBefore=8,
-                alignment=TA_CENTER,
-                leading=28
-            )
-            
-            # Subtitle - Document Type
-            doc_subtitle_style = ParagraphStyle(
-                'DocSubtitle',
-                parent=styles['Normal'],
-                fontSize=14,
-                fontName='Helvetica',
-                textColor=medium_text,
-                spaceAfter=20,
-                alignment=TA_CENTER,
-                leading=18
-            )
-            
-            # Section Header - For major sections
-            section_header_style = ParagraphStyle(
-                'SectionHeader',
-                parent=styles['Heading1'],
-                fontSize=14,
-                fontName='Helvetica-Bold',
-                textColor=dark_text,
-                spaceAfter=12,
-                spaceBefore=20,
-                alignment=TA_LEFT,
-                borderWidth=0,
-                borderColor=primary_blue,
-                borderPadding=0,
-                leftIndent=0,
-                leading=18
-            )
-            
-            # Stats Label (for summary boxes)
-            stats_label_style = ParagraphStyle(
-                'StatsLabel',
-                parent=styles['Normal'],
-                fontSize=9,
-                fontName='Helvetica',
-                textColor=light_text,
-                spaceAfter=2,
-                alignment=TA_LEFT,
-                leading=12
-            )
-            
-            # Stats Value (for summary boxes)
-            stats_value_style = ParagraphStyle(
-                'StatsValue',
-                parent=styles['Normal'],
-                fontSize=16,
-                fontName='Helvetica-Bold',
-                textColor=primary_blue,
-                spaceAfter=4,
-                alignment=TA_LEFT,
-                leading=20
-            )
-            
-            # Info Label (key-value pairs)
-            info_label_style = ParagraphStyle(
-                'InfoLabel',
-                parent=styles['Normal'],
-                fontSize=10,
-                fontName='Helvetica-Bold',
-                textColor=dark_text,
-                spaceAfter=0,
-                leading=14
-            )
-            
-            # Info Value (key-value pairs)
-            info_value_style = ParagraphStyle(
-                'InfoValue',
-                parent=styles['Normal'],
-                fontSize=10,
-                fontName='Helvetica',
-                textColor=medium_text,
-                spaceAfter=0,
-                leading=14
-            )
-            
-            # Table cell style
-            table_cell_style = ParagraphStyle(
-                'TableCell',
-                parent=styles['Normal'],
-                fontSize=9,
-                fontName='Helvetica',
-                textColor=dark_text,
-                alignment=TA_LEFT,
-                leading=12
-            )
-            
-            # Table header style
-            table_header_style = ParagraphStyle(
-                'TableHeader',
-                parent=styles['Normal'],
-                fontSize=9,
-                fontName='Helvetica-Bold',
-                textColor=dark_text,
-                alignment=TA_CENTER,
-                leading=12
-            )
-            
-            # ==================== BUILD PDF CONTENT ====================
-            story = []
-            
-            # Company profile and door system info already loaded above
-            
-            # ==================== TITLE PAGE SECTION ====================
-            story.append(Spacer(1, 0.2*inch))
-            
-            # Company Logo (if available)
-            if company_profile and company_profile.logo_path:
-                try:
-                    from reportlab.platypus import Image
-                    logo_path = os.path.join(app.root_path, 'static', company_profile.logo_path.lstrip('/static/'))
-                    if os.path.exists(logo_path):
-                        logo = Image(logo_path, width=1.5*inch, height=1.5*inch, kind='proportional')
-                        logo.hAlign = 'CENTER'
-                        story.append(logo)
-                        story.append(Spacer(1, 0.15*inch))
-                except Exception as e:
-                    print(f"[WARNING] Could not add logo to PDF: {e}")
-            
-            # Company Name (if available)
-            if company_profile and company_profile.company_name:
-                company_name_style = ParagraphStyle(
-                    'CompanyName',
-                    parent=styles['Normal'],
-                    fontSize=11,
-                    fontName='Helvetica-Bold',
-                    textColor=dark_text,
-                    alignment=TA_CENTER,
-                    spaceAfter=10
-                )
-                story.append(Paragraph(company_profile.company_name, company_name_style))
-            
-            # Main Title
-            story.append(Paragraph("DOOR MONITORING", main_title_style))
-            story.append(Paragraph("SECURITY AUDIT REPORT", main_title_style))
-            story.append(Spacer(1, 0.15*inch))
-            
-            # Document type badge with door location
-            doc_subtitle_text = "Access Control & Event Log"
-            if door_system_info and door_system_info.door_location:
-                doc_subtitle_text += f" - {door_system_info.door_location}"
-            story.append(Paragraph(doc_subtitle_text, doc_subtitle_style))
-            
-            # Decorative separator
-            story.append(HRFlowable(
-                width="40%",
-                thickness=2,
-                color=primary_blue,
-                spaceAfter=30,
-                spaceBefore=10
-            ))
-            
-            # ==================== EXECUTIVE SUMMARY SECTION ====================
-            story.append(Paragraph("EXECUTIVE SUMMARY", section_header_style))
-            
-            # Calculate comprehensive statistics
-            door_open_count = sum(1 for e in events if e.event_type == 'door_open')
-            door_close_count = sum(1 for e in events if e.event_type == 'door_close')
-            alarm_count = sum(1 for e in events if e.event_type == 'alarm_triggered')
-            timer_set_count = sum(1 for e in events if e.event_type == 'timer_set')
-            
-            # Create statistics cards (4 columns) - Fixed overlapping issue
-            # Build each card as a mini-table to ensure proper layout
-            cards = []
-            stats_info = [
-                ("TOTAL EVENTS", str(len(events)), '#0066CC'),
-                ("DOOR OPENS", str(door_open_count), '#FF9800'),
-                ("DOOR CLOSES", str(door_close_count), '#4CAF50'),
-                ("ALARMS", str(alarm_count), '#F44336'),
-            ]
-            
-            for label, value, color in stats_info:
-                card_data = [
-                    [Paragraph(f"<para align='center'><font size='9' color='#757575'><b>{label}</b></font></para>", styles['Normal'])],
-                    [Paragraph(f"<para align='center'><font size='20' color='{color}'><b>{value}</b></font></para>", styles['Normal'])],
-                ]
-                card_table = Table(card_data, colWidths=[1.75*inch])
-                card_table.setStyle(TableStyle([
-                    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                    ('TOPPADDING', (0, 0), (-1, 0), 8),
-                    ('BOTTOMPADDING', (0, 1), (-1, 1), 8),
-                    ('TOPPADDING', (0, 1), (-1, 1), 4),
-                    ('BOTTOMPADDING', (0, 0), (-1, 0), 4),
-                ]))
-                cards.append(card_table)
-            
-            stats_table = Table([cards], colWidths=[1.85*inch, 1.85*inch, 1.85*inch, 1.85*inch])
-            stats_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, -1), header_bg),
-                ('BOX', (0, 0), (-1, -1), 1.5, primary_blue),
-                ('INNERGRID', (0, 0), (-1, -1), 0.5, colors.white),
-                ('TOPPADDING', (0, 0), (-1, -1), 12),
-                ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-                ('LEFTPADDING', (0, 0), (-1, -1), 8),
-                ('RIGHTPADDING', (0, 0), (-1, -1), 8),
-                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                ('ROUNDEDCORNERS', [8, 8, 8, 8]),  # Rounded corners: [topLeft, topRight, bottomLeft, bottomRight]
-            ]))
-            
-            story.append(stats_table)
-            story.append(Spacer(1, 0.25*inch))
-            
-            # ==================== REPORT INFORMATION SECTION ====================
-            story.append(Paragraph("REPORT INFORMATION", section_header_style))
-            
-            # Prepare report metadata
-            date_range = f"{data.get('start_date', 'N/A')} to {data.get('end_date', 'N/A')}"
-            event_filter = ', '.join([t.replace('_', ' ').title() for t in event_types]) if event_types else 'All Event Types'
-            generated_date = datetime.now().strftime('%B %d, %Y')
-            generated_time = datetime.now().strftime('%I:%M:%S %p')
-            
-            # Get user info for "Generated by" field
-            generated_by = current_user.full_name if current_user.full_name else current_user.username
-            if current_user.employee_id:
-                generated_by += f" (ID: {current_user.employee_id})"
-            if current_user.department:
-                generated_by += f" - {current_user.department}"
-            
-            # Build door location info
-            door_location_info = "eDOMOS v2.1 - Door Monitoring System"
-            if door_system_info:
-                if door_system_info.door_location:
-                    door_location_info = f"{door_system_info.door_location}"
-                    if door_system_info.department_name:
-                        door_location_info += f" ({door_system_info.department_name})"
-                if door_system_info.device_serial_number:
-                    door_location_info += f" - S/N: {door_system_info.device_serial_number}"
-            
-            # Create modern 2-column metadata table with gradient effect
-            info_data = [
-                [Paragraph("<b>Report Period:</b>", info_label_style), Paragraph(date_range, info_value_style)],
-                [Paragraph("<b>Event Filter:</b>", info_label_style), Paragraph(event_filter, info_value_style)],
-                [Paragraph("<b>Total Records:</b>", info_label_style), Paragraph(f"{len(events)} events recorded", info_value_style)],
-                [Paragraph("<b>Door Location:</b>", info_label_style), Paragraph(door_location_info, info_value_style)],
-                [Paragraph("<b>Report Generated:</b>", info_label_style), Paragraph(f"{generated_date} at {generated_time}", info_value_style)],
-                [Paragraph("<b>Generated By:</b>", info_label_style), Paragraph(generated_by, info_value_style)],
-                [Paragraph("<b>Report Type:</b>", info_label_style), Paragraph("Security Audit - Access Control Log", info_value_style)],
-            ]
-            
-            # Add company info if available
-            if company_profile and company_profile.company_name:
-                company_info = company_profile.company_name
-                if company_profile.company_city and company_profile.company_state:
-                    company_info += f" - {company_profile.company_city}, {company_profile.company_state}"
-                info_data.insert(3, [Paragraph("<b>Facility:</b>", info_label_style), Paragraph(company_info, info_value_style)])
-            
-            info_table = Table(info_data, colWidths=[2*inch, 5.4*inch])
-            info_table.setStyle(TableStyle([
-                # Modern look with subtle gradients using alternating backgrounds
-                ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#E8EAF6')),  # Light indigo for labels
-                ('BACKGROUND', (1, 0), (1, -1), colors.white),  # White for values
-                ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-                ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-                ('ALIGN', (1, 0), (1, -1), 'LEFT'),
-                ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-                ('FONTSIZE', (0, 0), (-1, -1), 9),
-                ('TEXTCOLOR', (0, 0), (-1, -1), dark_text),
-                ('TOPPADDING', (0, 0), (-1, -1), 10),
-                ('BOTTOMPADDING', (0, 0), (-1, -1), 10),
-                ('LEFTPADDING', (0, 0), (-1, -1), 15),
-                ('RIGHTPADDING', (0, 0), (-1, -1), 15),
-                # Outer border with primary color
-                ('BOX', (0, 0), (-1, -1), 1.5, primary_blue),
-                # Horizontal lines between rows for clarity
-                ('LINEBELOW', (0, 0), (-1, -2), 0.5, colors.HexColor('#E0E0E0')),
-                ('ROUNDEDCORNERS', [8, 8, 8, 8]),  # Rounded corners
-            ]))
-            
-            story.append(info_table)
-            story.append(Spacer(1, 0.3*inch))
-            
-            # ==================== EVENT LOG TABLE SECTION ====================
-            story.append(Paragraph("DETAILED EVENT LOG", section_header_style))
-            story.append(Spacer(1, 0.1*inch))
-            
-            if events:
-                # Build table with enhanced styling
-                table_data = [[
-                    Paragraph('<b>ID</b>', table_header_style),
-                    Paragraph('<b>DATE & TIME</b>', table_header_style),
-                    Paragraph('<b>EVENT TYPE</b>', table_header_style),
-                    Paragraph('<b>STATUS</b>', table_header_style),
-                    Paragraph('<b>USER/SOURCE</b>', table_header_style)
-                ]]
-                
-                # Populate table rows
-                for idx, event in enumerate(events):
-                    event_id = f"#{event.id}"
-                    
-                    # Format timestamp using user preference with line break
-                    date_time = event.timestamp.strftime(date_fmt) + '<br/>' + event.timestamp.strftime(time_fmt)
-                    
-                    # Format event type
-                    event_type_display = event.event_type.replace('_', ' ').title()
-                    
-                    # Determine status with colored indicator
-                    if event.event_type == 'door_open':
-                        status = '<font color="#FF9800">●</font> OPEN'
-                        row_bg = colors.white if idx % 2 == 0 else alt_row_bg
-                    elif event.event_type == 'door_close':
-                        status = '<font color="#4CAF50">●</font> CLOSED'
-                        row_bg = colors.white if idx % 2 == 0 else alt_row_bg
-                    elif event.event_type == 'alarm_triggered':
-                        status = '<font color="#F44336">●</font> ALERT'
-                        row_bg = highlight_bg  # Highlight alarms
-                    elif event.event_type == 'timer_set':
-                        status = '<font color="#2196F3">●</font> TIMER'
-                        row_bg = colors.white if idx % 2 == 0 else alt_row_bg
-                    else:
-                        status = '<font color="#9E9E9E">●</font> INFO'
-                        row_bg = colors.white if idx % 2 == 0 else alt_row_bg
-                    
-                    user_name = "SYSTEM"
-                    
-                    table_data.append([
-                        Paragraph(f'<para align="center"><b>{event_id}</b></para>', table_cell_style),
-                        Paragraph(f'<para align="center">{date_time}</para>', table_cell_style),
-                        Paragraph(event_type_display, table_cell_style),
-                        Paragraph(f'<para align="center"><b>{status}</b></para>', table_cell_style),
-                        Paragraph(user_name, table_cell_style)
-                    ])
-                
-                # Create table with optimized column widths
-                event_table = Table(
-                    table_data,
-                    colWidths=[0.65*inch, 1.4*inch, 2*inch, 1.35*inch, 1.4*inch],
-                    repeatRows=1  # Header repeats on each page
-                )
-                
-                # Apply modern, professional table styling with gradients
-                table_style_list = [
-                    # Modern Header with gradient effect (dark to light blue)
-                    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1976D2')),
-                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                    ('FONTSIZE', (0, 0), (-1, 0), 10),
-                    ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-                    ('TOPPADDING', (0, 0), (-1, 0), 14),
-                    ('BOTTOMPADDING', (0, 0), (-1, 0), 14),
-                    
-                    # Data rows - general styling
-                    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-                    ('FONTSIZE', (0, 1), (-1, -1), 9),
-                    ('TOPPADDING', (0, 1), (-1, -1), 10),
-                    ('BOTTOMPADDING', (0, 1), (-1, -1), 10),
-                    ('LEFTPADDING', (0, 0), (-1, -1), 8),
-                    ('RIGHTPADDING', (0, 0), (-1, -1), 8),
-                    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                    
-                    # Modern borders - clean outer box with subtle inner lines
-                    ('BOX', (0, 0), (-1, -1), 2, colors.HexColor('#1976D2')),
-                    ('LINEBELOW', (0, 0), (-1, 0), 2, colors.HexColor('#0D47A1')),
-                    ('INNERGRID', (0, 1), (-1, -1), 0.25, colors.HexColor('#E0E0E0')),
-                    ('ROUNDEDCORNERS', [8, 8, 8, 8]),  # Rounded corners
-                ]
-                
-                # Apply modern alternating row colors with subtle gradient effect
-                for i in range(1, len(table_data)):
-                    event_type = events[i-1].event_type
-                    if event_type == 'alarm_triggered':
-                        # Highlight alarms with soft red/pink
-                        table_style_list.append(('BACKGROUND', (0, i), (-1, i), colors.HexColor('#FFEBEE')))
-                        table_style_list.append(('LEFTPADDING', (0, i), (0, i), 10))
-                    elif i % 2 == 0:
-                        # Alternating very light blue-gray
-                        table_style_list.append(('BACKGROUND', (0, i), (-1, i), colors.HexColor('#F5F7FA')))
-                    else:
-                        # White background
-                        table_style_list.append(('BACKGROUND', (0, i), (-1, i), colors.white))
-                
-                event_table.setStyle(TableStyle(table_style_list))
-                story.append(event_table)
-            else:
-                # No events found message
-                no_data_para = Paragraph(
-                    "<para align='center' backColor='#FFF3E0' borderColor='#FF9800' borderWidth='1' "
-                    "borderPadding='20'><b>NO EVENTS FOUND</b><br/>"
-                    "No events match the specified criteria for the selected time period.</para>",
-                    doc_subtitle_style
-                )
-                story.append(no_data_para)
-            
-            # ==================== COMPLIANCE & AUDIT SECTION ====================
-            # Add compliance metrics for ISO 27001 / SOC 2 audits
-            if data.get('report_type') == 'compliance_audit':
-                story.append(Spacer(1, 0.3*inch))
-                story.append(Paragraph("COMPLIANCE & AUDIT METRICS", section_header_style))
-                story.append(Spacer(1, 0.1*inch))
-                
-                # Calculate compliance metrics
-                alarm_events_list = [e for e in events if e.event_type == 'alarm_triggered']
-                total_alarms = len(alarm_events_list)
-                
-                # Get anomalies in the same period
-                anomalies = AnomalyDetection.query.filter(
-                    AnomalyDetection.detected_at.between(start_date, end_date)
-                ).all()
-                total_anomalies = len(anomalies)
-                unacknowledged_anomalies = len([a for a in anomalies if not a.is_acknowledged])
-                
-                # Compliance percentage (from analytics)
-                timer_setting = Setting.query.filter_by(key='timer_duration').first()
-                alarm_threshold = int(timer_setting.value) if timer_setting else 30
-                
-                # Calculate MTTR (Mean Time To Resolve)
-                mttr_durations = []
-                for alarm in alarm_events_list:
-                    # Find the next door_close event after this alarm
-                    close_event = EventLog.query.filter(
-                        EventLog.event_type == 'door_close',
-                        EventLog.timestamp > alarm.timestamp
-                    ).order_by(EventLog.timestamp.asc()).first()
-                    
-                    if close_event:
-                        duration = (close_event.timestamp - alarm.timestamp).total_seconds()
-                        mttr_durations.append(duration)
-                
-                mttr = sum(mttr_durations) / len(mttr_durations) if mttr_durations else 0
-                
-                # Build compliance table
-                compliance_data = [
-                    [Paragraph("<b>Metric</b>", info_label_style), Paragraph("<b>Value</b>", info_label_style), Paragraph("<b>Standard</b>", info_label_style)],
-                    [Paragraph("Total Security Events", info_value_style), Paragraph(str(len(events)), info_value_style), Paragraph("ISO 27001:2013", info_value_style)],
-                    [Paragraph("Alarm Events Triggered", info_value_style), Paragraph(str(total_alarms), info_value_style), Paragraph("Access Control (A.9.1)", info_value_style)],
-                    [Paragraph("Anomalies Detected", info_value_style), Paragraph(str(total_anomalies), info_value_style), Paragraph("Monitoring (A.12.4)", info_value_style)],
-                    [Paragraph("Unacknowledged Anomalies", info_value_style), Paragraph(str(unacknowledged_anomalies), info_value_style), Paragraph("Incident Response", info_value_style)],
-                    [Paragraph("Mean Time To Resolve (MTTR)", info_value_style), Paragraph(f"{mttr:.1f} seconds", info_value_style), Paragraph("SOC 2 CC7.3", info_value_style)],
-                    [Paragraph("Alarm Threshold Setting", info_value_style), Paragraph(f"{alarm_threshold} seconds", info_value_style), Paragraph("Policy Compliance", info_value_style)],
-                ]
-                
-                compliance_table = Table(compliance_data, colWidths=[2.5*inch, 2*inch, 2*inch])
-                compliance_table.setStyle(TableStyle([
-                    ('BACKGROUND', (0, 0), (-1, 0), header_bg),
-                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-                    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                    ('FONTSIZE', (0, 0), (-1, -1), 9),
-                    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                    ('TOPPADDING', (0, 1), (-1, -1), 8),
-                    ('BOTTOMPADDING', (0, 1), (-1, -1), 8),
-                    ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#CCCCCC')),
-                    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                ]))
-                
-                story.append(compliance_table)
-                story.append(Spacer(1, 0.2*inch))
-            
-            # ==================== CERTIFICATION & SIGNATURES SECTION ====================
-            # Create signature section elements
-            signature_elements = []
-            
-            signature_elements.append(Spacer(1, 0.3*inch))
-            signature_elements.append(HRFlowable(width="100%", thickness=1, color=colors.HexColor('#CCCCCC')))
-            signature_elements.append(Spacer(1, 0.15*inch))
-            
-            # Certification statement
-            cert_style = ParagraphStyle(
-                'Certification',
-                parent=styles['Normal'],
-                fontSize=8,
-                fontName='Helvetica-Oblique',
-                textColor=light_text,
-                alignment=TA_JUSTIFY,
-                leading=11
-            )
-            
-            # Build certification text based on report type
-            if data.get('report_type') == 'compliance_audit':
-                certification_text = (
-                    "<b>CERTIFICATION & COMPLIANCE STATEMENT:</b> This report was automatically generated by the eDOMOS Door Monitoring System "
-                    "in compliance with ISO/IEC 27001:2013 information security standards and SOC 2 Trust Service Criteria. "
-                    "All timestamps are recorded in local system time with audit trail preservation. Event data is stored in a secure database "
-                    "with integrity controls and access restrictions. This document contains sensitive security information and is intended for "
-                    "authorized personnel, auditors, and compliance officers only. The system maintains continuous monitoring for anomaly detection, "
-                    "incident response tracking (MTTR), and access control verification as required by applicable security frameworks."
-                )
-            else:
-                certification_text = (
-                    "<b>CERTIFICATION:</b> This report was automatically generated by the eDOMOS Door Monitoring System. "
-                    "All timestamps are recorded in local system time. Event data is stored in a secure database and "
-                    "is subject to audit trails. This document is intended for authorized personnel only and contains "
-                    "sensitive security information regarding access control and facility monitoring."
-                )
-            signature_elements.append(Paragraph(certification_text, cert_style))
-            signature_elements.append(Spacer(1, 0.2*inch))
-            
-            # Signature blocks (for manual signatures if needed) - Aligned to certification text width
-            sig_style = ParagraphStyle(
-                'SignatureBlock',
-                parent=styles['Normal'],
-                fontSize=8,
-                alignment=TA_LEFT,  # Left-align text within each block
-                leading=12
-            )
-            
-            sig_data = [
-                [
-                    Paragraph("<b>Prepared By:</b><br/>__________________________<br/><font size='7'>System Administrator</font>", sig_style),
-                    Paragraph("<b>Reviewed By:</b><br/>__________________________<br/><font size='7'>Security Officer</font>", sig_style),
-                    Paragraph("<b>Date:</b><br/>__________________________<br/><font size='7'>Approval Date</font>", sig_style),
-                ]
-            ]
-            
-            # Match the width of the content area (same as certification text)
-            # Page width is 8.5 inches, with 1 inch margins on each side = 6.5 inches usable width
-            # Divide equally among 3 columns
-            available_width = 6.5*inch
-            col_width = available_width / 3
-            sig_table = Table(sig_data, colWidths=[col_width, col_width, col_width])
-            sig_table.setStyle(TableStyle([
-                ('ALIGN', (0, 0), (0, 0), 'LEFT'),    # Prepared By - left aligned
-                ('ALIGN', (1, 0), (1, 0), 'CENTER'),  # Reviewed By - center aligned
-                ('ALIGN', (2, 0), (2, 0), 'RIGHT'),   # Date - right aligned
-                ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-                ('TOPPADDING', (0, 0), (-1, -1), 0),
-                ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
-                ('LEFTPADDING', (0, 0), (-1, -1), 0),   # No left padding
-                ('RIGHTPADDING', (0, 0), (-1, -1), 0),  # No right padding
-            ]))
-            
-            signature_elements.append(sig_table)
-            
-            # Wrap signature section in KeepTogether to prevent page breaks
-            story.append(KeepTogether(signature_elements))
-            
-            # ==================== BUILD AND RETURN PDF ====================
-            try:
-                doc.build(story)
-                buffer.seek(0)
-                pdf_data = base64.b64encode(buffer.getvalue()).decode()
-                return jsonify({'pdf_data': pdf_data})
+        query = EventLog.query.filter(EventLog.timestamp.between(start_date, end_date))
+        if event_types:
+            query = query.filter(EventLog.event_type.in_(event_types))
             
-            except Exception as e:
-                print(f"PDF Generation Error: {str(e)}")
-                import traceback
-                traceback.print_exc()
-                return jsonify({'error': f'PDF generation failed: {str(e)}'}), 500
+        events = query.all()
         
-        # For JSON (default)
-        # Company profile and door system info already loaded above
+        # Get company and system info
+        company_profile = CompanyProfile.query.first()
+        door_system_info = DoorSystemInfo.query.first()
         
+        # For JSON (default)
         # Build metadata
         metadata = {
             'report_generated': datetime.now().isoformat(),
@@ -5796,27 +5475,26 @@ def generate_report():
 def api_dashboard():
     """Get complete dashboard data for real-time updates"""
     try:
-        global door_open, alarm_active
-        
         # Get system status
-        door_status = "Open" if door_open else "Closed"
-        alarm_status = "Active" if alarm_active else "Inactive"
-        timer_setting = Setting.query.filter_by(key='timer_duration').first()
-        timer_set = timer_setting.value if timer_setting else '30'
-        
-        # Get event counts
-        total_events = EventLog.query.count()
-        door_open_events = EventLog.query.filter_by(event_type='door_open').count()
-        door_close_events = EventLog.query.filter_by(event_type='door_close').count()
-        alarm_events = EventLog.query.filter_by(event_type='alarm_triggered').count()
-        
-        # Get last event
-        last_event = EventLog.query.order_by(EventLog.timestamp.desc()).first()
-        last_event_data = last_event.to_dict() if last_event else None
-        
-        # Get recent events for dashboard display
+        state = hardware_state()
+        door_status = "Open" if state.get('door_open') else "Closed"
+        alarm_status = "Active" if state.get('alarm_active') else "Inactive"
+        
+        # Get the timer setting and event counts in one aggregate query
+        timer_query = (select(Setting.value).where(Setting.key == 'timer_duration')
+                       .limit(1).scalar_subquery())
+        timer_value, total_events, door_open_events, door_close_events, alarm_events = db.session.query(
+            timer_query,
+            func.count(EventLog.id),
+            func.count(case((EventLog.event_type == 'door_open', 1))),
+            func.count(case((EventLog.event_type == 'door_close', 1))),
+            func.count(case((EventLog.event_type == 'alarm_triggered', 1)))).one()
+        timer_set = timer_value or '30'
+        
+        # Get recent events for dashboard display; the first is the last event
         recent_events = EventLog.query.order_by(EventLog.timestamp.desc()).limit(5).all()
         recent_events_data = [event.to_dict() for event in recent_events]
+        last_event_data = recent_events_data[0] if recent_events_data else None
         
         # Get system uptime
         uptime_data = calculate_uptime()
@@ -5867,15 +5545,15 @@ def api_uptime():
 def api_status():
     """Get current system status for real-time updates"""
     try:
-        global door_open, alarm_active
+        state = hardware_state()
         
         # Get timer setting
         timer_setting = Setting.query.filter_by(key='timer_duration').first()
         timer_set = timer_setting.value if timer_setting else '30'
         
         return jsonify({
-            'door_status': 'Open' if door_open else 'Closed',
-            'alarm_status': 'Active' if alarm_active else 'Inactive',
+            'door_status': 'Open' if state.get('door_open') else 'Closed',
+            'alarm_status': 'Active' if state.get('alarm_active') else 'Inactive',
             'timer_set': timer_set,
             'timestamp': datetime.now().isoformat(),
             'success': True
@@ -5888,6 +5566,15 @@ def api_status():
             'success': False
         }), 500
 
+@app.route('/api/websocket/metrics')
+@login_required
+def api_websocket_metrics():
+    """Real-time broadcaster counters (messages/bytes emitted, lagging clients)"""
+    return jsonify({
+        'success': True,
+        'metrics': broadcaster.get_metrics()
+    })
+
 @app.route('/websocket-test')
 def websocket_test():
     """WebSocket connection test page"""
@@ -6721,6 +6408,7 @@ def api_scheduled_reports():
             db.session.commit()
             
             log_event('scheduled_report_created', f'Scheduled {data["frequency"]} {data["report_type"]} report created by {current_user.username}')
+            notify_report_schedule_changed()
             
             return jsonify({
                 'success': True,
@@ -6771,6 +6459,7 @@ def api_scheduled_report_detail(report_id):
             db.session.commit()
             
             log_event('scheduled_report_updated', f'Scheduled report {report_id} updated by {current_user.username}')
+            notify_report_schedule_changed()
             
             return jsonify({
                 'success': True,
@@ -6784,10 +6473,12 @@ def api_scheduled_report_detail(report_id):
     
     else:  # DELETE
         try:
+            ScheduledReportRun.query.filter_by(report_id=report.id).delete()
             db.session.delete(report)
             db.session.commit()
             
             log_event('scheduled_report_deleted', f'Scheduled report {report_id} deleted by {current_user.username}')
+            notify_report_schedule_changed()
             
             return jsonify({
                 'success': True,
@@ -7399,229 +7090,143 @@ def test_stress_data():
 # SCHEDULED REPORTS SYSTEM
 # ============================================================================
 
-report_scheduler_thread = None
+report_scheduler = None
 
-def report_scheduler():
-    """Background thread to check and send scheduled reports"""
-    global shutdown_flag
-    print("[SCHEDULER] 📧 Report scheduler thread started")
+def load_scheduled_report_runs():
+    """Pending scheduled report runs as (due_at, report_id, scheduled_for)"""
+    config = Config.REPORT_SCHEDULER_CONFIG
+    with app.app_context():
+        due = [(report.next_run, report.id, report.next_run) for report in ScheduledReport.query.filter(
+            ScheduledReport.enabled == True,
+            ScheduledReport.next_run != None
+        )]
+        
+        # Runs interrupted by a restart are resumed; failed runs retried after a delay
+        retry_delay = timedelta(seconds=config['retry_delay'])
+        unfinished = ScheduledReportRun.query.filter(
+            ScheduledReportRun.status.in_(('running', 'failed')),
+            ScheduledReportRun.attempts < config['max_attempts']
+        ).all()
+        for run in unfinished:
+            due_at = run.started_at if run.status == 'running' else (run.finished_at or run.started_at) + retry_delay
+            due.append((due_at, run.report_id, run.scheduled_for))
+    return due
+
+def claim_scheduled_report_run(report, scheduled_for, now):
+    """
+    Record that this process runs one occurrence of a report
     
-    while not shutdown_flag.is_set():
+    The first attempt inserts the run and advances next_run in one
+    transaction; the unique (report_id, scheduled_for) key lets only one
+    claim succeed, across restarts and scheduler processes. Retries claim
+    the existing run by bumping its attempt counter.
+    
+    Returns:
+        True if the occurrence should be run now
+    """
+    config = Config.REPORT_SCHEDULER_CONFIG
+    run = ScheduledReportRun.query.filter_by(report_id=report.id, scheduled_for=scheduled_for).first()
+    if run is None:
+        if report.next_run != scheduled_for:
+            return False  # Stale entry - already rescheduled
+        db.session.add(ScheduledReportRun(report_id=report.id, scheduled_for=scheduled_for, started_at=now))
+        report.next_run = following_run(report.frequency, scheduled_for, now, config['max_catchup_runs'])
+    elif run.status == 'sent' or run.attempts >= config['max_attempts']:
+        return False
+    else:
+        claimed = ScheduledReportRun.query.filter_by(id=run.id, attempts=run.attempts).update(
+            {'status': 'running', 'attempts': run.attempts + 1, 'started_at': now, 'error': None})
+        if not claimed:
+            db.session.rollback()
+            return False
+    
+    try:
+        db.session.commit()
+        return True
+    except IntegrityError:
+        db.session.rollback()
+        return False
+
+def run_scheduled_report(report_id, scheduled_for):
+    """Generate and email one occurrence of a scheduled report (scheduler worker)"""
+    with app.app_context():
+        report = ScheduledReport.query.get(report_id)
+        if not report or not report.enabled:
+            return
+        if not claim_scheduled_report_run(report, scheduled_for, datetime.now()):
+            print(f"[SCHEDULER] ⏭️ Report {report_id} for {scheduled_for} already handled")
+            return
+        
+        print(f"[SCHEDULER] 📊 Processing scheduled report: {report.report_type} ({report.frequency}) for {scheduled_for}")
+        run_filter = {'report_id': report_id, 'scheduled_for': scheduled_for}
         try:
-            with app.app_context():
-                now = datetime.now()
-                
-                # Find all enabled scheduled reports that are due
-                due_reports = ScheduledReport.query.filter(
-                    ScheduledReport.enabled == True,
-                    ScheduledReport.next_run <= now
-                ).all()
-                
-                for report in due_reports:
-                    print(f"[SCHEDULER] 📊 Processing scheduled report: {report.report_type} ({report.frequency})")
-                    
-                    try:
-                        # Generate report based on frequency
-                        if report.frequency == 'daily':
-                            start_date = (now - timedelta(days=1)).strftime('%Y-%m-%d')
-                            end_date = now.strftime('%Y-%m-%d')
-                        elif report.frequency == 'weekly':
-                            start_date = (now - timedelta(days=7)).strftime('%Y-%m-%d')
-                            end_date = now.strftime('%Y-%m-%d')
-                        elif report.frequency == 'monthly':
-                            start_date = (now - timedelta(days=30)).strftime('%Y-%m-%d')
-                            end_date = now.strftime('%Y-%m-%d')
-                        else:
-                            start_date = (now - timedelta(days=1)).strftime('%Y-%m-%d')
-                            end_date = now.strftime('%Y-%m-%d')
-                        
-                        # Parse filters if available
-                        import json
-                        filters = json.loads(report.filters) if report.filters else {}
-                        event_types = filters.get('event_types', ['door_open', 'door_close', 'alarm_triggered'])
-                        
-                        # Generate PDF report
-                        pdf_buffer = generate_scheduled_report_pdf(
-                            start_date=start_date,
-                            end_date=end_date,
-                            event_types=event_types,
-                            report_type=report.report_type
-                        )
-                        
-                        # Send email with PDF attachment
-                        send_scheduled_report_email(
-                            report=report,
-                            pdf_buffer=pdf_buffer,
-                            start_date=start_date,
-                            end_date=end_date
-                        )
-                        
-                        # Update report schedule with scheduled_time
-                        report.last_run = now
-                        
-                        # Parse scheduled time (HH:MM format)
-                        scheduled_time = report.scheduled_time or '09:00'
-                        hour, minute = map(int, scheduled_time.split(':'))
-                        
-                        # Calculate next run based on frequency
-                        if report.frequency == 'daily':
-                            next_date = now.date() + timedelta(days=1)
-                        elif report.frequency == 'weekly':
-                            next_date = now.date() + timedelta(days=7)
-                        elif report.frequency == 'monthly':
-                            next_date = now.date() + timedelta(days=30)
-                        else:
-                            next_date = now.date() + timedelta(days=1)
-                        
-                        # Combine date with scheduled time
-                        report.next_run = datetime.combine(next_date, datetime.min.time()).replace(hour=hour, minute=minute)
-                        
-                        db.session.commit()
-                        print(f"[SCHEDULER] ✅ Report sent successfully: {report.report_type}, Next run: {report.next_run}")
-                        
-                    except Exception as e:
-                        print(f"[SCHEDULER] ❌ Failed to send report {report.id}: {e}")
-                        import traceback
-                        traceback.print_exc()
-                        db.session.rollback()
+            start_date, end_date = report_window(report.frequency, scheduled_for)
+            filters = json.loads(report.filters) if report.filters else {}
+            event_types = filters.get('event_types', ['door_open', 'door_close', 'alarm_triggered'])
+            
+            pdf_buffer = generate_scheduled_report_pdf(
+                start_date=start_date,
+                end_date=end_date,
+                event_types=event_types,
+                report_type=report.report_type,
+                user=report.creator
+            )
+            if pdf_buffer is None:
+                raise RuntimeError('PDF generation failed')
+            if not send_scheduled_report_email(report=report, pdf_buffer=pdf_buffer,
+                                               start_date=start_date, end_date=end_date):
+                raise RuntimeError('Email delivery failed')
+            
+            run = ScheduledReportRun.query.filter_by(**run_filter).first()
+            run.status = 'sent'
+            run.finished_at = datetime.now()
+            report.last_run = run.finished_at
+            db.session.commit()
+            print(f"[SCHEDULER] ✅ Report sent successfully: {report.report_type}, Next run: {report.next_run}")
             
         except Exception as e:
-            print(f"[SCHEDULER] ❌ Scheduler error: {e}")
-            import traceback
-            traceback.print_exc()
-        
-        # Check every hour
-        time.sleep(3600)
-    
-    print("[SCHEDULER] 📧 Report scheduler thread exiting...")
+            print(f"[SCHEDULER] ❌ Failed to send report {report_id}: {e}")
+            db.session.rollback()
+            run = ScheduledReportRun.query.filter_by(**run_filter).first()
+            run.status = 'failed'
+            run.error = str(e)
+            run.finished_at = datetime.now()
+            db.session.commit()
+
+def notify_report_schedule_changed():
+    """Wake the scheduler after a schedule changed (via the controller when it runs there)"""
+    if report_scheduler is not None:
+        report_scheduler.wake()
+    elif hardware_client is not None:
+        try:
+            hardware_client.command('reschedule_reports', timeout=1.0)
+        except ControllerUnavailable as e:
+            print(f"[SCHEDULER] ⚠️ Could not wake the controller's scheduler ({e}) - applied on its next resync")
 
-def generate_scheduled_report_pdf(start_date, end_date, event_types, report_type):
-    """Generate PDF report for scheduled delivery"""
+def generate_scheduled_report_pdf(start_date, end_date, event_types, report_type, user=None):
+    """
+    Generate PDF report for scheduled delivery
+    
+    Built by the report job queue exactly like a /reports PDF for the report's
+    creator, so an unchanged period that was already rendered comes from the
+    report cache instead of being laid out again.
+    """
     from io import BytesIO
-    from models import CompanyProfile, DoorSystemInfo
     
     try:
-        # Query events for the date range
-        start_dt = datetime.strptime(start_date, '%Y-%m-%d')
-        end_dt = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)
-        
-        query = EventLog.query.filter(EventLog.timestamp.between(start_dt, end_dt))
-        if event_types:
-            query = query.filter(EventLog.event_type.in_(event_types))
-        
-        events = query.all()
-        
-        # Get company and system info
-        company_profile = CompanyProfile.query.first()
-        door_system_info = DoorSystemInfo.query.first()
-        
-        # Prepare data dict similar to generate_report route
-        data = {
-            'start_date': start_date,
-            'end_date': end_date,
-            'event_types': event_types or [],
-            'report_type': report_type,
-            'format': 'pdf'
-        }
-        
-        # Import PDF libraries
-        from reportlab.lib.pagesizes import A4
-        from reportlab.lib.units import inch
-        from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-        from reportlab.lib import colors
-        from reportlab.lib.enums import TA_CENTER, TA_LEFT
-        
-        buffer = BytesIO()
-        
-        # Create simplified PDF document
-        doc = SimpleDocTemplate(
-            buffer,
-            pagesize=A4,
-            rightMargin=0.75*inch,
-            leftMargin=0.75*inch,
-            topMargin=1*inch,
-            bottomMargin=1*inch,
-            title=f"eDOMOS {report_type.title()} Report - {start_date} to {end_date}"
-        )
-        
-        # Build content
-        story = []
-        styles = getSampleStyleSheet()
-        
-        # Title
-        title_style = ParagraphStyle(
-            'Title',
-            parent=styles['Title'],
-            fontSize=20,
-            fontName='Helvetica-Bold',
-            textColor=colors.HexColor('#0066CC'),
-            spaceAfter=12,
-            alignment=TA_CENTER
-        )
-        
-        story.append(Paragraph(f"eDOMOS {report_type.title()} Report", title_style))
-        story.append(Paragraph(f"Period: {start_date} to {end_date}", styles['Normal']))
-        story.append(Spacer(1, 0.3*inch))
-        
-        # Summary statistics
-        summary_data = [
-            ['Total Events', str(len(events))],
-            ['Report Type', report_type.title()],
-            ['Generated', datetime.now().strftime('%Y-%m-%d %H:%M:%S')]
-        ]
-        
-        summary_table = Table(summary_data, colWidths=[2.5*inch, 3*inch])
-        summary_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#E3F2FD')),
-            ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey)
-        ]))
-        
-        story.append(summary_table)
-        story.append(Spacer(1, 0.3*inch))
-        
-        # Events table
-        if events:
-            story.append(Paragraph("Event Details", styles['Heading2']))
-            story.append(Spacer(1, 0.1*inch))
-            
-            event_data = [['Date/Time', 'Event Type', 'Description']]
-            
-            for event in events[:100]:  # Limit to 100 events for email
-                event_data.append([
-                    event.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-                    event.event_type.replace('_', ' ').title(),
-                    event.description or '-'
-                ])
-            
-            event_table = Table(event_data, colWidths=[2*inch, 2*inch, 1.5*inch])
-            event_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#0066CC')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 10),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-                ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-                ('FONTSIZE', (0, 1), (-1, -1), 8),
-                ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#F5F5F5')])
-            ]))
-            
-            story.append(event_table)
-        else:
-            story.append(Paragraph("No events found for the selected period.", styles['Normal']))
-        
-        # Build PDF
-        doc.build(story)
-        buffer.seek(0)
-        
-        print(f"[SCHEDULER] 📄 PDF generated: {len(buffer.getvalue())} bytes, {len(events)} events")
+        params = build_report_params(user, 'pdf', start_date, end_date, event_types, report_type)
+        manager = get_report_job_manager()
+        job, _ = manager.submit(params, user.id if user else None)
+        manager.wait(job.id, timeout=Config.REPORT_JOB_CONFIG['scheduled_timeout'])
+        if job.status != JOB_DONE:
+            print(f"[SCHEDULER] ❌ PDF generation failed: {job.error or 'timed out'}")
+            return None
+        
+        with open(job.path, 'rb') as f:
+            buffer = BytesIO(f.read())
+        
+        source = 'from cache' if job.cached else 'generated'
+        print(f"[SCHEDULER] 📄 PDF {source}: {len(buffer.getvalue())} bytes, {job.row_count} events")
         return buffer
         
     except Exception as e:
@@ -7630,7 +7235,7 @@ def generate_scheduled_report_pdf(start_date, end_date, event_types, report_type
         return None
 
 def send_scheduled_report_email(report, pdf_buffer, start_date, end_date):
-    """Send scheduled report via email with PDF attachment"""
+    """Queue the scheduled report email with its PDF attachment"""
     try:
         email_config = EmailConfig.query.first()
         if not email_config or not email_config.is_configured:
@@ -7671,26 +7276,12 @@ eDOMOS v2.1 - Door Alarm & Monitoring System
         else:
             print("[SCHEDULER] ⚠️ No PDF buffer provided, sending email without attachment")
         
-        # Send email using Gmail SMTP
-        print(f"[SCHEDULER] 🔗 Connecting to SMTP server (smtp.gmail.com:587)...")
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        print(f"[SCHEDULER] 🔐 Logging in as {email_config.sender_email}...")
-        server.login(email_config.sender_email, email_config.app_password)
-        print(f"[SCHEDULER] 📤 Sending email...")
-        server.sendmail(email_config.sender_email, recipients, msg.as_string())
-        server.quit()
-        
-        print(f"[SCHEDULER] ✅ Report emailed successfully to {len(recipients)} recipients")
+        # The outbox delivers (and retries) it; the run is done once it is stored
+        email_id = get_email_outbox().enqueue(msg.as_string(), email_config.sender_email, recipients,
+                                              subject=msg['Subject'], category='scheduled_report')
+        print(f"[SCHEDULER] ✅ Report email #{email_id} queued for {len(recipients)} recipients")
         return True
         
-    except smtplib.SMTPAuthenticationError as e:
-        print(f"[SCHEDULER] ❌ SMTP Authentication failed: {e}")
-        print("[SCHEDULER] 💡 Check email and app password in System Configuration")
-        return False
-    except smtplib.SMTPException as e:
-        print(f"[SCHEDULER] ❌ SMTP error: {e}")
-        return False
     except Exception as e:
         print(f"[SCHEDULER] ❌ Email sending failed: {e}")
         print(f"[SCHEDULER] 🔍 Error details: {traceback.format_exc()}")
@@ -7698,11 +7289,16 @@ eDOMOS v2.1 - Door Alarm & Monitoring System
 
 def start_report_scheduler():
     """Start the report scheduler thread"""
-    global report_scheduler_thread
-    if not report_scheduler_thread or not report_scheduler_thread.is_alive():
-        report_scheduler_thread = threading.Thread(target=report_scheduler, name="ReportScheduler")
-        report_scheduler_thread.daemon = True
-        report_scheduler_thread.start()
+    global report_scheduler
+    if report_scheduler is None or not report_scheduler.is_alive():
+        config = Config.REPORT_SCHEDULER_CONFIG
+        report_scheduler = ReportScheduler(
+            load_scheduled_report_runs,
+            run_scheduled_report,
+            max_workers=config['workers'],
+            resync_interval=config['resync_interval']
+        )
+        report_scheduler.start()
         print("📧 Report scheduler thread started")
     else:
         print("⚠️ Report scheduler already running")
@@ -7727,10 +7323,76 @@ def start_monitoring():
 # LIVE VIDEO STREAMING ENDPOINTS
 # ============================================================================
 
+def local_camera_frame(width=None, height=None, known_etags=()):
+    """
+    Latest frame of this process's camera
+    
+    Returns:
+        Dict with etag, sequence, timestamp and jpeg bytes - jpeg is None
+        when the frame's etag is in known_etags, so an unchanged frame is
+        neither encoded nor sent - or None without a camera or frame
+    """
+    if not camera_manager or not camera_manager.camera_available:
+        return None
+    
+    grabber = camera_manager.grabber
+    if not grabber.touch():
+        return None
+    
+    # Answer conditional requests before touching the encoded frame
+    etag = f"{grabber.epoch}-{grabber.sequence}-{width or 0}x{height or 0}"
+    if etag in known_etags:
+        return {'etag': etag, 'sequence': grabber.sequence, 'timestamp': grabber.timestamp, 'jpeg': None}
+    
+    result = grabber.get_jpeg(width, height)
+    if not result:
+        return None
+    seq, frame_time, jpeg = result
+    return {'etag': f"{grabber.epoch}-{seq}-{width or 0}x{height or 0}", 'sequence': seq,
+            'timestamp': frame_time, 'jpeg': jpeg}
+
+def camera_frame(width=None, height=None, known_etags=()):
+    """
+    Latest camera frame (see local_camera_frame); web workers get it from the
+    hardware controller, which owns the camera
+    
+    Raises:
+        ControllerUnavailable: The controller could not be asked
+    """
+    if hardware_client is None:
+        return local_camera_frame(width, height, known_etags)
+    
+    frame = hardware_client.command('camera_frame', width=width, height=height, known_etags=list(known_etags))
+    if frame:
+        frame['timestamp'] = datetime.fromisoformat(frame['timestamp'])
+        if frame['jpeg'] is not None:
+            frame['jpeg'] = base64.b64decode(frame['jpeg'])
+    return frame
+
+def relay_camera_frames():
+    """MJPEG stream of the hardware controller's frames (web workers)"""
+    etag = None
+    try:
+        while True:
+            frame = camera_frame(640, 480, [etag] if etag else ())
+            if frame is None:
+                break
+            if frame['jpeg'] is not None:
+                yield (b'--frame\r\n'
+                       b'Content-Type: image/jpeg\r\n\r\n' + frame['jpeg'] + b'\r\n')
+            etag = frame['etag']
+            time.sleep(0.2)  # The frame grabber's default 5 fps
+    except ControllerUnavailable as e:
+        print(f"[ERROR] Camera relay stopped: {e}")
+
 def generate_camera_frames():
     """Generate camera frames for MJPEG streaming"""
     global camera_manager
     
+    if hardware_client is not None and hardware_state().get('camera_available'):
+        yield from relay_camera_frames()
+        return
+    
     if not camera_manager or not camera_manager.camera_available:
         # Return a placeholder frame if camera is not available
         import numpy as np
@@ -7747,8 +7409,8 @@ def generate_camera_frames():
     try:
         while True:
             if camera_manager.camera_type == 'usb':
-                ret, frame = camera_manager.camera.read()
-                if not ret:
+                frame = camera_manager.read_frame()
+                if frame is None:
                     break
                     
                 # Resize frame for better streaming performance
@@ -7782,53 +7444,85 @@ def video_stream():
 
 @app.route('/api/camera/snapshot')
 def camera_snapshot():
-    """Get a single camera snapshot"""
-    global camera_manager
-    
+    """Get a single camera snapshot as base64 JSON (legacy - prefer /api/camera/snapshot.jpg)"""
     try:
-        if not camera_manager or not camera_manager.camera_available:
+        if not hardware_state().get('camera_available'):
             return jsonify({'error': 'Camera not available'}), 503
-            
-        # Capture a frame
-        if camera_manager.camera_type == 'usb':
-            ret, frame = camera_manager.camera.read()
-            if not ret:
-                return jsonify({'error': 'Failed to capture frame'}), 500
-                
-            # Add timestamp
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            cv2.putText(frame, timestamp, (10, 30),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-            
-            # Encode as base64 for JSON response
-            ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
-            if ret:
-                import base64
-                img_data = base64.b64encode(buffer).decode('utf-8')
-                return jsonify({
-                    'success': True,
-                    'image': f"data:image/jpeg;base64,{img_data}",
-                    'timestamp': timestamp,
-                    'door_status': 'open' if door_open else 'closed'
-                })
         
-        return jsonify({'error': 'Failed to capture snapshot'}), 500
+        try:
+            frame = camera_frame()
+        except ControllerUnavailable as e:
+            return jsonify({'error': f'Hardware controller unavailable: {e}'}), 503
+        if not frame:
+            return jsonify({'error': 'Failed to capture snapshot'}), 500
+        
+        img_data = base64.b64encode(frame['jpeg']).decode('utf-8')
+        return jsonify({
+            'success': True,
+            'image': f"data:image/jpeg;base64,{img_data}",
+            'timestamp': frame['timestamp'].strftime("%Y-%m-%d %H:%M:%S"),
+            'sequence': frame['sequence'],
+            'door_status': 'open' if hardware_state().get('door_open') else 'closed'
+        })
         
     except Exception as e:
         print(f"[ERROR] Snapshot error: {e}")
         return jsonify({'error': str(e)}), 500
 
+def _snapshot_dimension(name):
+    """Parse an optional resize query parameter, clamped to 16-1920 pixels"""
+    value = request.args.get(name, type=int)
+    if not value:
+        return None
+    return max(16, min(value, 1920))
+
+@app.route('/api/camera/snapshot.jpg')
+@login_required
+def camera_snapshot_jpeg():
+    """
+    Latest camera frame as image/jpeg
+    
+    Serves the frame grabber's pre-encoded JPEG with an ETag keyed on the
+    frame sequence number, so polls of an unchanged frame get a bodyless 304.
+    Optional ?width= / ?height= resize the frame (aspect kept if one is given).
+    In web workers the frame comes from the hardware controller; an
+    unchanged frame is not sent over the channel either.
+    """
+    if not hardware_state().get('camera_available'):
+        return jsonify({'error': 'Camera not available'}), 503
+    
+    width = _snapshot_dimension('width')
+    height = _snapshot_dimension('height')
+    
+    try:
+        frame = camera_frame(width, height, list(request.if_none_match))
+    except ControllerUnavailable as e:
+        return jsonify({'error': f'Hardware controller unavailable: {e}'}), 503
+    if not frame:
+        return jsonify({'error': 'Failed to capture snapshot'}), 503
+    
+    if frame['jpeg'] is None:
+        response = Response(status=304)
+    else:
+        response = Response(frame['jpeg'], mimetype='image/jpeg')
+        response.headers['X-Frame-Timestamp'] = frame['timestamp'].strftime("%Y-%m-%d %H:%M:%S")
+        response.headers['X-Frame-Sequence'] = str(frame['sequence'])
+    
+    response.set_etag(frame['etag'])
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Door-Status'] = 'open' if hardware_state().get('door_open') else 'closed'
+    return response
+
 @app.route('/api/camera/status')
 def camera_status():
     """Get camera availability status"""
-    global camera_manager
-    
+    state = hardware_state()
     status = {
-        'available': camera_manager.camera_available if camera_manager else False,
-        'type': camera_manager.camera_type if camera_manager else None,
-        'resolution': camera_manager.resolution if camera_manager else None,
-        'door_status': 'open' if door_open else 'closed',
-        'alarm_status': 'active' if alarm_active else 'inactive'
+        'available': bool(state.get('camera_available')),
+        'type': state.get('camera_type'),
+        'resolution': state.get('camera_resolution'),
+        'door_status': 'open' if state.get('door_open') else 'closed',
+        'alarm_status': 'active' if state.get('alarm_active') else 'inactive'
     }
     
     return jsonify(status)
@@ -7877,11 +7571,13 @@ if __name__ == '__main__':
         print("⚠️  Self-signed certificate - Browser will show security warning")
     
     print("=" * 60)
+    print("💡 Development server - for production workers run: python wsgi.py")
     
     try:
         init_system()
         start_monitoring()
         start_report_scheduler()  # Start scheduled reports system
+        get_email_outbox()  # Deliver emails left pending by a previous run
         
         # Enhanced SocketIO configuration for better connection handling
         print("🔧 Starting SocketIO server with enhanced configuration...")
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Anomaly rule backtest
+
+Replays the recorded event history through the anomaly rules with the
+current settings and with every combination of candidate values, and prints
+how many anomalies each configuration would have raised (rule_backtest.py).
+
+Usage:
+    python backtest_rules.py                                   # current rules only
+    python backtest_rules.py business_hours_start=7,8,9 business_hours_end=17,18,19
+    python backtest_rules.py repeat_threshold=3,4,5 repeat_window=300,600 --workers=4
+    python backtest_rules.py ai_rapid_limit=8,10,15 --since=2025-01-01 --until=2025-04-01
+    python backtest_rules.py --db=/path/to/alarm_system.db --top=20
+
+Parameters: see rule_backtest.DEFAULT_PARAMS
+"""
+
+import os
+import sys
+import time
+from datetime import datetime
+
+import rule_backtest
+
+COLUMNS = ('odd_hours', 'repeated_opens', 'ai_anomalies', 'total')
+
+
+def option(name, default=None):
+    for arg in sys.argv[1:]:
+        if arg.startswith(f'--{name}='):
+            return arg.split('=', 1)[1]
+    return default
+
+
+def parse_grid(args):
+    grid = {}
+    for arg in args:
+        key, _, values = arg.partition('=')
+        if key not in rule_backtest.DEFAULT_PARAMS:
+            sys.exit(f"Unknown parameter: {key} (one of {', '.join(rule_backtest.DEFAULT_PARAMS)})")
+        grid[key] = [int(value) for value in values.split(',') if value]
+    return grid
+
+
+def main():
+    db_path = option('db', os.path.join(os.path.abspath(os.path.dirname(__file__)), 'instance', 'alarm_system.db'))
+    since, until = option('since'), option('until')
+    workers = int(option('workers', os.cpu_count() or 1))
+    top = int(option('top', 10))
+    grid = parse_grid([a for a in sys.argv[1:] if not a.startswith('--')])
+
+    print("🔁 eDOMOS Anomaly Rule Backtest")
+    print("=" * 80)
+    started = time.perf_counter()
+    events, results = rule_backtest.backtest(
+        f'sqlite:///{db_path}', grid,
+        since=datetime.fromisoformat(since) if since else None,
+        until=datetime.fromisoformat(until) if until else None,
+        workers=workers)
+    elapsed = time.perf_counter() - started
+    print(f"  Replayed {events:,} events through {len(results):,} configurations in {elapsed:.2f}s")
+
+    def row(label, counts):
+        print(f"  {label:<44}" + "".join(f"{counts[column]:>9,}" for column in COLUMNS))
+
+    print(f"\n  {'':<44}" + "".join(f"{column.replace('_', ' ')[:8]:>9}" for column in COLUMNS))
+    base_params, base_counts = results[0]
+    row("current rules", base_counts)
+    ranked = sorted(results[1:], key=lambda result: result[1]['total'])
+    for params, counts in ranked[:top]:
+        row(", ".join(f"{key}={params[key]}" for key in grid), counts)
+    if len(ranked) > top:
+        print(f"  ... {len(ranked) - top} more (--top=N)")
+    print("=" * 80)
+
+
+if __name__ == '__main__':
+    main()
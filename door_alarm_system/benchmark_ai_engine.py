@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+AI engine scoring micro-benchmark
+
+Feeds a synthetic event stream through AISecurityEngine and times threat
+scoring from the incremental sliding window against scoring a copy of the
+full event history (the list-based predict_threat_level path), and reports
+the memory allocated per windowed scoring call.
+
+Usage:
+    python benchmark_ai_engine.py                 # 10k events
+    python benchmark_ai_engine.py 50000           # custom event count
+"""
+
+import sys
+import time
+import tempfile
+import tracemalloc
+from datetime import datetime, timedelta
+
+import ai_security
+
+EVENT_TYPES = ('door_opened', 'door_closed', 'door_opened', 'door_closed', 'alarm_triggered')
+
+
+def per_call(function, calls):
+    started = time.perf_counter()
+    for _ in range(calls):
+        function()
+    return (time.perf_counter() - started) / calls * 1e6
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    events = int(args[0]) if args else 10000
+
+    with tempfile.TemporaryDirectory() as model_dir:
+        engine = ai_security.AISecurityEngine(model_file=f"{model_dir}/model.json")
+        start = datetime(2025, 1, 6)
+
+        print("🧠 eDOMOS AI Engine Benchmark")
+        print("=" * 80)
+        started = time.perf_counter()
+        for i in range(events):
+            engine.analyze_behavior({'event_type': EVENT_TYPES[i % len(EVENT_TYPES)],
+                                     'timestamp': start + timedelta(seconds=13 * i)})
+        elapsed = time.perf_counter() - started
+        print(f"  analyze_behavior  {events:>8,} events  {elapsed:8.2f}s  {events / elapsed:10,.0f} events/s")
+
+        calls = 2000
+        windowed = per_call(engine.predict_threat_level, calls)
+        rescanned = per_call(lambda: engine.predict_threat_level(list(engine.event_history)), calls)
+        print(f"  threat score (window)    {windowed:8.1f} µs/call")
+        print(f"  threat score (history)   {rescanned:8.1f} µs/call  "
+              f"({len(engine.event_history):,} events copied per call)")
+
+        now = start + timedelta(seconds=13 * events)
+        per_call(lambda: engine.window.rapid_count(now), 10)  # Warm up
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        for _ in range(calls):
+            engine.window.rapid_count(now)
+            engine.window.gap_mean
+            engine.window.count('alarm_triggered')
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        retained = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+        print(f"  window features          {retained / calls:8.1f} bytes retained/call")
+        print("=" * 80)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Audit PDF rendering benchmark
+
+Renders the security audit report for synthetic event logs of 1k, 10k and
+100k rows with the fast canvas table, and for comparison with the detailed
+Paragraph table where that finishes in reasonable time. Events are stored in
+a temporary SQLite database and read back through load_report_data, the same
+keyset-batched path as report jobs.
+
+Each run happens in a fresh process so its peak RSS is its own: the render
+process, and with --workers the largest page-range worker.
+
+Usage:
+    python benchmark_report_pdf.py                # 1k, 10k, 100k
+    python benchmark_report_pdf.py 5000 50000     # custom sizes
+    python benchmark_report_pdf.py --detailed     # also time detailed mode up to 10k
+    python benchmark_report_pdf.py --workers=4    # also time page-range rendering on 4 processes
+"""
+
+import os
+import sys
+import time
+import resource
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, insert
+
+import report_engine
+from models import db, EventLog
+
+EVENT_TYPES = ('door_open', 'door_close', 'door_open', 'door_close', 'alarm_triggered', 'timer_set')
+DETAILED_LIMIT = 10000
+INSERT_BATCH = 10000
+
+
+def synthetic_database(path, rows):
+    """SQLite database holding `rows` synthetic events in January 2025"""
+    engine = create_engine(f"sqlite:///{path}")
+    db.metadata.create_all(engine)
+    start = datetime(2025, 1, 1)
+    with engine.begin() as conn:
+        for offset in range(0, rows, INSERT_BATCH):
+            conn.execute(insert(EventLog.__table__), [
+                {'event_type': EVENT_TYPES[i % len(EVENT_TYPES)], 'description': f'Synthetic event {i}',
+                 'timestamp': start + timedelta(seconds=26 * i)}
+                for i in range(offset, min(offset + INSERT_BATCH, rows))])
+    engine.dispose()
+    return f"sqlite:///{path}"
+
+
+def render(uri, mode, workers, output):
+    """Runs in a fresh process: returns (seconds, own peak RSS KB, largest worker peak RSS KB)"""
+    params = {'start_date': '2025-01-01', 'end_date': '2025-01-31', 'event_types': [],
+              'date_fmt': '%Y-%m-%d', 'time_fmt': '%H:%M:%S', 'render_mode': mode,
+              'render_workers': workers, 'generated_by': {'username': 'benchmark'}}
+    started = time.perf_counter()
+    report = report_engine.load_report_data(uri, params)
+    report_engine.render_audit_pdf(report, params, output)
+    elapsed = time.perf_counter() - started
+    return (elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+
+def run(uri, rows, mode, workers=1):
+    context = multiprocessing.get_context('fork')
+    with tempfile.NamedTemporaryFile(suffix='.pdf') as output:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            elapsed, peak_kb, worker_peak_kb = pool.submit(render, uri, mode, workers, output.name).result()
+        size = os.path.getsize(output.name)
+    label = f"{mode} x{workers}" if workers > 1 else mode
+    workers_rss = f"  workers {worker_peak_kb / 1024:5.0f} MB" if workers > 1 else ''
+    print(f"  {label:<9} {rows:>8,} rows  {elapsed:8.2f}s  {rows / elapsed:10,.0f} rows/s  "
+          f"{size / 1024 / 1024:7.1f} MB PDF  peak RSS {peak_kb / 1024:5.0f} MB{workers_rss}")
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    sizes = [int(a) for a in args] or [1000, 10000, 100000]
+    workers = [int(a.split('=', 1)[1]) for a in sys.argv[1:] if a.startswith('--workers=')]
+
+    print("📄 eDOMOS Audit PDF Benchmark")
+    print("=" * 80)
+    with tempfile.TemporaryDirectory() as tmp:
+        databases = {rows: synthetic_database(os.path.join(tmp, f'events_{rows}.db'), rows) for rows in sizes}
+        for rows in sizes:
+            run(databases[rows], rows, 'fast')
+        if workers:
+            # Page-range rendering only kicks in above the parallel threshold
+            report_engine.PARALLEL_RENDER_THRESHOLD = 0
+            for rows in sizes:
+                run(databases[rows], rows, 'fast', workers[0])
+        if '--detailed' in sys.argv:
+            for rows in sizes:
+                if rows <= DETAILED_LIMIT:
+                    run(databases[rows], rows, 'detailed')
+    print("=" * 80)
+
+
+if __name__ == '__main__':
+    main()
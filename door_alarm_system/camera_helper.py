@@ -6,11 +6,15 @@ Auto-detects available camera and provides graceful fallback
 
 import os
 import cv2
+import time
 import hashlib
+import threading
 from datetime import datetime
 from pathlib import Path
 import logging
 
+from image_retention import ImageRetentionManager
+
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -34,7 +38,10 @@ class CameraManager:
                     'resolution': (1920, 1080),
                     'quality': 85,
                     'storage_path': 'static/captures',
-                    'auto_detect': True
+                    'auto_detect': True,
+                    'retention_days': 90,
+                    'max_storage_gb': 50,
+                    'retention_check_interval': 300
                 }
         """
         self.config = config or {}
@@ -42,6 +49,9 @@ class CameraManager:
         self.camera_available = False
         self.camera_type = None
         
+        # Serializes access to the capture device (grabber, stream, event captures)
+        self.camera_lock = threading.RLock()
+        
         # Default configuration
         self.enabled = self.config.get('enabled', True)
         self.required = self.config.get('required', False)
@@ -55,6 +65,21 @@ class CameraManager:
         # Ensure storage directory exists
         Path(self.storage_path).mkdir(parents=True, exist_ok=True)
         
+        # Indexed retention (enforces retention_days and max_storage_gb)
+        self.retention = ImageRetentionManager(
+            self.storage_path,
+            retention_days=self.config.get('retention_days', 90),
+            max_storage_gb=self.config.get('max_storage_gb', 50),
+            interval=self.config.get('retention_check_interval', 300)
+        )
+        
+        # Latest-frame grabber for snapshot polling (started on first use)
+        self.grabber = FrameGrabber(
+            self,
+            fps=self.config.get('snapshot_fps', 5),
+            idle_timeout=self.config.get('snapshot_idle_timeout', 30)
+        )
+        
         # Initialize camera if enabled
         if self.enabled:
             self.initialize_camera()
@@ -192,6 +217,9 @@ class CameraManager:
             # Get file size
             file_size = os.path.getsize(filepath)
             
+            # Index capture for retention enforcement
+            self.retention.register(filepath, file_size, timestamp, event_id)
+            
             logger.info(f"📸 Image captured: {filename} ({file_size} bytes)")
             
             return {
@@ -215,13 +243,14 @@ class CameraManager:
             # USB webcams buffer multiple frames, so we need to flush the buffer
             # to get the most recent frame
             logger.info("📸 Flushing camera buffer to get fresh frame...")
-            for i in range(5):  # Read and discard 5 buffered frames
+            with self.camera_lock:
+                for i in range(5):  # Read and discard 5 buffered frames
+                    ret, frame = self.camera.read()
+                    if not ret:
+                        logger.warning(f"Failed to read buffer frame {i+1}/5")
+                
+                # Now capture the fresh frame
                 ret, frame = self.camera.read()
-                if not ret:
-                    logger.warning(f"Failed to read buffer frame {i+1}/5")
-            
-            # Now capture the fresh frame
-            ret, frame = self.camera.read()
             
             if not ret or frame is None:
                 logger.error("Failed to capture frame from USB camera")
@@ -242,13 +271,35 @@ class CameraManager:
         """Capture image from Pi Camera"""
         try:
             # Capture to file
-            self.camera.capture_file(filepath)
+            with self.camera_lock:
+                self.camera.capture_file(filepath)
             return True
             
         except Exception as e:
             logger.error(f"Pi Camera capture error: {e}")
             return False
     
+    def read_frame(self):
+        """
+        Read a single BGR frame from the camera
+        
+        Returns:
+            numpy array or None if no frame could be read
+        """
+        if not self.camera_available or not self.camera:
+            return None
+        
+        try:
+            with self.camera_lock:
+                if self.camera_type == 'usb':
+                    ret, frame = self.camera.read()
+                    return frame if ret else None
+                elif self.camera_type == 'picamera':
+                    return cv2.cvtColor(self.camera.capture_array(), cv2.COLOR_RGB2BGR)
+        except Exception as e:
+            logger.error(f"Frame read error: {e}")
+        return None
+    
     def _calculate_file_hash(self, filepath):
         """Calculate SHA-256 hash of image file for verification"""
         try:
@@ -284,7 +335,8 @@ class CameraManager:
             'type': self.camera_type,
             'resolution': self.resolution,
             'quality': self.quality,
-            'storage_path': self.storage_path
+            'storage_path': self.storage_path,
+            'retention': self.retention.get_stats()
         }
     
     def cleanup_old_images(self, days=90):
@@ -298,36 +350,29 @@ class CameraManager:
             Number of files deleted
         """
         try:
-            import time
-            
             logger.info(f"Cleaning up images older than {days} days...")
-            
-            storage_dir = Path(self.storage_path)
-            if not storage_dir.exists():
-                return 0
-            
-            current_time = time.time()
-            cutoff_time = current_time - (days * 24 * 60 * 60)
-            
-            deleted_count = 0
-            for image_file in storage_dir.glob("*.jpg"):
-                file_time = image_file.stat().st_mtime
-                if file_time < cutoff_time:
-                    image_file.unlink()
-                    deleted_count += 1
-                    logger.debug(f"Deleted old image: {image_file.name}")
-            
-            if deleted_count > 0:
-                logger.info(f"🗑️ Deleted {deleted_count} old images")
-            
-            return deleted_count
+            deleted = self.retention.enforce(retention_days=days, max_deletions=None)
+            return len(deleted)
             
         except Exception as e:
             logger.error(f"Image cleanup error: {e}")
             return 0
     
+    def start_retention(self, on_delete=None):
+        """
+        Start background retention enforcement
+        
+        Args:
+            on_delete: Optional callback receiving deleted CaptureEntry objects
+        """
+        if on_delete is not None:
+            self.retention.on_delete = on_delete
+        self.retention.start()
+    
     def close(self):
         """Release camera resources"""
+        self.retention.stop()
+        self.grabber.stop()
         if self.camera:
             try:
                 if self.camera_type == 'usb':
@@ -342,6 +387,154 @@ class CameraManager:
                 self.camera_available = False
 
 
+class FrameGrabber:
+    """
+    Background grabber holding the camera's latest frame
+    
+    Frames are numbered with a sequence number and JPEG-encoded lazily, at
+    most once per frame and size, so any number of snapshot pollers share one
+    encode. The thread starts on first use and stops after idle_timeout
+    seconds without requests.
+    """
+    
+    MAX_VARIANTS = 4  # Cached encodings (sizes) kept per frame
+    
+    def __init__(self, camera_manager, fps=5, idle_timeout=30, quality=None):
+        self.camera_manager = camera_manager
+        self.interval = 1.0 / max(fps, 0.1)
+        self.idle_timeout = idle_timeout
+        self.quality = quality or camera_manager.quality
+        
+        # Distinguishes sequence numbers across grabber restarts (used in ETags)
+        self.epoch = format(int(time.time() * 1000) & 0xFFFFFFFF, 'x')
+        
+        self._lock = threading.Lock()
+        self._frame = None
+        self._seq = 0
+        self._timestamp = None
+        self._encoded = {}
+        self._first_frame = threading.Event()
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._last_access = 0
+    
+    @property
+    def sequence(self):
+        """Sequence number of the latest frame (0 if none yet)"""
+        return self._seq
+    
+    @property
+    def timestamp(self):
+        """Capture time of the latest frame"""
+        return self._timestamp
+    
+    def touch(self, wait=2.0):
+        """
+        Mark the grabber as in use, starting it if needed
+        
+        Args:
+            wait: Seconds to wait for the first frame after a cold start
+        
+        Returns:
+            True if a frame is available
+        """
+        if not self.camera_manager.camera_available:
+            return False
+        
+        # Under the lock the running thread either sees this access before
+        # deciding to idle out, or has already retired and a new one starts
+        with self._lock:
+            self._last_access = time.time()
+            if self._thread is None or not self._thread.is_alive():  # Not started, retired or crashed
+                self._stop_event.clear()
+                self._thread = threading.Thread(target=self._run, name="FrameGrabber")
+                self._thread.daemon = True
+                self._thread.start()
+        
+        return self._first_frame.wait(wait)
+    
+    def stop(self):
+        """Stop the grabber thread"""
+        self._stop_event.set()
+        thread = self._thread
+        if thread and thread.is_alive():
+            thread.join(timeout=2.0)
+    
+    def _run(self):
+        logger.info("Frame grabber started")
+        while True:
+            with self._lock:
+                if self._stop_event.is_set() or time.time() - self._last_access > self.idle_timeout:
+                    # Retire before releasing the lock: drop the stale frame so a
+                    # restart waits for a fresh one, and let touch() start a new thread
+                    self._thread = None
+                    self._frame = None
+                    self._encoded = {}
+                    self._first_frame.clear()
+                    break
+            
+            frame = self.camera_manager.read_frame()
+            if frame is not None:
+                with self._lock:
+                    self._frame = frame
+                    self._seq += 1
+                    self._timestamp = datetime.now()
+                    self._encoded = {}
+                self._first_frame.set()
+            
+            self._stop_event.wait(self.interval)
+        
+        logger.info("Frame grabber stopped")
+    
+    def get_jpeg(self, width=None, height=None):
+        """
+        Get the latest frame as JPEG bytes
+        
+        Args:
+            width: Optional output width (aspect kept if height omitted)
+            height: Optional output height (aspect kept if width omitted)
+        
+        Returns:
+            (sequence, timestamp, jpeg_bytes) or None if no frame yet
+        """
+        key = (width, height)
+        with self._lock:
+            frame = self._frame
+            seq = self._seq
+            timestamp = self._timestamp
+            cached = self._encoded.get(key)
+        
+        if frame is None:
+            return None
+        if cached is not None:
+            return seq, timestamp, cached
+        
+        # Encode outside the lock so slow encodes never stall the grabber
+        output = frame.copy()
+        if width or height:
+            src_h, src_w = output.shape[:2]
+            if not height:
+                height = max(1, round(src_h * width / src_w))
+            elif not width:
+                width = max(1, round(src_w * height / src_h))
+            interpolation = cv2.INTER_AREA if width < src_w else cv2.INTER_LINEAR
+            output = cv2.resize(output, (width, height), interpolation=interpolation)
+        
+        cv2.putText(output, timestamp.strftime("%Y-%m-%d %H:%M:%S"), (10, 30),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+        ret, buffer = cv2.imencode('.jpg', output, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ret:
+            return None
+        jpeg = buffer.tobytes()
+        
+        with self._lock:
+            # Only cache if the frame has not been superseded meanwhile
+            if self._seq == seq and len(self._encoded) < self.MAX_VARIANTS:
+                self._encoded[key] = jpeg
+        
+        return seq, timestamp, jpeg
+
+
 # Global camera manager instance (initialized later with config)
 camera_manager = None
 
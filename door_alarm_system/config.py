@@ -6,17 +6,107 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///alarm_system.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     PERMANENT_SESSION_LIFETIME = timedelta(minutes=30)  # Session timeout
-    SOCKETIO_ASYNC_MODE = 'eventlet'
+    # Socket.IO server mode: 'threading' for the development server,
+    # 'eventlet' or 'gevent' for cooperative production workers (see wsgi.py)
+    SOCKETIO_ASYNC_MODE = os.environ.get('SOCKETIO_ASYNC_MODE') or 'threading'
+    # Optional message queue shared by web worker processes (e.g.
+    # redis://localhost:6379/0, needs a Redis server; the client is in
+    # requirements.txt); unset keeps Socket.IO delivery in-process, which is
+    # enough for a single worker or workers behind the hardware controller
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE') or None
+    # Exactly one process owns GPIO, camera and the monitoring threads
+    HARDWARE_OWNER = os.environ.get('EDOMOS_HARDWARE_OWNER', 'true').lower() == 'true'
+    # Unix socket of the hardware controller daemon (hardware_controller.py);
+    # web workers with HARDWARE_OWNER=false read door/alarm state from it
+    CONTROLLER_SOCKET = os.environ.get('EDOMOS_CONTROLLER_SOCKET') or None
     
-    # Email configuration (will be set by admin)
-    MAIL_SERVER = 'smtp.gmail.com'
-    MAIL_PORT = 587
-    MAIL_USE_TLS = True
+    # Email configuration (sender and password are set by admin)
+    # For a local debugging SMTP server: MAIL_SERVER=localhost MAIL_PORT=1025
+    # MAIL_USE_TLS=false MAIL_USE_AUTH=false
+    MAIL_SERVER = os.environ.get('MAIL_SERVER') or 'smtp.gmail.com'
+    MAIL_PORT = int(os.environ.get('MAIL_PORT') or 587)
+    MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS', 'true').lower() == 'true'
+    MAIL_USE_AUTH = os.environ.get('MAIL_USE_AUTH', 'true').lower() == 'true'
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME') or ''
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD') or ''
     MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER') or ''
     RECIPIENT_EMAILS = []  # Will be populated from database
     
+    # Outbound email queue (see email_outbox.py)
+    EMAIL_OUTBOX_CONFIG = {
+        'batch_size': 20,             # Messages sent per pass over one SMTP connection
+        'max_attempts': 8,            # Delivery attempts before a message is marked failed
+        'retry_base': 30,             # Seconds before the first retry (doubles each attempt)
+        'retry_max': 3600,            # Longest retry delay
+        'idle_close': 60,             # Seconds an idle SMTP connection is kept open
+    }
+    
+    # Background report jobs (PDF/CSV generation off the request thread)
+    REPORT_JOB_CONFIG = {
+        'workers': 2,                 # Reports generated concurrently
+        'artifact_ttl': 3600,         # Seconds a finished report stays downloadable
+        'sync_timeout': 20,           # Max seconds a legacy (non-async) request waits (then 202)
+        'scheduled_timeout': 600,     # Max seconds the scheduler waits for a scheduled report
+        # Processes per very large PDF (page ranges merged with pypdf). 1 keeps
+        # rendering in one process; no speedup has been measured yet that
+        # outweighs the serial merge, so raise it only after benchmarking
+        # (benchmark_report_pdf.py --workers=N) on the target hardware
+        'render_processes': 1,
+        'cache_max_mb': 256,          # Disk space for cached reports (0 disables the cache)
+    }
+    
+    # Scheduled report delivery
+    REPORT_SCHEDULER_CONFIG = {
+        'workers': 2,                 # Scheduled reports generated/sent concurrently
+        'resync_interval': 300,       # Max seconds before schedules are re-read
+        'max_catchup_runs': 3,        # Missed occurrences still sent after downtime
+        'max_attempts': 3,            # Tries per occurrence (failures and interrupted runs)
+        'retry_delay': 900,           # Seconds before a failed run is retried
+    }
+    
+    # Door anomaly rules (see anomaly_rules.py)
+    ANOMALY_RULES_CONFIG = {
+        'extra_rules': [],            # Window rules added to repeated_opens, e.g.
+                                      # {'name': 'alarm_burst', 'event_type': 'alarm_triggered',
+                                      #  'count': 2, 'window': 3600, 'severity': 'high'}
+        'settings_ttl': 60,           # Seconds business hours are cached
+        'flush_interval': 2.0,        # Max seconds before detected anomalies are written
+        'batch_size': 50,             # Pending anomalies that force a write
+    }
+
+    # Performance metrics (perf_metrics.py); /metrics is only served to these peers
+    METRICS_CONFIG = {
+        'allowed_ips': ['127.0.0.1', '::1'],   # Single IPs or CIDR ranges, e.g. '10.0.0.0/24' for a scraper
+    }
+
+    # Slow query log (slow_queries.py, /admin/slow-queries)
+    SLOW_QUERY_CONFIG = {
+        'threshold': float(os.environ.get('EDOMOS_SLOW_QUERY_SECONDS', '0.1')),  # Seconds
+        'max_entries': 200,           # Distinct query fingerprints kept
+        'explain': True,              # Capture EXPLAIN QUERY PLAN for SELECTs
+    }
+
+    # Door event latency tracing (event_trace.py)
+    EVENT_TRACE_CONFIG = {
+        'window': 1000,               # Samples per stage for p50/p95/p99
+        'budgets': {},                # Stage: seconds, overriding event_trace.DEFAULT_BUDGETS
+        'alert_interval': 60,         # Minimum seconds between alerts for one stage
+    }
+
+    # Door flap detection (door_flap.py)
+    DOOR_FLAP_CONFIG = {
+        'threshold': 6,               # Open/close transitions within the window that start an episode
+        'window': 10,                 # Seconds
+        'quiet': 5,                   # Seconds without a transition that end an episode
+        'max_span': 60,               # Seconds before a still-flapping episode is summarized
+    }
+    
+    # AI model snapshots (see ai_security.py)
+    AI_SNAPSHOT_CONFIG = {
+        'interval': 60,               # Seconds before unsaved learning is written
+        'max_changes': 500,           # Learned events that trigger an earlier write
+    }
+    
     # Camera configuration
     CAMERA_CONFIG = {
         'enabled': True,              # Enable/disable camera feature
@@ -32,5 +122,8 @@ class Config:
         'capture_on_alarm': True,     # Capture image when alarm triggers
         'retention_days': 90,         # Delete images older than this
         'max_storage_gb': 50,         # Maximum storage for images (GB)
+        'retention_check_interval': 300,  # Seconds between retention passes
         'timestamp_overlay': False,   # Add timestamp text to image (optional)
+        'snapshot_fps': 5,            # Frame grabber rate while snapshots are polled
+        'snapshot_idle_timeout': 30,  # Stop grabber after this many idle seconds
     }
\ No newline at end of file
@@ -8,6 +8,9 @@ import pytest
 import os
 import sys
 import tempfile
+import threading
+from collections import Counter
+from contextlib import contextmanager
 from datetime import datetime
 
 # Add parent directory to path for imports
@@ -25,7 +28,101 @@ except (ImportError, RuntimeError):
 from app import app as flask_app, db as database
 from models import User, Setting, EventLog, CompanyProfile, DoorSystemInfo
 from config import Config
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 from sqlalchemy.exc import IntegrityError
+from flask import request_started, request_finished, request as flask_request
+from slow_queries import fingerprint
+
+
+# ============================================================================
+# SQL QUERY BUDGETS
+# ============================================================================
+
+class QueryCounter:
+    """
+    SQL statements executed by the current thread while active (every Engine)
+
+    Statements from background threads (broadcaster, anomaly writer, ...) are
+    not counted, so counts only cover what the code under test ran itself.
+    """
+    
+    def __init__(self):
+        self.statements = []
+        self._thread = None
+    
+    def __enter__(self):
+        self._thread = threading.get_ident()
+        event.listen(Engine, 'before_cursor_execute', self._record)
+        return self
+    
+    def __exit__(self, *exc):
+        event.remove(Engine, 'before_cursor_execute', self._record)
+        return False
+    
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == self._thread:
+            self.statements.append(statement)
+    
+    @property
+    def count(self):
+        return len(self.statements)
+
+
+def query_budget_failure(label, statements, max_queries):
+    """Failure message listing the statements grouped by fingerprint, most repeated first"""
+    counts = Counter(fingerprint(statement) for statement in statements)
+    listing = '\n'.join(f'  {count:>4} x {text[:400]}' for text, count in counts.most_common())
+    return f"{label} ran {len(statements)} SQL statements, budget is {max_queries}:\n{listing}"
+
+
+@pytest.fixture
+def query_budget():
+    """
+    Assert a block stays within a number of SQL statements
+    
+        with query_budget(3, 'GET /api/dashboard'):
+            admin_auth.get('/api/dashboard')
+    
+    The context manager yields the QueryCounter for further assertions.
+    """
+    @contextmanager
+    def budget(max_queries, label='block'):
+        with QueryCounter() as counter:
+            yield counter
+        if counter.count > max_queries:
+            pytest.fail(query_budget_failure(label, counter.statements, max_queries), pytrace=False)
+    return budget
+
+
+class RequestQueryRecorder:
+    """SQL statements per Flask request handled by the current thread"""
+    
+    def __init__(self, app):
+        self.app = app
+        self.requests = []          # ('METHOD /path', [statements])
+        self._counter = None
+    
+    def __enter__(self):
+        request_started.connect(self._started, self.app)
+        request_finished.connect(self._finished, self.app)
+        return self
+    
+    def __exit__(self, *exc):
+        request_started.disconnect(self._started, self.app)
+        request_finished.disconnect(self._finished, self.app)
+        if self._counter:
+            self._counter.__exit__()
+        return False
+    
+    def _started(self, sender, **extra):
+        self._counter = QueryCounter().__enter__()
+    
+    def _finished(self, sender, response, **extra):
+        if self._counter:
+            self._counter.__exit__()
+            self.requests.append((f'{flask_request.method} {flask_request.path}', self._counter.statements))
+            self._counter = None
 
 
 @pytest.fixture(scope='function')
@@ -293,3 +390,38 @@ def pytest_configure(config):
     config.addinivalue_line(
         "markers", "cfr: 21 CFR Part 11 compliance tests"
     )
+    config.addinivalue_line(
+        "markers", "query_budget(request, max_queries): fail if a matching request during the test "
+                   "runs more SQL statements, e.g. query_budget('GET /api/dashboard', 3)"
+    )
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_call(item):
+    """
+    Enforce query_budget markers: every request made in the test body
+    (fixture setup such as logging in is not counted) that matches a
+    marker's 'METHOD /path' - or just '/path' for any method - must stay
+    within its statement budget; the failure lists the offending statements.
+    """
+    budgets = [marker.args for marker in item.iter_markers('query_budget')]
+    if not budgets:
+        yield
+        return
+    
+    with RequestQueryRecorder(flask_app) as recorder:
+        outcome = yield
+    if outcome.excinfo is not None:
+        return
+    
+    failures = []
+    for target, max_queries in budgets:
+        matching = [(label, statements) for label, statements in recorder.requests
+                    if label == target or label.split(' ', 1)[1] == target]
+        if not matching:
+            failures.append(f"query_budget: no request matched {target!r} "
+                            f"(made: {', '.join(label for label, _ in recorder.requests) or 'none'})")
+        failures.extend(query_budget_failure(label, statements, max_queries)
+                        for label, statements in matching if len(statements) > max_queries)
+    if failures:
+        outcome.force_exception(pytest.fail.Exception('\n\n'.join(failures), pytrace=False))
@@ -0,0 +1,134 @@
+"""
+Door Flap Aggregator for eDOMOS
+Recognizes high-frequency open/close toggling (a misaligned magnet, a door
+propped and nudged) and logs one door_flapping summary per episode instead
+of a full event per toggle, so a faulty sensor does not drive a database,
+blockchain, camera and AI pass per transition.
+"""
+
+import time
+import logging
+from collections import deque
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class FlapDetector:
+    """
+    Per-door flap detection on debounced sensor transitions
+
+    Transitions are logged individually until `threshold` of them fall
+    within `window` seconds. From then on they are only counted; once the
+    door has been quiet for `quiet` seconds the episode is logged as one
+    door_flapping event (counts, span) followed by the state the door
+    settled in, if that differs from the last logged state. Episodes longer
+    than `max_span` seconds are summarized in parts so a door that never
+    settles is still recorded.
+
+    Every transition is either logged or counted in a summary, so the audit
+    trail accounts for all of them.
+    """
+
+    def __init__(self, emit, threshold=6, window=10.0, quiet=5.0, max_span=60.0, clock=time.time):
+        """
+        Args:
+            emit: Callable(event_type, description, **context) logging an event
+            threshold: Transitions within `window` seconds that start an episode
+            window: Seconds the transition rate is measured over
+            quiet: Seconds without a transition that end an episode
+            max_span: Longest episode part before a summary is logged
+            clock: Current time in seconds (time.time)
+        """
+        self.emit = emit
+        self.threshold = threshold
+        self.window = window
+        self.quiet = quiet
+        self.max_span = max_span
+        self.clock = clock
+
+        self._recent = deque()      # Times of transitions within the window
+        self._logged_open = None    # Door state of the last logged open/close
+        self.flapping = False
+        self._start = self._last = None
+        self._opens = self._closes = 0
+        self._state = None
+        self.episodes = 0
+        self.suppressed = 0
+
+    def transition(self, is_open, now=None, **context):
+        """
+        Record a debounced door transition
+
+        Args:
+            context: Passed on to emit when the transition is logged
+                individually (e.g. a latency trace id)
+
+        Returns:
+            True if it was logged as door_open/door_close, False if it was
+            counted into a flapping episode
+        """
+        now = self.clock() if now is None else now
+        self.poll(now)
+        self._recent.append(now)
+        while self._recent and now - self._recent[0] > self.window:
+            self._recent.popleft()
+
+        if not self.flapping and len(self._recent) >= self.threshold:
+            self.flapping = True
+            self.episodes += 1
+            self._start = now
+            logger.warning(f"Door flapping: {len(self._recent)} transitions within {self.window:g}s")
+
+        if self.flapping:
+            self._last = now
+            self._state = is_open
+            if is_open:
+                self._opens += 1
+            else:
+                self._closes += 1
+            self.suppressed += 1
+            return False
+
+        self._log_state(is_open, **context)
+        return True
+
+    def poll(self, now=None):
+        """Close or split the current episode when due (call periodically)"""
+        if not self.flapping:
+            return
+        now = self.clock() if now is None else now
+        if now - self._last >= self.quiet:
+            self._summarize(settled=True)
+            self.flapping = False
+            self._recent.clear()
+            if self._state != self._logged_open:
+                self._log_state(self._state)
+        elif now - self._start >= self.max_span:
+            self._summarize(settled=False)
+            self._start = now
+
+    def _log_state(self, is_open, **context):
+        self._logged_open = is_open
+        if is_open:
+            self.emit('door_open', 'Door opened', **context)
+        else:
+            self.emit('door_close', 'Door closed', **context)
+
+    def _summarize(self, settled):
+        count = self._opens + self._closes
+        if count:
+            start, end = datetime.fromtimestamp(self._start), datetime.fromtimestamp(self._last)
+            outcome = f"door settled {'open' if self._state else 'closed'}" if settled else "still flapping"
+            self.emit('door_flapping',
+                      f"Door flapping: {count} transitions ({self._opens} opens, {self._closes} closes) "
+                      f"over {self._last - self._start:.1f}s from {start:%H:%M:%S} to {end:%H:%M:%S}; {outcome}")
+        self._opens = self._closes = 0
+
+    def get_stats(self):
+        return {
+            'flapping': self.flapping,
+            'episodes': self.episodes,
+            'suppressed': self.suppressed,
+            'recent_transitions': len(self._recent),
+        }
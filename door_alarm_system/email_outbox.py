@@ -0,0 +1,298 @@
+"""
+Outbound Email Queue for eDOMOS
+Messages are written to the outbound_email table and delivered by a sender
+thread, so alarm handling never waits on an SMTP server. The sender keeps one
+authenticated SMTP connection open across a batch, retries failed messages
+with exponential backoff and survives restarts (pending rows are picked up
+again when it starts).
+
+For local debugging point MAIL_SERVER/MAIL_PORT at a debugging SMTP server
+and turn off TLS and login, e.g.:
+    python -m aiosmtpd -n -l localhost:1025
+    MAIL_SERVER=localhost MAIL_PORT=1025 MAIL_USE_TLS=false MAIL_USE_AUTH=false python app.py
+"""
+
+import time
+import smtplib
+import threading
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, select, update, insert, func
+
+from models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+EMAIL_PENDING = 'pending'
+EMAIL_SENDING = 'sending'
+EMAIL_SENT = 'sent'
+EMAIL_FAILED = 'failed'
+
+
+def _permanent(error):
+    """SMTP errors that will not go away by retrying (5xx replies about the message)"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    if isinstance(error, (smtplib.SMTPSenderRefused, smtplib.SMTPDataError)):
+        return error.smtp_code >= 500
+    return False
+
+
+class EmailOutbox:
+    """
+    Persistent outbox with a single sender thread
+
+    Rows are claimed with a conditional UPDATE (pending -> sending), so a row
+    is never handed to SMTP twice; rows left in 'sending' by a crash are
+    returned to the queue when the sender starts. Only the hardware owner
+    process runs a sender.
+    """
+
+    def __init__(self, source, settings, batch_size=20, max_attempts=8, retry_base=30,
+                 retry_max=3600, idle_close=60, poll_interval=30, smtp_factory=smtplib.SMTP):
+        """
+        Args:
+            source: SQLAlchemy Engine or database URI
+            settings: Callable returning the SMTP settings dict (host, port,
+                starttls, username, password), or None while email is not
+                configured; read for every batch so changes apply immediately
+            batch_size: Messages claimed per pass over one connection
+            max_attempts: Delivery attempts before a message is marked failed
+            retry_base: Seconds before the first retry (doubles per attempt)
+            retry_max: Upper bound of the retry delay
+            idle_close: Seconds an unused connection is kept open
+            poll_interval: Longest sleep between outbox scans
+            smtp_factory: SMTP client class (smtplib.SMTP)
+        """
+        self.engine = create_engine(source) if isinstance(source, str) else source
+        self.settings = settings
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.idle_close = idle_close
+        self.poll_interval = poll_interval
+        self.smtp_factory = smtp_factory
+
+        self.table = OutboundEmail.__table__
+        self._smtp = None
+        self._smtp_key = None
+        self._last_used = 0.0
+        self._configured = False
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.connections = 0
+
+    # ------------------------------------------------------------------
+    # Queueing
+    # ------------------------------------------------------------------
+
+    def enqueue(self, message, sender, recipients, subject='', category='general', priority=0):
+        """
+        Store a message for delivery and wake the sender
+
+        Args:
+            message: Complete MIME message as a string
+            sender: Envelope sender address
+            recipients: List of envelope recipients (sent in one transaction)
+            priority: Higher is sent first (alarm alerts jump report emails)
+
+        Returns:
+            Outbox row id
+        """
+        now = datetime.now()
+        with self.engine.begin() as conn:
+            result = conn.execute(insert(self.table).values(
+                sender=sender,
+                recipients=','.join(recipients),
+                subject=subject,
+                message=message,
+                category=category,
+                priority=priority,
+                status=EMAIL_PENDING,
+                attempts=0,
+                next_attempt_at=now,
+                created_at=now,
+            ))
+        self.wake()
+        return result.inserted_primary_key[0]
+
+    def wake(self):
+        self._wake_event.set()
+
+    # ------------------------------------------------------------------
+    # Sender thread
+    # ------------------------------------------------------------------
+
+    def start(self):
+        if self.is_alive():
+            return
+        self._stop_event.clear()
+        with self.engine.begin() as conn:
+            conn.execute(update(self.table).where(self.table.c.status == EMAIL_SENDING)
+                         .values(status=EMAIL_PENDING))
+        self._thread = threading.Thread(target=self._run, name="EmailOutbox")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=2.0):
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._close()
+
+    def is_alive(self):
+        return bool(self._thread and self._thread.is_alive())
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._wake_event.clear()
+            try:
+                processed = self.send_pending()
+            except Exception as e:
+                logger.error(f"Email outbox pass failed: {e}")
+                processed = 0
+            if processed >= self.batch_size:
+                continue  # More waiting - keep the connection busy
+            if self._smtp is not None and time.monotonic() - self._last_used > self.idle_close:
+                self._close()
+            # Unconfigured email leaves due rows waiting - don't spin on them
+            self._wake_event.wait(self._next_wait() if self._configured else self.poll_interval)
+
+    def _next_wait(self):
+        timeout = self.poll_interval
+        if self._smtp is not None:
+            timeout = min(timeout, self.idle_close)
+        with self.engine.connect() as conn:
+            next_due = conn.execute(select(func.min(self.table.c.next_attempt_at))
+                                    .where(self.table.c.status == EMAIL_PENDING)).scalar()
+        if next_due is not None:
+            timeout = min(timeout, (next_due - datetime.now()).total_seconds())
+        return max(timeout, 0.0)
+
+    def send_pending(self):
+        """
+        Deliver one batch of due messages over a shared connection
+
+        Returns:
+            Number of messages attempted
+        """
+        settings = self.settings()
+        self._configured = bool(settings)
+        if not settings:
+            return 0
+        rows = self._claim_batch()
+        for row in rows:
+            self._deliver(row, settings)
+        return len(rows)
+
+    def _claim_batch(self):
+        table = self.table
+        with self.engine.begin() as conn:
+            candidates = conn.execute(
+                select(table).where(table.c.status == EMAIL_PENDING,
+                                    table.c.next_attempt_at <= datetime.now())
+                .order_by(table.c.priority.desc(), table.c.id).limit(self.batch_size)
+            ).all()
+            claimed = []
+            for row in candidates:
+                result = conn.execute(update(table).where(table.c.id == row.id, table.c.status == EMAIL_PENDING)
+                                      .values(status=EMAIL_SENDING))
+                if result.rowcount:
+                    claimed.append(row)
+        return claimed
+
+    # ------------------------------------------------------------------
+    # SMTP
+    # ------------------------------------------------------------------
+
+    def _connect(self, settings):
+        key = (settings['host'], settings['port'], settings.get('starttls'), settings.get('username'),
+               settings.get('password'))
+        if self._smtp is not None and key == self._smtp_key:
+            return self._smtp
+        self._close()
+        smtp = self.smtp_factory(settings['host'], settings['port'], timeout=30)
+        try:
+            smtp.ehlo()
+            if settings.get('starttls'):
+                smtp.starttls()
+                smtp.ehlo()
+            if settings.get('username'):
+                smtp.login(settings['username'], settings['password'])
+        except Exception:
+            try:
+                smtp.close()
+            except Exception:
+                pass
+            raise
+        self._smtp, self._smtp_key = smtp, key
+        self.connections += 1
+        logger.info(f"SMTP connection opened to {settings['host']}:{settings['port']}")
+        return smtp
+
+    def _close(self):
+        smtp, self._smtp, self._smtp_key = self._smtp, None, None
+        if smtp is not None:
+            try:
+                smtp.quit()
+            except Exception:
+                try:
+                    smtp.close()
+                except Exception:
+                    pass
+
+    def _sendmail(self, row, settings):
+        recipients = [address for address in row.recipients.split(',') if address]
+        try:
+            return self._connect(settings).sendmail(row.sender, recipients, row.message)
+        except smtplib.SMTPServerDisconnected:
+            # The server dropped an idle connection - reconnect once
+            self._close()
+            return self._connect(settings).sendmail(row.sender, recipients, row.message)
+
+    def _deliver(self, row, settings):
+        attempts = row.attempts + 1
+        values = {'attempts': attempts}
+        try:
+            refused = self._sendmail(row, settings)
+            self._last_used = time.monotonic()
+            values.update(status=EMAIL_SENT, sent_at=datetime.now(), last_error=None)
+            if refused:
+                values['last_error'] = f"Refused recipients: {', '.join(sorted(refused))}"
+                logger.warning(f"Email {row.id}: {values['last_error']}")
+            self.sent += 1
+        except Exception as e:
+            if not isinstance(e, smtplib.SMTPResponseException) or isinstance(e, smtplib.SMTPAuthenticationError):
+                self._close()  # Connection state is unknown
+            values['last_error'] = str(e)
+            if _permanent(e) or attempts >= self.max_attempts:
+                values['status'] = EMAIL_FAILED
+                self.failed += 1
+                logger.error(f"Email {row.id} ({row.category}) failed permanently: {e}")
+            else:
+                delay = min(self.retry_base * 2 ** (attempts - 1), self.retry_max)
+                values.update(status=EMAIL_PENDING, next_attempt_at=datetime.now() + timedelta(seconds=delay))
+                self.retried += 1
+                logger.warning(f"Email {row.id} ({row.category}) attempt {attempts} failed, retrying in {delay}s: {e}")
+        with self.engine.begin() as conn:
+            conn.execute(update(self.table).where(self.table.c.id == row.id).values(**values))
+
+    def get_stats(self):
+        with self.engine.connect() as conn:
+            counts = dict(conn.execute(select(self.table.c.status, func.count())
+                                       .group_by(self.table.c.status)).all())
+        return {
+            'queued': counts.get(EMAIL_PENDING, 0) + counts.get(EMAIL_SENDING, 0),
+            'sent': self.sent,
+            'failed': self.failed,
+            'retried': self.retried,
+            'connections': self.connections,
+            'connected': self._smtp is not None,
+        }
@@ -0,0 +1,150 @@
+"""
+Door Event Latency Tracing for eDOMOS
+Follows a door event from the GPIO edge to the browser: each stage is stamped
+with time.monotonic() and the time since the previous stage is kept in a
+rolling window per stage, reported as p50/p95/p99. A stage slower than its
+budget raises a (rate-limited) alert.
+"""
+
+import time
+import uuid
+import threading
+import logging
+from collections import deque, OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Stages in pipeline order; the latency of a stage is measured from the one before it
+STAGES = ('gpio_edge', 'debounced', 'db_commit', 'enriched', 'emitted', 'acked')
+
+# Per-stage budgets in seconds; 'total' is GPIO edge to browser acknowledgement
+DEFAULT_BUDGETS = {
+    'debounced': 0.25,      # 50ms debounce plus the 100ms polling loop
+    'db_commit': 0.5,
+    'enriched': 2.0,        # Camera capture, blockchain, anomaly rules, AI
+    'emitted': 0.5,         # Statistics queries plus the broadcaster window
+    'acked': 2.0,           # Network and browser rendering
+    'total': 5.0,
+}
+
+
+class RollingPercentiles:
+    """The last `size` samples of one measurement, with percentiles on demand"""
+
+    def __init__(self, size=1000):
+        self.samples = deque(maxlen=size)
+        self.count = 0
+
+    def add(self, value):
+        self.samples.append(value)
+        self.count += 1
+
+    def percentiles(self, *quantiles):
+        ordered = sorted(self.samples)
+        if not ordered:
+            return [0.0 for _ in quantiles]
+        return [ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in quantiles]
+
+
+class EventTracer:
+    """
+    Stage timestamps of in-flight door event traces
+
+    start() opens a trace at the GPIO edge; mark() stamps later stages.
+    Stages may be skipped (an event nobody acknowledges), and a stage is
+    only recorded once per trace, so acknowledgements from several browsers
+    count the first one. At most `max_open` traces are kept; the oldest are
+    dropped first.
+    """
+
+    def __init__(self, window=1000, budgets=None, max_open=256, alert_interval=60.0,
+                 on_budget_exceeded=None, clock=time.monotonic):
+        """
+        Args:
+            window: Samples kept per stage for the percentiles
+            budgets: Seconds per stage (and 'total') overriding DEFAULT_BUDGETS
+            max_open: Traces kept waiting for later stages
+            alert_interval: Minimum seconds between alerts for the same stage
+            on_budget_exceeded: Callable(stage, seconds, budget, trace_id)
+            clock: Monotonic time in seconds
+        """
+        self.window = window
+        self.budgets = dict(DEFAULT_BUDGETS, **(budgets or {}))
+        self.max_open = max_open
+        self.alert_interval = alert_interval
+        self.on_budget_exceeded = on_budget_exceeded
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._traces = OrderedDict()    # trace_id -> {stage: monotonic time}
+        self._stats = {stage: RollingPercentiles(window) for stage in STAGES[1:] + ('total',)}
+        self._over_budget = dict.fromkeys(self._stats, 0)
+        self._last_alert = {}
+
+    def start(self, edge_at=None):
+        """Open a trace at the GPIO edge; returns its id"""
+        trace_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            self._traces[trace_id] = {'gpio_edge': self.clock() if edge_at is None else edge_at}
+            while len(self._traces) > self.max_open:
+                self._traces.popitem(last=False)
+        return trace_id
+
+    def mark(self, trace_id, stage, at=None):
+        """
+        Stamp a stage of a trace
+
+        Returns:
+            Seconds since the previous stamped stage, or None when the trace
+            is unknown (expired, another process) or the stage already stamped
+        """
+        if not trace_id:
+            return None
+        now = self.clock() if at is None else at
+        alerts = []
+        with self._lock:
+            stamps = self._traces.get(trace_id)
+            if stamps is None or stage in stamps:
+                return None
+            previous = max(stamps.values())
+            stamps[stage] = now
+            elapsed = now - previous
+            measured = [(stage, elapsed)]
+            if stage == STAGES[-1]:
+                measured.append(('total', now - stamps['gpio_edge']))
+                del self._traces[trace_id]
+            for name, seconds in measured:
+                self._stats[name].add(seconds)
+                budget = self.budgets.get(name)
+                if budget is not None and seconds > budget:
+                    self._over_budget[name] += 1
+                    if now - self._last_alert.get(name, float('-inf')) >= self.alert_interval:
+                        self._last_alert[name] = now
+                        alerts.append((name, seconds, budget))
+
+        for name, seconds, budget in alerts:
+            logger.warning(f"Door event stage '{name}' took {seconds * 1000:.0f}ms (budget {budget * 1000:.0f}ms)")
+            if self.on_budget_exceeded:
+                try:
+                    self.on_budget_exceeded(name, seconds, budget, trace_id)
+                except Exception as e:
+                    logger.error(f"Latency budget callback failed: {e}")
+        return elapsed
+
+    def get_stats(self):
+        """Per stage: samples, p50/p95/p99/max in milliseconds, budget and budget overruns"""
+        with self._lock:
+            stages = {}
+            for name, stat in self._stats.items():
+                p50, p95, p99 = stat.percentiles(0.50, 0.95, 0.99)
+                budget = self.budgets.get(name)
+                stages[name] = {
+                    'count': stat.count,
+                    'p50_ms': round(p50 * 1000, 1),
+                    'p95_ms': round(p95 * 1000, 1),
+                    'p99_ms': round(p99 * 1000, 1),
+                    'max_ms': round(max(stat.samples, default=0.0) * 1000, 1),
+                    'budget_ms': round(budget * 1000, 1) if budget is not None else None,
+                    'over_budget': self._over_budget[name],
+                }
+            return {'stages': stages, 'open_traces': len(self._traces)}
@@ -0,0 +1,124 @@
+"""
+Hardware Controller Daemon for eDOMOS
+Owns GPIO, the door monitor, alarm timer, audio and camera in a process that
+serves no HTTP traffic, so web load cannot perturb alarm timing. State and
+events are published to web workers over a local Unix socket (hardware_ipc.py)
+
+Usage:
+    export EDOMOS_CONTROLLER_SOCKET=/run/edomos/controller.sock
+    python hardware_controller.py                                    # controller
+    EDOMOS_HARDWARE_OWNER=false python wsgi.py                       # web worker(s)
+
+Only one controller may run: a second one refuses to start while the socket
+answers. The socket is created with mode 0660, so web workers must run as
+the controller's user or group.
+
+Web workers mirror the door/alarm state, rebroadcast events to their own
+Socket.IO clients and forward hardware commands here:
+    test_hooter         2-second siren test
+    reschedule_reports  a scheduled report was created, changed or deleted
+    settings_changed    timer duration / business hours were saved
+    camera_frame        latest camera frame for the live view and snapshots
+    trace_ack           a browser acknowledged a traced door event
+    trace_stats         door event latency statistics for the admin metrics
+    metrics             performance metrics (event ingestion stages) for /metrics
+Everything else a web worker does only touches the shared database.
+"""
+
+import os
+import sys
+import base64
+
+# This process is the single hardware owner regardless of the environment
+os.environ['EDOMOS_HARDWARE_OWNER'] = 'true'
+
+import threading
+
+from config import Config
+from hardware_ipc import ControllerServer, controller_running
+
+DEFAULT_SOCKET = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'controller.sock')
+
+# Checked before importing app, whose GPIO setup terminates every other
+# process using the GPIO pins - including a controller that is running
+if __name__ == '__main__' and controller_running(Config.CONTROLLER_SOCKET or DEFAULT_SOCKET):
+    sys.exit(f"A hardware controller is already running on {Config.CONTROLLER_SOCKET or DEFAULT_SOCKET}")
+
+import app as edomos  # noqa: E402
+
+
+def run_hooter_test():
+    """Command: 2-second siren test, run in the background like the web route"""
+    def worker():
+        edomos.test_hooter()
+        edomos.log_event('test_event', 'Hooter siren test completed via admin panel')
+    threading.Thread(target=worker, daemon=True).start()
+    return True
+
+
+def reschedule_reports():
+    """Command: a web worker changed a scheduled report"""
+    if edomos.report_scheduler is not None:
+        edomos.report_scheduler.wake()
+    return True
+
+
+def camera_frame(width=None, height=None, known_etags=()):
+    """Command: latest camera frame (JPEG base64 encoded, None if the worker has it already)"""
+    frame = edomos.local_camera_frame(width, height, tuple(known_etags))
+    if frame:
+        frame['timestamp'] = frame['timestamp'].isoformat()
+        if frame['jpeg'] is not None:
+            frame['jpeg'] = base64.b64encode(frame['jpeg']).decode('ascii')
+    return frame
+
+
+def trace_ack(trace_id, at):
+    """Command: close a door event trace with the time a web worker received the ack"""
+    return edomos.event_tracer.mark(trace_id, 'acked', at=at) is not None
+
+
+def metrics(summary=False):
+    """Command: this process's metrics, as a snapshot to merge or a JSON summary"""
+    return edomos.metrics.summary() if summary else edomos.metrics.snapshot()
+
+
+COMMANDS = {
+    'test_hooter': run_hooter_test,
+    'reschedule_reports': reschedule_reports,
+    'settings_changed': lambda: edomos.reload_hardware_settings(),
+    'camera_frame': camera_frame,
+    'trace_ack': trace_ack,
+    'trace_stats': lambda: edomos.event_tracer.get_stats(),
+    'metrics': metrics,
+}
+
+
+def main():
+    socket_path = Config.CONTROLLER_SOCKET or DEFAULT_SOCKET
+    server = ControllerServer(
+        socket_path,
+        commands=COMMANDS,
+        state_provider=edomos.hardware_state
+    )
+    edomos.controller_server = server
+
+    edomos.init_system()
+    server.start()
+    edomos.start_monitoring()
+    edomos.start_report_scheduler()
+    edomos.get_email_outbox()
+    print(f"[CONTROLLER] ✅ Hardware controller running - web workers connect to {socket_path}")
+
+    try:
+        while not edomos.shutdown_flag.wait(1.0):
+            pass
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        edomos.cleanup_and_exit()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,411 @@
+"""
+Hardware Controller IPC for eDOMOS
+Local Unix-socket channel between the hardware controller daemon (GPIO, door
+monitor, alarm timer, audio, camera) and stateless web workers
+
+Wire format is one JSON object per line:
+    controller -> worker   {"op": "state", "state": {...}}
+                           {"op": "event", "payload": {...}}
+                           {"op": "emit", "name": ..., "payload": {...}, "room": ...}
+                           {"op": "reply", "id": n, "ok": true, "result": ...}
+    worker -> controller   {"op": "command", "id": n, "name": ..., "args": {...}}
+"""
+
+import os
+import json
+import queue
+import socket
+import threading
+import itertools
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ControllerUnavailable(Exception):
+    """The hardware controller could not be reached or did not answer"""
+
+
+class ControllerAlreadyRunning(Exception):
+    """Another hardware controller is serving the socket path"""
+
+
+def controller_running(path, timeout=1.0):
+    """
+    True if a controller accepts connections on the socket path
+
+    A socket file nobody listens on is left over from a crashed controller.
+    A socket this user may not connect to counts as running, so it is never
+    taken over.
+    """
+    if not os.path.exists(path):
+        return False
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    probe.settimeout(timeout)
+    try:
+        probe.connect(path)
+        return True
+    except (ConnectionRefusedError, FileNotFoundError):
+        return False
+    except OSError:
+        return True
+    finally:
+        probe.close()
+
+
+def _encode(message):
+    return (json.dumps(message, default=str, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+class _Subscriber:
+    """Connected web worker with its own bounded send queue"""
+
+    def __init__(self, conn, max_queue):
+        self.conn = conn
+        self.outbox = queue.Queue(maxsize=max_queue)
+        self.alive = True
+
+    def send(self, data):
+        """Queue data without blocking; False if the worker is hopelessly behind"""
+        try:
+            self.outbox.put_nowait(data)
+            return True
+        except queue.Full:
+            return False
+
+    def close(self):
+        self.alive = False
+        try:
+            # shutdown() ends the peer's read even while makefile() holds the fd
+            self.conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        try:
+            self.conn.close()
+        except OSError:
+            pass
+        try:
+            self.outbox.put_nowait(None)  # Wake the writer so it exits
+        except queue.Full:
+            pass
+
+
+class ControllerServer:
+    """
+    Controller side of the channel
+
+    Publishing only queues messages, so a slow or stuck web worker never
+    delays the door monitor or alarm timer; a worker whose queue overflows is
+    disconnected and resynchronizes with a fresh state snapshot on reconnect.
+    """
+
+    def __init__(self, path, commands=None, state_provider=None, max_queue=1000,
+                 heartbeat=5.0, mode=0o660):
+        """
+        Args:
+            path: Unix socket path
+            commands: Dict of command name -> callable(**args) returning a
+                JSON-serializable result
+            state_provider: Callable returning the current hardware state dict
+            max_queue: Messages buffered per worker before it is dropped
+            heartbeat: Seconds between unsolicited state snapshots
+            mode: Socket file permissions; commands drive the siren, so
+                only the controller's user and group may connect
+        """
+        self.path = path
+        self.commands = dict(commands or {})
+        self.state_provider = state_provider
+        self.max_queue = max_queue
+        self.heartbeat = heartbeat
+        self.mode = mode
+
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._sock = None
+        self._stop_event = threading.Event()
+        self.published = 0
+        self.dropped_subscribers = 0
+
+    def start(self):
+        """
+        Bind the socket and start accepting web workers
+
+        Raises:
+            ControllerAlreadyRunning: Another controller answers on the path
+        """
+        if controller_running(self.path):
+            raise ControllerAlreadyRunning(f"A hardware controller is already listening on {self.path}")
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # Stale socket from a previous run
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(self.path)
+        # Connections are refused until listen(), so nobody gets in before the chmod
+        os.chmod(self.path, self.mode)
+        self._sock.listen(16)
+        self._stop_event.clear()
+        for target, name in ((self._accept_loop, "ControllerAccept"),
+                             (self._heartbeat_loop, "ControllerHeartbeat")):
+            thread = threading.Thread(target=target, name=name)
+            thread.daemon = True
+            thread.start()
+        logger.info(f"Hardware controller listening on {self.path}")
+
+    def stop(self):
+        """Close the listening socket and all worker connections"""
+        self._stop_event.set()
+        if self._sock:
+            for close in (lambda: self._sock.shutdown(socket.SHUT_RDWR), self._sock.close):
+                try:
+                    close()
+                except OSError:
+                    pass
+        with self._lock:
+            subscribers, self._subscribers = self._subscribers, []
+        for subscriber in subscribers:
+            subscriber.close()
+        if os.path.exists(self.path):
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+    # ------------------------------------------------------------------
+    # Publishing
+    # ------------------------------------------------------------------
+
+    def publish(self, message):
+        """Send a message to every connected web worker"""
+        data = _encode(message)
+        with self._lock:
+            subscribers = list(self._subscribers)
+            self.published += 1
+        for subscriber in subscribers:
+            if not subscriber.send(data):
+                logger.warning("Web worker fell behind - disconnecting it")
+                self._drop(subscriber)
+
+    def publish_state(self):
+        if self.state_provider:
+            self.publish({'op': 'state', 'state': self.state_provider()})
+
+    def publish_event(self, payload):
+        self.publish({'op': 'event', 'payload': payload})
+
+    def publish_emit(self, name, payload, room):
+        self.publish({'op': 'emit', 'name': name, 'payload': payload, 'room': room})
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def _drop(self, subscriber):
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+                self.dropped_subscribers += 1
+        subscriber.close()
+
+    # ------------------------------------------------------------------
+    # Connection handling
+    # ------------------------------------------------------------------
+
+    def _accept_loop(self):
+        while not self._stop_event.is_set():
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                break
+            subscriber = _Subscriber(conn, self.max_queue)
+            if self.state_provider:
+                subscriber.send(_encode({'op': 'state', 'state': self.state_provider()}))
+            with self._lock:
+                self._subscribers.append(subscriber)
+            for target in (self._writer, self._reader):
+                thread = threading.Thread(target=target, args=(subscriber,), name="ControllerConn")
+                thread.daemon = True
+                thread.start()
+
+    def _heartbeat_loop(self):
+        while not self._stop_event.wait(self.heartbeat):
+            try:
+                self.publish_state()
+            except Exception as e:
+                logger.error(f"Controller heartbeat failed: {e}")
+
+    def _writer(self, subscriber):
+        while subscriber.alive:
+            data = subscriber.outbox.get()
+            if data is None:
+                break
+            try:
+                subscriber.conn.sendall(data)
+            except OSError:
+                break
+        self._drop(subscriber)
+
+    def _reader(self, subscriber):
+        try:
+            for line in subscriber.conn.makefile('rb'):
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    continue
+                if message.get('op') == 'command':
+                    # Commands run off the reader so one slow command never
+                    # blocks the next line from this worker
+                    thread = threading.Thread(target=self._run_command, args=(subscriber, message))
+                    thread.daemon = True
+                    thread.start()
+        except OSError:
+            pass
+        self._drop(subscriber)
+
+    def _run_command(self, subscriber, message):
+        reply = {'op': 'reply', 'id': message.get('id')}
+        handler = self.commands.get(message.get('name'))
+        if handler is None:
+            reply.update(ok=False, error=f"Unknown command: {message.get('name')}")
+        else:
+            try:
+                reply.update(ok=True, result=handler(**(message.get('args') or {})))
+            except Exception as e:
+                logger.error(f"Controller command '{message.get('name')}' failed: {e}")
+                reply.update(ok=False, error=str(e))
+        subscriber.send(_encode(reply))
+
+
+class ControllerClient:
+    """
+    Web worker side of the channel
+
+    Keeps a read-only mirror of the controller's hardware state and passes
+    published events to callbacks. Reconnects in the background if the
+    controller restarts.
+    """
+
+    def __init__(self, path, on_event=None, on_emit=None, reconnect_delay=1.0):
+        """
+        Args:
+            path: Unix socket path of the controller
+            on_event: Callback receiving each published event payload
+            on_emit: Callback(name, payload, room) for one-off room emits
+            reconnect_delay: Seconds between connection attempts
+        """
+        self.path = path
+        self.on_event = on_event
+        self.on_emit = on_emit
+        self.reconnect_delay = reconnect_delay
+
+        self.state = {}
+        self.connected = False
+        self._sock = None
+        self._send_lock = threading.Lock()
+        self._pending = {}  # command id -> [threading.Event, reply]
+        self._ids = itertools.count(1)
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._state_ready = threading.Event()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="ControllerClient")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._close()
+
+    def wait_for_state(self, timeout=2.0):
+        """Block until the first state snapshot arrived"""
+        return self._state_ready.wait(timeout)
+
+    def command(self, name, timeout=5.0, **args):
+        """
+        Run a command in the controller and return its result
+
+        Raises:
+            ControllerUnavailable: Not connected, no reply in time, or the
+                command failed in the controller
+        """
+        if not self.connected:
+            raise ControllerUnavailable("Hardware controller not connected")
+        command_id = next(self._ids)
+        waiter = [threading.Event(), None]
+        self._pending[command_id] = waiter
+        try:
+            data = _encode({'op': 'command', 'id': command_id, 'name': name, 'args': args})
+            with self._send_lock:
+                try:
+                    self._sock.sendall(data)
+                except (OSError, AttributeError) as e:
+                    raise ControllerUnavailable(f"Send failed: {e}")
+            if not waiter[0].wait(timeout):
+                raise ControllerUnavailable(f"No reply to '{name}' within {timeout}s")
+        finally:
+            self._pending.pop(command_id, None)
+        reply = waiter[1]
+        if not reply.get('ok'):
+            raise ControllerUnavailable(reply.get('error') or f"Command '{name}' failed")
+        return reply.get('result')
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.connect(self.path)
+            except OSError:
+                self._stop_event.wait(self.reconnect_delay)
+                continue
+
+            self._sock = sock
+            self.connected = True
+            logger.info(f"Connected to hardware controller at {self.path}")
+            try:
+                for line in sock.makefile('rb'):
+                    self._handle(line)
+            except OSError:
+                pass
+            self._close()
+            if not self._stop_event.is_set():
+                logger.warning("Hardware controller connection lost - reconnecting")
+                self._stop_event.wait(self.reconnect_delay)
+
+    def _close(self):
+        self.connected = False
+        sock, self._sock = self._sock, None
+        if sock:
+            for close in (lambda: sock.shutdown(socket.SHUT_RDWR), sock.close):
+                try:
+                    close()
+                except OSError:
+                    pass
+        # Fail outstanding commands immediately rather than at their timeout
+        for waiter in list(self._pending.values()):
+            waiter[1] = {'ok': False, 'error': 'Hardware controller disconnected'}
+            waiter[0].set()
+
+    def _handle(self, line):
+        try:
+            message = json.loads(line)
+        except ValueError:
+            return
+        op = message.get('op')
+        try:
+            if op == 'state':
+                self.state = message.get('state') or {}
+                self._state_ready.set()
+            elif op == 'event' and self.on_event:
+                self.on_event(message.get('payload') or {})
+            elif op == 'emit' and self.on_emit:
+                self.on_emit(message.get('name'), message.get('payload'), message.get('room'))
+            elif op == 'reply':
+                waiter = self._pending.get(message.get('id'))
+                if waiter:
+                    waiter[1] = message
+                    waiter[0].set()
+        except Exception as e:
+            logger.error(f"Controller message '{op}' handling failed: {e}")
@@ -0,0 +1,252 @@
+"""
+Image Retention Manager for eDOMOS Door Alarm System
+Keeps an index of captured event images and enforces the retention_days and
+max_storage_gb limits from Config.CAMERA_CONFIG without rescanning the
+capture directory on every pass
+"""
+
+import os
+import heapq
+import threading
+import time
+import logging
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class CaptureEntry:
+    """Single indexed capture (path, size, capture time, owning event)"""
+
+    __slots__ = ('path', 'size_bytes', 'timestamp', 'event_id')
+
+    def __init__(self, path, size_bytes, timestamp, event_id=None):
+        self.path = path
+        self.size_bytes = size_bytes
+        self.timestamp = timestamp  # Epoch seconds
+        self.event_id = event_id
+
+    def to_dict(self):
+        return {
+            'path': self.path,
+            'size_bytes': self.size_bytes,
+            'timestamp': self.timestamp,
+            'event_id': self.event_id
+        }
+
+
+class ImageRetentionManager:
+    """
+    Oldest-first retention for captured images
+
+    Captures are kept in a min-heap ordered by capture time together with a
+    running byte total, so each enforcement pass only touches the entries it
+    deletes. The directory is scanned once when the index is (re)built.
+    """
+
+    def __init__(self, storage_path, retention_days=90, max_storage_gb=50,
+                 interval=300, batch_size=500, on_delete=None):
+        """
+        Args:
+            storage_path: Directory holding captured images
+            retention_days: Delete images older than this (None/0 disables)
+            max_storage_gb: Keep total image size below this (None/0 disables)
+            interval: Seconds between background enforcement passes
+            batch_size: Maximum deletions per pass (keeps each pass short)
+            on_delete: Optional callback receiving the list of deleted
+                CaptureEntry objects, used to clear EventLog image references
+        """
+        self.storage_path = storage_path
+        self.retention_days = retention_days
+        self.max_storage_bytes = int(max_storage_gb * 1024 ** 3) if max_storage_gb else None
+        self.interval = interval
+        self.batch_size = batch_size
+        self.on_delete = on_delete
+
+        self._heap = []
+        self._seq = 0  # Tie-breaker for identical timestamps
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._indexed = False
+
+        self._thread = None
+        self._stop_event = threading.Event()
+
+        self.deleted_total = 0
+        self.bytes_freed_total = 0
+        self.delete_failures = 0
+        self.last_run = None
+
+    # ------------------------------------------------------------------
+    # Index maintenance
+    # ------------------------------------------------------------------
+
+    def rebuild_index(self):
+        """Scan the storage directory once and rebuild the capture index"""
+        entries = []
+        storage_dir = Path(self.storage_path)
+        if storage_dir.exists():
+            for image_file in storage_dir.glob("*.jpg"):
+                try:
+                    stat = image_file.stat()
+                except OSError:
+                    continue
+                entries.append(CaptureEntry(str(image_file), stat.st_size, stat.st_mtime))
+
+        with self._lock:
+            self._heap = []
+            self._total_bytes = 0
+            for entry in entries:
+                self._push(entry)
+            self._indexed = True
+
+        logger.info(f"Image index rebuilt: {len(entries)} captures, "
+                    f"{self._total_bytes / (1024 ** 2):.1f} MB")
+        return len(entries)
+
+    def register(self, path, size_bytes, timestamp=None, event_id=None):
+        """
+        Add a new capture to the index
+
+        Args:
+            path: Image file path
+            size_bytes: File size in bytes
+            timestamp: Capture time (datetime or epoch seconds, default now)
+            event_id: Optional EventLog id referencing this image
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        elif hasattr(timestamp, 'timestamp'):
+            timestamp = timestamp.timestamp()
+
+        with self._lock:
+            self._push(CaptureEntry(path, size_bytes, timestamp, event_id))
+
+    def _push(self, entry):
+        """Push entry onto the heap (caller holds the lock)"""
+        self._seq += 1
+        heapq.heappush(self._heap, (entry.timestamp, self._seq, entry))
+        self._total_bytes += entry.size_bytes
+
+    # ------------------------------------------------------------------
+    # Enforcement
+    # ------------------------------------------------------------------
+
+    def enforce(self, now=None, retention_days=None, max_deletions=None):
+        """
+        Delete oldest captures until both retention limits are satisfied
+
+        Args:
+            now: Reference time in epoch seconds (default: current time)
+            retention_days: Override the configured retention period
+            max_deletions: Override the per-pass batch size
+
+        Returns:
+            List of deleted CaptureEntry objects
+
+        A capture that cannot be deleted stays indexed and counted towards
+        the storage total (it is still on disk) and is retried next pass.
+        """
+        if not self._indexed:
+            self.rebuild_index()
+
+        now = now if now is not None else time.time()
+        days = retention_days if retention_days is not None else self.retention_days
+        cutoff = now - days * 24 * 60 * 60 if days else None
+        limit = max_deletions if max_deletions is not None else self.batch_size
+
+        deleted = []
+        failed = []
+        with self._lock:
+            while self._heap and (limit is None or len(deleted) + len(failed) < limit):
+                oldest = self._heap[0][2]
+                expired = cutoff is not None and oldest.timestamp < cutoff
+                over_quota = (self.max_storage_bytes is not None and
+                              self._total_bytes > self.max_storage_bytes)
+                if not expired and not over_quota:
+                    break
+
+                heapq.heappop(self._heap)
+                try:
+                    os.remove(oldest.path)
+                except FileNotFoundError:
+                    pass  # Already gone - still drop it from the index
+                except OSError as e:
+                    logger.error(f"Failed to delete {oldest.path}, retrying next pass: {e}")
+                    failed.append(oldest)
+                    continue
+                self._total_bytes -= oldest.size_bytes
+                deleted.append(oldest)
+
+            # Back into the index without counting their bytes a second time
+            for entry in failed:
+                self._seq += 1
+                heapq.heappush(self._heap, (entry.timestamp, self._seq, entry))
+            self.delete_failures += len(failed)
+
+        if deleted:
+            freed = sum(entry.size_bytes for entry in deleted)
+            self.deleted_total += len(deleted)
+            self.bytes_freed_total += freed
+            logger.info(f"🗑️ Retention removed {len(deleted)} images ({freed / (1024 ** 2):.1f} MB)")
+
+            if self.on_delete:
+                try:
+                    self.on_delete(deleted)
+                except Exception as e:
+                    logger.error(f"Retention on_delete callback failed: {e}")
+
+        self.last_run = now
+        return deleted
+
+    # ------------------------------------------------------------------
+    # Background worker
+    # ------------------------------------------------------------------
+
+    def start(self):
+        """Start the background retention thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="ImageRetention")
+        self._thread.daemon = True
+        self._thread.start()
+        logger.info("Image retention thread started")
+
+    def stop(self):
+        """Signal the background thread to exit"""
+        self._stop_event.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=2.0)
+
+    def _run(self):
+        self.rebuild_index()
+        while not self._stop_event.is_set():
+            try:
+                # Drain in batches, yielding between them so a large backlog
+                # never holds the index lock for long
+                while len(self.enforce()) >= self.batch_size:
+                    if self._stop_event.wait(0.1):
+                        return
+            except Exception as e:
+                logger.error(f"Image retention pass failed: {e}")
+            self._stop_event.wait(self.interval)
+
+    def get_stats(self):
+        """Get retention index statistics"""
+        with self._lock:
+            count = len(self._heap)
+            total = self._total_bytes
+            oldest = self._heap[0][0] if self._heap else None
+        return {
+            'indexed_images': count,
+            'total_bytes': total,
+            'max_storage_bytes': self.max_storage_bytes,
+            'retention_days': self.retention_days,
+            'oldest_timestamp': oldest,
+            'deleted_total': self.deleted_total,
+            'bytes_freed_total': self.bytes_freed_total,
+            'delete_failures': self.delete_failures,
+            'last_run': self.last_run,
+            'running': bool(self._thread and self._thread.is_alive())
+        }
@@ -242,6 +242,24 @@ class EmailConfig(db.Model):
     recipient_emails = db.Column(db.Text, nullable=False)  # Comma-separated emails
     is_configured = db.Column(db.Boolean, default=False)
 
+class OutboundEmail(db.Model):
+    """Email outbox: messages waiting for (or done with) SMTP delivery, see email_outbox.py"""
+    __tablename__ = 'outbound_email'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    sender = db.Column(db.String(120), nullable=False)
+    recipients = db.Column(db.Text, nullable=False)  # Comma-separated envelope recipients
+    subject = db.Column(db.String(255), default='')
+    message = db.Column(db.Text, nullable=False)  # Complete MIME message
+    category = db.Column(db.String(30), default='general')  # alarm, scheduled_report, ...
+    priority = db.Column(db.Integer, default=0)  # Higher is sent first
+    status = db.Column(db.String(20), default='pending', index=True)  # pending, sending, sent, failed
+    attempts = db.Column(db.Integer, default=0)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.now)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+
 class AnomalyDetection(db.Model):
     """Anomaly detection for unusual door access patterns"""
     id = db.Column(db.Integer, primary_key=True)
@@ -306,6 +324,31 @@ class ScheduledReport(db.Model):
             'updated_at': self.updated_at.strftime('%Y-%m-%d %H:%M:%S') if self.updated_at else None
         }
 
+class ScheduledReportRun(db.Model):
+    """One occurrence of a scheduled report; the unique key lets exactly one scheduler claim it"""
+    __table_args__ = (db.UniqueConstraint('report_id', 'scheduled_for', name='uq_scheduled_report_run'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    report_id = db.Column(db.Integer, db.ForeignKey('scheduled_report.id'), nullable=False, index=True)
+    scheduled_for = db.Column(db.DateTime, nullable=False)
+    status = db.Column(db.String(20), default='running')  # running, sent, failed
+    attempts = db.Column(db.Integer, default=1)
+    started_at = db.Column(db.DateTime, default=datetime.now)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'report_id': self.report_id,
+            'scheduled_for': self.scheduled_for.strftime('%Y-%m-%d %H:%M:%S'),
+            'status': self.status,
+            'attempts': self.attempts,
+            'started_at': self.started_at.strftime('%Y-%m-%d %H:%M:%S') if self.started_at else None,
+            'finished_at': self.finished_at.strftime('%Y-%m-%d %H:%M:%S') if self.finished_at else None,
+            'error': self.error
+        }
+
 class License(db.Model):
     """Software license and restrictions"""
     id = db.Column(db.Integer, primary_key=True)
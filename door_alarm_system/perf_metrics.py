@@ -0,0 +1,297 @@
+"""
+Performance Metrics for eDOMOS
+Per-endpoint latency, response size and status histograms, per-request SQL
+statement counts and durations (SQLAlchemy cursor events) and event ingestion
+stage timings, kept in process memory and exported in Prometheus text format
+or as a JSON summary.
+"""
+
+import time
+import bisect
+import threading
+import logging
+from contextlib import contextmanager
+
+from flask import request, g
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+
+class Histogram:
+    """Cumulative bucket counts plus count, sum and max"""
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.buckets = [0] * (len(self.bounds) + 1)  # Last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """Estimate of the q quantile, interpolated within its bucket"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            if n and seen + n >= rank:
+                lower = self.bounds[i - 1] if i else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else self.max
+                return min(lower + (upper - lower) * (rank - seen) / n, self.max)
+            seen += n
+        return self.max
+
+
+def _label_text(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+
+class MetricsRegistry:
+    """Thread-safe named counters and histograms with labels"""
+
+    def __init__(self, prefix='edomos'):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._counters = {}     # (name, labels) -> value
+        self._histograms = {}   # (name, labels) -> Histogram
+        self._help = {}         # name -> help text
+
+    def describe(self, name, help_text):
+        self._help[name] = help_text
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observe the seconds the block takes (also when it raises)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def snapshot(self):
+        """Counters and histograms as JSON-serializable lists, to merge registries of other processes"""
+        with self._lock:
+            return {
+                'counters': [[name, [list(pair) for pair in labels], value]
+                             for (name, labels), value in self._counters.items()],
+                'histograms': [[name, [list(pair) for pair in labels], list(histogram.bounds),
+                                list(histogram.buckets), histogram.count, histogram.sum]
+                               for (name, labels), histogram in self._histograms.items()],
+            }
+
+    def render_prometheus(self, process=None, others=()):
+        """
+        All metrics in the Prometheus text exposition format
+
+        Args:
+            process: Value of a 'process' label added to every series
+            others: (process, snapshot()) pairs of other processes'
+                registries, merged into the same metric families
+        """
+        counters, histograms = [], []
+        for label, snapshot in [(process, self.snapshot())] + list(others):
+            extra = [('process', label)] if label is not None else []
+            for name, labels, value in snapshot['counters']:
+                counters.append(((name, tuple(sorted([tuple(pair) for pair in labels] + extra))), value))
+            for name, labels, bounds, buckets, count, total in snapshot['histograms']:
+                histograms.append(((name, tuple(sorted([tuple(pair) for pair in labels] + extra))),
+                                   (bounds, buckets, count, total)))
+
+        lines = []
+        for kind, items in (('counter', counters), ('histogram', histograms)):
+            last = None
+            for (name, labels), value in sorted(items, key=lambda item: item[0]):
+                full = f'{self.prefix}_{name}'
+                if name != last:
+                    if name in self._help:
+                        lines.append(f'# HELP {full} {self._help[name]}')
+                    lines.append(f'# TYPE {full} {kind}')
+                    last = name
+                if kind == 'counter':
+                    lines.append(f'{full}{_label_text(labels)} {value:g}')
+                    continue
+                bounds, buckets, count, total = value
+                cumulative = 0
+                for le, n in zip([f'{bound:g}' for bound in bounds] + ['+Inf'], buckets):
+                    cumulative += n
+                    lines.append(f'{full}_bucket{_label_text(labels + (("le", le),))} {cumulative}')
+                lines.append(f'{full}_sum{_label_text(labels)} {total:.6g}')
+                lines.append(f'{full}_count{_label_text(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """
+        JSON-friendly summary: counters by name, and per histogram series
+        count, sum, mean, p50, p95, p99 and max
+        """
+        result = {'counters': {}, 'histograms': {}}
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                result['counters'].setdefault(name, []).append({'labels': dict(labels), 'value': value})
+            for (name, labels), histogram in sorted(self._histograms.items(), key=lambda item: item[0]):
+                result['histograms'].setdefault(name, []).append({
+                    'labels': dict(labels),
+                    'count': histogram.count,
+                    'sum': round(histogram.sum, 6),
+                    'mean': round(histogram.sum / histogram.count, 6) if histogram.count else 0.0,
+                    'p50': round(histogram.quantile(0.50), 6),
+                    'p95': round(histogram.quantile(0.95), 6),
+                    'p99': round(histogram.quantile(0.99), 6),
+                    'max': round(histogram.max, 6),
+                })
+        return result
+
+
+class TimedLock:
+    """A threading.Lock that records wait and hold times as stage timings"""
+
+    def __init__(self, registry, name):
+        self._lock = threading.Lock()
+        self.registry = registry
+        self.name = name
+        self._acquired = 0.0
+
+    def __enter__(self):
+        started = time.perf_counter()
+        self._lock.acquire()
+        self._acquired = time.perf_counter()
+        self.registry.observe('ingest_stage_seconds', self._acquired - started, stage=f'{self.name}_wait')
+        return self
+
+    def __exit__(self, *exc):
+        held = time.perf_counter() - self._acquired
+        self._lock.release()
+        self.registry.observe('ingest_stage_seconds', held, stage=f'{self.name}_hold')
+        return False
+
+
+def _statement_kind(statement):
+    word = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ''
+    return word if word in ('SELECT', 'INSERT', 'UPDATE', 'DELETE') else 'OTHER'
+
+
+class RequestMetrics:
+    """
+    Flask request and SQLAlchemy statement instrumentation
+
+    init_app() records per endpoint the latency, response size, status code
+    and the number and duration of SQL statements run while handling the
+    request; instrument_sql() listens to cursor events of every Engine, so
+    statements outside requests (threads, workers) are counted globally too.
+    """
+
+    def __init__(self, registry):
+        self.registry = registry
+        self._state = threading.local()  # SQL counts of the request this thread is handling
+        self._sql_instrumented = False
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        self.instrument_sql()
+
+    def instrument_sql(self):
+        if self._sql_instrumented:
+            return
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+        self._sql_instrumented = True
+
+    def _before_request(self):
+        g.metrics_started = time.perf_counter()
+        self._state.queries = 0
+        self._state.sql_seconds = 0.0
+        self._state.active = True
+
+    def _after_request(self, response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        self._state.active = False
+        endpoint = request.endpoint or 'unmatched'
+        registry = self.registry
+        registry.observe('http_request_duration_seconds', time.perf_counter() - started,
+                         endpoint=endpoint, method=request.method)
+        registry.inc('http_responses_total', endpoint=endpoint, status=str(response.status_code))
+        registry.observe('http_request_sql_statements', self._state.queries, buckets=COUNT_BUCKETS,
+                         endpoint=endpoint)
+        registry.observe('http_request_sql_seconds', self._state.sql_seconds, endpoint=endpoint)
+        if not response.is_streamed and response.content_length is not None:
+            registry.observe('http_response_size_bytes', response.content_length, buckets=SIZE_BUCKETS,
+                             endpoint=endpoint)
+        return response
+
+    def _teardown_request(self, exc):
+        self._state.active = False
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('metrics_started')
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        self.registry.observe('sql_statement_seconds', elapsed, kind=_statement_kind(statement))
+        if getattr(self._state, 'active', False):
+            self._state.queries += 1
+            self._state.sql_seconds += elapsed
+
+
+registry = MetricsRegistry()
+registry.describe('http_request_duration_seconds', 'Request handling time by endpoint')
+registry.describe('http_responses_total', 'Responses by endpoint and status code')
+registry.describe('http_request_sql_statements', 'SQL statements run per request')
+registry.describe('http_request_sql_seconds', 'Time spent in SQL per request')
+registry.describe('http_response_size_bytes', 'Response body size (streamed responses excluded)')
+registry.describe('sql_statement_seconds', 'SQL statement execution time by statement kind')
+registry.describe('controller_scrape_errors_total', 'Scrapes that could not include the hardware controller metrics')
+registry.describe('ingest_stage_seconds', 'Event ingestion stage timings (lock wait/hold, db, camera, blockchain, anomaly, ai)')
+
+request_metrics = RequestMetrics(registry)
+
+
+def timer(name, **labels):
+    """Convenience function: time a block into the global registry"""
+    return registry.timer(name, **labels)
+
+
+def get_metrics_summary():
+    """Convenience function: JSON summary of the global registry"""
+    return registry.summary()
@@ -0,0 +1,155 @@
+"""
+Report Artifact Cache for eDOMOS
+Keeps rendered reports on disk, addressed by a fingerprint of the request and
+of the data it covers, so a regenerated daily/weekly report is served from
+disk instead of being queried and laid out again
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Params that only affect how a report is produced, not what it contains
+EXECUTION_PARAMS = ('render_workers', 'static_root')
+
+
+def _link_or_copy(src, dst):
+    """Hard-link src to dst (same file system), falling back to a copy"""
+    tmp = f"{dst}.tmp"
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+
+class ReportCache:
+    """
+    Content-addressed, size-bounded report store
+
+    Entries are evicted least recently used first, using the file mtime
+    (touched on every hit) as the access time. Jobs get their own hard link
+    to an entry, so evicting it never pulls a file from under a download.
+    """
+
+    def __init__(self, cache_dir, max_bytes=256 * 1024 * 1024):
+        """
+        Args:
+            cache_dir: Directory holding cached artifacts
+            max_bytes: Total size kept before the oldest entries are evicted
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def fingerprint(params, watermark):
+        """
+        Cache key of a report
+
+        Args:
+            params: Report request as handed to the job queue (period, event
+                types, format, report type, date/time formats, render mode
+                and the generating user printed on the document)
+            watermark: report_engine.data_watermark() of the covered events
+        """
+        content = {key: value for key, value in params.items() if key not in EXECUTION_PARAMS}
+        canonical = json.dumps({'params': content, 'data': watermark}, sort_keys=True, default=str)
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def _path(self, key, extension):
+        return os.path.join(self.cache_dir, f"{key}.{extension}")
+
+    def fetch(self, key, extension, dest_path):
+        """
+        Link a cached artifact to dest_path
+
+        Returns:
+            True on a hit, False if the report has to be rendered
+        """
+        path = self._path(key, extension)
+        try:
+            os.utime(path)
+            _link_or_copy(path, dest_path)
+        except OSError:
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+
+    def store(self, key, extension, src_path):
+        """Add a finished artifact (src_path stays in place) and evict down to max_bytes"""
+        try:
+            if os.path.getsize(src_path) > self.max_bytes:
+                return False
+            _link_or_copy(src_path, self._path(key, extension))
+        except OSError as e:
+            logger.warning(f"Could not cache report artifact {src_path}: {e}")
+            return False
+        self.evict()
+        return True
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.tmp'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits max_bytes"""
+        removed = 0
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    logger.warning(f"Could not evict cached report {path}: {e}")
+                    continue
+                total -= size
+                removed += 1
+            self.evictions += removed
+        return removed
+
+    def purge(self):
+        """Delete every cached artifact (reports on data edited outside the application)"""
+        removed = 0
+        with self._lock:
+            for _, _, path in self._entries():
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError as e:
+                    logger.warning(f"Could not purge cached report {path}: {e}")
+        return removed
+
+    def get_stats(self):
+        entries = self._entries()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+            'max_bytes': self.max_bytes,
+        }
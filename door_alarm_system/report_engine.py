@@ -0,0 +1,1167 @@
+"""
+Report Engine for eDOMOS
+Loads report data and renders the security audit PDF / CSV exports without a
+Flask request or app context, so reports can be built in worker processes
+"""
+
+import os
+import csv
+import json
+import zlib
+import hashlib
+import bisect
+import logging
+import threading
+import multiprocessing
+from io import StringIO, BytesIO
+from collections import namedtuple, deque
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from sqlalchemy import create_engine, select, func, case
+
+from models import EventLog, CompanyProfile, DoorSystemInfo, AnomalyDetection, Setting
+
+logger = logging.getLogger(__name__)
+
+# Picklable event row handed to page-range render workers
+EventRow = namedtuple('EventRow', 'id event_type description timestamp')
+
+# Approximate detailed event rows per A4 page (used for progress estimates)
+ROWS_PER_PAGE = 18
+
+# Above this many events the audit PDF draws its event log with the
+# fixed-row canvas renderer (report_table_renderer) instead of a Paragraph table
+FAST_RENDER_THRESHOLD = 2000
+
+# Above this many events (and with more than one worker) the fast event log
+# is rendered in page ranges across processes and merged (needs pypdf)
+PARALLEL_RENDER_THRESHOLD = 20000
+
+# A4 page margins in inches (left/right, top/bottom) and platypus frame padding in points
+SIDE_MARGIN = 0.75
+VERTICAL_MARGIN = 1
+FRAME_PADDING = 6
+
+
+def report_period(params):
+    """Parse start/end dates of a report request (end date is inclusive)"""
+    start_date = datetime.strptime(params['start_date'], '%Y-%m-%d')
+    end_date = datetime.strptime(params['end_date'], '%Y-%m-%d') + timedelta(days=1)
+    return start_date, end_date
+
+
+def _first_row(conn, table):
+    row = conn.execute(select(table).limit(1)).mappings().first()
+    return SimpleNamespace(**row) if row else None
+
+
+def _event_filter(params):
+    """WHERE clauses selecting a report's period and event types"""
+    start_date, end_date = report_period(params)
+    event_types = params.get('event_types') or []
+    events_table = EventLog.__table__
+
+    clauses = [events_table.c.timestamp.between(start_date, end_date)]
+    if event_types:
+        clauses.append(events_table.c.event_type.in_(event_types))
+    return clauses
+
+
+def event_query(params):
+    """SELECT of the events in a report's period and type filter, in id order"""
+    events_table = EventLog.__table__
+    return select(events_table.c.id, events_table.c.event_type,
+                  events_table.c.description, events_table.c.timestamp).where(
+        *_event_filter(params)).order_by(events_table.c.id)
+
+
+def data_watermark(source, params):
+    """
+    Version of everything a report prints, for the report cache key
+
+    - Events: row count, highest id and latest timestamp in range. A new
+      event raises max_id and a purge changes the count. The printed event
+      columns (id, type, description, timestamp) are never updated; only
+      image_path (image retention) and ai_metadata (AI re-scoring) are, and
+      reports print neither.
+    - A digest of the company profile and door system info in the headers.
+    - For compliance audits: the anomaly counts, door closes (MTTR) and
+      alarm threshold behind the compliance section.
+
+    A rendered report stays valid for as long as its watermark is unchanged;
+    data edited outside the application needs ReportCache.purge().
+    """
+    events_table = EventLog.__table__
+    query = select(func.count(), func.max(events_table.c.id), func.max(events_table.c.timestamp)).where(
+        *_event_filter(params))
+
+    engine = create_engine(source) if isinstance(source, str) else source
+    with engine.connect() as conn:
+        count, max_id, max_timestamp = conn.execute(query).one()
+        context = {name: vars(row) if row else None for name, row in load_report_context(conn).items()}
+        watermark = {
+            'count': count,
+            'max_id': max_id,
+            'max_timestamp': max_timestamp.isoformat() if max_timestamp else None,
+            'context': hashlib.sha256(json.dumps(context, sort_keys=True, default=str).encode('utf-8')).hexdigest(),
+        }
+        if params.get('report_type') == 'compliance_audit':
+            watermark['compliance'] = _compliance_watermark(conn, *report_period(params))
+    if isinstance(source, str):
+        engine.dispose()
+    return watermark
+
+
+def _compliance_watermark(conn, start_date, end_date):
+    """What the compliance section reads besides the report's own events"""
+    anomalies = AnomalyDetection.__table__
+    events_table = EventLog.__table__
+    settings = Setting.__table__
+    anomaly_count, unacknowledged, anomaly_max_id = conn.execute(select(
+        func.count(), func.sum(case((anomalies.c.is_acknowledged.isnot(True), 1), else_=0)), func.max(anomalies.c.id)
+    ).where(anomalies.c.detected_at.between(start_date, end_date))).one()
+    # MTTR pairs alarms with the next door close, which may fall after the period
+    close_count, close_max_id = conn.execute(select(func.count(), func.max(events_table.c.id)).where(
+        events_table.c.event_type == 'door_close', events_table.c.timestamp > start_date)).one()
+    threshold = conn.execute(select(settings.c.value).where(settings.c.key == 'timer_duration')).scalar()
+    return [anomaly_count, unacknowledged, anomaly_max_id, close_count, close_max_id, threshold]
+
+
+def load_report_context(conn):
+    """Company profile and door system info shown in report headers"""
+    return {
+        'company_profile': _first_row(conn, CompanyProfile.__table__),
+        'door_system_info': _first_row(conn, DoorSystemInfo.__table__),
+    }
+
+
+class EventStream:
+    """
+    A report's events, read from the database in keyset batches on every pass
+
+    Only the per-type counts are held in memory, so a PDF over 100k events
+    needs no more than one batch of rows at a time. Iteration stops at the
+    highest id seen when the report was opened, so rows logged meanwhile do
+    not change a report that is already laid out.
+    """
+
+    def __init__(self, source, params, counts, max_id, batch_size=1000):
+        self.source = source
+        self.params = params
+        self.counts = counts
+        self.max_id = max_id
+        self.batch_size = batch_size
+
+    def __len__(self):
+        return sum(self.counts.values())
+
+    def __iter__(self):
+        if not self.counts:
+            return
+        engine = create_engine(self.source) if isinstance(self.source, str) else self.source
+        try:
+            yield from iter_events(engine, self.params, self.batch_size, max_id=self.max_id)
+        finally:
+            if isinstance(self.source, str):
+                engine.dispose()
+
+
+def event_counts(events):
+    """Events per event type, from the database for an EventStream"""
+    if isinstance(events, EventStream):
+        return events.counts
+    counts = {}
+    for event in events:
+        counts[event.event_type] = counts.get(event.event_type, 0) + 1
+    return counts
+
+
+def load_report_data(source, params, batch_size=1000):
+    """
+    Query everything a report needs
+
+    Args:
+        source: SQLAlchemy Engine, or a database URI (worker processes open
+            their own engine)
+        params: Report request (start_date, end_date, event_types, report_type)
+        batch_size: Events per keyset batch while rendering
+
+    Returns:
+        Dict with 'events' (an EventStream of rows with
+        id/event_type/description/timestamp attributes), 'company_profile',
+        'door_system_info' and, for compliance audits, 'compliance'
+    """
+    engine = create_engine(source) if isinstance(source, str) else source
+    events_table = EventLog.__table__
+
+    with engine.connect() as conn:
+        counts = dict(conn.execute(select(events_table.c.event_type, func.count()).where(
+            *_event_filter(params)).group_by(events_table.c.event_type)).all())
+        max_id = conn.execute(select(func.max(events_table.c.id)).where(*_event_filter(params))).scalar()
+        report = load_report_context(conn)
+        report['compliance'] = None
+        if params.get('report_type') == 'compliance_audit':
+            report['compliance'] = _load_compliance(conn, params)
+
+    if isinstance(source, str):
+        engine.dispose()
+    report['events'] = EventStream(source, params, counts, max_id, batch_size)
+    return report
+
+
+def iter_events(engine, params, batch_size=1000, max_id=None):
+    """
+    Yield a report's events in keyset batches (id > last id, LIMIT batch_size)
+
+    Each batch is its own short read. A cursor held open for a whole export
+    would keep SQLite's shared lock and stall the door monitor's event
+    writes for as long as the client takes to download.
+    """
+    id_column = EventLog.__table__.c.id
+    query = event_query(params).limit(batch_size)
+    if max_id is not None:
+        query = query.where(id_column <= max_id)
+
+    last_id = None
+    while True:
+        batch_query = query if last_id is None else query.where(id_column > last_id)
+        with engine.connect() as conn:
+            batch = conn.execute(batch_query).all()
+        yield from batch
+        if len(batch) < batch_size:
+            break
+        last_id = batch[-1].id
+
+
+def stream_report(source, params, batch_size=1000):
+    """
+    Open a report whose events are fetched lazily (see iter_events)
+
+    Returns:
+        (context, events) - context as from load_report_context(); events is
+        a generator holding at most one batch in memory
+    """
+    engine = create_engine(source) if isinstance(source, str) else source
+    with engine.connect() as conn:
+        context = load_report_context(conn)
+
+    def events():
+        try:
+            yield from iter_events(engine, params, batch_size)
+        finally:
+            if isinstance(source, str):
+                engine.dispose()
+
+    return context, events()
+
+
+def _load_compliance(conn, params):
+    """Anomaly counts, alarm threshold and MTTR for the compliance section"""
+    start_date, end_date = report_period(params)
+    anomalies = AnomalyDetection.__table__
+    in_period = anomalies.c.detected_at.between(start_date, end_date)
+    total_anomalies = conn.execute(select(func.count()).where(in_period)).scalar()
+    unacknowledged = conn.execute(select(func.count()).where(
+        in_period, anomalies.c.is_acknowledged.isnot(True))).scalar()
+
+    settings = Setting.__table__
+    threshold = conn.execute(select(settings.c.value).where(settings.c.key == 'timer_duration')).scalar()
+
+    # MTTR: alarm -> next door_close, with one ordered scan instead of a query per alarm
+    events_table = EventLog.__table__
+    alarms = conn.execute(select(events_table.c.timestamp).where(
+        *_event_filter(params), events_table.c.event_type == 'alarm_triggered')).scalars().all()
+    durations = []
+    if alarms:
+        closes = conn.execute(select(events_table.c.timestamp).where(
+            events_table.c.event_type == 'door_close',
+            events_table.c.timestamp > min(alarms)).order_by(events_table.c.timestamp)).scalars().all()
+        for alarm_time in alarms:
+            index = bisect.bisect_right(closes, alarm_time)
+            if index < len(closes):
+                durations.append((closes[index] - alarm_time).total_seconds())
+
+    return {
+        'total_alarms': len(alarms),
+        'total_anomalies': total_anomalies,
+        'unacknowledged_anomalies': unacknowledged,
+        'alarm_threshold': int(threshold) if threshold else 30,
+        'mttr': sum(durations) / len(durations) if durations else 0
+    }
+
+
+def report_datetime_formats(date_format, time_format):
+    """Map user preference names to strftime patterns"""
+    date_format_map = {
+        'YYYY-MM-DD': '%Y-%m-%d',
+        'DD/MM/YYYY': '%d/%m/%Y',
+        'MM/DD/YYYY': '%m/%d/%Y',
+        'DD-MM-YYYY': '%d-%m-%Y'
+    }
+    time_format_map = {
+        '24h': '%H:%M:%S',
+        '12h': '%I:%M:%S %p'
+    }
+    return date_format_map.get(date_format, '%Y-%m-%d'), time_format_map.get(time_format, '%H:%M:%S')
+
+
+# ==================== CSV ====================
+
+def iter_csv(context, events, params, batch_size=500):
+    """
+    Generate the CSV export (metadata header plus one row per event) as text chunks
+
+    Rows are written in batches of `batch_size` so memory stays constant
+    however many events are streamed.
+    """
+    user = params.get('generated_by') or {}
+    company_profile = context['company_profile']
+    door_system_info = context['door_system_info']
+    datetime_fmt = f"{params['date_fmt']} {params['time_fmt']}"
+
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+
+    def take():
+        chunk = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return chunk
+
+    writer.writerow(['# eDOMOS Security Report - CSV Export'])
+    writer.writerow([f'# Generated: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}'])
+    writer.writerow([f'# Generated By: {user.get("full_name") or user.get("username")}'])
+
+    if company_profile and company_profile.company_name:
+        writer.writerow([f'# Company: {company_profile.company_name}'])
+
+    if door_system_info:
+        if door_system_info.door_location:
+            writer.writerow([f'# Door Location: {door_system_info.door_location}'])
+        if door_system_info.device_serial_number:
+            writer.writerow([f'# Device S/N: {door_system_info.device_serial_number}'])
+
+    writer.writerow([f'# Report Period: {params.get("start_date")} to {params.get("end_date")}'])
+    writer.writerow(['#'])
+
+    employee_id = user.get('employee_id')
+    location = door_system_info.door_location if door_system_info else None
+    headers = ['ID', 'Event Type', 'Description', 'Timestamp']
+    if employee_id:
+        headers.append('Logged By ID')
+    if location:
+        headers.append('Location')
+    writer.writerow(headers)
+    yield take()
+
+    pending = 0
+    for event in events:
+        row = [event.id, event.event_type, event.description, event.timestamp.strftime(datetime_fmt)]
+        if employee_id:
+            row.append(employee_id)
+        if location:
+            row.append(location)
+        writer.writerow(row)
+        pending += 1
+        if pending >= batch_size:
+            pending = 0
+            yield take()
+    if pending:
+        yield take()
+
+
+def gzip_chunks(chunks, level=6):
+    """Gzip-compress a stream of text chunks on the fly"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31 = gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+# ==================== PDF - INDUSTRIAL-GRADE AUDIT-READY DESIGN ====================
+
+def render_audit_pdf(report, params, output, progress=None):
+    """
+    Render the security audit PDF
+
+    Args:
+        report: Result of load_report_data(); 'events' may also be a list
+        params: Report request plus date_fmt/time_fmt, generated_by (user
+            dict), static_root (for the company logo) and optional
+            render_mode ('auto', 'detailed' or 'fast') and render_workers
+            (processes for page-range rendering, default 1: off)
+        output: File path or binary file object
+        progress: Optional callable(fraction) receiving 0.0-1.0
+
+    Page ranges are rendered in forked processes, which is only safe from a
+    process without other threads (report job workers, the benchmark CLI);
+    anywhere else the report is rendered in this process.
+    """
+    params = dict(params)
+    params.setdefault('generated_at', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    workers = params.get('render_workers') or 1
+
+    if (workers > 1 and len(report['events']) >= PARALLEL_RENDER_THRESHOLD
+            and params.get('render_mode', 'auto') in ('auto', 'fast')):
+        try:
+            import pypdf  # noqa: F401 - only needed to merge the partial PDFs
+        except ImportError:
+            logger.warning("pypdf not installed - rendering large report in a single process")
+        else:
+            if threading.active_count() == 1:
+                return _render_parallel(report, params, output, progress, workers)
+            logger.warning("Threads running - rendering large report in a single process")
+
+    _build_audit_pdf(report, params, output, progress)
+
+
+def event_rows_per_page():
+    """Fast-table event rows on a page that starts with the table"""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import inch
+    from report_table_renderer import rows_per_frame
+    return rows_per_frame(A4[1] - 2 * VERTICAL_MARGIN * inch - 2 * FRAME_PADDING)
+
+
+def _render_event_chunk(report, params, page_offset):
+    """Pool worker: render one page range of the event log to PDF bytes"""
+    output = BytesIO()
+    _build_audit_pdf(report, params, output, parts=('events',), page_offset=page_offset)
+    return output.getvalue()
+
+
+def _render_parallel(report, params, output, progress, workers):
+    """
+    Render the event log in page ranges across worker processes
+
+    Every range starts on a fresh page and holds whole pages of rows, so
+    each worker knows its first page number in advance and headers, footers
+    and numbering line up after merging. The cover, summary and information
+    pages and the compliance/certification pages are rendered here meanwhile.
+    Ranges are read from the events as workers free up, so at most one
+    range per worker (plus the next) is held in memory.
+    """
+    from pypdf import PdfWriter
+
+    events = report['events']
+    total = len(events)
+    per_page = event_rows_per_page()
+    event_pages = -(-total // per_page)
+    # About two ranges per worker; an even page count keeps row striping continuous
+    pages_per_chunk = max(2, -(-event_pages // (workers * 2)))
+    pages_per_chunk += pages_per_chunk % 2
+    chunk_rows = per_page * pages_per_chunk
+    chunk_count = -(-total // chunk_rows)
+
+    params = dict(params, render_mode='fast')  # Ranges must paginate identically
+    front = BytesIO()
+    front_pages = _build_audit_pdf(report, params, front, parts=('front',))
+    rows = iter(events)
+
+    def submit(pool, index):
+        chunk = {'events': [EventRow(*row) for row in islice(rows, chunk_rows)],
+                 'company_profile': report['company_profile'],
+                 'door_system_info': report['door_system_info'],
+                 'compliance': None}
+        return pool.submit(_render_event_chunk, chunk, params, front_pages + index * pages_per_chunk)
+
+    context = multiprocessing.get_context('fork')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        pending = deque(submit(pool, index) for index in range(min(workers + 1, chunk_count)))
+        back = BytesIO()
+        _build_audit_pdf(report, params, back, parts=('back',), page_offset=front_pages + event_pages)
+        parts = []
+        while pending:
+            parts.append(pending.popleft().result())
+            next_index = len(parts) + len(pending)
+            if next_index < chunk_count:
+                pending.append(submit(pool, next_index))
+            if progress:
+                progress(0.05 + 0.85 * len(parts) / chunk_count)
+
+    writer = PdfWriter()
+    for data in [front.getvalue()] + parts + [back.getvalue()]:
+        writer.append(BytesIO(data))
+    writer.add_metadata({
+        '/Title': f"eDOMOS Security Audit Report - {params.get('start_date')} to {params.get('end_date')}",
+        '/Author': "eDOMOS Security System",
+        '/Subject': "Door Monitoring Security Audit Report",
+    })
+    if isinstance(output, str):
+        with open(output, 'wb') as f:
+            writer.write(f)
+    else:
+        writer.write(output)
+    if progress:
+        progress(1.0)
+
+
+def _build_audit_pdf(report, params, output, progress=None, parts=('front', 'events', 'back'), page_offset=0):
+    """
+    Lay out the audit PDF (or some of its parts) with platypus
+
+    Args:
+        parts: 'front' (cover, summary, information), 'events' (detailed
+            log) and/or 'back' (compliance and certification)
+        page_offset: Pages preceding this output in the merged report
+
+    Returns:
+        Number of pages written
+    """
+    from reportlab.lib.pagesizes import A4
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, KeepTogether
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.units import inch
+    from reportlab.lib import colors
+    from reportlab.platypus.flowables import HRFlowable
+    from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_JUSTIFY
+
+    events = report['events']
+    company_profile = report['company_profile']
+    door_system_info = report['door_system_info']
+    event_types = params.get('event_types') or []
+    date_fmt = params['date_fmt']
+    time_fmt = params['time_fmt']
+    user = params.get('generated_by') or {}
+    # One timestamp for every page, also across separately rendered parts
+    generated_at = (datetime.strptime(params['generated_at'], '%Y-%m-%d %H:%M:%S')
+                    if params.get('generated_at') else datetime.now())
+
+    # ==================== PROFESSIONAL HEADER/FOOTER TEMPLATE ====================
+    class AuditReportTemplate(SimpleDocTemplate):
+        def __init__(self, *args, **kwargs):
+            self.report_data = kwargs.pop('report_data', {})
+            self.company_profile = kwargs.pop('company_profile', None)
+            self.door_system_info = kwargs.pop('door_system_info', None)
+            self.page_offset = kwargs.pop('page_offset', 0)
+            self.pages_written = 0
+            SimpleDocTemplate.__init__(self, *args, **kwargs)
+
+        def afterPage(self):
+            """Add header and footer to each page"""
+            self.handle_pageBegin()
+            canvas_obj = self.canv
+
+            # Define colors
+            primary_blue = colors.HexColor('#0066CC')
+            dark_gray = colors.HexColor('#1A1A1A')
+            medium_gray = colors.HexColor('#555555')
+            light_gray = colors.HexColor('#CCCCCC')
+
+            # PAGE HEADER (top of every page)
+            canvas_obj.saveState()
+
+            # Top border - Bold blue line
+            canvas_obj.setStrokeColor(primary_blue)
+            canvas_obj.setLineWidth(3)
+            canvas_obj.line(self.leftMargin, A4[1] - 0.6*inch, A4[0] - self.rightMargin, A4[1] - 0.6*inch)
+
+            # Company/System name (top left)
+            canvas_obj.setFont('Helvetica-Bold', 9)
+            canvas_obj.setFillColor(dark_gray)
+            canvas_obj.drawString(self.leftMargin, A4[1] - 0.5*inch, "eDOMOS SECURITY SYSTEM")
+
+            # Document ID and Classification (top right)
+            canvas_obj.setFont('Helvetica', 7)
+            canvas_obj.setFillColor(medium_gray)
+            doc_id = f"DOC-{generated_at.strftime('%Y%m%d-%H%M%S')}"
+            canvas_obj.drawRightString(A4[0] - self.rightMargin, A4[1] - 0.45*inch, f"Document ID: {doc_id}")
+            canvas_obj.drawRightString(A4[0] - self.rightMargin, A4[1] - 0.55*inch, "Classification: CONFIDENTIAL")
+
+            # PAGE FOOTER (bottom of every page)
+
+            # Bottom border - Thin gray line
+            canvas_obj.setStrokeColor(light_gray)
+            canvas_obj.setLineWidth(0.5)
+            canvas_obj.line(self.leftMargin, 0.75*inch, A4[0] - self.rightMargin, 0.75*inch)
+
+            # Footer left: System info and company name
+            canvas_obj.setFont('Helvetica', 7)
+            canvas_obj.setFillColor(medium_gray)
+
+            # Show company name if available
+            footer_line1 = "eDOMOS Door Monitoring System"
+            if self.company_profile and self.company_profile.company_name:
+                footer_line1 = self.company_profile.company_name
+
+            footer_line2 = f"Generated: {generated_at.strftime('%Y-%m-%d %H:%M:%S')}"
+            if self.door_system_info and self.door_system_info.door_location:
+                footer_line2 = f"{self.door_system_info.door_location} | {generated_at.strftime('%Y-%m-%d %H:%M:%S')}"
+
+            canvas_obj.drawString(self.leftMargin, 0.6*inch, footer_line1)
+            canvas_obj.drawString(self.leftMargin, 0.5*inch, footer_line2)
+
+            # Footer center: Security notice
+            canvas_obj.setFont('Helvetica-Oblique', 7)
+            canvas_obj.drawCentredString(A4[0]/2, 0.6*inch, "SECURITY AUDIT REPORT")
+            canvas_obj.drawCentredString(A4[0]/2, 0.5*inch, "This document contains confidential information")
+
+            # Footer right: Page number
+            canvas_obj.setFont('Helvetica-Bold', 8)
+            canvas_obj.setFillColor(dark_gray)
+            self.pages_written = canvas_obj.getPageNumber()
+            page_text = f"Page {self.pages_written + self.page_offset}"
+            canvas_obj.drawRightString(A4[0] - self.rightMargin, 0.55*inch, page_text)
+
+            canvas_obj.restoreState()
+
+    # Page Setup: A4, Portrait, optimized margins for printing
+    doc = AuditReportTemplate(
+        output,
+        pagesize=A4,
+        rightMargin=SIDE_MARGIN*inch,
+        leftMargin=SIDE_MARGIN*inch,
+        topMargin=VERTICAL_MARGIN*inch,
+        bottomMargin=VERTICAL_MARGIN*inch,
+        title=f"eDOMOS Security Audit Report - {params.get('start_date')} to {params.get('end_date')}",
+        author="eDOMOS Security System",
+        subject="Door Monitoring Security Audit Report",
+        report_data={'start_date': params.get('start_date'), 'end_date': params.get('end_date')},
+        company_profile=company_profile,
+        door_system_info=door_system_info,
+        page_offset=page_offset
+    )
+
+    # 'detailed' forces the Paragraph table, 'fast' the canvas renderer
+    render_mode = params.get('render_mode') or 'auto'
+    fast_table = render_mode == 'fast' or (render_mode == 'auto' and len(events) > FAST_RENDER_THRESHOLD)
+
+    if progress and not fast_table:
+        # Rows are built in the first 30%, page layout covers the rest
+        estimated_pages = max(1, len(events) // ROWS_PER_PAGE + 2)
+
+        def on_progress(typ, value):
+            if typ == 'PAGE':
+                progress(0.3 + 0.7 * min(value / estimated_pages, 0.99))
+        doc.setProgressCallBack(on_progress)
+
+    # ==================== PROFESSIONAL COLOR PALETTE ====================
+    # Primary colors
+    primary_blue = colors.HexColor('#0066CC')
+
+    # Text colors
+    dark_text = colors.HexColor('#1A1A1A')
+    medium_text = colors.HexColor('#424242')
+    light_text = colors.HexColor('#757575')
+
+    # Background colors
+    header_bg = colors.HexColor('#E3F2FD')       # Light blue
+
+    # ==================== TYPOGRAPHY STYLES ====================
+    styles = getSampleStyleSheet()
+
+    # Main Title - Bold, Large, Professional
+    main_title_style = ParagraphStyle(
+        'MainTitle',
+        parent=styles['Title'],
+        fontSize=24,
+        fontName='Helvetica-Bold',
+        textColor=primary_blue,
+        spaceAfter=6,
+        spaceBefore=8,
+        alignment=TA_CENTER,
+        leading=28
+    )
+
+    # Subtitle - Document Type
+    doc_subtitle_style = ParagraphStyle(
+        'DocSubtitle',
+        parent=styles['Normal'],
+        fontSize=14,
+        fontName='Helvetica',
+        textColor=medium_text,
+        spaceAfter=20,
+        alignment=TA_CENTER,
+        leading=18
+    )
+
+    # Section Header - For major sections
+    section_header_style = ParagraphStyle(
+        'SectionHeader',
+        parent=styles['Heading1'],
+        fontSize=14,
+        fontName='Helvetica-Bold',
+        textColor=dark_text,
+        spaceAfter=12,
+        spaceBefore=20,
+        alignment=TA_LEFT,
+        borderWidth=0,
+        borderColor=primary_blue,
+        borderPadding=0,
+        leftIndent=0,
+        leading=18
+    )
+
+    # Info Label (key-value pairs)
+    info_label_style = ParagraphStyle(
+        'InfoLabel',
+        parent=styles['Normal'],
+        fontSize=10,
+        fontName='Helvetica-Bold',
+        textColor=dark_text,
+        spaceAfter=0,
+        leading=14
+    )
+
+    # Info Value (key-value pairs)
+    info_value_style = ParagraphStyle(
+        'InfoValue',
+        parent=styles['Normal'],
+        fontSize=10,
+        fontName='Helvetica',
+        textColor=medium_text,
+        spaceAfter=0,
+        leading=14
+    )
+
+    # Table cell style
+    table_cell_style = ParagraphStyle(
+        'TableCell',
+        parent=styles['Normal'],
+        fontSize=9,
+        fontName='Helvetica',
+        textColor=dark_text,
+        alignment=TA_LEFT,
+        leading=12
+    )
+
+    # Table header style
+    table_header_style = ParagraphStyle(
+        'TableHeader',
+        parent=styles['Normal'],
+        fontSize=9,
+        fontName='Helvetica-Bold',
+        textColor=dark_text,
+        alignment=TA_CENTER,
+        leading=12
+    )
+
+    # ==================== BUILD PDF CONTENT ====================
+    story = []
+
+    # ==================== TITLE PAGE SECTION ====================
+    story.append(Spacer(1, 0.2*inch))
+
+    # Company Logo (if available)
+    if company_profile and company_profile.logo_path and params.get('static_root'):
+        try:
+            from reportlab.platypus import Image
+            logo_path = os.path.join(params['static_root'], company_profile.logo_path.lstrip('/static/'))
+            if os.path.exists(logo_path):
+                logo = Image(logo_path, width=1.5*inch, height=1.5*inch, kind='proportional')
+                logo.hAlign = 'CENTER'
+                story.append(logo)
+                story.append(Spacer(1, 0.15*inch))
+        except Exception as e:
+            print(f"[WARNING] Could not add logo to PDF: {e}")
+
+    # Company Name (if available)
+    if company_profile and company_profile.company_name:
+        company_name_style = ParagraphStyle(
+            'CompanyName',
+            parent=styles['Normal'],
+            fontSize=11,
+            fontName='Helvetica-Bold',
+            textColor=dark_text,
+            alignment=TA_CENTER,
+            spaceAfter=10
+        )
+        story.append(Paragraph(company_profile.company_name, company_name_style))
+
+    # Main Title
+    story.append(Paragraph("DOOR MONITORING", main_title_style))
+    story.append(Paragraph("SECURITY AUDIT REPORT", main_title_style))
+    story.append(Spacer(1, 0.15*inch))
+
+    # Document type badge with door location
+    doc_subtitle_text = "Access Control & Event Log"
+    if door_system_info and door_system_info.door_location:
+        doc_subtitle_text += f" - {door_system_info.door_location}"
+    story.append(Paragraph(doc_subtitle_text, doc_subtitle_style))
+
+    # Decorative separator
+    story.append(HRFlowable(
+        width="40%",
+        thickness=2,
+        color=primary_blue,
+        spaceAfter=30,
+        spaceBefore=10
+    ))
+
+    # ==================== EXECUTIVE SUMMARY SECTION ====================
+    story.append(Paragraph("EXECUTIVE SUMMARY", section_header_style))
+
+    # Calculate comprehensive statistics
+    counts = event_counts(events)
+    door_open_count = counts.get('door_open', 0)
+    door_close_count = counts.get('door_close', 0)
+    alarm_count = counts.get('alarm_triggered', 0)
+
+    # Create statistics cards (4 columns)
+    # Build each card as a mini-table to ensure proper layout
+    cards = []
+    stats_info = [
+        ("TOTAL EVENTS", str(len(events)), '#0066CC'),
+        ("DOOR OPENS", str(door_open_count), '#FF9800'),
+        ("DOOR CLOSES", str(door_close_count), '#4CAF50'),
+        ("ALARMS", str(alarm_count), '#F44336'),
+    ]
+
+    for label, value, color in stats_info:
+        card_data = [
+            [Paragraph(f"<para align='center'><font size='9' color='#757575'><b>{label}</b></font></para>", styles['Normal'])],
+            [Paragraph(f"<para align='center'><font size='20' color='{color}'><b>{value}</b></font></para>", styles['Normal'])],
+        ]
+        card_table = Table(card_data, colWidths=[1.75*inch])
+        card_table.setStyle(TableStyle([
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('TOPPADDING', (0, 0), (-1, 0), 8),
+            ('BOTTOMPADDING', (0, 1), (-1, 1), 8),
+            ('TOPPADDING', (0, 1), (-1, 1), 4),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 4),
+        ]))
+        cards.append(card_table)
+
+    stats_table = Table([cards], colWidths=[1.85*inch, 1.85*inch, 1.85*inch, 1.85*inch])
+    stats_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, -1), header_bg),
+        ('BOX', (0, 0), (-1, -1), 1.5, primary_blue),
+        ('INNERGRID', (0, 0), (-1, -1), 0.5, colors.white),
+        ('TOPPADDING', (0, 0), (-1, -1), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+        ('LEFTPADDING', (0, 0), (-1, -1), 8),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 8),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('ROUNDEDCORNERS', [8, 8, 8, 8]),  # Rounded corners: [topLeft, topRight, bottomLeft, bottomRight]
+    ]))
+
+    story.append(stats_table)
+    story.append(Spacer(1, 0.25*inch))
+
+    # ==================== REPORT INFORMATION SECTION ====================
+    story.append(Paragraph("REPORT INFORMATION", section_header_style))
+
+    # Prepare report metadata
+    date_range = f"{params.get('start_date', 'N/A')} to {params.get('end_date', 'N/A')}"
+    event_filter = ', '.join([t.replace('_', ' ').title() for t in event_types]) if event_types else 'All Event Types'
+    generated_date = generated_at.strftime('%B %d, %Y')
+    generated_time = generated_at.strftime('%I:%M:%S %p')
+
+    # "Generated by" field
+    generated_by = user.get('full_name') or user.get('username') or 'SYSTEM'
+    if user.get('employee_id'):
+        generated_by += f" (ID: {user['employee_id']})"
+    if user.get('department'):
+        generated_by += f" - {user['department']}"
+
+    # Build door location info
+    door_location_info = "eDOMOS v2.1 - Door Monitoring System"
+    if door_system_info:
+        if door_system_info.door_location:
+            door_location_info = f"{door_system_info.door_location}"
+            if door_system_info.department_name:
+                door_location_info += f" ({door_system_info.department_name})"
+        if door_system_info.device_serial_number:
+            door_location_info += f" - S/N: {door_system_info.device_serial_number}"
+
+    # Create modern 2-column metadata table
+    info_data = [
+        [Paragraph("<b>Report Period:</b>", info_label_style), Paragraph(date_range, info_value_style)],
+        [Paragraph("<b>Event Filter:</b>", info_label_style), Paragraph(event_filter, info_value_style)],
+        [Paragraph("<b>Total Records:</b>", info_label_style), Paragraph(f"{len(events)} events recorded", info_value_style)],
+        [Paragraph("<b>Door Location:</b>", info_label_style), Paragraph(door_location_info, info_value_style)],
+        [Paragraph("<b>Report Generated:</b>", info_label_style), Paragraph(f"{generated_date} at {generated_time}", info_value_style)],
+        [Paragraph("<b>Generated By:</b>", info_label_style), Paragraph(generated_by, info_value_style)],
+        [Paragraph("<b>Report Type:</b>", info_label_style), Paragraph("Security Audit - Access Control Log", info_value_style)],
+    ]
+
+    # Add company info if available
+    if company_profile and company_profile.company_name:
+        company_info = company_profile.company_name
+        if company_profile.company_city and company_profile.company_state:
+            company_info += f" - {company_profile.company_city}, {company_profile.company_state}"
+        info_data.insert(3, [Paragraph("<b>Facility:</b>", info_label_style), Paragraph(company_info, info_value_style)])
+
+    info_table = Table(info_data, colWidths=[2*inch, 5.4*inch])
+    info_table.setStyle(TableStyle([
+        # Modern look with subtle gradients using alternating backgrounds
+        ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#E8EAF6')),  # Light indigo for labels
+        ('BACKGROUND', (1, 0), (1, -1), colors.white),  # White for values
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('ALIGN', (0, 0), (0, -1), 'LEFT'),
+        ('ALIGN', (1, 0), (1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 0), (-1, -1), 9),
+        ('TEXTCOLOR', (0, 0), (-1, -1), dark_text),
+        ('TOPPADDING', (0, 0), (-1, -1), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 10),
+        ('LEFTPADDING', (0, 0), (-1, -1), 15),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 15),
+        # Outer border with primary color
+        ('BOX', (0, 0), (-1, -1), 1.5, primary_blue),
+        # Horizontal lines between rows for clarity
+        ('LINEBELOW', (0, 0), (-1, -2), 0.5, colors.HexColor('#E0E0E0')),
+        ('ROUNDEDCORNERS', [8, 8, 8, 8]),  # Rounded corners
+    ]))
+
+    story.append(info_table)
+    story.append(Spacer(1, 0.3*inch))
+
+    # ==================== EVENT LOG TABLE SECTION ====================
+    story.append(Paragraph("DETAILED EVENT LOG", section_header_style))
+    story.append(Spacer(1, 0.1*inch))
+    if 'events' not in parts and events:
+        # Event pages are rendered separately and follow this page
+        story.append(Paragraph(f"{len(events)} events are listed on the following pages.", info_value_style))
+    sections = {'front': story}
+    story = []
+
+    if events and fast_table:
+        from report_table_renderer import EventRowsFlowable
+        on_rows = (lambda drawn: progress(min(drawn / len(events), 0.99))) if progress else None
+        story.append(EventRowsFlowable(events, date_fmt, time_fmt, on_rows=on_rows))
+    elif events:
+        # The Paragraph table holds every row anyway; only used for smaller reports
+        events = list(events)
+
+        # Build table with enhanced styling
+        table_data = [[
+            Paragraph('<b>ID</b>', table_header_style),
+            Paragraph('<b>DATE & TIME</b>', table_header_style),
+            Paragraph('<b>EVENT TYPE</b>', table_header_style),
+            Paragraph('<b>STATUS</b>', table_header_style),
+            Paragraph('<b>USER/SOURCE</b>', table_header_style)
+        ]]
+
+        # Populate table rows
+        report_every = max(1, len(events) // 20)
+        for idx, event in enumerate(events):
+            event_id = f"#{event.id}"
+
+            # Format timestamp using user preference with line break
+            date_time = event.timestamp.strftime(date_fmt) + '<br/>' + event.timestamp.strftime(time_fmt)
+
+            # Format event type
+            event_type_display = event.event_type.replace('_', ' ').title()
+
+            # Determine status with colored indicator
+            if event.event_type == 'door_open':
+                status = '<font color="#FF9800">●</font> OPEN'
+            elif event.event_type == 'door_close':
+                status = '<font color="#4CAF50">●</font> CLOSED'
+            elif event.event_type == 'alarm_triggered':
+                status = '<font color="#F44336">●</font> ALERT'
+            elif event.event_type == 'timer_set':
+                status = '<font color="#2196F3">●</font> TIMER'
+            else:
+                status = '<font color="#9E9E9E">●</font> INFO'
+
+            user_name = "SYSTEM"
+
+            table_data.append([
+                Paragraph(f'<para align="center"><b>{event_id}</b></para>', table_cell_style),
+                Paragraph(f'<para align="center">{date_time}</para>', table_cell_style),
+                Paragraph(event_type_display, table_cell_style),
+                Paragraph(f'<para align="center"><b>{status}</b></para>', table_cell_style),
+                Paragraph(user_name, table_cell_style)
+            ])
+
+            if progress and idx % report_every == 0:
+                progress(0.3 * idx / len(events))
+
+        # Create table with optimized column widths
+        event_table = Table(
+            table_data,
+            colWidths=[0.65*inch, 1.4*inch, 2*inch, 1.35*inch, 1.4*inch],
+            repeatRows=1  # Header repeats on each page
+        )
+
+        # Apply modern, professional table styling
+        table_style_list = [
+            # Modern Header (dark to light blue)
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1976D2')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+            ('TOPPADDING', (0, 0), (-1, 0), 14),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 14),
+
+            # Data rows - general styling
+            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+            ('FONTSIZE', (0, 1), (-1, -1), 9),
+            ('TOPPADDING', (0, 1), (-1, -1), 10),
+            ('BOTTOMPADDING', (0, 1), (-1, -1), 10),
+            ('LEFTPADDING', (0, 0), (-1, -1), 8),
+            ('RIGHTPADDING', (0, 0), (-1, -1), 8),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+
+            # Modern borders - clean outer box with subtle inner lines
+            ('BOX', (0, 0), (-1, -1), 2, colors.HexColor('#1976D2')),
+            ('LINEBELOW', (0, 0), (-1, 0), 2, colors.HexColor('#0D47A1')),
+            ('INNERGRID', (0, 1), (-1, -1), 0.25, colors.HexColor('#E0E0E0')),
+            ('ROUNDEDCORNERS', [8, 8, 8, 8]),  # Rounded corners
+        ]
+
+        # Alternating row colors, alarms highlighted
+        for i in range(1, len(table_data)):
+            event_type = events[i-1].event_type
+            if event_type == 'alarm_triggered':
+                # Highlight alarms with soft red/pink
+                table_style_list.append(('BACKGROUND', (0, i), (-1, i), colors.HexColor('#FFEBEE')))
+                table_style_list.append(('LEFTPADDING', (0, i), (0, i), 10))
+            elif i % 2 == 0:
+                # Alternating very light blue-gray
+                table_style_list.append(('BACKGROUND', (0, i), (-1, i), colors.HexColor('#F5F7FA')))
+            else:
+                # White background
+                table_style_list.append(('BACKGROUND', (0, i), (-1, i), colors.white))
+
+        event_table.setStyle(TableStyle(table_style_list))
+        story.append(event_table)
+    else:
+        # No events found message
+        no_data_para = Paragraph(
+            "<para align='center' backColor='#FFF3E0' borderColor='#FF9800' borderWidth='1' "
+            "borderPadding='20'><b>NO EVENTS FOUND</b><br/>"
+            "No events match the specified criteria for the selected time period.</para>",
+            doc_subtitle_style
+        )
+        story.append(no_data_para)
+    sections['events'] = story
+    story = []
+
+    # ==================== COMPLIANCE & AUDIT SECTION ====================
+    # Add compliance metrics for ISO 27001 / SOC 2 audits
+    compliance = report.get('compliance')
+    if params.get('report_type') == 'compliance_audit' and compliance:
+        story.append(Spacer(1, 0.3*inch))
+        story.append(Paragraph("COMPLIANCE & AUDIT METRICS", section_header_style))
+        story.append(Spacer(1, 0.1*inch))
+
+        # Build compliance table
+        compliance_data = [
+            [Paragraph("<b>Metric</b>", info_label_style), Paragraph("<b>Value</b>", info_label_style), Paragraph("<b>Standard</b>", info_label_style)],
+            [Paragraph("Total Security Events", info_value_style), Paragraph(str(len(events)), info_value_style), Paragraph("ISO 27001:2013", info_value_style)],
+            [Paragraph("Alarm Events Triggered", info_value_style), Paragraph(str(compliance['total_alarms']), info_value_style), Paragraph("Access Control (A.9.1)", info_value_style)],
+            [Paragraph("Anomalies Detected", info_value_style), Paragraph(str(compliance['total_anomalies']), info_value_style), Paragraph("Monitoring (A.12.4)", info_value_style)],
+            [Paragraph("Unacknowledged Anomalies", info_value_style), Paragraph(str(compliance['unacknowledged_anomalies']), info_value_style), Paragraph("Incident Response", info_value_style)],
+            [Paragraph("Mean Time To Resolve (MTTR)", info_value_style), Paragraph(f"{compliance['mttr']:.1f} seconds", info_value_style), Paragraph("SOC 2 CC7.3", info_value_style)],
+            [Paragraph("Alarm Threshold Setting", info_value_style), Paragraph(f"{compliance['alarm_threshold']} seconds", info_value_style), Paragraph("Policy Compliance", info_value_style)],
+        ]
+
+        compliance_table = Table(compliance_data, colWidths=[2.5*inch, 2*inch, 2*inch])
+        compliance_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), header_bg),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 9),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('TOPPADDING', (0, 1), (-1, -1), 8),
+            ('BOTTOMPADDING', (0, 1), (-1, -1), 8),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#CCCCCC')),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ]))
+
+        story.append(compliance_table)
+        story.append(Spacer(1, 0.2*inch))
+
+    # ==================== CERTIFICATION & SIGNATURES SECTION ====================
+    story.append(KeepTogether(_signature_elements(params, styles, light_text)))
+
+    sections['back'] = story
+
+    # ==================== BUILD PDF ====================
+    doc.build([flowable for part in parts for flowable in sections[part]])
+    if progress:
+        progress(1.0)
+    return doc.pages_written
+
+
+def _signature_elements(params, styles, light_text):
+    """Certification statement and signature blocks, kept together on one page"""
+    from reportlab.platypus import Table, TableStyle, Paragraph, Spacer
+    from reportlab.lib.styles import ParagraphStyle
+    from reportlab.lib.units import inch
+    from reportlab.lib import colors
+    from reportlab.platypus.flowables import HRFlowable
+    from reportlab.lib.enums import TA_LEFT, TA_JUSTIFY
+
+    signature_elements = []
+
+    signature_elements.append(Spacer(1, 0.3*inch))
+    signature_elements.append(HRFlowable(width="100%", thickness=1, color=colors.HexColor('#CCCCCC')))
+    signature_elements.append(Spacer(1, 0.15*inch))
+
+    # Certification statement
+    cert_style = ParagraphStyle(
+        'Certification',
+        parent=styles['Normal'],
+        fontSize=8,
+        fontName='Helvetica-Oblique',
+        textColor=light_text,
+        alignment=TA_JUSTIFY,
+        leading=11
+    )
+
+    # Build certification text based on report type
+    if params.get('report_type') == 'compliance_audit':
+        certification_text = (
+            "<b>CERTIFICATION & COMPLIANCE STATEMENT:</b> This report was automatically generated by the eDOMOS Door Monitoring System "
+            "in compliance with ISO/IEC 27001:2013 information security standards and SOC 2 Trust Service Criteria. "
+            "All timestamps are recorded in local system time with audit trail preservation. Event data is stored in a secure database "
+            "with integrity controls and access restrictions. This document contains sensitive security information and is intended for "
+            "authorized personnel, auditors, and compliance officers only. The system maintains continuous monitoring for anomaly detection, "
+            "incident response tracking (MTTR), and access control verification as required by applicable security frameworks."
+        )
+    else:
+        certification_text = (
+            "<b>CERTIFICATION:</b> This report was automatically generated by the eDOMOS Door Monitoring System. "
+            "All timestamps are recorded in local system time. Event data is stored in a secure database and "
+            "is subject to audit trails. This document is intended for authorized personnel only and contains "
+            "sensitive security information regarding access control and facility monitoring."
+        )
+    signature_elements.append(Paragraph(certification_text, cert_style))
+    signature_elements.append(Spacer(1, 0.2*inch))
+
+    # Signature blocks (for manual signatures if needed) - Aligned to certification text width
+    sig_style = ParagraphStyle(
+        'SignatureBlock',
+        parent=styles['Normal'],
+        fontSize=8,
+        alignment=TA_LEFT,  # Left-align text within each block
+        leading=12
+    )
+
+    sig_data = [
+        [
+            Paragraph("<b>Prepared By:</b><br/>__________________________<br/><font size='7'>System Administrator</font>", sig_style),
+            Paragraph("<b>Reviewed By:</b><br/>__________________________<br/><font size='7'>Security Officer</font>", sig_style),
+            Paragraph("<b>Date:</b><br/>__________________________<br/><font size='7'>Approval Date</font>", sig_style),
+        ]
+    ]
+
+    # Match the width of the content area (same as certification text)
+    available_width = 6.5*inch
+    col_width = available_width / 3
+    sig_table = Table(sig_data, colWidths=[col_width, col_width, col_width])
+    sig_table.setStyle(TableStyle([
+        ('ALIGN', (0, 0), (0, 0), 'LEFT'),    # Prepared By - left aligned
+        ('ALIGN', (1, 0), (1, 0), 'CENTER'),  # Reviewed By - center aligned
+        ('ALIGN', (2, 0), (2, 0), 'RIGHT'),   # Date - right aligned
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('TOPPADDING', (0, 0), (-1, -1), 0),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
+        ('LEFTPADDING', (0, 0), (-1, -1), 0),   # No left padding
+        ('RIGHTPADDING', (0, 0), (-1, -1), 0),  # No right padding
+    ]))
+
+    signature_elements.append(sig_table)
+    return signature_elements
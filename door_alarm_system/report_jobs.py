@@ -0,0 +1,421 @@
+"""
+Background Report Jobs for eDOMOS
+Runs PDF/CSV report generation off the request thread in a worker pool,
+tracks progress, keeps finished artifacts on disk for a limited time and
+collapses identical concurrent requests into a single job
+"""
+
+import os
+import json
+import uuid
+import time
+import hashlib
+import threading
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import report_engine
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+REPORT_FORMATS = {
+    'pdf': ('application/pdf', 'pdf'),
+    'csv': ('text/csv', 'csv'),
+}
+
+# Progress queue of the current worker process (set by the pool initializer)
+_progress_queue = None
+
+
+def _init_worker(progress_queue):
+    global _progress_queue
+    _progress_queue = progress_queue
+
+
+def run_report_job(job_id, source, params, out_path, progress=None):
+    """
+    Build one report artifact; runs inside a pool worker
+
+    Args:
+        job_id: Job identifier used for progress messages
+        source: Database URI or Engine handed to report_engine.load_report_data
+        params: Report request plus formatting options (see render_audit_pdf)
+        out_path: Artifact path; written to a temp file and renamed when complete
+        progress: Callable(job_id, fraction) for thread workers; process
+            workers report through the queue set by _init_worker
+
+    Returns:
+        Number of events in the report
+    """
+    def report(fraction):
+        if progress:
+            progress(job_id, fraction)
+        elif _progress_queue is not None:
+            _progress_queue.put((job_id, fraction))
+
+    report(0.0)
+    tmp_path = f"{out_path}.tmp"
+    if params['format'] == 'csv':
+        # Streamed straight to disk; no progress steps since the total is unknown
+        context, events = report_engine.stream_report(source, params)
+        counted = [0]
+
+        def counting(rows):
+            for row in rows:
+                counted[0] += 1
+                yield row
+        with open(tmp_path, 'w', newline='', encoding='utf-8') as output:
+            for chunk in report_engine.iter_csv(context, counting(events), params):
+                output.write(chunk)
+        row_count = counted[0]
+    else:
+        data = report_engine.load_report_data(source, params)
+        report(0.05)
+        report_engine.render_audit_pdf(data, params, tmp_path, progress=lambda f: report(0.05 + 0.95 * f))
+        row_count = len(data['events'])
+    os.replace(tmp_path, out_path)
+    return row_count
+
+
+class ReportJob:
+    """State of one submitted report"""
+
+    def __init__(self, job_id, key, owner_id, params):
+        self.id = job_id
+        self.key = key
+        self.owner_id = owner_id
+        self.params = params
+        self.format = params['format']
+        self.status = JOB_QUEUED
+        self.progress = 0.0
+        self.error = None
+        self.path = None
+        self.row_count = None
+        self.cache_key = None
+        self.cached = False
+        self.created_at = time.time()
+        self.finished_at = None
+        self.done_event = threading.Event()
+
+    @property
+    def mimetype(self):
+        return REPORT_FORMATS[self.format][0]
+
+    @property
+    def filename(self):
+        extension = REPORT_FORMATS[self.format][1]
+        return f"eDOMOS_Report_{self.params['start_date']}_to_{self.params['end_date']}.{extension}"
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'progress': round(self.progress * 100),
+            'format': self.format,
+            'error': self.error,
+            'row_count': self.row_count,
+            'cached': self.cached,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+        }
+
+
+class ReportJobManager:
+    """
+    Report job queue
+
+    Jobs run in a process pool when the database is a file (reportlab layout
+    is CPU-bound and would otherwise hold the GIL against the door monitor).
+    Workers are forked: a spawned or forkserver child would re-import the
+    server's main module and with it the GPIO setup. Forking a process that
+    runs threads can leave a child blocked on a lock one of them held
+    (logging, the SQLAlchemy pool), so start() forks every worker up front
+    and is called at startup before any other thread exists; the workers
+    live as long as the server. If a worker dies (the OOM killer taking a
+    large render) the pool is broken for good, and re-forking from the now
+    threaded server is unsafe, so jobs fall back to a thread pool until the
+    next restart. In-memory databases are only visible to this process, so
+    those jobs run in a thread pool from the start.
+    """
+
+    def __init__(self, artifact_dir, source, max_workers=2, ttl=3600, on_update=None,
+                 use_processes=None, cache=None):
+        """
+        Args:
+            artifact_dir: Directory for finished report files
+            source: Database URI (or Engine for thread workers)
+            max_workers: Reports generated concurrently
+            ttl: Seconds a finished artifact (and its job) is kept
+            on_update: Callback(job) on every status/progress change
+            use_processes: Force process (True) or thread (False) workers;
+                default picks processes for file-backed databases
+            cache: Optional ReportCache; finished artifacts are stored in it
+                and requests for unchanged data are answered from it
+        """
+        self.artifact_dir = artifact_dir
+        self.source = source
+        self.max_workers = max_workers
+        self.ttl = ttl
+        self.on_update = on_update
+        self.cache = cache
+        if use_processes is None:
+            use_processes = isinstance(source, str) and ':memory:' not in source
+        self.use_processes = use_processes
+
+        self._jobs = {}
+        self._active_keys = {}  # dedup key -> job id while queued/running
+        self._lock = threading.Lock()
+        self._executor = None
+        self._progress_queue = None
+        self.submitted = 0
+        self.pool_failures = 0
+        self.deduplicated = 0
+
+        os.makedirs(artifact_dir, exist_ok=True)
+
+    # ------------------------------------------------------------------
+    # Submission
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def job_key(params, owner_id):
+        """Identical requests from the same user share one job"""
+        canonical = json.dumps({'owner': owner_id, 'params': params}, sort_keys=True, default=str)
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def submit(self, params, owner_id):
+        """
+        Queue a report, or join an identical one that is still in progress
+
+        Returns:
+            (job, created) - created is False for a de-duplicated request
+        """
+        if params.get('format') not in REPORT_FORMATS:
+            raise ValueError(f"Unsupported report format: {params.get('format')}")
+        self.cleanup_expired()
+        key = self.job_key(params, owner_id)
+
+        with self._lock:
+            existing = self._jobs.get(self._active_keys.get(key))
+            if existing is not None and existing.status in (JOB_QUEUED, JOB_RUNNING):
+                self.deduplicated += 1
+                return existing, False
+
+        job = ReportJob(uuid.uuid4().hex, key, owner_id, params)
+        extension = REPORT_FORMATS[job.format][1]
+        job.path = os.path.join(self.artifact_dir, f"{job.id}.{extension}")
+        if self.cache is not None:
+            watermark = report_engine.data_watermark(self.source, params)
+            job.cache_key = self.cache.fingerprint(params, watermark)
+            if self.cache.fetch(job.cache_key, extension, job.path):
+                job.cached = True
+                job.row_count = watermark['count']
+                job.status = JOB_DONE
+                job.progress = 1.0
+                job.finished_at = time.time()
+                job.done_event.set()
+                with self._lock:
+                    self._jobs[job.id] = job
+                    self.submitted += 1
+                self._notify(job)
+                return job, True
+
+        with self._lock:
+            self._jobs[job.id] = job
+            self._active_keys[key] = job.id
+            self.submitted += 1
+            executor = self._get_executor()
+
+        self._notify(job)
+        try:
+            try:
+                future = self._run(executor, job)
+            except BrokenProcessPool:
+                self._replace_broken_pool(executor)
+                with self._lock:
+                    executor = self._get_executor()
+                future = self._run(executor, job)
+        except Exception as e:
+            self._finish(job, error=e)
+            raise
+        future.add_done_callback(lambda f, job=job, executor=executor: self._on_finished(job, f, executor))
+        return job, True
+
+    def _run(self, executor, job):
+        if isinstance(executor, ProcessPoolExecutor):
+            return executor.submit(run_report_job, job.id, self.source, job.params, job.path)
+        return executor.submit(run_report_job, job.id, self.source, job.params, job.path, self._on_progress)
+
+    def start(self):
+        """Create the worker pool now (see the class docstring)"""
+        with self._lock:
+            self._get_executor()
+        return self
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.use_processes:
+                if threading.active_count() > 1:
+                    logger.warning("Report workers forked while other threads run - "
+                                   "call ReportJobManager.start() at startup")
+                context = multiprocessing.get_context('fork')
+                # SimpleQueue writes from the calling thread, so workers never
+                # start a feeder thread and can fork render processes safely
+                self._progress_queue = context.SimpleQueue()
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers, mp_context=context,
+                    initializer=_init_worker, initargs=(self._progress_queue,))
+                # Fork all workers now, before this pool starts its own threads
+                self._executor.submit(os.getpid).result()
+                thread = threading.Thread(target=self._drain_progress, name="ReportJobProgress")
+                thread.daemon = True
+                thread.start()
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix="ReportJob")
+        return self._executor
+
+    # ------------------------------------------------------------------
+    # Progress and completion
+    # ------------------------------------------------------------------
+
+    def _drain_progress(self):
+        progress_queue = self._progress_queue
+        while True:
+            try:
+                item = progress_queue.get()
+            except (EOFError, OSError):
+                break
+            if item is None:
+                break
+            self._on_progress(*item)
+
+    def _on_progress(self, job_id, fraction):
+        job = self._jobs.get(job_id)
+        if job is None or job.status in (JOB_DONE, JOB_FAILED):
+            return
+        # Only forward whole-percent steps to keep notifications cheap
+        changed = job.status != JOB_RUNNING or int(fraction * 100) != int(job.progress * 100)
+        job.status = JOB_RUNNING
+        job.progress = max(job.progress, fraction)
+        if changed:
+            self._notify(job)
+
+    def _on_finished(self, job, future, executor):
+        try:
+            row_count = future.result()
+        except BrokenProcessPool as e:
+            self._replace_broken_pool(executor)
+            self._finish(job, error=e)
+        except Exception as e:
+            self._finish(job, error=e)
+        else:
+            self._finish(job, row_count=row_count)
+
+    def _finish(self, job, row_count=None, error=None):
+        if error is None:
+            try:
+                job.row_count = row_count
+                job.status = JOB_DONE
+                job.progress = 1.0
+                if self.cache is not None and job.cache_key:
+                    self.cache.store(job.cache_key, REPORT_FORMATS[job.format][1], job.path)
+            except Exception as e:
+                error = e
+        if error is not None:
+            logger.error(f"Report job {job.id} failed: {error}")
+            job.status = JOB_FAILED
+            job.error = str(error) or type(error).__name__
+        job.finished_at = time.time()
+        with self._lock:
+            if self._active_keys.get(job.key) == job.id:
+                del self._active_keys[job.key]
+        job.done_event.set()
+        self._notify(job)
+
+    def _replace_broken_pool(self, broken):
+        """A worker process died: run later jobs in threads (see the class docstring)"""
+        with self._lock:
+            if self._executor is not broken:
+                return  # Already replaced for another job of the same pool
+            logger.error("Report worker process died - running report jobs in threads until restart")
+            self.pool_failures += 1
+            self.use_processes = False
+            self._executor = None
+            # The drain thread is left blocked on the old queue: a killed
+            # worker may hold its write lock, so no sentinel can be sent
+            self._progress_queue = None
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def _notify(self, job):
+        if self.on_update:
+            try:
+                self.on_update(job)
+            except Exception as e:
+                logger.error(f"Report job notification failed: {e}")
+
+    # ------------------------------------------------------------------
+    # Lookup and expiry
+    # ------------------------------------------------------------------
+
+    def get(self, job_id):
+        self.cleanup_expired()
+        return self._jobs.get(job_id)
+
+    def wait(self, job_id, timeout=None):
+        """Block until a job finished; returns the job (or None if unknown)"""
+        job = self._jobs.get(job_id)
+        if job is not None:
+            job.done_event.wait(timeout)
+        return job
+
+    def cleanup_expired(self):
+        """Forget finished jobs older than the TTL and delete their files"""
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            expired = [job for job in self._jobs.values()
+                       if job.finished_at is not None and job.finished_at < cutoff]
+            for job in expired:
+                del self._jobs[job.id]
+        for job in expired:
+            for path in (job.path, f"{job.path}.tmp"):
+                if path and os.path.exists(path):
+                    try:
+                        os.remove(path)
+                    except OSError as e:
+                        logger.warning(f"Could not remove report artifact {path}: {e}")
+        return len(expired)
+
+    def get_stats(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        stats = {
+            'workers': self.max_workers,
+            'mode': 'process' if self.use_processes else 'thread',
+            'submitted': self.submitted,
+            'deduplicated': self.deduplicated,
+            'pool_failures': self.pool_failures,
+            'active': sum(1 for job in jobs if job.status in (JOB_QUEUED, JOB_RUNNING)),
+            'stored': sum(1 for job in jobs if job.status == JOB_DONE),
+        }
+        if self.cache is not None:
+            stats['cache'] = self.cache.get_stats()
+        return stats
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self._progress_queue is not None:
+            try:
+                self._progress_queue.put(None)
+            except (OSError, ValueError):
+                pass
+            self._progress_queue = None
@@ -0,0 +1,175 @@
+"""
+Scheduled Report Dispatcher for eDOMOS
+Keeps the due times of scheduled reports in a heap, sleeps until the earliest
+one and hands due runs to a small worker pool. Changes to the schedules wake
+it immediately; a periodic resync covers changes made by other processes.
+"""
+
+import heapq
+import threading
+import logging
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Report interval per schedule frequency
+FREQUENCIES = {
+    'daily': timedelta(days=1),
+    'weekly': timedelta(days=7),
+    'monthly': timedelta(days=30),
+}
+
+
+def frequency_period(frequency):
+    return FREQUENCIES.get(frequency, FREQUENCIES['daily'])
+
+
+def report_window(frequency, scheduled_for):
+    """
+    (start_date, end_date) strings of the report due at scheduled_for
+
+    The window ends on the scheduled day rather than on the day the run
+    actually happens, so a run caught up after downtime still covers the
+    period it was meant to.
+    """
+    start = scheduled_for - frequency_period(frequency)
+    return start.strftime('%Y-%m-%d'), scheduled_for.strftime('%Y-%m-%d')
+
+
+def following_run(frequency, scheduled_for, now, max_catchup=3):
+    """
+    Due time of the occurrence after scheduled_for
+
+    Every missed occurrence is run in turn after downtime, but at most
+    max_catchup of them; older ones are skipped.
+    """
+    period = frequency_period(frequency)
+    next_run = scheduled_for + period
+    missed = int((now - next_run) / period) + 1 if next_run <= now else 0
+    if missed > max_catchup:
+        next_run += period * (missed - max_catchup)
+    return next_run
+
+
+class ReportScheduler:
+    """
+    Heap-based scheduler thread
+
+    The scheduler only decides *when*; loading due runs and executing one
+    (including claiming it so it runs once) are callbacks, so the Flask app
+    keeps the database work.
+    """
+
+    def __init__(self, load_due, run_due, max_workers=2, resync_interval=300.0, clock=datetime.now):
+        """
+        Args:
+            load_due: Callable returning (due_at, report_id, scheduled_for)
+                tuples for every pending run
+            run_due: Callable(report_id, scheduled_for) executing one run
+            max_workers: Reports generated and sent concurrently
+            resync_interval: Longest sleep (seconds) before re-reading the
+                schedules, for changes that did not call wake()
+            clock: Current local time (as stored in ScheduledReport.next_run)
+        """
+        self.load_due = load_due
+        self.run_due = run_due
+        self.max_workers = max_workers
+        self.resync_interval = resync_interval
+        self.clock = clock
+
+        self._heap = []
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._executor = None
+        self._thread = None
+        self.dispatched = 0
+        self.failed = 0
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ScheduledReport")
+        self._thread = threading.Thread(target=self._run, name="ReportScheduler")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=2.0):
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def is_alive(self):
+        return bool(self._thread and self._thread.is_alive())
+
+    def wake(self):
+        """Re-read the schedules now (a report was created, changed or removed)"""
+        self._wake_event.set()
+
+    # ------------------------------------------------------------------
+    # Scheduling loop
+    # ------------------------------------------------------------------
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._wake_event.clear()
+            self._resync()
+            self._dispatch_due()
+            with self._lock:
+                next_due = self._heap[0][0] if self._heap else None
+            timeout = self.resync_interval
+            if next_due is not None:
+                timeout = min(timeout, max((next_due - self.clock()).total_seconds(), 0.0))
+            self._wake_event.wait(timeout)
+
+    def _resync(self):
+        try:
+            entries = self.load_due()
+        except Exception as e:
+            logger.error(f"Loading report schedules failed: {e}")
+            return
+        with self._lock:
+            self._heap = [(due_at, report_id, scheduled_for) for due_at, report_id, scheduled_for in entries
+                          if (report_id, scheduled_for) not in self._in_flight]
+            heapq.heapify(self._heap)
+
+    def _dispatch_due(self):
+        now = self.clock()
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                _, report_id, scheduled_for = heapq.heappop(self._heap)
+                key = (report_id, scheduled_for)
+                if key in self._in_flight:
+                    continue
+                self._in_flight.add(key)
+                self.dispatched += 1
+                self._executor.submit(self._execute, key)
+
+    def _execute(self, key):
+        try:
+            self.run_due(*key)
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Scheduled report {key[0]} ({key[1]}) failed: {e}")
+        finally:
+            with self._lock:
+                self._in_flight.discard(key)
+            self.wake()  # The run moved its report's next due time
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'pending': len(self._heap),
+                'in_flight': len(self._in_flight),
+                'next_due': self._heap[0][0].isoformat() if self._heap else None,
+                'dispatched': self.dispatched,
+                'failed': self.failed,
+                'workers': self.max_workers,
+            }
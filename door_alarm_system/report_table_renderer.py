@@ -0,0 +1,229 @@
+"""
+High-Volume Event Table Renderer for eDOMOS
+Draws the audit report's detailed event log straight onto the PDF canvas with
+fixed-height rows. A platypus Table with one Paragraph per cell re-measures
+every cell and style command on each layout pass, which is what makes large
+reports slow; this flowable only does arithmetic to lay out a page and keeps
+a (start, end) window into the shared events instead of per-row objects.
+Pages are drawn in order, so the rows are pulled from one iterator as each
+page is drawn and the events never have to be in memory all at once.
+"""
+
+from itertools import islice
+
+from reportlab.lib import colors
+from reportlab.lib.units import inch
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.platypus.flowables import Flowable
+
+ROW_HEIGHT = 14
+HEADER_HEIGHT = 20
+FONT_SIZE = 8
+
+# Same columns and widths as the detailed (Paragraph) table
+COLUMNS = (
+    ('ID', 0.65*inch),
+    ('DATE & TIME', 1.4*inch),
+    ('EVENT TYPE', 2*inch),
+    ('STATUS', 1.35*inch),
+    ('USER/SOURCE', 1.4*inch),
+)
+
+HEADER_BG = colors.HexColor('#1976D2')
+HEADER_RULE = colors.HexColor('#0D47A1')
+ALARM_BG = colors.HexColor('#FFEBEE')
+ALT_BG = colors.HexColor('#F5F7FA')
+GRID = colors.HexColor('#E0E0E0')
+
+STATUS = {
+    'door_open': ('OPEN', colors.HexColor('#FF9800')),
+    'door_close': ('CLOSED', colors.HexColor('#4CAF50')),
+    'alarm_triggered': ('ALERT', colors.HexColor('#F44336')),
+    'timer_set': ('TIMER', colors.HexColor('#2196F3')),
+}
+DEFAULT_STATUS = ('INFO', colors.HexColor('#9E9E9E'))
+
+
+def rows_per_frame(frame_height):
+    """Event rows that fit in a frame of the given inner height"""
+    return max(1, int((frame_height - HEADER_HEIGHT) // ROW_HEIGHT))
+
+
+def _fit(text, width, font='Helvetica'):
+    """Trim text with an ellipsis so it fits the column"""
+    if stringWidth(text, font, FONT_SIZE) <= width:
+        return text
+    while text and stringWidth(text + '...', font, FONT_SIZE) > width:
+        text = text[:-1]
+    return text + '...'
+
+
+class _RowCursor:
+    """Hands out the rows of an events iterable in order, one window at a time"""
+
+    def __init__(self, events):
+        self.rows = iter(events)
+        self.position = 0
+
+    def take(self, start, end):
+        if start != self.position:
+            raise RuntimeError(f"Event rows {start}-{end} drawn out of order (next row is {self.position})")
+        rows = list(islice(self.rows, end - start))
+        self.position = end
+        return rows
+
+
+class EventRowsFlowable(Flowable):
+    """
+    Detailed event log for a run of events
+
+    `events` is any sized iterable (a list or report_engine.EventStream).
+    Splits at page boundaries into new windows over the same events, so a
+    100k-row report costs one small object per page plus the rows of the
+    page being drawn.
+    """
+
+    def __init__(self, events, date_fmt, time_fmt, start=0, end=None, on_rows=None, _labels=None, _cursor=None):
+        Flowable.__init__(self)
+        self.events = events
+        self.date_fmt = date_fmt
+        self.time_fmt = time_fmt
+        self.start = start
+        self.end = len(events) if end is None else end
+        self.on_rows = on_rows
+        # Event type label cache shared by all windows (few distinct types)
+        self._labels = {} if _labels is None else _labels
+        # Opened on the first draw so an undrawn table never reads its events
+        self._cursor = [None] if _cursor is None else _cursor
+        self.widths = [width for _, width in COLUMNS]
+
+    def _window(self, start, end):
+        return EventRowsFlowable(self.events, self.date_fmt, self.time_fmt, start, end,
+                                 self.on_rows, self._labels, self._cursor)
+
+    def _rows(self):
+        if self._cursor[0] is None:
+            self._cursor[0] = _RowCursor(self.events)
+        return self._cursor[0].take(self.start, self.end)
+
+    def wrap(self, availWidth, availHeight):
+        self.width = sum(self.widths)
+        self.height = HEADER_HEIGHT + (self.end - self.start) * ROW_HEIGHT
+        return self.width, self.height
+
+    def split(self, availWidth, availHeight):
+        fit = int((availHeight - HEADER_HEIGHT) // ROW_HEIGHT)
+        if fit <= 0:
+            return []  # Not even the header and one row - move to the next page
+        if fit >= self.end - self.start:
+            return [self]
+        return [self._window(self.start, self.start + fit), self._window(self.start + fit, self.end)]
+
+    def _label(self, event_type):
+        label = self._labels.get(event_type)
+        if label is None:
+            label = _fit(event_type.replace('_', ' ').title(), self.widths[2] - 12)
+            self._labels[event_type] = label
+        return label
+
+    def _skeleton(self, count):
+        """
+        Form XObject with the header, row stripes, grid and source column for `count` rows
+
+        Full pages all have the same row count, so the table skeleton is
+        written to the PDF once and each page references it.
+        """
+        parity = self.start % 2
+        key = ('_skeleton', count, parity)
+        name = self._labels.get(key)
+        if name is not None:
+            return name
+        name = f"EventRows{count}_{parity}"
+        self._labels[key] = name
+
+        canv = self.canv
+        widths = self.widths
+        x_positions = [sum(widths[:i]) for i in range(len(widths))]
+        top = self.height
+        body_top = top - HEADER_HEIGHT
+        table_bottom = body_top - count * ROW_HEIGHT
+
+        canv.beginForm(name)
+        canv.setFillColor(HEADER_BG)
+        canv.rect(0, body_top, self.width, HEADER_HEIGHT, stroke=0, fill=1)
+        canv.setFillColor(colors.white)
+        canv.setFont('Helvetica-Bold', FONT_SIZE + 1)
+        for (title, width), x in zip(COLUMNS, x_positions):
+            canv.drawCentredString(x + width / 2, body_top + 7, title)
+
+        # Alternating stripes on even table rows (row 1 is the first event)
+        canv.setFillColor(ALT_BG)
+        for offset in range(count):
+            if (self.start + offset + 1) % 2 == 0:
+                canv.rect(0, body_top - (offset + 1) * ROW_HEIGHT, self.width, ROW_HEIGHT, stroke=0, fill=1)
+
+        # Every event is attributed to the system, so the source column is static
+        text = canv.beginText(x_positions[4] + 6, body_top - ROW_HEIGHT + 4)
+        text.setFont('Helvetica', FONT_SIZE, leading=ROW_HEIGHT)
+        text.setFillColor(colors.black)
+        text.textLines('\n'.join(['SYSTEM'] * count))
+        canv.drawText(text)
+
+        canv.setStrokeColor(GRID)
+        canv.setLineWidth(0.25)
+        canv.lines([(0, body_top - n * ROW_HEIGHT, self.width, body_top - n * ROW_HEIGHT) for n in range(1, count)])
+        canv.lines([(x, table_bottom, x, body_top) for x in x_positions[1:]])
+        canv.setStrokeColor(HEADER_RULE)
+        canv.setLineWidth(2)
+        canv.line(0, body_top, self.width, body_top)
+        canv.setStrokeColor(HEADER_BG)
+        canv.rect(0, table_bottom, self.width, top - table_bottom, stroke=1, fill=0)
+        canv.endForm()
+        return name
+
+    def draw(self):
+        canv = self.canv
+        widths = self.widths
+        x_positions = [sum(widths[:i]) for i in range(len(widths))]
+        events = self._rows()
+        body_top = self.height - HEADER_HEIGHT
+
+        canv.doForm(self._skeleton(len(events)))
+
+        # Alarm rows are highlighted on top of the stripes, inset to keep the grid
+        canv.setFillColor(ALARM_BG)
+        for offset, event in enumerate(events):
+            if event.event_type == 'alarm_triggered':
+                canv.rect(0.5, body_top - (offset + 1) * ROW_HEIGHT + 0.5, self.width - 1, ROW_HEIGHT - 1,
+                          stroke=0, fill=1)
+
+        # One text object per column: each row is a single "next line" operator
+        datetime_fmt = f"{self.date_fmt} {self.time_fmt}"
+        stamps = [event.timestamp.strftime(datetime_fmt) for event in events]
+        stamp_x = x_positions[1] + (widths[1] - stringWidth(stamps[0], 'Helvetica', FONT_SIZE)) / 2 if stamps else 0
+        first_line = body_top - ROW_HEIGHT + 4
+        columns = (
+            (x_positions[0] + 8, 'Helvetica-Bold', [f"#{event.id}" for event in events]),
+            (stamp_x, 'Helvetica', stamps),
+            (x_positions[2] + 6, 'Helvetica', [self._label(event.event_type) for event in events]),
+            (x_positions[3] + 22, 'Helvetica-Bold', [STATUS.get(event.event_type, DEFAULT_STATUS)[0] for event in events]),
+        )
+        for x, font, values in columns:
+            self._text_column(x, first_line, font, colors.black, values)
+
+        # Status dots, one text object per colour (ZapfDingbats 'l' is a filled circle)
+        statuses = [STATUS.get(event.event_type, DEFAULT_STATUS) for event in events]
+        for color in {status_color for _, status_color in statuses}:
+            self._text_column(x_positions[3] + 11, first_line, 'ZapfDingbats', color,
+                              ['l' if status_color == color else '' for _, status_color in statuses])
+
+        if self.on_rows:
+            self.on_rows(self.end)
+
+    def _text_column(self, x, y, font, color, values):
+        text = self.canv.beginText(x, y)
+        text.setFont(font, FONT_SIZE, leading=ROW_HEIGHT)
+        text.setFillColor(color)
+        for value in values:
+            text.textLine(value)
+        self.canv.drawText(text)
@@ -0,0 +1,212 @@
+"""
+Anomaly Rule Backtesting for eDOMOS
+Replays EventLog history through the anomaly rules of detect_anomalies
+(odd hours, repeated opens) and the AI engine's anomaly scoring with
+candidate parameters, and counts the anomalies each configuration would have
+raised. Everything parameter-independent is computed once with NumPy; a
+configuration is then a handful of array operations, and sweeps fan out over
+forked worker processes that share those arrays.
+"""
+
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from sqlalchemy import create_engine, select
+
+from models import Setting
+from ai_training import load_event_arrays, rapid_counts, event_hours, event_weekdays
+
+# Parameters of the live rules (app.detect_anomalies, AISecurityEngine.detect_anomaly)
+DEFAULT_PARAMS = {
+    'business_hours_start': 9,      # Door opens before this hour are odd_hours
+    'business_hours_end': 17,       # ... and from this hour on
+    'repeat_window': 600,           # repeated_opens: seconds looked back
+    'repeat_threshold': 3,          # repeated_opens: opens in the window (including this one)
+    'ai_min_score': 50,             # AI anomaly score that counts as an anomaly
+    'ai_frequency_factor': 3,       # AI: event type this many times the hour's average
+    'ai_night_start': 23,           # AI: night hours are from ...
+    'ai_night_end': 5,              # ... to this hour (inclusive)
+    'ai_rapid_period': 60,          # AI: rapid events window in seconds
+    'ai_rapid_limit': 10,           # AI: more events than this in the window is rapid
+}
+
+# Features shared by sweep workers (inherited through fork)
+_sweep_features = None
+
+
+def current_params(source):
+    """DEFAULT_PARAMS with the business hours configured in Settings"""
+    params = dict(DEFAULT_PARAMS)
+    table = Setting.__table__
+    engine = create_engine(source) if isinstance(source, str) else source
+    try:
+        with engine.connect() as conn:
+            rows = conn.execute(select(table.c.key, table.c.value).where(
+                table.c.key.in_(('business_hours_start', 'business_hours_end')))).all()
+    finally:
+        if isinstance(source, str):
+            engine.dispose()
+    for key, value in rows:
+        try:
+            params[key] = int(value)
+        except ValueError:
+            pass
+    return params
+
+
+def _running_sums(keys, values):
+    """Sum of values over earlier events with the same key, including each event itself"""
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    sorted_values = values[order]
+    sums = np.cumsum(sorted_values)
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]]) if len(keys) else np.empty(0, int)
+    lengths = np.diff(np.r_[starts, len(keys)])
+    result = np.empty_like(sums)
+    result[order] = sums - np.repeat(sums[starts] - sorted_values[starts], lengths)
+    return result
+
+
+def prepare(events):
+    """
+    Parameter-independent replay features of EventArrays
+
+    The AI pattern model is replayed as it would have grown: every event is
+    scored against the counts learned up to and including itself, as
+    analyze_behavior learns before it detects (without pattern decay).
+    """
+    types = events.types
+    code_of = {name: j for j, name in enumerate(types)}
+    ones = np.ones(len(events.codes), dtype=np.int64)
+
+    def is_type(name):
+        return events.codes == code_of[name] if name in code_of else np.zeros(len(events.codes), dtype=bool)
+
+    hours = event_hours(events.seconds)
+    days = event_weekdays(events.seconds)
+    hour_type = hours * len(types) + events.codes
+    hour_type_count = _running_sums(hour_type, ones)
+    day_type_count = _running_sums(days * len(types) + events.codes, ones)
+    door_open = is_type('door_open')
+    return {
+        'seconds': events.seconds,
+        'hours': hours,
+        'door_open': door_open,
+        'open_seconds': events.seconds[door_open],
+        'ai_night_type': is_type('door_opened') | is_type('alarm_triggered'),
+        'hour_type_count': hour_type_count,
+        'hour_total': _running_sums(hours, ones),
+        'hour_types': _running_sums(hours, (hour_type_count == 1).astype(np.int64)),
+        'day_type_count': day_type_count,
+        'day_total': _running_sums(days, ones),
+    }
+
+
+def _recent_opens(features, window):
+    """Door opens within `window` seconds up to each open (cached per window)"""
+    key = ('recent_opens', window)
+    if key not in features:
+        opens = features['open_seconds']
+        features[key] = np.arange(1, len(opens) + 1) - np.searchsorted(opens, opens - window, side='left')
+    return features[key]
+
+
+def _rapid_counts(features, period):
+    key = ('rapid_counts', period)
+    if key not in features:
+        features[key] = rapid_counts(features['seconds'], period)
+    return features[key]
+
+
+def evaluate(features, params):
+    """
+    Anomalies a configuration would have raised over the prepared history
+
+    Args:
+        features: prepare() result (window counts are cached in it)
+        params: Rule parameters (missing keys fall back to DEFAULT_PARAMS)
+
+    Returns:
+        Dict of anomaly counts: odd_hours, repeated_opens, the AI rule
+        hits (before the score threshold), ai_anomalies and total
+    """
+    p = dict(DEFAULT_PARAMS, **params)
+    hours = features['hours']
+
+    # detect_anomalies: odd hours and repeated opens (door_open events only)
+    open_hours = hours[features['door_open']]
+    odd_hours = (open_hours < p['business_hours_start']) | (open_hours >= p['business_hours_end'])
+    repeated_opens = _recent_opens(features, p['repeat_window']) >= p['repeat_threshold']
+
+    # AISecurityEngine.detect_anomaly against the model learned so far
+    hour_total = features['hour_total']
+    learning = (hour_total < 2) & (features['day_total'] < 3)
+    frequency = features['hour_type_count'] > hour_total / features['hour_types'] * p['ai_frequency_factor']
+    night = ((hours >= p['ai_night_start']) | (hours <= p['ai_night_end'])) & features['ai_night_type']
+    rapid = _rapid_counts(features, p['ai_rapid_period']) > p['ai_rapid_limit']
+    atypical_day = (features['day_total'] > 20) & (features['day_type_count'] == 0)
+    score = 30 * frequency + 40 * night + 50 * rapid + 25 * atypical_day
+    active = ~learning
+    ai_anomalies = int((active & (score >= p['ai_min_score'])).sum())
+
+    result = {
+        'odd_hours': int(odd_hours.sum()),
+        'repeated_opens': int(repeated_opens.sum()),
+        'ai_frequency': int((active & frequency).sum()),
+        'ai_night': int((active & night).sum()),
+        'ai_rapid': int((active & rapid).sum()),
+        'ai_atypical_day': int((active & atypical_day).sum()),
+        'ai_anomalies': ai_anomalies,
+    }
+    result['total'] = result['odd_hours'] + result['repeated_opens'] + ai_anomalies
+    return result
+
+
+def configurations(base, grid):
+    """Every combination of the grid's values on top of base params"""
+    keys = list(grid)
+    return [dict(base, **dict(zip(keys, values))) for values in itertools.product(*(grid[key] for key in keys))]
+
+
+def _evaluate_shared(params):
+    return evaluate(_sweep_features, params)
+
+
+def sweep(features, configs, workers=1):
+    """
+    Evaluate many configurations over the same history
+
+    Workers are forked after the features are in place, so they read the
+    arrays without copying or pickling them.
+
+    Returns:
+        List of (params, counts) in configuration order
+    """
+    global _sweep_features
+    if workers <= 1 or len(configs) <= 1:
+        return [(params, evaluate(features, params)) for params in configs]
+    _sweep_features = features
+    try:
+        context = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            chunksize = max(1, len(configs) // (workers * 4))
+            return list(zip(configs, pool.map(_evaluate_shared, configs, chunksize=chunksize)))
+    finally:
+        _sweep_features = None
+
+
+def backtest(source, grid=None, since=None, until=None, workers=1):
+    """
+    Load history and evaluate the current rules plus a parameter grid
+
+    Returns:
+        (events replayed, list of (params, counts)); the first entry is the
+        currently configured rules
+    """
+    events = load_event_arrays(source, since=since, until=until)
+    features = prepare(events)
+    base = current_params(source)
+    configs = [base] + (configurations(base, grid) if grid else [])
+    return len(events.ids), sweep(features, configs, workers)
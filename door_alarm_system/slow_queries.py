@@ -0,0 +1,198 @@
+"""
+Slow Query Log for eDOMOS
+Records SQL statements slower than a threshold (SQLAlchemy cursor events on
+every Engine). Statements are normalized into fingerprints - literals and
+IN-lists replaced by placeholders - so the same query with different values
+is aggregated into one entry, logged with its call site in this codebase and,
+for SQLite SELECTs, its EXPLAIN QUERY PLAN.
+"""
+
+import os
+import re
+import time
+import threading
+import logging
+import traceback
+from datetime import datetime
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+THIS_FILE = os.path.abspath(__file__)
+BASE_DIR = os.path.dirname(THIS_FILE)
+
+SORT_KEYS = ('total', 'mean', 'count', 'max')
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])")
+_IN_LIST = re.compile(r"\bIN\s*\((?:\s*\?\s*,)*\s*\?\s*\)", re.IGNORECASE)
+_VALUES_ROWS = re.compile(r"(\(\s*\?(?:\s*,\s*\?)*\s*\))(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))+")
+_SPACE = re.compile(r"\s+")
+
+
+def fingerprint(statement):
+    """
+    Normalized statement text: literals and parameters become ?, IN-lists
+    and multi-row VALUES collapse, whitespace is squeezed
+
+    >>> fingerprint("SELECT * FROM t WHERE a = 5 AND b IN (?, ?, ?)  AND c = 'x'")
+    'SELECT * FROM t WHERE a = ? AND b IN (...) AND c = ?'
+    """
+    text = _STRING.sub('?', statement)
+    text = _NUMBER.sub('?', text)
+    text = _SPACE.sub(' ', text).strip()
+    text = _IN_LIST.sub('IN (...)', text)
+    return _VALUES_ROWS.sub(r'\1, ...', text)
+
+
+def call_site(skip=(THIS_FILE,)):
+    """Innermost stack frame in this codebase outside the given files, as 'file.py:line in function'"""
+    for frame in reversed(traceback.extract_stack()):
+        filename = os.path.abspath(frame.filename)
+        if filename.startswith(BASE_DIR) and filename not in skip and 'site-packages' not in filename:
+            return f"{os.path.relpath(filename, BASE_DIR)}:{frame.lineno} in {frame.name}"
+    return 'unknown'
+
+
+class SlowQueryLog:
+    """
+    Aggregated statements slower than `threshold` seconds
+
+    Entries are keyed by fingerprint; each keeps count, total/max time, the
+    slowest example statement, the call sites seen and the query plan
+    captured the first time (EXPLAIN QUERY PLAN costs one extra statement
+    per fingerprint, not per slow execution). At most `max_entries`
+    fingerprints are kept; the one with the least total time is dropped.
+    """
+
+    def __init__(self, threshold=0.1, max_entries=200, explain=True, max_sites=5):
+        """
+        Args:
+            threshold: Seconds above which a statement is recorded
+            max_entries: Fingerprints kept
+            explain: Capture EXPLAIN QUERY PLAN for SQLite SELECTs
+            max_sites: Distinct call sites kept per fingerprint
+        """
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.explain = explain
+        self.max_sites = max_sites
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._instrumented = False
+        self.recorded = 0
+
+    def instrument(self):
+        """Listen to the cursor events of every Engine (once)"""
+        if self._instrumented:
+            return
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+        self._instrumented = True
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('slow_query_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('slow_query_started')
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        if elapsed < self.threshold:
+            return
+        try:
+            self.record(statement, elapsed, conn=conn, parameters=None if executemany else parameters)
+        except Exception as e:
+            logger.error(f"Recording slow query failed: {e}")
+
+    def record(self, statement, elapsed, conn=None, parameters=None, site=None):
+        """Add one slow execution (conn and parameters are used for the query plan)"""
+        key = fingerprint(statement)
+        site = site or call_site()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                if len(self._entries) >= self.max_entries:
+                    del self._entries[min(self._entries, key=lambda k: self._entries[k]['total'])]
+                entry = self._entries[key] = {
+                    'fingerprint': key, 'count': 0, 'total': 0.0, 'max': 0.0,
+                    'statement': statement, 'sites': [], 'plan': None, 'last_seen': None,
+                }
+            entry['count'] += 1
+            entry['total'] += elapsed
+            if elapsed > entry['max']:
+                entry['max'] = elapsed
+                entry['statement'] = statement
+            entry['last_seen'] = datetime.now()
+            if site not in entry['sites'] and len(entry['sites']) < self.max_sites:
+                entry['sites'].append(site)
+            needs_plan = entry['plan'] is None
+            self.recorded += 1
+
+        plan = self._query_plan(conn, statement, parameters) if needs_plan else None
+        if plan is not None:
+            with self._lock:
+                entry['plan'] = plan
+        logger.warning(f"Slow query {elapsed * 1000:.0f}ms at {site}: {key[:300]}"
+                       + (''.join(f"\n    {line}" for line in plan) if plan else ''))
+
+    def _query_plan(self, conn, statement, parameters):
+        if not (self.explain and conn is not None and conn.dialect.name == 'sqlite'
+                and statement.lstrip()[:6].upper() in ('SELECT', 'WITH')):
+            return None
+        try:
+            cursor = conn.connection.dbapi_connection.cursor()
+            try:
+                cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters or ())
+                rows = cursor.fetchall()
+            finally:
+                cursor.close()
+        except Exception as e:
+            logger.debug(f"EXPLAIN QUERY PLAN failed: {e}")
+            return []
+        # Rows are (id, parent, notused, detail); indent children under their parent
+        depth = {0: -1}
+        lines = []
+        for node_id, parent, _, detail in rows:
+            depth[node_id] = depth.get(parent, -1) + 1
+            lines.append('  ' * depth[node_id] + detail)
+        return lines
+
+    def report(self, sort='total', limit=50):
+        """
+        Recorded fingerprints ranked by total, mean, count or max time
+
+        Returns:
+            List of dicts with times in milliseconds
+        """
+        if sort not in SORT_KEYS:
+            raise ValueError(f"sort must be one of {', '.join(SORT_KEYS)}")
+        with self._lock:
+            rows = [{
+                'fingerprint': entry['fingerprint'],
+                'count': entry['count'],
+                'total_ms': round(entry['total'] * 1000, 1),
+                'mean_ms': round(entry['total'] / entry['count'] * 1000, 1),
+                'max_ms': round(entry['max'] * 1000, 1),
+                'statement': entry['statement'],
+                'sites': list(entry['sites']),
+                'plan': list(entry['plan'] or []),
+                'last_seen': entry['last_seen'].strftime('%Y-%m-%d %H:%M:%S'),
+            } for entry in self._entries.values()]
+        rows.sort(key=lambda row: row[f'{sort}_ms' if sort != 'count' else 'count'], reverse=True)
+        return rows[:limit]
+
+    def reset(self):
+        with self._lock:
+            self._entries.clear()
+            self.recorded = 0
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'threshold_ms': round(self.threshold * 1000, 1),
+                'fingerprints': len(self._entries),
+                'recorded': self.recorded,
+            }
@@ -49,7 +49,13 @@ class DashboardRealTime {
                 forceNew: true
             });
             
+            if (window.attachDeltaDecoder) {
+                window.attachDeltaDecoder(this.socket);
+            }
             this.setupWebSocketHandlers();
+            if (window.attachEventAcks) {
+                window.attachEventAcks(this.socket);
+            }
             
         } catch (error) {
             console.error('❌ WebSocket initialization failed:', error);
@@ -147,6 +147,9 @@ window.forceWebSocket = function() {
                 forceNew: true
             });
         
+        // Receive coalesced delta frames instead of full payloads
+        attachDeltaDecoder(socket);
+        
         // Export to window for access from event_log.html
         window.socket = socket;
         console.log("✅ Socket exported to window.socket");
@@ -393,6 +396,78 @@ function updateConnectionStatus() {
     }
 }
 
+// Delta stream decoder: the server sends 'state_update' frames holding new
+// events plus only the status fields that changed. This rebuilds the full
+// status locally and re-dispatches each event to the socket's existing
+// 'new_event' listeners in the legacy payload shape.
+function mergeDelta(target, changes) {
+    Object.keys(changes).forEach(key => {
+        const value = changes[key];
+        if (value && typeof value === 'object' && !Array.isArray(value) &&
+            target[key] && typeof target[key] === 'object') {
+            mergeDelta(target[key], value);
+        } else {
+            target[key] = value;
+        }
+    });
+    return target;
+}
+
+function attachDeltaDecoder(sock) {
+    if (!sock || sock._deltaDecoderAttached) return;
+    sock._deltaDecoderAttached = true;
+    
+    let state = {};
+    let version = 0;
+    
+    sock.on('connect', function() {
+        state = {};
+        version = 0;
+        sock.emit('subscribe_deltas', {});
+    });
+    
+    sock.on('state_update', function(frame, ack) {
+        if (ack) ack(frame.v);
+        
+        if (frame.full) {
+            state = mergeDelta({}, frame.changes || {});
+        } else if (frame.base !== version) {
+            // Missed a frame - ask for a full snapshot
+            sock.emit('state_resync', {have: version});
+            return;
+        } else {
+            mergeDelta(state, frame.changes || {});
+        }
+        version = frame.v;
+        
+        (frame.events || []).forEach(evt => {
+            const payload = Object.assign({}, state, evt);
+            sock.listeners('new_event').forEach(listener => listener(payload));
+        });
+    });
+}
+window.attachDeltaDecoder = attachDeltaDecoder;
+
+// Latency tracing: door events carry a trace_id; acknowledge each one once it
+// has been rendered so the server can measure sensor-to-browser time.
+function attachEventAcks(sock) {
+    if (!sock || sock._eventAcksAttached) return;
+    sock._eventAcksAttached = true;
+    
+    const acked = new Set();
+    sock.on('new_event', function(data) {
+        const traceId = data && data.event && data.event.trace_id;
+        if (!traceId || acked.has(traceId)) return;
+        acked.add(traceId);
+        if (acked.size > 200) acked.delete(acked.values().next().value);
+        // Registered after the page's handlers, so the update is in the DOM; ack after the next paint
+        requestAnimationFrame(function() {
+            sock.emit('event_ack', {trace_id: traceId, client_time: Date.now()});
+        });
+    });
+}
+window.attachEventAcks = attachEventAcks;
+
 document.addEventListener('DOMContentLoaded', function() {
     console.log('🚀 DOM loaded, initializing WebSocket...');
     
@@ -617,6 +692,7 @@ document.addEventListener('DOMContentLoaded', function() {
             console.log('🎯 WEBSOCKET EVENT PROCESSING COMPLETE');
             console.log('================================================');
         });
+        attachEventAcks(socket);
         
         socket.on('disconnect', function(reason) {
             console.log('❌ WEBSOCKET DISCONNECTED:');
@@ -1401,6 +1477,7 @@ function initializeWebSocket() {
             console.log('🎯 WEBSOCKET EVENT PROCESSING COMPLETE');
             console.log('================================================');
         });
+        attachEventAcks(socket);
         
         socket.on('disconnect', function(reason) {
             console.log('❌ WEBSOCKET DISCONNECTED:');
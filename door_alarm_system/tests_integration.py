@@ -80,6 +80,85 @@ class TestDashboardAPI:
         data = json.loads(response.data)
         assert isinstance(data, dict)
     
+    def test_api_ai_stats_not_modified(self, admin_auth):
+        """Unchanged AI insights return 304 to a dashboard that has them"""
+        first = admin_auth.get('/api/ai/stats')
+        second = admin_auth.get('/api/ai/stats', headers={'If-None-Match': first.headers['ETag']})
+        assert second.status_code == 304
+        assert second.data == b''
+    
+    def test_metrics_endpoints(self, admin_auth):
+        """Prometheus metrics for local scrapers and a JSON summary for admins"""
+        admin_auth.get('/api/dashboard')
+        response = admin_auth.get('/metrics')
+        assert response.status_code == 200
+        assert response.mimetype == 'text/plain'
+        assert (b'edomos_http_request_duration_seconds_count{endpoint="api_dashboard",method="GET",process="main"}'
+                in response.data)
+        
+        remote = admin_auth.get('/metrics', environ_base={'REMOTE_ADDR': '203.0.113.7'})
+        assert remote.status_code == 404
+        
+        data = json.loads(admin_auth.get('/api/admin/metrics').data)
+        assert data['success']
+        assert 'http_request_sql_statements' in data['metrics']['histograms']
+    
+    def test_web_worker_metrics_include_controller(self, admin_auth, monkeypatch):
+        """A web worker's /metrics merges the controller's ingestion series, labelled by process"""
+        import os, tempfile
+        import app as app_module
+        import perf_metrics
+        from hardware_ipc import ControllerServer, ControllerClient
+        
+        controller_metrics = perf_metrics.MetricsRegistry()
+        controller_metrics.observe('ingest_stage_seconds', 0.2, stage='camera')
+        path = os.path.join(tempfile.mkdtemp(prefix='edm'), 'c.sock')
+        server = ControllerServer(path, commands={
+            'metrics': lambda summary=False: controller_metrics.summary() if summary else controller_metrics.snapshot()},
+            state_provider=dict)
+        server.start()
+        worker = ControllerClient(path, reconnect_delay=0.05)
+        worker.start()
+        try:
+            assert worker.wait_for_state(timeout=2.0)
+            monkeypatch.setattr(app_module, 'hardware_client', worker)
+            admin_auth.get('/api/dashboard')
+            lines = admin_auth.get('/metrics').data.decode('utf-8').splitlines()
+            data = json.loads(admin_auth.get('/api/admin/metrics').data)
+        finally:
+            worker.stop()
+            server.stop()
+        
+        assert 'edomos_ingest_stage_seconds_count{process="controller",stage="camera"} 1' in lines
+        worker_label = f'process="web-{os.getpid()}"'
+        assert any(line.startswith('edomos_http_request_duration_seconds_count{endpoint="api_dashboard"')
+                   and worker_label in line for line in lines)
+        assert all('process="' in line for line in lines if not line.startswith('#'))
+        assert data['process'] == f'web-{os.getpid()}'
+        assert data['controller_metrics']['histograms']['ingest_stage_seconds'][0]['count'] == 1
+    
+    def test_admin_metrics_requires_admin(self, user_auth):
+        """Regular users cannot read the metrics summary or slow query log, or purge the report cache"""
+        assert user_auth.get('/api/admin/metrics').status_code == 403
+        assert user_auth.get('/api/admin/slow-queries').status_code == 403
+        assert user_auth.post('/api/admin/report-cache').status_code == 403
+    
+    def test_slow_query_log(self, admin_auth, monkeypatch):
+        """Admins see slow queries ranked on the admin page and as JSON"""
+        from app import slow_query_log
+        monkeypatch.setattr(slow_query_log, 'threshold', 0.0)
+        admin_auth.post('/api/admin/slow-queries')
+        admin_auth.get('/api/dashboard')
+        
+        data = json.loads(admin_auth.get('/api/admin/slow-queries?sort=count').data)
+        assert data['success'] and data['queries']
+        assert data['queries'][0]['count'] >= data['queries'][-1]['count']
+        assert admin_auth.get('/api/admin/slow-queries?sort=bogus').status_code == 400
+        
+        page = admin_auth.get('/admin/slow-queries?sort=mean')
+        assert page.status_code == 200
+        assert b'Slow Queries' in page.data and b'event_log' in page.data
+    
     def test_api_events(self, admin_auth):
         """Test events API"""
         response = admin_auth.get('/api/events')
@@ -246,6 +325,225 @@ class TestReports:
         assert response.status_code in [200, 404]
 
 
+@pytest.mark.integration
+class TestQueryBudgets:
+    """SQL statement budgets per request - catch N+1 query loops"""
+    
+    def _add_alarms(self, count):
+        from datetime import timedelta
+        from models import EventLog
+        from app import db
+        start = datetime.now() - timedelta(hours=12)
+        for i in range(count):
+            at = start + timedelta(minutes=5 * i)
+            db.session.add(EventLog(event_type='door_open', description='Door opened', timestamp=at))
+            db.session.add(EventLog(event_type='alarm_triggered', description='Alarm', timestamp=at + timedelta(seconds=30)))
+            db.session.add(EventLog(event_type='door_close', description='Door closed', timestamp=at + timedelta(seconds=90)))
+        db.session.commit()
+    
+    @pytest.mark.query_budget('GET /api/dashboard', 3)
+    def test_dashboard_api_budget(self, admin_auth):
+        """Dashboard polling: current user, timer setting, grouped counts, recent events"""
+        self._add_alarms(3)
+        response = admin_auth.get('/api/dashboard')
+        data = json.loads(response.data)
+        assert data['alarm_events'] == 3 and data['total_events'] == 9
+        assert data['last_event']['event_type'] == 'door_close'
+    
+    def test_analytics_budget_independent_of_alarms(self, admin_auth, query_budget):
+        """Analytics runs a fixed number of statements however many alarms there are"""
+        from models import User
+        User.query.filter_by(username='testadmin').first().permissions += ',analytics'
+        counts = []
+        for alarms in (1, 25):
+            self._add_alarms(alarms)
+            with query_budget(6, f'GET /analytics with {alarms} alarms') as counter:
+                assert admin_auth.get('/analytics').status_code == 200
+            counts.append(counter.count)
+        assert counts[0] == counts[1]
+        
+        with query_budget(6, 'GET /api/analytics/data'):
+            assert admin_auth.get('/api/analytics/data').status_code == 200
+    
+    def test_compliance_report_budget_independent_of_alarms(self, admin_auth, query_budget, tmp_path, monkeypatch):
+        """The synchronous compliance PDF runs a fixed number of statements however many alarms there are"""
+        from datetime import date, timedelta
+        import app as app_module
+        import report_jobs
+        from models import User
+        from app import db
+        User.query.filter_by(username='testadmin').first().permissions += ',report'
+        manager = report_jobs.ReportJobManager(str(tmp_path), db.engine, use_processes=False)
+        monkeypatch.setattr(app_module, 'report_job_manager', manager)
+        
+        # The report is built in a job thread while the request waits for it
+        job_statements = []
+        run_report_job = report_jobs.run_report_job
+        def counted_job(*args):
+            with query_budget(100, 'report job') as counter:
+                result = run_report_job(*args)
+            job_statements.append(counter.statements)
+            return result
+        monkeypatch.setattr(report_jobs, 'run_report_job', counted_job)
+        
+        request = {'start_date': (date.today() - timedelta(days=1)).isoformat(),
+                   'end_date': (date.today() + timedelta(days=1)).isoformat(),
+                   'format': 'pdf', 'report_type': 'compliance_audit'}
+        for alarms in (1, 25):
+            self._add_alarms(alarms)
+            with query_budget(4, f'POST /api/report with {alarms} alarms'):
+                response = admin_auth.post('/api/report', json=request)
+            assert response.status_code == 200 and 'pdf_data' in response.get_json()
+        manager.shutdown()
+        
+        counts = [len(statements) for statements in job_statements]
+        assert counts[0] == counts[1], job_statements
+        assert counts[1] <= 10, '\n'.join(job_statements[1])
+    
+    def test_training_reports_budget_independent_of_matrix(self, admin_auth, query_budget):
+        """The training matrix loads records in one query, not one per user and module"""
+        from models import User, TrainingModule, TrainingRecord
+        from app import db
+        modules = [TrainingModule(module_name=f'SOP-{i}', is_active=True) for i in range(4)]
+        db.session.add_all(modules)
+        db.session.commit()
+        users = User.query.all()
+        db.session.add_all(TrainingRecord(user_id=user.id, module_id=module.id, completed_date=datetime.utcnow())
+                           for user in users for module in modules[:2])
+        db.session.commit()
+        
+        with query_budget(6, 'GET /training/reports') as counter:
+            response = admin_auth.get('/training/reports')
+        assert response.status_code == 200
+        assert not any('training_record.user_id = ?' in statement for statement in counter.statements)
+    
+    def test_budget_failure_lists_statements(self, app, query_budget):
+        """Exceeding a budget fails with the statements grouped by fingerprint"""
+        from models import Setting
+        with pytest.raises(pytest.fail.Exception) as failure:
+            with query_budget(1, 'settings loop'):
+                for key in ('timer_duration', 'ai_enabled', 'ip_whitelist'):
+                    Setting.query.filter_by(key=key).first()
+        message = str(failure.value)
+        assert message.startswith('settings loop ran 3 SQL statements, budget is 1')
+        assert '3 x SELECT setting.id' in message
+
+
+@pytest.mark.integration
+class TestReportJobs:
+    """Test background PDF/CSV report jobs"""
+    
+    @pytest.fixture
+    def report_queue(self, app, tmp_path, monkeypatch):
+        import app as app_module
+        from models import db, User, EventLog
+        from report_jobs import ReportJobManager
+        
+        admin = User.query.filter_by(username='testadmin').first()
+        admin.permissions += ',report'
+        for i in range(30):
+            db.session.add(EventLog(event_type='alarm_triggered' if i % 10 == 0 else 'door_open',
+                                    description=f'Report event {i}',
+                                    timestamp=datetime(2025, 3, 1, 9, i)))
+        db.session.commit()
+        
+        manager = ReportJobManager(str(tmp_path), db.engine, use_processes=False,
+                                   on_update=app_module.notify_report_job)
+        monkeypatch.setattr(app_module, 'report_job_manager', manager)
+        yield manager
+        manager.shutdown()
+    
+    def test_async_pdf_job(self, admin_auth, report_queue):
+        """PDF request returns a job that can be polled and downloaded"""
+        response = admin_auth.post('/api/report', json={
+            'start_date': '2025-03-01', 'end_date': '2025-03-01',
+            'format': 'pdf', 'report_type': 'compliance_audit', 'async': True
+        })
+        assert response.status_code == 202
+        job = response.get_json()
+        assert job['status_url'] == f"/api/report/jobs/{job['job_id']}"
+        
+        report_queue.wait(job['job_id'], timeout=60.0)
+        status = admin_auth.get(job['status_url']).get_json()
+        assert status['status'] == 'done', status['error']
+        assert status['progress'] == 100
+        assert status['row_count'] == 30
+        
+        download = admin_auth.get(status['download_url'])
+        assert download.status_code == 200
+        assert download.content_type == 'application/pdf'
+        assert download.data[:4] == b'%PDF'
+    
+    def test_legacy_pdf_request_does_not_hold_worker(self, admin_auth, report_queue, monkeypatch):
+        """A non-async PDF request waits at most sync_timeout, then gets the job to poll"""
+        import threading
+        import report_jobs
+        from config import Config
+        release = threading.Event()
+        run_report_job = report_jobs.run_report_job
+        monkeypatch.setattr(report_jobs, 'run_report_job',
+                            lambda *args: release.wait(10.0) and run_report_job(*args))
+        monkeypatch.setitem(Config.REPORT_JOB_CONFIG, 'sync_timeout', 0.1)
+        
+        response = admin_auth.post('/api/report', json={
+            'start_date': '2025-03-01', 'end_date': '2025-03-01', 'format': 'pdf'
+        })
+        assert response.status_code == 202
+        job = response.get_json()
+        assert job['status'] in ('queued', 'running') and job['status_url']
+        release.set()
+        assert report_queue.wait(job['job_id'], timeout=60.0).status == 'done'
+    
+    def test_csv_streamed(self, admin_auth, report_queue):
+        """CSV is returned as a text/csv stream rather than inside JSON"""
+        response = admin_auth.post('/api/report', json={
+            'start_date': '2025-03-01', 'end_date': '2025-03-01',
+            'event_types': ['alarm_triggered'], 'format': 'csv'
+        })
+        assert response.status_code == 200
+        assert response.mimetype == 'text/csv'
+        assert response.is_streamed
+        assert 'attachment' in response.headers['Content-Disposition']
+        csv_data = response.get_data(as_text=True)
+        assert csv_data.startswith('# eDOMOS Security Report - CSV Export')
+        assert csv_data.count('alarm_triggered') == 3
+        assert 'door_open' not in csv_data
+    
+    def test_csv_gzip(self, admin_auth, report_queue):
+        """CSV stream is gzip-compressed when the client accepts it"""
+        import gzip
+        response = admin_auth.post('/api/report', json={
+            'start_date': '2025-03-01', 'end_date': '2025-03-01', 'format': 'csv'
+        }, headers={'Accept-Encoding': 'gzip, deflate'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        csv_data = gzip.decompress(response.data).decode('utf-8')
+        assert csv_data.count('Report event') == 30
+    
+    def test_scheduled_pdf_reuses_cached_report(self, admin_auth, report_queue, tmp_path):
+        """A scheduled PDF for the same period and data comes from the report cache"""
+        import app as app_module
+        from models import User
+        from report_cache import ReportCache
+        
+        report_queue.cache = ReportCache(str(tmp_path / 'cache'))
+        response = admin_auth.post('/api/report', json={
+            'start_date': '2025-03-01', 'end_date': '2025-03-01', 'format': 'pdf', 'async': True
+        })
+        job = report_queue.wait(response.get_json()['job_id'], timeout=60.0)
+        assert job.status == 'done' and not job.cached
+        
+        admin = User.query.filter_by(username='testadmin').first()
+        pdf_buffer = app_module.generate_scheduled_report_pdf('2025-03-01', '2025-03-01', [], 'summary', user=admin)
+        with open(job.path, 'rb') as f:
+            assert pdf_buffer.getvalue() == f.read()
+        assert report_queue.get_stats()['cache']['hits'] == 1
+    
+    def test_unknown_job(self, admin_auth, report_queue):
+        """Unknown or expired jobs return 404"""
+        assert admin_auth.get('/api/report/jobs/missing').status_code == 404
+        assert admin_auth.get('/api/report/jobs/missing/download').status_code == 404
+
+
 @pytest.mark.integration
 class TestSettings:
     """Test system settings"""
@@ -298,5 +596,165 @@ class TestWebSocket:
         assert response.status_code in [200, 302, 401]  # 302 = redirect to login, 401 = unauthorized
 
 
+    def test_event_ack_reaches_controller_trace(self, app, admin_auth, monkeypatch):
+        """A web worker forwards browser acks to the controller, which holds the traces"""
+        import os, tempfile, time
+        import app as app_module
+        from app import socketio
+        from event_trace import EventTracer
+        from hardware_ipc import ControllerServer, ControllerClient
+        
+        controller_tracer = EventTracer()
+        trace_id = controller_tracer.start(edge_at=time.monotonic() - 0.2)
+        path = os.path.join(tempfile.mkdtemp(prefix='edm'), 'c.sock')
+        server = ControllerServer(path, commands={
+            'trace_ack': lambda trace_id, at: controller_tracer.mark(trace_id, 'acked', at=at) is not None,
+            'trace_stats': controller_tracer.get_stats}, state_provider=dict)
+        server.start()
+        worker = ControllerClient(path, reconnect_delay=0.05)
+        worker.start()
+        try:
+            assert worker.wait_for_state(timeout=2.0)
+            monkeypatch.setattr(app_module, 'hardware_client', worker)
+            monkeypatch.setattr(app_module, 'event_tracer', EventTracer())  # The worker's own, empty
+            
+            ws = socketio.test_client(app, namespace='/events', flask_test_client=admin_auth)
+            ws.emit('event_ack', {'trace_id': trace_id}, namespace='/events')
+            ws.disconnect(namespace='/events')
+            
+            total = controller_tracer.get_stats()['stages']['total']
+            assert total['count'] == 1 and total['max_ms'] >= 200
+            latency = json.loads(admin_auth.get('/api/admin/metrics').data)['door_event_latency']
+            assert latency['stages']['acked']['count'] == 1
+        finally:
+            worker.stop()
+            server.stop()
+
+
+@pytest.mark.integration
+class TestCameraSnapshot:
+    """Test binary snapshot endpoint with conditional GET"""
+    
+    @pytest.fixture
+    def fake_camera(self, tmp_path, monkeypatch):
+        import numpy as np
+        import app as app_module
+        from camera_helper import CameraManager
+        
+        manager = CameraManager({'enabled': False, 'storage_path': str(tmp_path)})
+        manager.camera_available = True
+        manager.read_frame = lambda: np.zeros((120, 160, 3), dtype=np.uint8)
+        manager.grabber.interval = 60  # Hold a single frame for the test
+        monkeypatch.setattr(app_module, 'camera_manager', manager)
+        yield manager
+        manager.grabber.stop()
+    
+    def test_snapshot_jpeg(self, admin_auth, fake_camera):
+        """Snapshot is served as image/jpeg with an ETag"""
+        response = admin_auth.get('/api/camera/snapshot.jpg')
+        assert response.status_code == 200
+        assert response.content_type == 'image/jpeg'
+        assert response.data[:2] == b'\xff\xd8'
+        assert response.headers.get('ETag')
+    
+    def test_snapshot_not_modified(self, admin_auth, fake_camera):
+        """Unchanged frame returns 304 without a body"""
+        first = admin_auth.get('/api/camera/snapshot.jpg')
+        second = admin_auth.get('/api/camera/snapshot.jpg',
+                            headers={'If-None-Match': first.headers['ETag']})
+        assert second.status_code == 304
+        assert second.data == b''
+    
+    def test_snapshot_resize(self, admin_auth, fake_camera):
+        """Resize parameters change the image and the ETag"""
+        import cv2
+        import numpy as np
+        full = admin_auth.get('/api/camera/snapshot.jpg')
+        small = admin_auth.get('/api/camera/snapshot.jpg?width=80')
+        image = cv2.imdecode(np.frombuffer(small.data, np.uint8), cv2.IMREAD_COLOR)
+        assert image.shape[:2] == (60, 80)
+        assert small.headers['ETag'] != full.headers['ETag']
+    
+    def test_web_worker_snapshot_from_controller(self, admin_auth, fake_camera, monkeypatch):
+        """A worker without the camera serves the controller's frames, keeping ETags"""
+        import os, tempfile
+        import app as app_module
+        import hardware_controller
+        from hardware_ipc import ControllerServer, ControllerClient
+        
+        path = os.path.join(tempfile.mkdtemp(prefix='edm'), 'c.sock')
+        server = ControllerServer(path, commands={'camera_frame': hardware_controller.camera_frame},
+                                  state_provider=lambda: {'camera_available': True, 'camera_type': 'usb'})
+        server.start()
+        worker = ControllerClient(path, reconnect_delay=0.05)
+        worker.start()
+        try:
+            assert worker.wait_for_state(timeout=2.0)
+            monkeypatch.setattr(app_module, 'hardware_client', worker)
+            
+            first = admin_auth.get('/api/camera/snapshot.jpg?width=80')
+            assert first.status_code == 200 and first.data[:2] == b'\xff\xd8'
+            assert first.headers['X-Frame-Sequence'] == str(fake_camera.grabber.sequence)
+            second = admin_auth.get('/api/camera/snapshot.jpg?width=80',
+                                headers={'If-None-Match': first.headers['ETag']})
+            assert second.status_code == 304 and second.headers['ETag'] == first.headers['ETag']
+            
+            snapshot = json.loads(admin_auth.get('/api/camera/snapshot').data)
+            assert snapshot['success'] and snapshot['image'].startswith('data:image/jpeg;base64,')
+            assert json.loads(admin_auth.get('/api/camera/status').data)['type'] == 'usb'
+        finally:
+            worker.stop()
+            server.stop()
+    
+    def test_snapshot_requires_login(self, client, fake_camera):
+        """Anonymous clients cannot fetch (or have the server resize) camera frames"""
+        response = client.get('/api/camera/snapshot.jpg?width=1920')
+        assert response.status_code in [302, 401]
+        assert response.mimetype != 'image/jpeg'
+    
+    def test_grabber_never_serves_a_retiring_thread(self, fake_camera):
+        """A request racing the idle timeout keeps the grabber alive instead of losing its frame"""
+        import threading, time
+        grabber = fake_camera.grabber
+        at_check, proceed = threading.Event(), threading.Event()
+        
+        class PausingStopEvent(threading.Event):
+            """Holds the grabber thread once, just before its idle check"""
+            armed = False
+            
+            def wait(self, timeout=None):
+                if self.armed and threading.current_thread() is grabber._thread:
+                    self.armed = False
+                    at_check.set()
+                    proceed.wait(2.0)
+                    return self.is_set()
+                return super().wait(timeout)
+        
+        grabber._lock = threading.RLock()  # Lets the test hold it across touch()
+        grabber._stop_event = PausingStopEvent()
+        assert grabber.touch(wait=1.0)
+        grabber.interval = 0.01
+        grabber._stop_event.set()  # Wake the thread from its 60s interval ...
+        grabber._stop_event.clear()  # ... without stopping it
+        time.sleep(0.05)
+        grabber._stop_event.armed = True
+        assert at_check.wait(2.0)
+        grabber._last_access = 0  # Idle: the check after the pause retires the thread
+        
+        with grabber._lock:
+            proceed.set()
+            time.sleep(0.05)  # Thread is now blocked on the lock, at or past its idle check
+            assert grabber.touch(wait=1.0)
+        time.sleep(0.05)
+        assert grabber.get_jpeg() is not None
+    
+    def test_snapshot_unavailable(self, admin_auth, monkeypatch):
+        """No camera returns 503"""
+        import app as app_module
+        monkeypatch.setattr(app_module, 'camera_manager', None)
+        response = admin_auth.get('/api/camera/snapshot.jpg')
+        assert response.status_code == 503
+
+
 if __name__ == '__main__':
     pytest.main([__file__, '-v', '--tb=short'])
@@ -276,6 +276,66 @@ class TestAccessControl:
         response = supervisor_auth.get('/change-control/request/1/approve-director')
         assert response.status_code in [403, 404, 302]
 
+    def test_websocket_rejects_anonymous(self, app, client):
+        """Unauthenticated sockets are refused on the /events namespace"""
+        from app import socketio
+        
+        ws = socketio.test_client(app, namespace='/events', flask_test_client=client)
+        assert not ws.is_connected('/events')
+    
+    def test_websocket_streams_scoped_by_permission(self, app, client, db_session):
+        """Dashboard-only clients never receive admin anomaly alerts"""
+        from app import socketio, broadcaster
+        from ws_broadcaster import ANOMALY_ROOM
+        
+        kiosk = User(username='kiosk', permissions='dashboard', email='kiosk@test.com')
+        kiosk.set_password('Kiosk123!')
+        db_session.add(kiosk)
+        db_session.commit()
+        
+        client.post('/login', data={'username': 'kiosk', 'password': 'Kiosk123!'})
+        kiosk_ws = socketio.test_client(app, namespace='/events', flask_test_client=client)
+        assert kiosk_ws.is_connected('/events')
+        status = [m for m in kiosk_ws.get_received('/events') if m['name'] == 'connection_status']
+        assert status[0]['args'][0]['streams'] == ['stream:events']
+        
+        # No administrator connected - nothing is serialized for the room
+        assert broadcaster.emit_to_room('anomaly_detected', {'type': 'odd_hours'}, ANOMALY_ROOM) is False
+        
+        # The fixture's app context is shared, so drop the cached login user
+        from flask import g
+        g.pop('_login_user', None)
+        admin_client = app.test_client()
+        admin_client.post('/login', data={'username': 'testadmin', 'password': 'TestAdmin123!'})
+        admin_ws = socketio.test_client(app, namespace='/events', flask_test_client=admin_client)
+        assert admin_ws.is_connected('/events')
+        admin_ws.get_received('/events')
+        
+        assert broadcaster.emit_to_room('anomaly_detected', {'type': 'odd_hours'}, ANOMALY_ROOM) is True
+        assert [m['name'] for m in admin_ws.get_received('/events')] == ['anomaly_detected']
+        assert kiosk_ws.get_received('/events') == []
+        
+        kiosk_ws.disconnect('/events')
+        admin_ws.disconnect('/events')
+    
+    def test_report_jobs_private_to_owner(self, app, user_auth, tmp_path, monkeypatch):
+        """Another user's report job cannot be polled or downloaded"""
+        import app as app_module
+        from models import db
+        from report_jobs import ReportJobManager
+        
+        admin = User.query.filter_by(username='testadmin').first()
+        manager = ReportJobManager(str(tmp_path), db.engine, use_processes=False)
+        monkeypatch.setattr(app_module, 'report_job_manager', manager)
+        job, _ = manager.submit({'format': 'csv', 'start_date': '2025-01-01', 'end_date': '2025-01-02',
+                                 'event_types': [], 'date_fmt': '%Y-%m-%d', 'time_fmt': '%H:%M:%S'},
+                                owner_id=admin.id)
+        manager.wait(job.id, timeout=10.0)
+        
+        assert user_auth.get(f'/api/report/jobs/{job.id}').status_code == 404
+        assert user_auth.get(f'/api/report/jobs/{job.id}/download').status_code == 404
+        manager.shutdown()
+
 
 @pytest.mark.security
 class TestInputValidation:
@@ -5,14 +5,29 @@ Individual component testing for pharmaceutical compliance
 """
 
 import pytest
+import json
 from datetime import datetime, timedelta
+from collections import Counter, deque
 from unittest.mock import Mock, patch, MagicMock
 import sys
+import socketserver
 
 # Import application modules
 import blockchain_helper
 import ai_security
 import license_helper
+import image_retention
+import ws_broadcaster
+import hardware_ipc
+import report_jobs
+import report_cache
+import report_scheduler
+import email_outbox
+import anomaly_rules
+import door_flap
+import perf_metrics
+import event_trace
+import slow_queries
 from models import User, EventLog, Setting, CompanyProfile
 
 
@@ -258,6 +273,295 @@ class TestAISecurity:
         all_events = EventLog.query.all()
         assert len(all_events) == 11
 
+    
+    def test_pattern_model_is_bounded(self, tmp_path):
+        """Learning keeps per-bucket counts, so the saved model does not grow"""
+        import os
+        model_file = tmp_path / 'model.json'
+        engine = ai_security.AISecurityEngine(model_file=str(model_file))
+        start = datetime(2025, 1, 6, 0, 0)
+        
+        def learn(count, offset=0):
+            for i in range(offset, offset + count):
+                engine.analyze_behavior({'event_type': ('door_open', 'door_close')[i % 2],
+                                         'timestamp': start + timedelta(minutes=7 * i)})
+        learn(2000)  # Two weeks: every hour and weekday seen
+        assert engine.save_model()
+        size_after_2000 = os.path.getsize(model_file)
+        learn(8000, offset=2000)
+        assert engine.save_model()
+        
+        assert os.path.getsize(model_file) <= size_after_2000 * 1.1
+        assert engine.events_learned == 10000
+        assert sum(engine.hourly_totals.values()) == 10000
+        assert set(engine.hourly_patterns[9]) == {'door_open', 'door_close'}
+        
+        reloaded = ai_security.AISecurityEngine(model_file=str(model_file))
+        assert reloaded.hourly_patterns == engine.hourly_patterns
+        assert reloaded.events_learned == 10000
+    
+    def test_learning_does_not_write_model(self, tmp_path):
+        """The event path only counts changes; saving is left to the snapshot thread"""
+        model_file = tmp_path / 'model.json'
+        engine = ai_security.AISecurityEngine(model_file=str(model_file))
+        for i in range(200):
+            engine.learn_pattern('door_open', datetime(2025, 1, 6, 9, 0) + timedelta(minutes=i))
+        assert not model_file.exists()
+        assert engine.unsaved_changes == 200
+        
+        assert engine.save_model()
+        assert engine.unsaved_changes == 0
+        assert [p.name for p in tmp_path.iterdir()] == ['model.json']  # No temp file left
+    
+    def test_snapshot_thread_debounces_writes(self, tmp_path, monkeypatch):
+        """Snapshots are written after max_changes events or on stop, not per event"""
+        import time
+        monkeypatch.setattr(ai_security, 'SNAPSHOT_MIN_GAP', 0.0)
+        engine = ai_security.AISecurityEngine(model_file=str(tmp_path / 'model.json'))
+        saves = []
+        save_model = engine.save_model
+        monkeypatch.setattr(engine, 'save_model', lambda: saves.append(engine.unsaved_changes) or save_model())
+        
+        engine.start_snapshots(interval=60, max_changes=10)
+        try:
+            for i in range(25):
+                engine.learn_pattern('door_open', datetime(2025, 1, 6, 9, 0))
+                if i in (9, 19):
+                    deadline = time.monotonic() + 5
+                    while engine.unsaved_changes >= 10 and time.monotonic() < deadline:
+                        time.sleep(0.01)
+        finally:
+            engine.stop_snapshots()
+        
+        assert len(saves) == 3  # Two change-count triggers, one flush on stop
+        assert engine.unsaved_changes == 0
+        reloaded = ai_security.AISecurityEngine(model_file=str(tmp_path / 'model.json'))
+        assert reloaded.hourly_patterns[9]['door_open'] == 25
+    
+    def test_non_learning_engine_follows_model_file(self, tmp_path):
+        """A web worker engine never writes the model; it reloads the learner's snapshots"""
+        import time
+        model_file = tmp_path / 'model.json'
+        owner = ai_security.AISecurityEngine(model_file=str(model_file))
+        worker = ai_security.AISecurityEngine(model_file=str(model_file), learning=False)
+        worker.start_snapshots(interval=0.02)
+        try:
+            worker.analyze_behavior({'event_type': 'login', 'timestamp': datetime(2025, 1, 6, 9, 0)})
+            assert worker.events_learned == 0 and worker.unsaved_changes == 0
+            
+            owner.learn_pattern('door_open', datetime(2025, 1, 6, 9, 0))
+            owner.save_model()
+            deadline = time.monotonic() + 5
+            while worker.events_learned != 1 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert worker.hourly_patterns[9] == {'door_open': 1}
+        finally:
+            worker.stop_snapshots()
+        reloaded = ai_security.AISecurityEngine(model_file=str(model_file))
+        assert 'login' not in reloaded.hourly_patterns[9]
+    
+    def test_partial_model_file_is_ignored(self, tmp_path):
+        """A truncated or foreign model file leaves the engine untrained instead of failing"""
+        model_file = tmp_path / 'model.json'
+        engine = ai_security.AISecurityEngine(model_file=str(model_file))
+        engine.learn_pattern('door_open', datetime(2025, 1, 6, 9, 0))
+        engine.save_model()
+        content = model_file.read_text()
+        
+        model_file.write_text(content[:len(content) // 2])
+        assert ai_security.AISecurityEngine(model_file=str(model_file)).events_learned == 0
+        model_file.write_text('{"format": "other", "version": 1}')
+        assert ai_security.AISecurityEngine(model_file=str(model_file)).events_learned == 0
+    
+    def test_version1_model_migrates(self, tmp_path):
+        """Pickled models saved as per-bucket event lists load as counters"""
+        import pickle
+        with open(tmp_path / 'model.pkl', 'wb') as f:
+            pickle.dump({'hourly_patterns': {9: ['door_open', 'door_open', 'door_close']},
+                         'daily_patterns': {'Monday': ['door_open'] * 25},
+                         'incidents_prevented': 4}, f)
+        engine = ai_security.AISecurityEngine(model_file=str(tmp_path / 'model.json'))
+        assert engine.hourly_patterns[9] == {'door_open': 2, 'door_close': 1}
+        assert engine.hourly_totals[9] == 3 and engine.incidents_prevented == 4
+        
+        # Same scoring as before: an event type never seen on a busy weekday
+        is_anomaly, _, reason = engine.detect_anomaly('alarm_triggered', datetime(2025, 1, 6, 9, 0))
+        assert 'Atypical event for Monday' in reason
+        
+        # The next snapshot is JSON and takes precedence over the pickle
+        engine.save_model()
+        assert ai_security.AISecurityEngine(model_file=str(tmp_path / 'model.json')).hourly_totals[9] == 3
+    
+    def test_window_features_match_history(self, tmp_path):
+        """Incremental window features agree with a rescan of the history"""
+        import random
+        rng = random.Random(7)
+        engine = ai_security.AISecurityEngine(model_file=str(tmp_path / 'model.json'))
+        now = datetime(2025, 1, 6, 9, 0)
+        for _ in range(300):
+            now += timedelta(seconds=rng.choice((1, 5, 20, 45, 90)))
+            engine.analyze_behavior({'event_type': rng.choice(('door_opened', 'door_closed', 'alarm_triggered')),
+                                     'timestamp': now})
+            history = list(engine.event_history)
+            last_10 = history[-10:]
+            window = engine.window
+            assert window.count('alarm_triggered') == sum(e['event_type'] == 'alarm_triggered' for e in last_10)
+            assert window.count('door_opened') == sum(e['event_type'] == 'door_opened' for e in last_10)
+            gaps = [(b['timestamp'] - a['timestamp']).seconds for a, b in zip(last_10, last_10[1:])]
+            assert window.gap_mean == pytest.approx(sum(gaps) / len(gaps)) if gaps else window.gap_mean is None
+            in_period = sum((now - e['timestamp']).total_seconds() < 60 for e in history)
+            assert window.rapid_count(now) == min(in_period, ai_security.RAPID_EVENT_LIMIT + 1)
+            assert engine.predict_threat_level() == engine.predict_threat_level(history)
+    
+    def test_insights_are_cached_tallies(self, tmp_path):
+        """Insights come from running tallies and are rebuilt only after new events"""
+        engine = ai_security.AISecurityEngine(model_file=str(tmp_path / 'model.json'))
+        engine.event_history = deque(maxlen=50)
+        start = datetime(2025, 1, 6, 0, 0)
+        for i in range(120):
+            engine.analyze_behavior({'event_type': 'door_closed' if i < 60 else ('door_opened', 'alarm_triggered')[i % 3 == 0],
+                                     'timestamp': start + timedelta(minutes=1 + i // 40 * 60 + i % 40)})
+        
+        history = list(engine.event_history)
+        event_types = [e['event_type'] for e in history]
+        hours = [e['timestamp'].hour for e in history]
+        insights = engine.get_ai_insights()
+        assert insights['most_common_event'] == max(set(event_types), key=event_types.count) == 'door_opened'
+        assert insights['busiest_hour'] == f"{max(set(hours), key=hours.count)}:00" == '2:00'
+        assert engine.history_type_counts == Counter(event_types)
+        
+        assert engine.get_ai_insights() is insights
+        engine.analyze_behavior({'event_type': 'door_closed', 'timestamp': start + timedelta(hours=3)})
+        refreshed = engine.get_ai_insights()
+        assert refreshed['version'] == insights['version'] + 1
+    
+    def test_pattern_decay(self, tmp_path):
+        """With a half-life, old weights fade and are eventually dropped"""
+        engine = ai_security.AISecurityEngine(model_file=str(tmp_path / 'model.json'), decay_half_life=3600 * 24)
+        monday = datetime(2025, 1, 6, 9, 0)
+        for _ in range(4):
+            engine.learn_pattern('door_open', monday)
+        engine.learn_pattern('door_close', monday + timedelta(days=1))
+        assert engine.hourly_patterns[9]['door_open'] == pytest.approx(2.0)
+        assert engine.hourly_totals[9] == pytest.approx(3.0)
+        
+        engine.learn_pattern('door_close', monday + timedelta(days=30))
+        assert 'door_open' not in engine.hourly_patterns[9]
+
+@pytest.mark.unit
+class TestAITraining:
+    """Test vectorized batch training, history re-scoring and rule backtests"""
+    
+    TYPES = ('door_opened', 'door_closed', 'door_opened', 'door_closed', 'alarm_triggered', 'door_open')
+    
+    def _history_db(self, tmp_path, count=600):
+        import random
+        from sqlalchemy import create_engine, insert
+        from models import db as models_db
+        
+        rng = random.Random(11)
+        uri = f"sqlite:///{tmp_path / 'events.db'}"
+        engine = create_engine(uri)
+        models_db.metadata.create_all(engine)
+        now = datetime(2025, 1, 6, 20, 0)
+        rows = []
+        for i in range(count):
+            gap = 2 if 100 <= i < 115 else rng.choice((1, 3, 20, 45, 400, 5000))  # One burst of rapid events
+            now += timedelta(seconds=gap)
+            rows.append({'event_type': rng.choice(self.TYPES), 'description': f'Event {i}', 'timestamp': now})
+        with engine.begin() as conn:
+            conn.execute(insert(EventLog.__table__), rows)
+        engine.dispose()
+        return uri, rows
+    
+    @pytest.mark.parametrize('half_life', [None, 3 * 86400])
+    def test_batch_training_matches_incremental(self, tmp_path, half_life):
+        """One vectorized pass builds the model that event-by-event learning does"""
+        import ai_training
+        uri, rows = self._history_db(tmp_path)
+        events = ai_training.load_event_arrays(uri)
+        assert len(events.ids) == len(rows)
+        model = ai_training.train_patterns(events, decay_half_life=half_life)
+        
+        engine = ai_security.AISecurityEngine(model_file=str(tmp_path / 'model.json'), decay_half_life=half_life)
+        for row in rows:
+            engine.learn_pattern(row['event_type'], row['timestamp'])
+        batch = ai_security.AISecurityEngine(model_file=str(tmp_path / 'batch.json'), decay_half_life=half_life)
+        batch.replace_patterns(model['hourly_patterns'], model['daily_patterns'],
+                               model['events_learned'], model['decayed_at'])
+        
+        for learned, trained in ((engine.hourly_patterns, batch.hourly_patterns),
+                                 (engine.daily_patterns, batch.daily_patterns)):
+            assert {key for key, counts in learned.items() if counts} == set(trained)
+            for key, counts in trained.items():
+                assert set(counts) == set(learned[key])
+                for event_type, weight in counts.items():
+                    assert weight == pytest.approx(learned[key][event_type])
+        assert batch.events_learned == len(rows)
+        assert model['hour_of_week'].sum() == len(rows)
+        assert model['rates']['events'] == len(rows)
+    
+    def test_rescore_matches_engine(self, tmp_path):
+        """Re-scored history carries the analysis the engine gives with the trained model"""
+        import ai_training
+        from sqlalchemy import create_engine, select
+        uri, rows = self._history_db(tmp_path, count=300)
+        events = ai_training.load_event_arrays(uri)
+        model = ai_training.train_patterns(events)
+        assert ai_training.rescore_events(uri, events, model, workers=2, chunk_size=37) == len(rows)
+        
+        engine = ai_security.AISecurityEngine(model_file=str(tmp_path / 'model.json'))
+        engine.replace_patterns(model['hourly_patterns'], model['daily_patterns'], model['events_learned'])
+        db = create_engine(uri)
+        with db.connect() as conn:
+            stored = conn.execute(select(EventLog.__table__.c.ai_metadata).order_by(EventLog.__table__.c.id)).scalars().all()
+        db.dispose()
+        
+        anomalies = 0
+        for row, metadata in zip(rows, stored):
+            analysis = json.loads(metadata)['ai_analysis']
+            engine.window.push(row['event_type'], row['timestamp'])
+            is_anomaly, confidence, reason = engine.detect_anomaly(row['event_type'], row['timestamp'])
+            level, threat_confidence, prediction = engine.predict_threat_level(now=row['timestamp'])
+            assert (analysis['anomaly_detected'], analysis['anomaly_reason']) == (is_anomaly, reason)
+            assert analysis['anomaly_confidence'] == round(confidence * 100, 2)
+            assert (analysis['threat_level'], analysis['threat_prediction']) == (level, prediction)
+            assert analysis['timestamp'] == row['timestamp'].isoformat()
+            anomalies += is_anomaly
+        assert anomalies  # The history exercises the anomaly rules
+    
+    def test_backtest_matches_live_rules(self, tmp_path):
+        """Replayed rule counts equal what the live rules raise event by event"""
+        import ai_training
+        import rule_backtest
+        uri, rows = self._history_db(tmp_path, count=400)
+        features = rule_backtest.prepare(ai_training.load_event_arrays(uri))
+        counts = rule_backtest.evaluate(features, {})
+        
+        engine = ai_security.AISecurityEngine(model_file=str(tmp_path / 'model.json'))
+        ai_anomalies = sum(engine.analyze_behavior(dict(row))['anomaly_detected'] for row in rows)
+        opens = [row['timestamp'] for row in rows if row['event_type'] == 'door_open']
+        odd_hours = sum(not 9 <= t.hour < 17 for t in opens)
+        repeated = sum(sum(t - timedelta(minutes=10) <= o <= t for o in opens[:i + 1]) >= 3
+                       for i, t in enumerate(opens))
+        assert (counts['ai_anomalies'], counts['odd_hours'], counts['repeated_opens']) == (ai_anomalies, odd_hours, repeated)
+        assert counts['ai_anomalies'] and counts['repeated_opens']
+    
+    def test_backtest_sweep(self, tmp_path):
+        """Parallel sweeps give the sequential results, in configuration order"""
+        import ai_training
+        import rule_backtest
+        uri, _ = self._history_db(tmp_path, count=300)
+        features = rule_backtest.prepare(ai_training.load_event_arrays(uri))
+        configs = rule_backtest.configurations(rule_backtest.DEFAULT_PARAMS, {
+            'business_hours_start': [7, 9], 'repeat_threshold': [2, 3, 5], 'ai_rapid_limit': [5, 10]})
+        assert len(configs) == 12
+        
+        parallel = rule_backtest.sweep(features, configs, workers=2)
+        assert parallel == rule_backtest.sweep(features, configs, workers=1)
+        by_threshold = {params['repeat_threshold']: counts['repeated_opens'] for params, counts in parallel}
+        assert by_threshold[2] >= by_threshold[3] >= by_threshold[5]
+
 
 @pytest.mark.unit
 class TestLicenseSystem:
@@ -315,5 +619,1228 @@ class TestCompanyProfile:
         assert updated.logo_path == '/uploads/logo.png'
 
 
+@pytest.mark.unit
+class TestImageRetention:
+    """Test indexed image retention"""
+    
+    def _make_capture(self, manager, directory, name, size, timestamp, event_id=None):
+        path = directory / name
+        path.write_bytes(b'x' * size)
+        manager.register(str(path), size, timestamp, event_id)
+        return path
+    
+    def test_retention_days_deletes_oldest(self, tmp_path):
+        """Images older than retention_days are removed oldest-first"""
+        now = 1_000_000_000
+        manager = image_retention.ImageRetentionManager(str(tmp_path), retention_days=1, max_storage_gb=None)
+        manager._indexed = True
+        old = self._make_capture(manager, tmp_path, 'old.jpg', 10, now - 3 * 86400, event_id=1)
+        new = self._make_capture(manager, tmp_path, 'new.jpg', 10, now - 60, event_id=2)
+        
+        deleted = manager.enforce(now=now)
+        
+        assert [entry.event_id for entry in deleted] == [1]
+        assert not old.exists()
+        assert new.exists()
+        assert manager.get_stats()['indexed_images'] == 1
+    
+    def test_max_storage_enforced(self, tmp_path):
+        """Total size is kept under max_storage_gb"""
+        now = 1_000_000_000
+        manager = image_retention.ImageRetentionManager(str(tmp_path), retention_days=None, max_storage_gb=1)
+        manager._indexed = True
+        manager.max_storage_bytes = 25
+        removed = []
+        manager.on_delete = removed.extend
+        for i in range(5):
+            self._make_capture(manager, tmp_path, f'img{i}.jpg', 10, now + i, event_id=i)
+        
+        manager.enforce(now=now + 10)
+        
+        assert [entry.event_id for entry in removed] == [0, 1, 2]
+        assert manager.get_stats()['total_bytes'] == 20
+    
+    def test_failed_delete_stays_indexed(self, tmp_path, monkeypatch):
+        """A capture that cannot be deleted keeps counting towards the quota and is retried"""
+        import os
+        now = 1_000_000_000
+        manager = image_retention.ImageRetentionManager(str(tmp_path), retention_days=1, max_storage_gb=None)
+        manager._indexed = True
+        locked = self._make_capture(manager, tmp_path, 'locked.jpg', 10, now - 3 * 86400, event_id=1)
+        self._make_capture(manager, tmp_path, 'old.jpg', 10, now - 2 * 86400, event_id=2)
+        
+        remove = os.remove
+        def flaky_remove(path):
+            if path == str(locked):
+                raise PermissionError(13, 'Permission denied')
+            remove(path)
+        monkeypatch.setattr(image_retention.os, 'remove', flaky_remove)
+        
+        assert [entry.event_id for entry in manager.enforce(now=now)] == [2]
+        stats = manager.get_stats()
+        assert stats['indexed_images'] == 1 and stats['total_bytes'] == 10 and stats['delete_failures'] == 1
+        
+        monkeypatch.setattr(image_retention.os, 'remove', remove)
+        assert [entry.event_id for entry in manager.enforce(now=now)] == [1]
+        assert not locked.exists() and manager.get_stats()['total_bytes'] == 0
+    
+    def test_rebuild_index_from_directory(self, tmp_path):
+        """Existing captures are picked up by a single directory scan"""
+        for i in range(3):
+            (tmp_path / f'img{i}.jpg').write_bytes(b'x' * 4)
+        manager = image_retention.ImageRetentionManager(str(tmp_path))
+        
+        assert manager.rebuild_index() == 3
+        assert manager.get_stats()['total_bytes'] == 12
+    
+    def test_clear_deleted_image_references(self, db_session):
+        """Deleted images no longer referenced by EventLog, hash kept for audit"""
+        from app import clear_deleted_image_references
+        event = EventLog(event_type='door_open', description='With image',
+                         image_path='static/captures/a.jpg', image_hash='abc')
+        db_session.add(event)
+        db_session.commit()
+        
+        clear_deleted_image_references([
+            image_retention.CaptureEntry('static/captures/a.jpg', 10, 0, event.id)
+        ])
+        
+        db_session.refresh(event)
+        assert event.image_path is None
+        assert event.image_hash == 'abc'
+
+
+@pytest.mark.unit
+class TestCoalescingBroadcaster:
+    """Test coalesced WebSocket delta broadcasting"""
+    
+    class FakeSocketIO:
+        def __init__(self):
+            self.emitted = []
+            self.server = None  # No manager - legacy room treated as occupied
+        
+        def emit(self, name, payload, namespace=None, to=None, callback=None):
+            self.emitted.append((name, payload, to, callback))
+    
+    def _payload(self, event_id, door_status, total):
+        return {
+            'event': {'id': event_id, 'event_type': 'door_open'},
+            'event_id': f'evt{event_id}',
+            'door_status': door_status,
+            'alarm_status': 'Inactive',
+            'statistics': {'total_events': total, 'alarm_events': 0}
+        }
+    
+    def test_burst_coalesced_into_one_delta_frame(self):
+        """Events within a window go out as one frame with only changed fields"""
+        fake = self.FakeSocketIO()
+        broadcaster = ws_broadcaster.CoalescingBroadcaster(fake)
+        broadcaster.publish(self._payload(1, 'Open', 1))
+        broadcaster.flush()
+        broadcaster.enable_delta('sid1')
+        name, first, to, ack = fake.emitted[-1]
+        assert name == 'state_update' and first['full'] and to == 'sid1'
+        ack(first['v'])
+        
+        fake.emitted.clear()
+        broadcaster.publish(self._payload(2, 'Closed', 2))
+        broadcaster.publish(self._payload(3, 'Closed', 3))
+        broadcaster.flush()
+        
+        frames = [entry for entry in fake.emitted if entry[0] == 'state_update']
+        assert len(frames) == 1
+        frame = frames[0][1]
+        assert frame['base'] == first['v']
+        assert [evt['event']['id'] for evt in frame['events']] == [2, 3]
+        assert frame['changes'] == {'door_status': 'Closed', 'statistics': {'total_events': 3}}
+        # Legacy clients still get one full payload per event
+        legacy = [entry for entry in fake.emitted if entry[0] == 'new_event']
+        assert len(legacy) == 2 and legacy[0][1]['door_status'] == 'Closed'
+    
+    def test_lagging_client_skips_superseded_frames(self):
+        """Unacknowledged clients get no new frames but keep their events"""
+        fake = self.FakeSocketIO()
+        broadcaster = ws_broadcaster.CoalescingBroadcaster(fake, max_inflight=1)
+        broadcaster.enable_delta('slow')  # Full frame, never acknowledged
+        ack = fake.emitted[-1][3]
+        
+        for i in range(3):
+            broadcaster.publish(self._payload(i, 'Open' if i % 2 else 'Closed', i))
+            broadcaster.flush()
+        assert len([e for e in fake.emitted if e[0] == 'state_update']) == 1
+        assert broadcaster.get_metrics()['superseded_frames_dropped'] == 3
+        
+        ack(1)  # Client catches up - held events delivered in one frame
+        frame = fake.emitted[-1][1]
+        assert [evt['event']['id'] for evt in frame['events']] == [0, 1, 2]
+        assert frame['changes']['statistics']['total_events'] == 2
+    
+    def test_metrics_count_messages_and_bytes(self):
+        """Emitted messages and bytes are tracked"""
+        fake = self.FakeSocketIO()
+        broadcaster = ws_broadcaster.CoalescingBroadcaster(fake)
+        broadcaster.publish(self._payload(1, 'Open', 1))
+        broadcaster.flush()
+        metrics = broadcaster.get_metrics()
+        assert metrics['messages_emitted'] == 1
+        assert metrics['bytes_emitted'] == ws_broadcaster.payload_size(fake.emitted[0][1])
+    
+    def test_distributed_mode_uses_full_payloads_through_queue(self):
+        """With a shared message queue room emits never depend on local members"""
+        class EmptyManager:
+            rooms = {}
+        
+        fake = self.FakeSocketIO()
+        fake.server = type('Server', (), {'manager': EmptyManager()})()
+        broadcaster = ws_broadcaster.CoalescingBroadcaster(fake, distributed=True)
+        assert broadcaster.enable_delta('sid1') is False
+        
+        broadcaster.publish(self._payload(1, 'Open', 1))
+        broadcaster.flush()
+        assert [(e[0], e[2]) for e in fake.emitted] == [('new_event', ws_broadcaster.LEGACY_ROOM)]
+        assert broadcaster.emit_to_room('anomaly_detected', {}, ws_broadcaster.ANOMALY_ROOM)
+
+
+
+@pytest.mark.unit
+class TestHardwareIPC:
+    """Test the controller <-> web worker channel"""
+    
+    @pytest.fixture
+    def channel(self):
+        import tempfile, os
+        # Unix socket paths are length-limited - keep them short
+        path = os.path.join(tempfile.mkdtemp(prefix='edm'), 'c.sock')
+        state = {'door_open': False, 'alarm_active': False}
+        events, emits = [], []
+        server = hardware_ipc.ControllerServer(
+            path,
+            commands={'echo': lambda value: value * 2},
+            state_provider=lambda: dict(state)
+        )
+        server.start()
+        client = hardware_ipc.ControllerClient(
+            path, on_event=events.append,
+            on_emit=lambda name, payload, room: emits.append((name, room)),
+            reconnect_delay=0.05
+        )
+        client.start()
+        assert client.wait_for_state(timeout=2.0)
+        yield server, client, state, events, emits
+        client.stop()
+        server.stop()
+    
+    def _wait_for(self, condition, timeout=2.0):
+        import time
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if condition():
+                return True
+            time.sleep(0.01)
+        return False
+    
+    def test_state_and_events_are_mirrored(self, channel):
+        """Workers see the controller state and receive published events"""
+        server, client, state, events, emits = channel
+        assert client.state == {'door_open': False, 'alarm_active': False}
+        
+        state['door_open'] = True
+        server.publish_state()
+        server.publish_event({'event': {'id': 1}, 'door_status': 'Open'})
+        server.publish_emit('anomaly_detected', {'type': 'odd_hours'}, 'stream:anomalies')
+        
+        assert self._wait_for(lambda: emits)
+        assert client.state['door_open'] is True
+        assert events == [{'event': {'id': 1}, 'door_status': 'Open'}]
+        assert emits == [('anomaly_detected', 'stream:anomalies')]
+    
+    def test_commands_round_trip(self, channel):
+        """Commands run in the controller; failures raise ControllerUnavailable"""
+        server, client, state, events, emits = channel
+        assert client.command('echo', value=21) == 42
+        with pytest.raises(hardware_ipc.ControllerUnavailable):
+            client.command('missing')
+    
+    def test_second_controller_refuses_live_socket(self, channel):
+        """A running controller's socket is never taken over; stale ones are"""
+        import os
+        import socket
+        import stat
+        server, client, state, events, emits = channel
+        assert stat.S_IMODE(os.stat(server.path).st_mode) == 0o660
+        
+        intruder = hardware_ipc.ControllerServer(server.path)
+        with pytest.raises(hardware_ipc.ControllerAlreadyRunning):
+            intruder.start()
+        assert client.command('echo', value=3) == 6
+        
+        # Socket file left behind by a crashed controller
+        stale_path = os.path.join(os.path.dirname(server.path), 'stale.sock')
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(stale_path)
+        stale.close()
+        replacement = hardware_ipc.ControllerServer(stale_path)
+        replacement.start()
+        assert hardware_ipc.controller_running(stale_path)
+        replacement.stop()
+    
+    def test_client_reconnects_after_controller_restart(self, channel):
+        """A restarted controller is picked up with a fresh state snapshot"""
+        server, client, state, events, emits = channel
+        server.stop()
+        assert self._wait_for(lambda: not client.connected)
+        with pytest.raises(hardware_ipc.ControllerUnavailable):
+            client.command('echo', value=1)
+        
+        state['alarm_active'] = True
+        server.start()
+        assert self._wait_for(lambda: client.state.get('alarm_active') is True)
+        assert client.command('echo', value=2) == 4
+
+@pytest.mark.unit
+class TestReportEngine:
+    """Test report data streaming"""
+    
+    def test_stream_report_batches(self, db_session):
+        """Keyset batches return every matching event once, in id order"""
+        import report_engine
+        from models import db as models_db
+        for i in range(7):
+            db_session.add(EventLog(event_type='door_open' if i % 2 else 'door_close',
+                                    description=f'Stream {i}', timestamp=datetime(2025, 2, 3, 10, i)))
+        db_session.commit()
+        
+        params = {'start_date': '2025-02-03', 'end_date': '2025-02-03', 'event_types': ['door_close']}
+        context, events = report_engine.stream_report(models_db.engine, params, batch_size=2)
+        rows = list(events)
+        assert [row.description for row in rows] == ['Stream 0', 'Stream 2', 'Stream 4', 'Stream 6']
+        assert set(context) == {'company_profile', 'door_system_info'}
+    
+    def test_pdf_events_read_in_keyset_batches(self, db_session, tmp_path):
+        """PDF reports draw their event log from keyset batches, not a full result list"""
+        import re
+        from sqlalchemy import event as sa_event
+        from models import db as models_db
+        import report_engine
+        pypdf = pytest.importorskip('pypdf')
+        for i in range(300):
+            db_session.add(EventLog(event_type=('door_open', 'door_close', 'alarm_triggered')[i % 3],
+                                    description='', timestamp=datetime(2025, 3, 1) + timedelta(minutes=i)))
+        db_session.commit()
+
+        params = {'start_date': '2025-03-01', 'end_date': '2025-03-01', 'event_types': [],
+                  'report_type': 'compliance_audit', 'render_mode': 'fast', 'render_workers': 1,
+                  'date_fmt': '%Y-%m-%d', 'time_fmt': '%H:%M:%S', 'generated_by': {'username': 'tester'}}
+        report = report_engine.load_report_data(models_db.engine, params, batch_size=50)
+        assert isinstance(report['events'], report_engine.EventStream)
+        assert len(report['events']) == 300
+        assert report['compliance']['total_alarms'] == 100
+
+        batches = []
+        def count_batches(conn, cursor, statement, *args):
+            if 'FROM event_log' in statement and 'LIMIT' in statement:
+                batches.append(statement)
+        sa_event.listen(models_db.engine, 'before_cursor_execute', count_batches)
+        try:
+            report_engine.render_audit_pdf(report, params, str(tmp_path / 'batched.pdf'))
+        finally:
+            sa_event.remove(models_db.engine, 'before_cursor_execute', count_batches)
+        assert len(batches) == 6  # One short read per 50 rows
+
+        text = ''.join(page.extract_text() for page in pypdf.PdfReader(str(tmp_path / 'batched.pdf')).pages)
+        assert [int(found) for found in re.findall(r'#(\d+)', text)] == list(range(1, 301))
+
+    def test_gzip_chunks(self):
+        """Compressed stream decompresses to the original text"""
+        import gzip
+        import report_engine
+        chunks = ['id,event\n'] + [f'{i},door_open\n' for i in range(1000)]
+        compressed = b''.join(report_engine.gzip_chunks(iter(chunks)))
+        assert gzip.decompress(compressed).decode('utf-8') == ''.join(chunks)
+        assert len(compressed) < len(''.join(chunks)) / 4
+    
+    def test_fast_table_splits_into_page_windows(self):
+        """High-volume table splits by row count without copying events"""
+        from collections import namedtuple
+        from report_table_renderer import EventRowsFlowable, HEADER_HEIGHT, ROW_HEIGHT
+        Event = namedtuple('Event', 'id event_type description timestamp')
+        events = [Event(i, 'door_open', '', datetime(2025, 1, 1)) for i in range(100)]
+        
+        table = EventRowsFlowable(events, '%Y-%m-%d', '%H:%M:%S')
+        head, tail = table.split(500, HEADER_HEIGHT + 10 * ROW_HEIGHT + 5)
+        assert (head.start, head.end, tail.start, tail.end) == (0, 10, 10, 100)
+        assert head.events is events
+        assert table.split(500, HEADER_HEIGHT) == []
+    
+    def test_large_report_uses_fast_renderer(self, tmp_path):
+        """Reports above the threshold render quickly in auto mode"""
+        import time
+        from collections import namedtuple
+        import report_engine
+        Event = namedtuple('Event', 'id event_type description timestamp')
+        rows = report_engine.FAST_RENDER_THRESHOLD + 1000
+        events = [Event(i, ('door_open', 'door_close', 'alarm_triggered')[i % 3], '',
+                        datetime(2025, 1, 1) + timedelta(minutes=i)) for i in range(rows)]
+        report = {'events': events, 'company_profile': None, 'door_system_info': None, 'compliance': None}
+        params = {'start_date': '2025-01-01', 'end_date': '2025-01-31', 'date_fmt': '%Y-%m-%d',
+                  'time_fmt': '%H:%M:%S', 'generated_by': {'username': 'tester'}}
+        progress = []
+        
+        started = time.time()
+        report_engine.render_audit_pdf(report, params, str(tmp_path / 'large.pdf'), progress=progress.append)
+        assert time.time() - started < 20
+        assert (tmp_path / 'large.pdf').read_bytes()[:4] == b'%PDF'
+        assert progress[-1] == 1.0 and len(progress) > 10
+    
+    def test_parallel_page_ranges_merge_in_order(self, tmp_path, monkeypatch):
+        """Page ranges rendered in worker processes merge with continuous numbering"""
+        import re
+        from sqlalchemy import create_engine, insert
+        from models import db as models_db
+        import report_engine
+        pypdf = pytest.importorskip('pypdf')
+        monkeypatch.setattr(report_engine, 'PARALLEL_RENDER_THRESHOLD', 100)
+        
+        # Built by a (thread-free) report job worker, the only place page ranges are forked from
+        engine = create_engine(f"sqlite:///{tmp_path / 'reports.db'}")
+        models_db.metadata.create_all(engine)
+        per_page = report_engine.event_rows_per_page()
+        rows = per_page * 9 + 5  # Ranges of whole pages plus a partial last page
+        with engine.begin() as conn:
+            conn.execute(insert(EventLog.__table__), [
+                {'event_type': ('door_open', 'door_close')[i % 2], 'description': '',
+                 'timestamp': datetime(2025, 1, 1) + timedelta(minutes=i)} for i in range(rows)])
+        manager = report_jobs.ReportJobManager(str(tmp_path / 'out'), str(engine.url), max_workers=1).start()
+        assert len(manager._executor._processes) == 1  # Forked by start(), not by the first job
+        job, _ = manager.submit({'format': 'pdf', 'start_date': '2025-01-01', 'end_date': '2025-01-31',
+                                 'event_types': [], 'report_type': None, 'render_mode': 'fast',
+                                 'date_fmt': '%Y-%m-%d', 'time_fmt': '%H:%M:%S',
+                                 'generated_by': {'username': 'tester'}, 'render_workers': 2}, owner_id=1)
+        manager.wait(job.id, timeout=60.0)
+        manager.shutdown()
+        engine.dispose()
+        assert job.status == report_jobs.JOB_DONE, job.error
+        
+        pages = [page.extract_text() for page in pypdf.PdfReader(job.path).pages]
+        numbers = [int(re.search(r'Page (\d+)', text).group(1)) for text in pages]
+        assert numbers == list(range(1, len(pages) + 1))
+        ids = [int(found) for text in pages for found in re.findall(r'#(\d+)', text)]
+        assert ids == list(range(1, rows + 1))
+        assert len({re.search(r'DOC-[\d-]+', text).group(0) for text in pages}) == 1
+    
+    def test_no_page_range_processes_forked_beside_threads(self, tmp_path, monkeypatch):
+        """A process running other threads renders large reports itself"""
+        import threading
+        import report_engine
+        pytest.importorskip('pypdf')
+        monkeypatch.setattr(report_engine, 'PARALLEL_RENDER_THRESHOLD', 10)
+        monkeypatch.setattr(report_engine, '_render_parallel', lambda *args: pytest.fail('forked render workers'))
+        release = threading.Event()
+        thread = threading.Thread(target=release.wait)
+        thread.start()
+        try:
+            events = [report_engine.EventRow(i, 'door_open', '', datetime(2025, 1, 1)) for i in range(20)]
+            report = {'events': events, 'company_profile': None, 'door_system_info': None, 'compliance': None}
+            report_engine.render_audit_pdf(report, {'start_date': '2025-01-01', 'end_date': '2025-01-31',
+                                                    'date_fmt': '%Y-%m-%d', 'time_fmt': '%H:%M:%S',
+                                                    'render_workers': 2}, str(tmp_path / 'one.pdf'))
+        finally:
+            release.set()
+            thread.join()
+        assert (tmp_path / 'one.pdf').read_bytes()[:4] == b'%PDF'
+
+
+def _killed_report_job(job_id, source, params, out_path, progress=None):
+    """Report job whose worker process is killed, like an OOM-killed render"""
+    import os
+    import signal
+    os.kill(os.getpid(), signal.SIGKILL)
+
+
+@pytest.mark.unit
+class TestReportJobs:
+    """Test the background report job queue"""
+    
+    PARAMS = {'format': 'csv', 'start_date': '2025-01-01', 'end_date': '2025-01-31',
+              'event_types': [], 'report_type': None, 'date_fmt': '%Y-%m-%d',
+              'time_fmt': '%H:%M:%S', 'generated_by': {'username': 'tester'}}
+    
+    def test_identical_requests_share_job(self, tmp_path, monkeypatch):
+        """Concurrent identical requests from one user collapse into one job"""
+        import threading
+        release = threading.Event()
+        
+        def fake_job(job_id, source, params, out_path, progress=None):
+            release.wait(2.0)
+            with open(out_path, 'w') as f:
+                f.write('ok')
+            return 1
+        monkeypatch.setattr(report_jobs, 'run_report_job', fake_job)
+        
+        manager = report_jobs.ReportJobManager(str(tmp_path), 'sqlite://', use_processes=False)
+        first, created = manager.submit(dict(self.PARAMS), owner_id=1)
+        second, created_again = manager.submit(dict(self.PARAMS), owner_id=1)
+        other_user, _ = manager.submit(dict(self.PARAMS), owner_id=2)
+        
+        assert created and not created_again
+        assert second is first
+        assert other_user is not first
+        
+        release.set()
+        assert manager.wait(first.id, timeout=2.0).status == report_jobs.JOB_DONE
+        assert manager.get_stats()['deduplicated'] == 1
+        
+        # A finished job no longer absorbs new requests
+        third, created = manager.submit(dict(self.PARAMS), owner_id=1)
+        assert created and third is not first
+        manager.shutdown()
+    
+    def test_dead_worker_falls_back_to_threads(self, tmp_path, monkeypatch):
+        """A killed worker fails its job, frees its key and later jobs run in threads"""
+        manager = report_jobs.ReportJobManager(str(tmp_path / 'out'), f"sqlite:///{tmp_path / 'reports.db'}",
+                                               max_workers=1).start()
+        monkeypatch.setattr(report_jobs, 'run_report_job', _killed_report_job)
+        killed, _ = manager.submit(dict(self.PARAMS), owner_id=1)
+        assert manager.wait(killed.id, timeout=30.0).status == report_jobs.JOB_FAILED
+        assert manager.get_stats()['mode'] == 'thread'
+        assert manager.get_stats()['pool_failures'] == 1
+        
+        calls = []
+        def fake_job(job_id, source, params, out_path, progress=None):
+            calls.append(job_id)
+            with open(out_path, 'w') as f:
+                f.write('ok')
+            return 1
+        monkeypatch.setattr(report_jobs, 'run_report_job', fake_job)
+        retried, created = manager.submit(dict(self.PARAMS), owner_id=1)
+        assert created and retried is not killed
+        assert manager.wait(retried.id, timeout=5.0).status == report_jobs.JOB_DONE
+        assert calls == [retried.id]
+        manager.shutdown()
+    
+    def test_failed_job_and_artifact_expiry(self, tmp_path, monkeypatch):
+        """Failures are reported; expired artifacts are deleted"""
+        def failing_job(job_id, source, params, out_path, progress=None):
+            raise RuntimeError('disk full')
+        monkeypatch.setattr(report_jobs, 'run_report_job', failing_job)
+        
+        manager = report_jobs.ReportJobManager(str(tmp_path), 'sqlite://', use_processes=False, ttl=0)
+        job, _ = manager.submit(dict(self.PARAMS), owner_id=1)
+        manager.wait(job.id, timeout=2.0)
+        assert job.status == report_jobs.JOB_FAILED
+        assert job.error == 'disk full'
+        
+        monkeypatch.undo()
+        job.path = str(tmp_path / 'stale.csv')
+        with open(job.path, 'w') as f:
+            f.write('old')
+        assert manager.cleanup_expired() == 1
+        assert manager.get(job.id) is None
+        assert not (tmp_path / 'stale.csv').exists()
+        manager.shutdown()
+    
+    def test_process_worker_builds_csv(self, tmp_path):
+        """File databases are read by a forked worker process"""
+        from sqlalchemy import create_engine, insert
+        from models import db as models_db
+        
+        uri = f"sqlite:///{tmp_path / 'reports.db'}"
+        engine = create_engine(uri)
+        models_db.metadata.create_all(engine)
+        with engine.begin() as conn:
+            conn.execute(insert(EventLog.__table__), [
+                {'event_type': 'door_open', 'description': f'Open {i}',
+                 'timestamp': datetime(2025, 1, 10, 8, i)} for i in range(5)
+            ])
+        engine.dispose()
+        
+        updates = []
+        manager = report_jobs.ReportJobManager(str(tmp_path / 'out'), uri,
+                                               on_update=lambda job: updates.append(job.status))
+        assert manager.use_processes
+        job, _ = manager.submit(dict(self.PARAMS), owner_id=1)
+        manager.wait(job.id, timeout=30.0)
+        manager.shutdown()
+        
+        assert job.status == report_jobs.JOB_DONE, job.error
+        assert job.row_count == 5
+        with open(job.path) as f:
+            content = f.read()
+        assert 'Open 4' in content and '2025-01-10 08:04:00' in content
+        assert updates[0] == report_jobs.JOB_QUEUED and updates[-1] == report_jobs.JOB_DONE
+    
+    def test_cache_hit_until_new_data(self, tmp_path):
+        """Repeat requests are served from the cache until an event lands in range"""
+        from sqlalchemy import create_engine, insert
+        from models import db as models_db
+        
+        engine = create_engine(f"sqlite:///{tmp_path / 'reports.db'}")
+        models_db.metadata.create_all(engine)
+        
+        def add_events(first, count):
+            with engine.begin() as conn:
+                conn.execute(insert(EventLog.__table__), [
+                    {'event_type': 'door_open', 'description': f'Open {i}',
+                     'timestamp': datetime(2025, 1, 10, 8, i)} for i in range(first, first + count)
+                ])
+        add_events(0, 3)
+        
+        cache = report_cache.ReportCache(str(tmp_path / 'cache'))
+        manager = report_jobs.ReportJobManager(str(tmp_path / 'out'), engine, use_processes=False, cache=cache)
+        
+        def run(**overrides):
+            job, _ = manager.submit(dict(self.PARAMS, **overrides), owner_id=1)
+            manager.wait(job.id, timeout=10.0)
+            assert job.status == report_jobs.JOB_DONE, job.error
+            return job
+        
+        first = run()
+        repeat = run()
+        assert not first.cached and repeat.cached
+        assert repeat.row_count == 3 and repeat.path != first.path
+        with open(first.path) as f, open(repeat.path) as g:
+            assert f.read() == g.read()
+        
+        # Different formatting is a different report
+        assert not run(date_fmt='%d/%m/%Y').cached
+        # Execution-only params are not part of the key
+        assert run(render_workers=4).cached
+        
+        add_events(3, 1)
+        fresh = run()
+        assert not fresh.cached and fresh.row_count == 4
+        assert manager.get_stats()['cache']['hits'] == 2
+        manager.shutdown()
+        engine.dispose()
+    
+    def test_cache_key_covers_headers_and_compliance(self, tmp_path):
+        """Editing the company profile or acknowledging an anomaly invalidates cached reports"""
+        from sqlalchemy import create_engine, insert, update
+        from models import db as models_db, AnomalyDetection
+        
+        engine = create_engine(f"sqlite:///{tmp_path / 'reports.db'}")
+        models_db.metadata.create_all(engine)
+        with engine.begin() as conn:
+            conn.execute(insert(CompanyProfile.__table__), {'company_name': 'Acme Pharma'})
+            conn.execute(insert(EventLog.__table__), {'event_type': 'door_open', 'description': 'Open',
+                                                      'timestamp': datetime(2025, 1, 10, 8, 0)})
+            conn.execute(insert(AnomalyDetection.__table__), {'anomaly_type': 'odd_hours', 'severity': 'medium',
+                                                              'detected_at': datetime(2025, 1, 10, 2, 0)})
+        
+        cache = report_cache.ReportCache(str(tmp_path / 'cache'))
+        manager = report_jobs.ReportJobManager(str(tmp_path / 'out'), engine, use_processes=False, cache=cache)
+        
+        def run(**overrides):
+            job, _ = manager.submit(dict(self.PARAMS, **overrides), owner_id=1)
+            manager.wait(job.id, timeout=10.0)
+            assert job.status == report_jobs.JOB_DONE, job.error
+            return job
+        
+        run()
+        with engine.begin() as conn:
+            conn.execute(update(CompanyProfile.__table__).values(company_name='Acme Pharmaceuticals'))
+        renamed = run()
+        assert not renamed.cached
+        with open(renamed.path) as f:
+            assert '# Company: Acme Pharmaceuticals' in f.read()
+        
+        audit = dict(self.PARAMS, report_type='compliance_audit')
+        assert run(**audit) and run(**audit).cached
+        with engine.begin() as conn:
+            conn.execute(update(AnomalyDetection.__table__).values(is_acknowledged=True))
+        assert not run(**audit).cached
+        
+        assert cache.purge() == 4 and not run().cached
+        manager.shutdown()
+        engine.dispose()
+    
+    def test_cache_lru_eviction(self, tmp_path):
+        """The least recently used artifacts are evicted beyond max_bytes"""
+        import os
+        cache = report_cache.ReportCache(str(tmp_path / 'cache'), max_bytes=250)
+        for n, key in enumerate(('a', 'b', 'c')):
+            src = tmp_path / f'{key}.csv'
+            src.write_text('x' * 100)
+            assert cache.store(key, 'csv', str(src))
+            os.utime(tmp_path / 'cache' / f'{key}.csv', (1000 + n, 1000 + n))
+            if key == 'b':
+                # Reading 'a' makes 'b' the least recently used entry
+                assert cache.fetch('a', 'csv', str(tmp_path / 'a_job.csv'))
+        
+        assert cache.fetch('a', 'csv', str(tmp_path / 'a_job2.csv'))
+        assert not cache.fetch('b', 'csv', str(tmp_path / 'b_job.csv'))
+        assert cache.get_stats()['entries'] == 2 and cache.evictions == 1
+        # A job's own link survives eviction of the cache entry
+        assert (tmp_path / 'a_job.csv').read_text() == 'x' * 100
+
+
+
+@pytest.mark.unit
+class TestReportScheduler:
+    """Test scheduled report timing and run claiming"""
+    
+    def test_following_run_catches_up_boundedly(self):
+        """Missed occurrences run in turn, but only the most recent few"""
+        due = datetime(2025, 1, 1, 9, 0)
+        assert report_scheduler.following_run('daily', due, datetime(2025, 1, 1, 9, 1)) == datetime(2025, 1, 2, 9, 0)
+        # Two missed days are both still run
+        assert report_scheduler.following_run('daily', due, datetime(2025, 1, 3, 10, 0)) == datetime(2025, 1, 2, 9, 0)
+        # Ten missed days: only the last three remain
+        assert report_scheduler.following_run('daily', due, datetime(2025, 1, 11, 10, 0),
+                                              max_catchup=3) == datetime(2025, 1, 9, 9, 0)
+        assert report_scheduler.report_window('weekly', datetime(2025, 1, 8, 9, 0)) == ('2025-01-01', '2025-01-08')
+    
+    def test_dispatches_at_deadline_and_on_wake(self):
+        """Runs are dispatched when due, without waiting for a polling interval"""
+        import threading
+        from datetime import datetime as dt
+        schedule = [(dt.now() + timedelta(seconds=0.2), 1, 'first')]
+        ran = []
+        done = threading.Event()
+        
+        def run_due(report_id, scheduled_for):
+            ran.append((report_id, scheduled_for, dt.now()))
+            schedule[:] = [entry for entry in schedule if entry[1] != report_id]
+            if len(ran) == 2:
+                done.set()
+        
+        scheduler = report_scheduler.ReportScheduler(lambda: list(schedule), run_due, resync_interval=60)
+        scheduler.start()
+        try:
+            started = dt.now()
+            schedule.append((started - timedelta(minutes=5), 2, 'overdue'))
+            scheduler.wake()
+            assert done.wait(3.0)
+        finally:
+            scheduler.stop()
+        
+        assert [entry[:2] for entry in ran] == [(2, 'overdue'), (1, 'first')]
+        assert (ran[1][2] - started).total_seconds() < 2.0
+        assert scheduler.get_stats()['dispatched'] == 2
+    
+    def test_run_is_claimed_once(self, app, monkeypatch):
+        """An occurrence is sent once, next_run advances and failures are retried"""
+        import app as app_module
+        from io import BytesIO
+        from models import db, ScheduledReport, ScheduledReportRun
+        
+        admin = User.query.filter_by(username='testadmin').first()
+        due = datetime(2025, 1, 1, 9, 0)
+        report = ScheduledReport(report_type='summary', frequency='daily', scheduled_time='09:00',
+                                 recipients='qa@test.com', next_run=due, created_by=admin.id)
+        db.session.add(report)
+        db.session.commit()
+        
+        sent = []
+        outcome = {'ok': False}
+        monkeypatch.setattr(app_module, 'generate_scheduled_report_pdf', lambda **kwargs: BytesIO(b'%PDF'))
+        monkeypatch.setattr(app_module, 'send_scheduled_report_email',
+                            lambda **kwargs: sent.append(kwargs['start_date']) or outcome['ok'])
+        
+        # First attempt fails; the run is recorded and next_run has moved on
+        app_module.run_scheduled_report(report.id, due)
+        run = ScheduledReportRun.query.filter_by(report_id=report.id).one()
+        assert run.status == 'failed' and run.attempts == 1
+        db.session.refresh(report)
+        assert report.next_run > due
+        assert (run.finished_at + timedelta(seconds=900), report.id, due) in app_module.load_scheduled_report_runs()
+        
+        # The retry succeeds; a duplicate dispatch afterwards does nothing
+        outcome['ok'] = True
+        app_module.run_scheduled_report(report.id, due)
+        app_module.run_scheduled_report(report.id, due)
+        db.session.refresh(run)
+        assert run.status == 'sent' and run.attempts == 2
+        assert sent == ['2024-12-31', '2024-12-31']
+
+
+
+class _SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """Minimal SMTP dialogue: accepts everything, replies to DATA from a script"""
+    
+    def reply(self, text):
+        self.wfile.write(f"{text}\r\n".encode())
+    
+    def handle(self):
+        sink = self.server
+        sink.connections += 1
+        self.reply('220 sink ESMTP')
+        recipients = []
+        for line in self.rfile:
+            command = line.decode().strip()
+            verb = command.split(' ', 1)[0].upper()
+            if verb == 'MAIL':
+                recipients = []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                recipients.append(command.split(':', 1)[1].strip('<> '))
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                data = b''.join(iter(self.rfile.readline, b'.\r\n'))
+                response = sink.data_replies.pop(0) if sink.data_replies else '250 Queued'
+                if response.startswith('250'):
+                    sink.messages.append((recipients, data.decode()))
+                self.reply(response)
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('250 OK')
+
+
+@pytest.mark.unit
+class TestEmailOutbox:
+    """Test the persistent outbound email queue against a local SMTP sink"""
+    
+    @pytest.fixture
+    def sink(self):
+        import threading
+        server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), _SMTPSinkHandler)
+        server.daemon_threads = True
+        server.connections = 0
+        server.messages = []
+        server.data_replies = []
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        yield server
+        server.shutdown()
+        server.server_close()
+    
+    @pytest.fixture
+    def outbox(self, sink, tmp_path):
+        from sqlalchemy import create_engine
+        from models import db as models_db
+        engine = create_engine(f"sqlite:///{tmp_path / 'outbox.db'}")
+        models_db.metadata.create_all(engine)
+        settings = {'host': '127.0.0.1', 'port': sink.server_address[1], 'starttls': False, 'username': None}
+        outbox = email_outbox.EmailOutbox(engine, lambda: settings, retry_base=30, poll_interval=5)
+        yield outbox
+        outbox.stop()
+        engine.dispose()
+    
+    def status(self, outbox, email_id):
+        from sqlalchemy import select
+        with outbox.engine.connect() as conn:
+            return conn.execute(select(outbox.table).where(outbox.table.c.id == email_id)).one()
+    
+    def test_batch_over_one_connection(self, outbox, sink):
+        """Queued messages share one connection; alarms go first; recipients are batched"""
+        report = outbox.enqueue('Subject: report\r\n\r\nweekly', 'edomos@test.com', ['qa@test.com'])
+        alarm = outbox.enqueue('Subject: alarm\r\n\r\ndoor', 'edomos@test.com',
+                               ['guard@test.com', 'manager@test.com'], category='alarm', priority=10)
+        
+        assert outbox.send_pending() == 2
+        assert sink.connections == 1
+        assert [recipients for recipients, _ in sink.messages] == [['guard@test.com', 'manager@test.com'],
+                                                                   ['qa@test.com']]
+        assert self.status(outbox, alarm).status == email_outbox.EMAIL_SENT
+        assert self.status(outbox, report).attempts == 1
+        
+        # The open connection is reused for the next batch
+        outbox.enqueue('Subject: again\r\n\r\nx', 'edomos@test.com', ['qa@test.com'])
+        assert outbox.send_pending() == 1
+        assert sink.connections == 1 and outbox.get_stats()['connections'] == 1
+    
+    def test_retry_backoff_and_permanent_failure(self, outbox, sink):
+        """Temporary rejections are retried later; permanent ones fail"""
+        sink.data_replies = ['451 Try again later', '554 Rejected']
+        retry = outbox.enqueue('Subject: a\r\n\r\na', 'edomos@test.com', ['qa@test.com'])
+        rejected = outbox.enqueue('Subject: b\r\n\r\nb', 'edomos@test.com', ['qa@test.com'])
+        outbox.send_pending()
+        
+        row = self.status(outbox, retry)
+        assert row.status == email_outbox.EMAIL_PENDING and row.attempts == 1
+        assert 25 < (row.next_attempt_at - datetime.now()).total_seconds() <= 30
+        assert self.status(outbox, rejected).status == email_outbox.EMAIL_FAILED
+        # Not due yet
+        assert outbox.send_pending() == 0
+        assert sink.messages == []
+    
+    def test_sender_thread_delivers_queued_mail(self, outbox, sink):
+        """The sender wakes up on enqueue and resumes rows interrupted mid-send"""
+        import time
+        from sqlalchemy import update
+        stuck = outbox.enqueue('Subject: stuck\r\n\r\nx', 'edomos@test.com', ['qa@test.com'])
+        with outbox.engine.begin() as conn:
+            conn.execute(update(outbox.table).values(status=email_outbox.EMAIL_SENDING))
+        
+        outbox.start()
+        outbox.enqueue('Subject: new\r\n\r\ny', 'edomos@test.com', ['qa@test.com'])
+        deadline = time.time() + 3.0
+        while len(sink.messages) < 2 and time.time() < deadline:
+            time.sleep(0.05)
+        assert len(sink.messages) == 2
+        assert self.status(outbox, stuck).status == email_outbox.EMAIL_SENT
+
+
+
+@pytest.mark.unit
+class TestAnomalyRules:
+    """Test the streaming door anomaly rules and their batched writer"""
+    
+    @pytest.fixture
+    def engine(self, tmp_path):
+        from sqlalchemy import create_engine
+        from models import db as models_db
+        engine = create_engine(f"sqlite:///{tmp_path / 'anomalies.db'}")
+        models_db.metadata.create_all(engine)
+        yield engine
+        engine.dispose()
+    
+    def stored(self, engine):
+        from sqlalchemy import select
+        from models import AnomalyDetection
+        with engine.connect() as conn:
+            return conn.execute(select(AnomalyDetection.__table__.c.anomaly_type)
+                                .order_by(AnomalyDetection.__table__.c.id)).scalars().all()
+    
+    def test_repeated_opens_window(self, engine):
+        """Three opens within ten minutes raise repeated_opens; older opens slide out"""
+        rules = anomaly_rules.AnomalyRuleEngine(engine)
+        start = datetime(2025, 1, 6, 10, 0)
+        types = [[a['anomaly_type'] for a in rules.evaluate('door_open', timestamp=start + timedelta(minutes=m))]
+                 for m in (0, 4, 8, 30, 31)]
+        assert types == [[], [], ['repeated_opens'], [], []]
+        assert rules.get_stats()['windows'] == {'main/repeated_opens': 2}
+        assert 'Repeated door access detected: 3 opens in last 10 minutes' in [
+            a['description'] for a in rules.evaluate('door_open', timestamp=start + timedelta(minutes=32))]
+    
+    def test_business_hours_cached(self, engine):
+        """Business hours are read once and re-read only after invalidation"""
+        from sqlalchemy import insert, update
+        with engine.begin() as conn:
+            conn.execute(insert(Setting.__table__), [{'key': 'business_hours_start', 'value': '8'},
+                                                     {'key': 'business_hours_end', 'value': '18'}])
+        rules = anomaly_rules.AnomalyRuleEngine(engine)
+        assert rules.evaluate('door_open', timestamp=datetime(2025, 1, 6, 8, 30)) == []
+        
+        with engine.begin() as conn:
+            conn.execute(update(Setting.__table__).where(Setting.__table__.c.key == 'business_hours_start')
+                         .values(value='9'))
+        assert rules.evaluate('door_open', timestamp=datetime(2025, 1, 7, 8, 30)) == []
+        rules.invalidate_settings()
+        anomalies = rules.evaluate('door_open', timestamp=datetime(2025, 1, 8, 8, 30))
+        assert [a['anomaly_type'] for a in anomalies] == ['odd_hours']
+        assert 'Business hours: 9:00-18:00' in anomalies[0]['description']
+    
+    def test_prolonged_open_and_custom_rule(self, engine):
+        """The alarm reports how long the door was open; configured window rules apply"""
+        rules = anomaly_rules.AnomalyRuleEngine(engine, rules=anomaly_rules.DEFAULT_WINDOW_RULES + [
+            {'name': 'alarm_burst', 'event_type': 'alarm_triggered', 'count': 2, 'window': 3600, 'severity': 'high'}])
+        opened = datetime(2025, 1, 6, 10, 0)
+        rules.evaluate('door_open', timestamp=opened)
+        first = rules.evaluate('alarm_triggered', timestamp=opened + timedelta(seconds=45), threshold=30)
+        assert [(a['anomaly_type'], a['description']) for a in first] == [
+            ('prolonged_open', 'Door left open for 45 seconds (exceeded threshold)')]
+        rules.evaluate('door_close', timestamp=opened + timedelta(minutes=1))
+        second = rules.evaluate('alarm_triggered', timestamp=opened + timedelta(minutes=5), threshold=30)
+        assert [a['anomaly_type'] for a in second] == ['alarm_burst', 'prolonged_open']
+        assert 'Door left open for 30 seconds' in second[1]['description']
+    
+    def test_anomalies_written_in_batches(self, engine):
+        """The writer inserts anomalies in batches and flushes the rest on stop"""
+        import time
+        alerts = []
+        rules = anomaly_rules.AnomalyRuleEngine(engine, flush_interval=60, batch_size=3, on_anomaly=alerts.append)
+        rules.start()
+        night = datetime(2025, 1, 6, 2, 0)
+        for minute in (0, 20):
+            rules.evaluate('door_open', event_id=minute, timestamp=night + timedelta(minutes=minute))
+        assert len(alerts) == 2 and self.stored(engine) == []
+        
+        rules.evaluate('door_open', timestamp=night + timedelta(minutes=21))
+        rules.evaluate('door_open', timestamp=night + timedelta(minutes=22))  # odd_hours + repeated_opens
+        deadline = time.time() + 3.0
+        while len(self.stored(engine)) < 3 and time.time() < deadline:
+            time.sleep(0.02)
+        assert len(self.stored(engine)) >= 3
+        rules.stop()
+        assert self.stored(engine) == ['odd_hours', 'odd_hours', 'odd_hours', 'odd_hours', 'repeated_opens']
+    
+    def test_windows_seeded_after_restart(self, engine):
+        """Opens logged just before a restart still count towards repeated_opens"""
+        from sqlalchemy import insert
+        now = datetime(2025, 1, 6, 10, 0)
+        with engine.begin() as conn:
+            conn.execute(insert(EventLog.__table__), [
+                {'event_type': 'door_open', 'timestamp': now - timedelta(minutes=m)} for m in (3, 5, 30)])
+        rules = anomaly_rules.AnomalyRuleEngine(engine, clock=lambda: now)
+        anomalies = rules.evaluate('door_open', timestamp=now)
+        assert [a['anomaly_type'] for a in anomalies] == ['repeated_opens']
+        assert anomalies[0]['description'].startswith('Repeated door access detected: 3 opens')
+    
+    def test_triggering_event_not_counted_twice(self, engine):
+        """An engine created after the event was committed does not count it again"""
+        from sqlalchemy import insert
+        now = datetime(2025, 1, 6, 10, 0)
+        with engine.begin() as conn:
+            conn.execute(insert(EventLog.__table__), [
+                {'id': 1, 'event_type': 'door_open', 'timestamp': now - timedelta(minutes=2)},
+                {'id': 2, 'event_type': 'door_open', 'timestamp': now}])
+        rules = anomaly_rules.AnomalyRuleEngine(engine, clock=lambda: now)
+        assert rules.evaluate('door_open', event_id=2, timestamp=now) == []
+        assert rules.get_stats()['windows'] == {'main/repeated_opens': 2}
+        anomalies = rules.evaluate('door_open', event_id=3, timestamp=now + timedelta(minutes=1))
+        assert anomalies[0]['description'].startswith('Repeated door access detected: 3 opens')
+
+
+@pytest.mark.unit
+class TestDoorFlap:
+    """Test collapsing door open/close storms into door_flapping summaries"""
+    
+    @pytest.fixture
+    def detector(self):
+        events = []
+        detector = door_flap.FlapDetector(lambda event_type, description: events.append((event_type, description)),
+                                          threshold=4, window=10, quiet=5, max_span=60)
+        return detector, events
+    
+    def test_normal_transitions_logged(self, detector):
+        """Ordinary opens and closes are logged individually, even in quick succession"""
+        detector, events = detector
+        for t, is_open in ((0, True), (1.5, False), (30, True), (31, False)):
+            assert detector.transition(is_open, now=1000 + t)
+        assert [e[0] for e in events] == ['door_open', 'door_close', 'door_open', 'door_close']
+        assert not detector.flapping
+    
+    def test_storm_summarized_once(self, detector):
+        """A toggle storm becomes one summary plus the settled state; every transition is accounted for"""
+        detector, events = detector
+        logged = [detector.transition(i % 2 == 0, now=1000 + i * 0.3) for i in range(25)]
+        assert logged[:3] == [True] * 3 and not any(logged[3:])
+        assert detector.flapping and len(events) == 3
+        
+        detector.poll(now=1000 + 24 * 0.3 + 1)
+        assert len(events) == 3  # Not quiet long enough yet
+        detector.poll(now=1000 + 24 * 0.3 + 5)
+        assert not detector.flapping
+        assert [e[0] for e in events] == ['door_open', 'door_close', 'door_open', 'door_flapping']
+        assert events[3][1].startswith('Door flapping: 22 transitions (11 opens, 11 closes) over 6.3s')
+        assert events[3][1].endswith('door settled open')  # Last logged state was already open
+        assert detector.get_stats() == {'flapping': False, 'episodes': 1, 'suppressed': 22, 'recent_transitions': 0}
+        
+        assert detector.transition(False, now=1100)
+        assert events[-1] == ('door_close', 'Door closed')
+    
+    def test_settled_state_logged_and_long_episode_split(self, detector):
+        """A door that keeps flapping is summarized every max_span; settling closed logs door_close"""
+        detector, events = detector
+        for i in range(90):
+            detector.transition(i % 2 == 0, now=1000 + i)
+        flapping = [e for e in events if e[0] == 'door_flapping']
+        assert len(flapping) == 1 and flapping[0][1].endswith('still flapping')
+        
+        detector.transition(False, now=1090)
+        detector.poll(now=1100)
+        assert [e[0] for e in events[-3:]] == ['door_flapping', 'door_flapping', 'door_close']
+        total = sum(int(e[1].split()[2]) for e in events if e[0] == 'door_flapping')
+        assert total + 3 == 91
+
+
+@pytest.mark.unit
+class TestPerfMetrics:
+    """Test the in-process metrics registry and request/SQL instrumentation"""
+    
+    def test_histogram_quantiles(self):
+        """Quantiles interpolate within buckets and never exceed the maximum"""
+        histogram = perf_metrics.Histogram((1, 2, 4))
+        for value in (0.5, 1.5, 1.5, 3, 10):
+            histogram.observe(value)
+        assert histogram.buckets == [1, 2, 1, 1]
+        assert histogram.quantile(0.5) == pytest.approx(1.75)
+        assert histogram.quantile(1.0) == 10
+        assert perf_metrics.Histogram().quantile(0.99) == 0.0
+    
+    def test_prometheus_text(self):
+        """Counters and cumulative histogram buckets in exposition format"""
+        registry = perf_metrics.MetricsRegistry(prefix='t')
+        registry.describe('latency_seconds', 'Latency')
+        registry.inc('responses_total', endpoint='a', status='200')
+        registry.inc('responses_total', endpoint='a', status='200')
+        registry.observe('latency_seconds', 0.003, buckets=(0.001, 0.01), endpoint='a "b"')
+        lines = registry.render_prometheus().splitlines()
+        assert '# TYPE t_responses_total counter' in lines
+        assert 't_responses_total{endpoint="a",status="200"} 2' in lines
+        assert '# HELP t_latency_seconds Latency' in lines
+        assert 't_latency_seconds_bucket{endpoint="a \\"b\\"",le="0.001"} 0' in lines
+        assert 't_latency_seconds_bucket{endpoint="a \\"b\\"",le="+Inf"} 1' in lines
+        assert 't_latency_seconds_count{endpoint="a \\"b\\""} 1' in lines
+        
+        summary = registry.summary()['histograms']['latency_seconds'][0]
+        assert summary['count'] == 1 and summary['max'] == pytest.approx(0.003)
+    
+    def test_prometheus_merges_other_processes(self):
+        """Snapshots of other registries join the same families, each series labelled by process"""
+        import json
+        worker = perf_metrics.MetricsRegistry(prefix='t')
+        controller = perf_metrics.MetricsRegistry(prefix='t')
+        worker.inc('responses_total', status='200')
+        controller.inc('responses_total', status='200', value=3)
+        controller.observe('stage_seconds', 0.5, buckets=(1,), stage='camera')
+        snapshot = json.loads(json.dumps(controller.snapshot()))  # As sent over the controller socket
+        
+        lines = worker.render_prometheus(process='web-1', others=[('controller', snapshot)]).splitlines()
+        assert lines.count('# TYPE t_responses_total counter') == 1
+        assert 't_responses_total{process="controller",status="200"} 3' in lines
+        assert 't_responses_total{process="web-1",status="200"} 1' in lines
+        assert 't_stage_seconds_bucket{process="controller",stage="camera",le="1"} 1' in lines
+        assert 't_stage_seconds_sum{process="controller",stage="camera"} 0.5' in lines
+    
+    def test_request_sql_and_lock_timings(self, tmp_path):
+        """Requests record latency, status, size and their SQL statements; the timed lock records wait/hold"""
+        from flask import Flask
+        from sqlalchemy import create_engine, text
+        registry = perf_metrics.MetricsRegistry()
+        instrumented = Flask(__name__)
+        perf_metrics.RequestMetrics(registry).init_app(instrumented)
+        engine = create_engine(f"sqlite:///{tmp_path / 'metrics.db'}")
+        
+        @instrumented.route('/three')
+        def three():
+            with engine.connect() as conn:
+                for _ in range(3):
+                    conn.execute(text('SELECT 1'))
+            return 'ok'
+        
+        with instrumented.test_client() as client:
+            assert client.get('/three').status_code == 200
+            assert client.get('/missing').status_code == 404
+        with engine.connect() as conn:
+            conn.execute(text('SELECT 1'))  # Outside a request: counted globally only
+        engine.dispose()
+        
+        lock = perf_metrics.TimedLock(registry, 'test_lock')
+        with lock:
+            pass
+        
+        summary = registry.summary()
+        statements = {s['labels']['endpoint']: s for s in summary['histograms']['http_request_sql_statements']}
+        assert statements['three']['sum'] == 3 and statements['unmatched']['sum'] == 0
+        statuses = {(c['labels']['endpoint'], c['labels']['status']): c['value']
+                    for c in summary['counters']['http_responses_total']}
+        assert statuses == {('three', '200'): 1, ('unmatched', '404'): 1}
+        sizes = {s['labels']['endpoint']: s['sum'] for s in summary['histograms']['http_response_size_bytes']}
+        assert sizes['three'] == 2
+        selects = [s for s in summary['histograms']['sql_statement_seconds'] if s['labels']['kind'] == 'SELECT']
+        assert selects[0]['count'] >= 4
+        stages = {s['labels']['stage'] for s in summary['histograms']['ingest_stage_seconds']}
+        assert stages == {'test_lock_wait', 'test_lock_hold'}
+
+
+@pytest.mark.unit
+class TestEventTrace:
+    """Test sensor-to-browser latency tracing of door events"""
+    
+    class Clock:
+        def __init__(self):
+            self.now = 100.0
+        
+        def __call__(self):
+            return self.now
+    
+    def test_stage_latencies_and_budget_alerts(self):
+        """Each stage is timed from the previous one; overruns alert at most once per interval"""
+        clock = self.Clock()
+        alerts = []
+        tracer = event_trace.EventTracer(budgets={'enriched': 0.5}, alert_interval=60, clock=clock,
+                                         on_budget_exceeded=lambda *args: alerts.append(args))
+        for run in range(2):
+            trace_id = tracer.start(edge_at=clock.now)
+            for stage, delay in (('debounced', 0.06), ('db_commit', 0.02), ('enriched', 0.8),
+                                 ('emitted', 0.1), ('acked', 0.3)):
+                clock.now += delay
+                assert tracer.mark(trace_id, stage) == pytest.approx(delay)
+            assert tracer.mark(trace_id, 'acked') is None  # Second browser / closed trace
+        
+        stats = tracer.get_stats()
+        assert stats['open_traces'] == 0
+        assert stats['stages']['enriched']['p95_ms'] == pytest.approx(800.0)
+        assert stats['stages']['enriched']['over_budget'] == 2
+        assert stats['stages']['total']['count'] == 2
+        assert stats['stages']['total']['p50_ms'] == pytest.approx(1280.0)
+        assert [(stage, budget) for stage, seconds, budget, trace in alerts] == [('enriched', 0.5)]
+    
+    def test_trace_follows_event_through_flap_detector_and_broadcaster(self):
+        """The trace id reaches log_event through the flap detector and is stamped when broadcast"""
+        clock = self.Clock()
+        tracer = event_trace.EventTracer(max_open=2, clock=clock)
+        logged = []
+        detector = door_flap.FlapDetector(lambda event_type, description, **context: logged.append(context))
+        trace_id = tracer.start()
+        detector.transition(True, now=0, trace_id=trace_id)
+        assert logged == [{'trace_id': trace_id}]
+        
+        fake = TestCoalescingBroadcaster.FakeSocketIO()
+        broadcaster = ws_broadcaster.CoalescingBroadcaster(
+            fake, on_events_sent=lambda events: [tracer.mark(e['event'].get('trace_id'), 'emitted') for e in events])
+        clock.now += 0.2
+        broadcaster.publish({'event': {'id': 1, 'trace_id': trace_id}, 'event_id': 'evt1', 'door_status': 'Open'})
+        broadcaster.flush()
+        assert tracer.get_stats()['stages']['emitted']['count'] == 1
+        
+        for _ in range(3):
+            tracer.start()
+        assert tracer.get_stats()['open_traces'] == 2  # Oldest unacknowledged traces dropped
+        assert tracer.mark(trace_id, 'acked') is None
+
+
+@pytest.mark.unit
+class TestSlowQueries:
+    """Test the slow query log"""
+    
+    def test_fingerprint_normalizes_literals(self):
+        """Queries differing only in values share a fingerprint"""
+        a = slow_queries.fingerprint("SELECT * FROM event_log WHERE id = 5 AND event_type IN (?, ?)\n  AND description = 'it''s'")
+        b = slow_queries.fingerprint("SELECT * FROM event_log WHERE id = 123 AND event_type IN (?) AND description = 'x'")
+        assert a == b == "SELECT * FROM event_log WHERE id = ? AND event_type IN (...) AND description = ?"
+        assert slow_queries.fingerprint("INSERT INTO t (a, b) VALUES (?, ?), (?, ?), (?, ?)") == \
+            "INSERT INTO t (a, b) VALUES (?, ?), ..."
+        assert slow_queries.fingerprint("SELECT col2 FROM t2") == "SELECT col2 FROM t2"
+    
+    def test_slow_statements_recorded_with_plan_and_call_site(self, tmp_path):
+        """Statements over the threshold are aggregated with their query plan and caller"""
+        import time
+        from sqlalchemy import create_engine, event as sa_event, text
+        log = slow_queries.SlowQueryLog(threshold=0.02)
+        log.instrument()
+        engine = create_engine(f"sqlite:///{tmp_path / 'slow.db'}")
+        
+        @sa_event.listens_for(engine, 'connect')
+        def add_sleep(dbapi_connection, record):
+            dbapi_connection.create_function('pause', 1, lambda ms: time.sleep(ms / 1000) or ms)
+        
+        with engine.begin() as conn:
+            conn.execute(text('CREATE TABLE item (id INTEGER PRIMARY KEY, kind TEXT)'))
+            conn.execute(text('CREATE INDEX ix_item_kind ON item (kind)'))
+            conn.execute(text("INSERT INTO item (kind) VALUES ('a'), ('b')"))
+            for ms in (30, 40):
+                conn.execute(text("SELECT pause(:ms) FROM item WHERE kind = :kind"), {'ms': ms, 'kind': 'a'})
+            conn.execute(text("SELECT pause(0) FROM item"))  # Fast: not recorded
+            conn.execute(text("SELECT pause(50)"))
+        engine.dispose()
+        
+        by_total = log.report(sort='total')
+        assert [row['count'] for row in by_total] == [2, 1]
+        query = by_total[0]
+        assert query['fingerprint'] == 'SELECT pause(?) FROM item WHERE kind = ?'
+        assert query['total_ms'] >= 70 and query['max_ms'] >= 40
+        assert any('ix_item_kind' in line for line in query['plan'])
+        assert query['sites'][0].startswith('tests_unit.py:') and 'test_slow_statements' in query['sites'][0]
+        assert [row['count'] for row in log.report(sort='mean')] == [1, 2]
+        assert log.get_stats()['recorded'] == 3
+        with pytest.raises(ValueError):
+            log.report(sort='nope')
+    
+    def test_least_costly_fingerprint_evicted(self):
+        """The log keeps max_entries fingerprints, dropping the one with the least total time"""
+        log = slow_queries.SlowQueryLog(max_entries=2)
+        log.record('SELECT a FROM t', 0.5, site='x.py:1 in f')
+        log.record('SELECT b FROM t', 0.3, site='x.py:2 in f')
+        log.record('SELECT b FROM t', 0.3, site='x.py:3 in g')
+        log.record('SELECT c FROM t', 0.3, site='x.py:4 in f')
+        rows = log.report(sort='count')
+        assert [row['fingerprint'] for row in rows] == ['SELECT b FROM t', 'SELECT c FROM t']
+        assert rows[0]['sites'] == ['x.py:2 in f', 'x.py:3 in g']
+
 if __name__ == '__main__':
     pytest.main([__file__, '-v', '--tb=short'])
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Offline AI Training
+
+Rebuilds the AI pattern model from the full event history in one vectorized
+pass (ai_training.py) and saves it as the engine's model file. With
+--rescore, historical events are scored again against the new model and
+their ai_metadata is rewritten.
+
+Stop the application first: a running engine would replace the trained model
+with its own at its next snapshot.
+
+Usage:
+    python train_ai.py                          # train from instance/alarm_system.db
+    python train_ai.py --since=2025-01-01       # only events from that date on
+    python train_ai.py --rescore --workers=4    # also re-score history on 4 processes
+    python train_ai.py --db=/path/to/alarm_system.db --model=ai_model.json
+"""
+
+import os
+import sys
+import time
+from datetime import datetime
+
+import ai_security
+import ai_training
+
+
+def option(name, default=None):
+    for arg in sys.argv[1:]:
+        if arg.startswith(f'--{name}='):
+            return arg.split('=', 1)[1]
+    return default
+
+
+def main():
+    db_path = option('db', os.path.join(os.path.abspath(os.path.dirname(__file__)), 'instance', 'alarm_system.db'))
+    model_file = option('model', ai_security.MODEL_FILE)
+    since = option('since')
+    workers = int(option('workers', os.cpu_count() or 1))
+    half_life = option('half-life-days')
+    half_life = float(half_life) * 86400 if half_life else ai_security.DECAY_HALF_LIFE
+    source = f'sqlite:///{db_path}'
+
+    print("🧠 eDOMOS Offline AI Training")
+    print("=" * 80)
+    started = time.perf_counter()
+    events = ai_training.load_event_arrays(source, since=datetime.fromisoformat(since) if since else None)
+    loaded = time.perf_counter()
+    print(f"  Loaded {len(events.ids):,} events ({len(events.types)} types) in {loaded - started:.2f}s")
+    if not len(events.ids):
+        print("  Nothing to train on")
+        return
+
+    model = ai_training.train_patterns(events, decay_half_life=half_life)
+    trained = time.perf_counter()
+    print(f"  Trained pattern model in {trained - loaded:.2f}s")
+    for key, value in model['rates'].items():
+        print(f"    {key:<22} {value}")
+
+    engine = ai_security.AISecurityEngine(model_file=model_file, decay_half_life=half_life)
+    engine.replace_patterns(model['hourly_patterns'], model['daily_patterns'],
+                            model['events_learned'], model['decayed_at'])
+    if not engine.save_model():
+        sys.exit(1)
+    print(f"  ✅ Model saved to {model_file}")
+
+    if '--rescore' in sys.argv:
+        def progress(done, total):
+            print(f"\r  Re-scoring {done:,}/{total:,} events", end='', flush=True)
+        ai_training.rescore_events(source, events, model, workers=workers, progress=progress)
+        print(f"\n  ✅ Re-scored history in {time.perf_counter() - trained:.2f}s")
+    print("=" * 80)
+
+
+if __name__ == '__main__':
+    main()
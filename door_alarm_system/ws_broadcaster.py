@@ -0,0 +1,385 @@
+"""
+Coalescing WebSocket Broadcaster for eDOMOS
+Batches real-time updates within a short window and sends each client only
+the status fields that changed since the last frame it received. Streams are
+delivered to permission-scoped rooms so clients only receive what they can see
+"""
+
+import json
+import threading
+import time
+import logging
+from functools import partial
+
+logger = logging.getLogger(__name__)
+
+# Room for clients that still expect one full 'new_event' payload per event
+LEGACY_ROOM = 'full_payload'
+
+# Permission-scoped stream rooms; a client joins every room its permissions allow
+EVENTS_ROOM = 'stream:events'        # Door/alarm events and status
+ANALYTICS_ROOM = 'stream:analytics'  # Analytics page updates
+ANOMALY_ROOM = 'stream:anomalies'    # Anomaly alerts for administrators
+
+STREAM_PERMISSIONS = {
+    EVENTS_ROOM: ('all', 'dashboard', 'event_log', 'analytics'),
+    ANALYTICS_ROOM: ('all', 'analytics'),
+    ANOMALY_ROOM: ('all', 'admin'),
+}
+
+# Keys of a broadcast payload that describe the event itself; everything else
+# is treated as status that can be coalesced and delta-encoded
+EVENT_KEYS = ('event', 'event_id')
+
+
+def diff_state(old, new):
+    """
+    Compute the changes that turn `old` into `new`
+
+    Nested dicts are diffed recursively; removed keys map to None.
+    """
+    changes = {}
+    for key, value in new.items():
+        previous = old.get(key)
+        if isinstance(value, dict) and isinstance(previous, dict):
+            nested = diff_state(previous, value)
+            if nested:
+                changes[key] = nested
+        elif key not in old or previous != value:
+            changes[key] = value
+    for key in old:
+        if key not in new:
+            changes[key] = None
+    return changes
+
+
+def rooms_for_user(user):
+    """
+    Get the stream rooms a user may join
+
+    Administrators get every stream; other users get the rooms whose
+    permissions intersect their comma-separated User.permissions.
+    """
+    if user is None or not getattr(user, 'is_authenticated', False):
+        return []
+    if getattr(user, 'is_admin', False):
+        return list(STREAM_PERMISSIONS)
+    granted = {p.strip() for p in (user.permissions or '').split(',') if p.strip()}
+    return [room for room, allowed in STREAM_PERMISSIONS.items() if granted.intersection(allowed)]
+
+
+def user_room(user_id):
+    """Private room of one user (report job notifications and the like)"""
+    return f'user:{user_id}'
+
+
+def payload_size(payload):
+    """Approximate wire size of a payload in bytes"""
+    return len(json.dumps(payload, default=str, separators=(',', ':')).encode('utf-8'))
+
+
+class _ClientState:
+    """Per-client delta bookkeeping"""
+
+    __slots__ = ('sent_state', 'version', 'synced', 'inflight', 'pending_events', 'truncated')
+
+    def __init__(self):
+        self.sent_state = {}      # Status as of the last frame sent to this client
+        self.version = 0          # Version of the last frame sent
+        self.synced = False       # Has received a full frame
+        self.inflight = 0         # Frames sent but not yet acknowledged
+        self.pending_events = []  # Events held back while the client is lagging
+        self.truncated = 0        # Events dropped from pending_events on overflow
+
+
+class CoalescingBroadcaster:
+    """
+    Real-time update broadcaster for the /events namespace
+
+    publish() queues an event payload; a background thread flushes the queue
+    at most once per `window` seconds. Delta clients receive one
+    'state_update' frame per flush holding the new events plus only the
+    status fields that changed for them. Frames are acknowledged by the
+    client; a socket with `max_inflight` unacknowledged frames is lagging and
+    gets no further status frames until it catches up - its events are kept
+    and sent with the next frame, superseded status is simply not sent.
+    Clients that have not opted in keep receiving full 'new_event' payloads.
+
+    With `distributed=True` (Socket.IO message queue shared by several
+    worker processes) clients live in other processes: room emits always go
+    out through the queue and delta frames are disabled, because per-client
+    state and acknowledgements cannot cross processes.
+    """
+
+    def __init__(self, socketio, namespace='/events', window=0.1,
+                 max_inflight=2, max_pending_events=500, distributed=False, on_events_sent=None):
+        self.socketio = socketio
+        self.on_events_sent = on_events_sent  # Callable(event entries) after each flush that sent events
+        self.namespace = namespace
+        self.distributed = distributed
+        self.window = window
+        self.max_inflight = max_inflight
+        self.max_pending_events = max_pending_events
+
+        self._lock = threading.RLock()
+        self._wakeup = threading.Event()
+        self._queue = []          # Event entries awaiting the next flush
+        self._state = {}          # Latest coalesced status
+        self._version = 0
+        self._clients = {}        # sid -> _ClientState (delta clients only)
+        self._thread = None
+        self._stop_event = threading.Event()
+
+        self.metrics = {
+            'published': 0,
+            'flushes': 0,
+            'messages_emitted': 0,
+            'bytes_emitted': 0,
+            'legacy_messages': 0,
+            'legacy_bytes': 0,
+            'room_messages': 0,
+            'room_bytes': 0,
+            'room_emits_skipped': 0,
+            'delta_messages': 0,
+            'delta_bytes': 0,
+            'full_frames': 0,
+            'superseded_frames_dropped': 0,
+            'events_truncated': 0
+        }
+
+    # ------------------------------------------------------------------
+    # Publishing
+    # ------------------------------------------------------------------
+
+    def publish(self, payload):
+        """
+        Queue a broadcast payload (event dict plus status fields)
+
+        Args:
+            payload: Dict with 'event'/'event_id' and status keys such as
+                door_status, alarm_status, timer_set, statistics
+        """
+        event = {key: payload[key] for key in EVENT_KEYS if key in payload}
+        status = {key: value for key, value in payload.items() if key not in EVENT_KEYS}
+
+        with self._lock:
+            if event:
+                self._queue.append(event)
+            self._state.update(status)
+            self.metrics['published'] += 1
+
+        self.start()
+        self._wakeup.set()
+
+    def start(self):
+        """Start the flush thread if it is not running"""
+        if self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="WSBroadcaster")
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        """Stop the flush thread after a final flush"""
+        self._stop_event.set()
+        self._wakeup.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=2.0)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._wakeup.wait()
+            self._wakeup.clear()
+            # Let a burst accumulate before sending
+            time.sleep(self.window)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Broadcast flush failed: {e}")
+        self.flush()
+
+    def flush(self):
+        """Send everything queued since the last flush"""
+        with self._lock:
+            events = self._queue
+            self._queue = []
+            if not events and not self._clients:
+                return
+            self._version += 1
+            self.metrics['flushes'] += 1
+            state = dict(self._state)
+            version = self._version
+            sids = list(self._clients)
+
+        # Legacy clients: one full payload per event, carrying the latest status
+        if events and self._room_has_members(LEGACY_ROOM):
+            for event in events:
+                self._emit('new_event', dict(state, **event), to=LEGACY_ROOM, kind='legacy')
+
+        for sid in sids:
+            with self._lock:
+                client = self._clients.get(sid)
+                if client is None:
+                    continue
+                self._queue_client_events(client, events)
+                if client.inflight >= self.max_inflight:
+                    # Lagging socket - its status frame for this flush is superseded
+                    self.metrics['superseded_frames_dropped'] += 1
+                    continue
+            self._send_frame(sid, state, version)
+
+        if events and self.on_events_sent:
+            try:
+                self.on_events_sent(events)
+            except Exception as e:
+                logger.error(f"Broadcast callback failed: {e}")
+
+    def emit_to_room(self, name, payload, room):
+        """
+        Emit a one-off event to a stream room
+
+        Nothing is serialized when the room is empty, so streams no connected
+        client may see cost nothing.
+        """
+        if not self._room_has_members(room):
+            with self._lock:
+                self.metrics['room_emits_skipped'] += 1
+            return False
+        self._emit(name, payload, to=room, kind='room')
+        return True
+
+    def _room_has_members(self, room):
+        """Check whether any client is in a room (avoids serializing for nobody)"""
+        if self.distributed:
+            return True  # Members may be connected to another worker
+        try:
+            return bool(self.socketio.server.manager.rooms.get(self.namespace, {}).get(room))
+        except Exception:
+            return True  # Unknown manager layout - emit anyway
+
+    def _queue_client_events(self, client, events):
+        """Append events to a client's pending list (caller holds the lock)"""
+        client.pending_events.extend(events)
+        overflow = len(client.pending_events) - self.max_pending_events
+        if overflow > 0:
+            del client.pending_events[:overflow]
+            client.truncated += overflow
+            self.metrics['events_truncated'] += overflow
+
+    # ------------------------------------------------------------------
+    # Per-client frames
+    # ------------------------------------------------------------------
+
+    def _send_frame(self, sid, state=None, version=None, full=False):
+        """Send one state_update frame to a delta client"""
+        with self._lock:
+            client = self._clients.get(sid)
+            if client is None:
+                return
+            if state is None:
+                state = dict(self._state)
+                version = self._version
+
+            full = full or client.truncated > 0 or not client.synced
+            changes = dict(state) if full else diff_state(client.sent_state, state)
+            events = client.pending_events
+            if not events and not changes and not full:
+                return
+
+            frame = {
+                'v': version,
+                'base': 0 if full else client.version,
+                'full': full,
+                'events': events,
+                'changes': changes
+            }
+            if client.truncated:
+                frame['events_truncated'] = client.truncated
+
+            client.pending_events = []
+            client.truncated = 0
+            client.sent_state = state
+            client.version = version
+            client.synced = True
+            client.inflight += 1
+            if full:
+                self.metrics['full_frames'] += 1
+
+        self._emit('state_update', frame, to=sid, kind='delta',
+                   callback=partial(self._on_ack, sid))
+
+    def _on_ack(self, sid, *args):
+        """Client acknowledged a frame - send anything held back meanwhile"""
+        with self._lock:
+            client = self._clients.get(sid)
+            if client is None:
+                return
+            client.inflight = max(0, client.inflight - 1)
+            behind = bool(client.pending_events) or client.sent_state != self._state
+        if behind:
+            self._send_frame(sid)
+
+    def _emit(self, name, payload, to, kind, callback=None):
+        size = payload_size(payload)
+        try:
+            if callback:
+                self.socketio.emit(name, payload, namespace=self.namespace, to=to, callback=callback)
+            else:
+                self.socketio.emit(name, payload, namespace=self.namespace, to=to)
+        except Exception as e:
+            logger.error(f"WebSocket emit '{name}' failed: {e}")
+            return
+        with self._lock:
+            self.metrics['messages_emitted'] += 1
+            self.metrics['bytes_emitted'] += size
+            self.metrics[f'{kind}_messages'] += 1
+            self.metrics[f'{kind}_bytes'] += size
+
+    # ------------------------------------------------------------------
+    # Client registry
+    # ------------------------------------------------------------------
+
+    def enable_delta(self, sid):
+        """
+        Switch a client to delta frames and send it the full current state
+
+        Returns:
+            False when delta frames are unavailable (distributed mode) and the
+            client should stay on full payloads
+        """
+        if self.distributed:
+            return False
+        with self._lock:
+            self._clients[sid] = _ClientState()
+        self._send_frame(sid, full=True)
+        return True
+
+    def resync(self, sid):
+        """Client lost track of versions - resend full state"""
+        with self._lock:
+            client = self._clients.get(sid)
+            if client is None:
+                return
+            client.inflight = 0
+        self._send_frame(sid, full=True)
+
+    def remove_client(self, sid):
+        """Forget a disconnected client"""
+        with self._lock:
+            self._clients.pop(sid, None)
+
+    def get_metrics(self):
+        """Get broadcaster counters"""
+        with self._lock:
+            metrics = dict(self.metrics)
+            metrics['delta_clients'] = len(self._clients)
+            metrics['lagging_clients'] = sum(
+                1 for client in self._clients.values() if client.inflight >= self.max_inflight)
+            metrics['state_version'] = self._version
+            metrics['window_ms'] = int(self.window * 1000)
+            metrics['distributed'] = self.distributed
+        return metrics
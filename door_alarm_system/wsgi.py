@@ -0,0 +1,74 @@
+"""
+Production entry point for eDOMOS
+Runs the web application on cooperative (eventlet/gevent) workers instead of
+the Werkzeug development server used by `python app.py`
+
+Single server (owns GPIO, camera and the monitoring threads):
+    python wsgi.py
+
+Several web workers sharing Socket.IO traffic through a message queue (Redis,
+client from requirements.txt; the queue is optional, see below); exactly one
+process keeps EDOMOS_HARDWARE_OWNER=true (the default):
+    export SOCKETIO_MESSAGE_QUEUE=redis://localhost:6379/0
+    python wsgi.py                                              # hardware owner, port 5000
+    EDOMOS_HARDWARE_OWNER=false gunicorn -k eventlet -w 1 \\
+        -b 0.0.0.0:5001 wsgi:app                                # extra web worker
+
+With the dedicated hardware controller (hardware_controller.py) every web
+worker runs with EDOMOS_HARDWARE_OWNER=false and EDOMOS_CONTROLLER_SOCKET set,
+mirroring door/alarm state from the controller instead of owning GPIO.
+
+Socket.IO needs sticky sessions, so put the workers behind a proxy that pins
+each client to one worker (e.g. nginx ip_hash). With neither a message queue
+nor a controller socket, delivery stays in-process and only a single worker
+should be run.
+
+Environment:
+    SOCKETIO_ASYNC_MODE     eventlet (default) or gevent
+    SOCKETIO_MESSAGE_QUEUE  redis://... (optional; amqp:// needs the kombu package)
+    EDOMOS_HARDWARE_OWNER   true (default) / false
+    EDOMOS_CONTROLLER_SOCKET  hardware controller socket for web workers (optional)
+    EDOMOS_HOST, EDOMOS_PORT  bind address for `python wsgi.py` (0.0.0.0:5000)
+"""
+
+import os
+
+# Cooperative workers must patch the standard library before anything else
+# (Flask, SQLAlchemy, threading) is imported
+ASYNC_MODE = os.environ.setdefault('SOCKETIO_ASYNC_MODE', 'eventlet')
+if ASYNC_MODE == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+elif ASYNC_MODE == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+else:
+    raise RuntimeError(f"wsgi.py needs SOCKETIO_ASYNC_MODE=eventlet or gevent, got '{ASYNC_MODE}'")
+
+from config import Config
+from app import app, socketio, init_system, start_monitoring, start_report_scheduler, get_email_outbox
+
+
+def bootstrap():
+    """Prepare the database and, in the hardware owner only, the background threads"""
+    init_system()
+    if Config.HARDWARE_OWNER:
+        start_monitoring()
+        start_report_scheduler()
+        get_email_outbox()
+        print(f"[WSGI] ✅ Hardware owner started ({ASYNC_MODE} workers)")
+    else:
+        print(f"[WSGI] ✅ Web worker started ({ASYNC_MODE} workers, no hardware)")
+    if Config.SOCKETIO_MESSAGE_QUEUE:
+        print(f"[WSGI] 🔗 Socket.IO message queue: {Config.SOCKETIO_MESSAGE_QUEUE}")
+
+
+# gunicorn imports this module and serves `app`
+bootstrap()
+
+
+if __name__ == '__main__':
+    host = os.environ.get('EDOMOS_HOST', '0.0.0.0')
+    port = int(os.environ.get('EDOMOS_PORT', '5000'))
+    print(f"[WSGI] 🚀 Serving on {host}:{port}")
+    socketio.run(app, host=host, port=port, debug=False, use_reloader=False, log_output=True)